@@ -1,11 +1,17 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Dict, Mapping, Optional
 from google.adk import Agent
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.models import Gemini
 from app.core.config.config import get_settings
 from app.ai.tools.universal_analyst import execute_semantic_query
 from app.ai.tools.executive_report_orchestrator import generate_executive_report as get_executive_turnover_report
 # REMOVED: headcount_analyst - Now using universal_analyst with registry metrics
 from app.schemas.analytics import SemanticRequest
+from app.services.session_compaction import SUMMARY_STATE_KEY, render_summary
 from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY, DEFAULT_LISTING_COLUMNS
 
 settings = get_settings()
@@ -38,14 +44,17 @@ DEFAULT_COLS_LIST = ", ".join(DEFAULT_LISTING_COLUMNS)
 DEFAULT_COLS_JSON = json.dumps(DEFAULT_LISTING_COLUMNS)
 
 # Obtener valores reales de divisiones para el prompt (Zero-Shot Accuracy)
-try:
-    from app.services.bigquery import get_bq_service
-    bq = get_bq_service()
-    CUBE_SOURCE = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
-    divisions_df = bq.execute_query(f"SELECT DISTINCT uo2 FROM {CUBE_SOURCE} WHERE uo2 IS NOT NULL ORDER BY 1")
-    REAL_DIVISIONS = ", ".join(divisions_df['uo2'].tolist())
-except Exception as e:
-    REAL_DIVISIONS = "DIVISION TALENTO, DIVISION SEGUROS PERSONAS, DIVISION FINANZAS, DIVISION RIESGOS"
+def _load_division_catalog() -> str:
+    """Catálogo de divisiones como string (el DataFrame no queda retenido como global del módulo)."""
+    try:
+        from app.services.bigquery import get_bq_service
+        cube_source = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
+        divisions_df = get_bq_service().execute_query(f"SELECT DISTINCT uo2 FROM {cube_source} WHERE uo2 IS NOT NULL ORDER BY 1")
+        return ", ".join(divisions_df['uo2'].tolist())
+    except Exception:
+        return "DIVISION TALENTO, DIVISION SEGUROS PERSONAS, DIVISION FINANZAS, DIVISION RIESGOS"
+
+REAL_DIVISIONS = _load_division_catalog()
 
 # Contexto Dinámico de Tiempo (Sincronizado con Tiempo Real)
 NOW = datetime.now() 
@@ -442,20 +451,57 @@ Arguments:
 }}
 '''
 
-def get_hr_agent(profile: str = "EJECUTIVO", context_state: dict = None):
-    """Retorna la configuración del Agente HR Semántico (v2.1 Nexus)."""
-    
-    final_instruction = HR_PROMPT_SEMANTIC
-    if context_state:
-        context_str = "\n\n### ESTADO DETERMINADO POR TRIAJE (Prioridad Alta):\n"
-        for k, v in context_state.items():
-            context_str += f"- {k.upper()}: {v}\n"
-        context_str += "\nSI EL FORMATO ES 'TABLE', DEBES USAR INTENT='LISTING' Y REQUESTED_VIZ='TABLE'.\n"
-        final_instruction = context_str + HR_PROMPT_SEMANTIC
-
-    return Agent(
-        name="HR_Semantic_Agent",
-        instruction=final_instruction,
-        model=get_vertex_model(),
-        tools=[execute_semantic_query, get_executive_turnover_report]
-    )
+def build_triage_context(context_state: Optional[dict] = None) -> str:
+    """Bloque de estado del triaje que se antepone a la instrucción del agente."""
+    if not context_state:
+        return ""
+    context_str = "\n\n### ESTADO DETERMINADO POR TRIAJE (Prioridad Alta):\n"
+    for k, v in context_state.items():
+        context_str += f"- {k.upper()}: {v}\n"
+    context_str += "\nSI EL FORMATO ES 'TABLE', DEBES USAR INTENT='LISTING' Y REQUESTED_VIZ='TABLE'.\n"
+    return context_str
+
+
+# Estado del triaje de la request en curso (cada request/tarea asyncio ve el suyo)
+_triage_state: ContextVar[Optional[dict]] = ContextVar("triage_state", default=None)
+
+
+@contextmanager
+def triage_state(context_state: Optional[dict]):
+    """Inyecta el estado del triaje en el agente cacheado durante la ejecución del Runner."""
+    token = _triage_state.set(dict(context_state) if context_state else None)
+    try:
+        yield
+    finally:
+        _triage_state.reset(token)
+
+
+def _hr_instruction(ctx: ReadonlyContext) -> str:
+    """InstructionProvider: estado del triaje de la request + resumen de la sesión + prompt fijo."""
+    summary = ctx.state.get(SUMMARY_STATE_KEY) if isinstance(getattr(ctx, "state", None), Mapping) else None
+    return build_triage_context(_triage_state.get()) + render_summary(summary) + HR_PROMPT_SEMANTIC
+
+
+# Agentes prearmados por perfil (modelo Gemini + tools + prompt: inmutables entre requests)
+_agents: Dict[str, Agent] = {}
+_agents_lock = threading.Lock()
+
+
+def get_hr_agent(profile: str = "EJECUTIVO") -> Agent:
+    """
+    Retorna el Agente HR Semántico (v2.1 Nexus) del perfil, construido una sola vez.
+    El estado del triaje se inyecta por request con `triage_state(...)`.
+    """
+    agent = _agents.get(profile)
+    if agent is None:
+        with _agents_lock:
+            agent = _agents.get(profile)
+            if agent is None:
+                agent = Agent(
+                    name="HR_Semantic_Agent",
+                    instruction=_hr_instruction,
+                    model=get_vertex_model(),
+                    tools=[execute_semantic_query, get_executive_turnover_report]
+                )
+                _agents[profile] = agent
+    return agent
@@ -5,14 +5,20 @@ import time
 import random
 import logging
 import re
+import uuid
 import traceback
 from google.genai import types, Client
 from google.adk.events.event import Event
-from app.ai.agents.hr_agent import get_hr_agent
+from app.ai.agents.hr_agent import get_hr_agent, triage_state, REAL_DIVISIONS
+from app.services.session_compaction import SUMMARY_STATE_KEY, render_summary
 from app.core.config.config import get_settings
 from app.ai.tools.triage_validator import validate_dimensions, list_organizational_units
 
 from app.services.adk_firestore_connector import FirestoreADKSessionService
+from app.services.speculative_query import get_speculative_executor
+from app.services.llm_hedging import get_llm_hedger
+from app.services.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from app.core.utils.server_timing import record_timing
 
 class AgentRouter:
     """
@@ -25,6 +31,7 @@ class AgentRouter:
         settings = get_settings()
         self.session_service = FirestoreADKSessionService() # Integración Firestore real
         self.name = "ADK Router"
+        self._runners = {}  # perfil -> Runner (ver _get_runner)
         # Configurar logging básico
         logging.basicConfig(level=settings.LOG_LEVEL)
         self.logger = logging.getLogger("AgentRouter")
@@ -121,6 +128,18 @@ class AgentRouter:
         TU SALIDA DEBE SER EXCLUSIVAMENTE LA LLAMADA A LA TOOL Y LUEGO LA PALABRA "PROCEED".
         '''
 
+    def _get_runner(self, profile: str, app_name: str) -> Runner:
+        """Runner prearmado por perfil (el agente y su modelo se construyen una sola vez)."""
+        runner = self._runners.get(profile)
+        if runner is None:
+            runner = Runner(
+                app_name=app_name,
+                agent=get_hr_agent(profile=profile),
+                session_service=self.session_service
+            )
+            self._runners[profile] = runner
+        return runner
+
     def _track_and_log_rpm(self):
         """Mantiene una ventana móvil de 60 segundos para calcular RPM."""
         now = time.time()
@@ -132,6 +151,13 @@ class AgentRouter:
         self.logger.info(f"📊 [METRICS] Current RPM: {rpm} requests/min")
         return rpm
 
+    def _degraded_response(self, error: CircuitOpenError) -> str:
+        """Respuesta inmediata cuando una dependencia tiene el circuito abierto."""
+        self.logger.warning(f"🔌 [CIRCUIT] Fallo rápido: {error}")
+        service = {"genai": "de IA", "firestore": "de sesiones", "bigquery": "de datos"}.get(error.name, error.name)
+        return (f"⚠️ El servicio {service} no está disponible temporalmente. "
+                f"Por favor, intenta de nuevo en {max(int(error.retry_after), 5)} segundos.")
+
     def _clean_triage_response(self, text: str) -> str:
         """Limpia alucinaciones comunes de código en el triage."""
         if not text: return ""
@@ -148,15 +174,37 @@ class AgentRouter:
         return clean.strip()
 
     async def route(self, message: str, session_id: str = "default", profile: str = "EJECUTIVO") -> str:
+        """
+        Punto de entrada del router.
+        Si la consulta es adivinable localmente, lanza su BigQuery de forma especulativa para
+        solapar su latencia con el triage y los turnos del agente; lo no consumido se cancela al final.
+        """
+        settings = get_settings()
+        if not settings.SPECULATIVE_QUERIES_ENABLED:
+            return await self._route(message, session_id=session_id, profile=profile)
+
+        # Armado de SQL + jobs.insert en un hilo: no retrasa el triage
+        speculative = get_speculative_executor()
+        request_owner = f"{session_id}:{uuid.uuid4()}"
+        speculation = asyncio.get_running_loop().run_in_executor(
+            None, speculative.speculate, message, request_owner, REAL_DIVISIONS.split(", ")
+        )
+        try:
+            return await self._route(message, session_id=session_id, profile=profile)
+        finally:
+            try:
+                await speculation
+            except Exception as e:
+                self.logger.warning(f"🔮 [SPECULATIVE] Speculation failed: {e}")
+            speculative.discard(request_owner)
+
+    async def _route(self, message: str, session_id: str = "default", profile: str = "EJECUTIVO") -> str:
         """
         Ejecuta la consulta a través de un Runner configurado para el perfil del usuario.
         """
         user_id = "default_user"
         app_name = "PeopleAnalyticsApp"
 
-        # 1. Obtener agente especializado para el perfil
-        specialized_agent = get_hr_agent(profile=profile)
-
         # Asegurar variables de entorno para inicialización implícita del cliente GenAI de ADK
         settings = get_settings()
         if settings.GOOGLE_GENAI_USE_VERTEXAI:
@@ -192,9 +240,11 @@ class AgentRouter:
         # -----------------------------------------------------------------------
 
         # IMPORTANTE: Incluimos breve historial para evitar repeticiones (Context-Aware Triage)
+        triage_slots = {}
         try:
             t_start_session = time.time()
             session = await self.session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+            record_timing("session_fetch", time.time() - t_start_session)
             self.logger.info(f"[ROUTER] Session fetch time: {time.time() - t_start_session:.4f}s")
             
             # --- GESTIÓN DE ESTADO (MEMORY SLOTS) ---
@@ -203,45 +253,48 @@ class AgentRouter:
                 triage_slots = session.state.get("triage_slots", {})
 
             # --- HERRAMIENTA UNIFICADA DE BAJA LATENCIA ---
-            def process_triage_step(
-                period: str = None, 
-                structure: str = None, 
-                format: str = None,
-                reset_memory: bool = False
-            ):
-                """
-                ACCIÓN ATÓMICA: 
-                1. Actualiza la memoria con lo nuevo.
-                2. Valida automáticamente lo recibido (Año/Estructura).
-                3. Devuelve estado actual y validaciones.
-                """
-                # 0. Reset si se solicita (cambio de tema)
-                if reset_memory:
-                    triage_slots.clear()
+            # Una instancia por intento (sobre su propia copia de los slots): los intentos
+            # duplicados del hedging no se pisan la memoria entre sí.
+            def make_triage_step(slots: dict):
+                def process_triage_step(
+                    period: str = None, 
+                    structure: str = None, 
+                    format: str = None,
+                    reset_memory: bool = False
+                ):
+                    """
+                    ACCIÓN ATÓMICA: 
+                    1. Actualiza la memoria con lo nuevo.
+                    2. Valida automáticamente lo recibido (Año/Estructura).
+                    3. Devuelve estado actual y validaciones.
+                    """
+                    # 0. Reset si se solicita (cambio de tema)
+                    if reset_memory:
+                        slots.clear()
+                        
+                    # 1. Actualizar Memoria
+                    if period: slots["period"] = period
+                    if structure: slots["structure"] = structure
+                    if format: slots["format"] = format
                     
-                # 1. Actualizar Memoria
-                if period: triage_slots["period"] = period
-                if structure: triage_slots["structure"] = structure
-                if format: triage_slots["format"] = format
-                
-                # 2. Validación "Dummy" (Ultrarrápida)
-                # Ya NO consultamos BigQuery. Asumimos validez y dejamos que el experto (HR Agent) falle si es necesario.
-                validation_log = []
-                
-                # Simple heurística de texto para evitar basura obvia
-                cur_struct = triage_slots.get("structure")
-                if cur_struct:
-                    triage_slots["structure_valid"] = True # Fe ciega por velocidad
-
-                cur_period = triage_slots.get("period")
-                if cur_period:
-                    triage_slots["period_valid"] = True
-
-                return {
-                    "memory_updated": triage_slots,
-                    "validation_alerts": [], # Sin alertas de base de datos
-                    "status": "Ready to Proceed" if triage_slots.get("period") and triage_slots.get("structure") and triage_slots.get("format") else "Missing Slots"
-                }
+                    # 2. Validación "Dummy" (Ultrarrápida)
+                    # Ya NO consultamos BigQuery. Asumimos validez y dejamos que el experto (HR Agent) falle si es necesario.
+                    
+                    # Simple heurística de texto para evitar basura obvia
+                    cur_struct = slots.get("structure")
+                    if cur_struct:
+                        slots["structure_valid"] = True # Fe ciega por velocidad
+
+                    cur_period = slots.get("period")
+                    if cur_period:
+                        slots["period_valid"] = True
+
+                    return {
+                        "memory_updated": slots,
+                        "validation_alerts": [], # Sin alertas de base de datos
+                        "status": "Ready to Proceed" if slots.get("period") and slots.get("structure") and slots.get("format") else "Missing Slots"
+                    }
+                return process_triage_step
 
             # ----------------------------------------------
             
@@ -282,43 +335,62 @@ class AgentRouter:
             triage_contents.append({"role": "user", "parts": [{"text": message}]})
             
             # Incorporar ESTADO y PERFIL en la instrucción del sistema
-            triage_instr = f"[ESTADO DE MEMORIA ACTUAL: {triage_slots}]\n\n[PERFIL USUARIO: {profile}]\n\n" + self.TRIAGE_PROMPT
+            # Turnos antiguos compactados: resumen estructurado en lugar de eventos crudos
+            summary_block = render_summary(session.state.get(SUMMARY_STATE_KEY)) if session else ""
+            triage_instr = f"[ESTADO DE MEMORIA ACTUAL: {triage_slots}]{summary_block}\n\n[PERFIL USUARIO: {profile}]\n\n" + self.TRIAGE_PROMPT
 
             t_start_llm = time.time()
             self._track_and_log_rpm() # Telemetría antes de llamar
             
-            try:
-                triage_response = self.client.models.generate_content(
+            def triage_attempt():
+                slots = dict(triage_slots)
+                response = self.client.models.generate_content(
                     model="gemini-2.5-flash",
                     contents=triage_contents,
                     config=types.GenerateContentConfig(
                         system_instruction=triage_instr,
                         temperature=0.0,
-                        tools=[process_triage_step], # SOLO herramientas lógicas, nada de I/O
+                        tools=[make_triage_step(slots)], # SOLO herramientas lógicas, nada de I/O
                         automatic_function_calling=types.AutomaticFunctionCallingConfig(
                             disable=False,
                             maximum_remote_calls=3 
                         )
                     )
                 )
+                return response, slots
+
+            def fallback_attempt():
+                return self.client.models.generate_content(
+                    model="gemini-2.5-flash",
+                    contents=triage_contents,
+                    config=types.GenerateContentConfig(
+                        system_instruction=triage_instr + "\n\n[NOTA: EL VALIDADOR FALLÓ. RESPONDE SOLO CON TEXTO Y 'PROCEED' SI ES POSIBLE.]",
+                        temperature=0.0,
+                        tools=[], # Sin tools
+                    )
+                )
+
+            # Hedging: si el triaje supera el p95 observado se lanza un duplicado (primera respuesta gana).
+            # En un hilo: la llamada síncrona del SDK no bloquea el event loop.
+            hedger = get_llm_hedger()
+            try:
+                with get_circuit_breaker("genai").guard():
+                    triage_response, resolved_slots = await asyncio.to_thread(hedger.call, "triage", triage_attempt)
+                # Slots resueltos por el intento ganador (mismo dict que session.state)
+                triage_slots.clear()
+                triage_slots.update(resolved_slots)
             except Exception as e:
                 # Catch specific timeout/read errors that might be wrapped
                 error_str = str(e).lower()
                 if "timeout" in error_str or "readoperation" in error_str or "deadline" in error_str:
                     self.logger.warning(f"⚠️ [ROUTER] Triage timed out with AFC. Retrying WITHOUT tools (Pure Text Fallback). Error: {e}")
                     # FALLBACK: Intentar sin herramientas para desbloquear
-                    triage_response = self.client.models.generate_content(
-                        model="gemini-2.5-flash",
-                        contents=triage_contents,
-                        config=types.GenerateContentConfig(
-                            system_instruction=triage_instr + "\n\n[NOTA: EL VALIDADOR FALLÓ. RESPONDE SOLO CON TEXTO Y 'PROCEED' SI ES POSIBLE.]",
-                            temperature=0.0,
-                            tools=[], # Sin tools
-                        )
-                    )
+                    with get_circuit_breaker("genai").guard():
+                        triage_response = await asyncio.to_thread(hedger.call, "triage_fallback", fallback_attempt)
                 else:
                     raise e
                     
+            record_timing("triage_llm", time.time() - t_start_llm)
             self.logger.info(f"[ROUTER] LLM Generation time: {time.time() - t_start_llm:.4f}s")
             
             # Obtener texto de forma ultra-robusta
@@ -360,131 +432,148 @@ class AgentRouter:
             # self.logger.error(traceback.format_exc()) # Reduce noise
             pass
 
-        # 2. Inicializar Runner dinámico (Maquinaria pesada)
-        # Inyectamos el ESTADO del triaje directamente en el agente para evitar re-lectura de historial
-        specialized_agent = get_hr_agent(profile=profile, context_state=triage_slots)
-        
-        runner = Runner(
-            app_name=app_name,
-            agent=specialized_agent,
-            session_service=self.session_service
-        )
+        # 2. Runner prearmado del perfil (Maquinaria pesada)
+        # El ESTADO del triaje se inyecta por request (triage_state) sin reconstruir el agente
+        runner = self._get_runner(profile, app_name)
 
         new_message = types.Content(parts=[types.Part(text=full_message)], role="user")
         
         # 4. Asegurar sesión (Confirmado Async)
-        if not await self.session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id):
-            await self.session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        try:
+            if not await self.session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id):
+                await self.session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        except CircuitOpenError as e:
+            return self._degraded_response(e)
+
+        genai_breaker = get_circuit_breaker("genai")
 
-        max_retries = 3
-        retry_delay = 5 # Aumentamos delay inicial por seguridad (era 2)
+        with triage_state(triage_slots):
+            max_retries = 3
+            retry_delay = 5 # Aumentamos delay inicial por seguridad (era 2)
         
-        # Variables de telemetría
-        total_api_calls = 0
-        tools_called = []
+            # Variables de telemetría
+            total_api_calls = 0
+            tools_called = []
         
-        for attempt in range(max_retries):
-            response_text = ""
-            last_tool_result = None
-            turn_count = 0
+            for attempt in range(max_retries):
+                response_text = ""
+                last_tool_result = None
+                turn_count = 0
             
-            try:
-                self.logger.info(f"--- Starting Runner for session {session_id} (Attempt {attempt+1}/{max_retries}) ---")
+                try:
+                    # Con el circuito de GenAI abierto se falla al instante (sin reintentos ni esperas)
+                    genai_breaker.before_call()
+                    self.logger.info(f"--- Starting Runner for session {session_id} (Attempt {attempt+1}/{max_retries}) ---")
                 
-                # Turn counting logic: A turn starts at the beginning of the run 
-                # and after each tool call result is processed.
-                current_turn_counted = False
+                    # Turn counting logic: A turn starts at the beginning of the run 
+                    # and after each tool call result is processed.
+                    current_turn_counted = False
                 
-                t_run_start = time.time()
-                t_last_event = t_run_start
-                t_tool_start = 0
-
-                async for event in runner.run_async(
-                    user_id=user_id,
-                    session_id=session_id,
-                    new_message=new_message
-                ):
-                    now = time.time()
-                    delta = now - t_last_event
-                    t_last_event = now
-
-                    if event.content and event.content.parts:
-                        # If we get content, and we haven't counted this turn yet, count it
-                        if not current_turn_counted:
-                            turn_count += 1
-                            current_turn_counted = True
+                    t_run_start = time.time()
+                    t_last_event = t_run_start
+                    t_tool_start = 0
+
+                    async for event in runner.run_async(
+                        user_id=user_id,
+                        session_id=session_id,
+                        new_message=new_message
+                    ):
+                        now = time.time()
+                        delta = now - t_last_event
+                        t_last_event = now
+
+                        if event.content and event.content.parts:
+                            # Server-Timing: el tramo previo a una respuesta de tool es ejecución de la tool,
+                            # el resto es tiempo del modelo (planificación / redacción)
+                            is_tool_result = any(p.function_response for p in event.content.parts)
+                            record_timing("runner_tool" if is_tool_result else "runner_llm", delta)
+
+                            # If we get content, and we haven't counted this turn yet, count it
+                            if not current_turn_counted:
+                                turn_count += 1
+                                current_turn_counted = True
                         
-                        for part in event.content.parts:
-                            if part.text:
-                                response_text += part.text
+                            for part in event.content.parts:
+                                if part.text:
+                                    response_text += part.text
                             
-                            if part.function_call:
-                                total_api_calls += 1 
-                                tools_called.append(part.function_call.name)
-                                self.logger.info(f"[PROFILER] 🤖 Model planned tool: {part.function_call.name} (Think time: {delta:.4f}s)")
-                                # After a function call, a new call will follow to process the result
-                                current_turn_counted = False
-                                t_tool_start = time.time()
-
-                            if part.function_response:
-                                duration = time.time() - t_tool_start
-                                self.logger.info(f"[PROFILER] 🛠️ Tool execution finished in {duration:.4f}s")
-                                try:
-                                    if hasattr(part.function_response, 'response'):
-                                        res = part.function_response.response
-                                        last_tool_result = res.get('result', res)
-                                except Exception as e:
-                                    self.logger.error(f"Error capturing tool result: {e}")
+                                if part.function_call:
+                                    total_api_calls += 1 
+                                    tools_called.append(part.function_call.name)
+                                    self.logger.info(f"[PROFILER] 🤖 Model planned tool: {part.function_call.name} (Think time: {delta:.4f}s)")
+                                    # After a function call, a new call will follow to process the result
+                                    current_turn_counted = False
+                                    t_tool_start = time.time()
+
+                                if part.function_response:
+                                    duration = time.time() - t_tool_start
+                                    self.logger.info(f"[PROFILER] 🛠️ Tool execution finished in {duration:.4f}s")
+                                    try:
+                                        if hasattr(part.function_response, 'response'):
+                                            res = part.function_response.response
+                                            last_tool_result = res.get('result', res)
+                                    except Exception as e:
+                                        self.logger.error(f"Error capturing tool result: {e}")
                 
-                self.logger.info(f"[PROFILER] Session {session_id} - Total Model Turns: {turn_count} | Tools: {tools_called}")
-                break
+                    record_timing("runner", time.time() - t_run_start)
+                    self.logger.info(f"[PROFILER] Session {session_id} - Total Model Turns: {turn_count} | Tools: {tools_called}")
+                    genai_breaker.record_success()
+                    break
 
-            except Exception as e:
-                error_msg = str(e)
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (2 ** attempt)
-                        self.logger.warning(f"Quota exhausted (429). Retrying in {wait_time}s...")
-                        await asyncio.sleep(wait_time)
-                        continue
-                    else:
-                        self.logger.error("Max retries reached for 429 error.")
-                        return "Lo siento, la cuota de la API de IA se ha agotado. Por favor, intenta de nuevo en unos minutos."
-                
-                # RESILIENCE BLOCK: Timeout/Network Error but Data was Generated
-                elif "timeout" in error_msg.lower() or "readoperation" in error_msg.lower():
+                except CircuitOpenError as e:
+                    genai_breaker.record_failure(e)
                     if last_tool_result and isinstance(last_tool_result, dict):
-                         self.logger.warning(f"⚠️ [RESILIENCE] LLM Timeout ({error_msg}) but Tool Data was captured. Returning data to user.")
-                         break # Break loop, code below will return last_tool_result
+                        break
+                    return self._degraded_response(e)
+
+                except Exception as e:
+                    genai_breaker.record_failure(e)
+                    error_msg = str(e)
+                    if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+                        if attempt < max_retries - 1:
+                            wait_time = retry_delay * (2 ** attempt)
+                            self.logger.warning(f"Quota exhausted (429). Retrying in {wait_time}s...")
+                            await asyncio.sleep(wait_time)
+                            continue
+                        else:
+                            self.logger.error("Max retries reached for 429 error.")
+                            return "Lo siento, la cuota de la API de IA se ha agotado. Por favor, intenta de nuevo en unos minutos."
+                
+                    # RESILIENCE BLOCK: Timeout/Network Error but Data was Generated
+                    elif "timeout" in error_msg.lower() or "readoperation" in error_msg.lower():
+                        if last_tool_result and isinstance(last_tool_result, dict):
+                             self.logger.warning(f"⚠️ [RESILIENCE] LLM Timeout ({error_msg}) but Tool Data was captured. Returning data to user.")
+                             break # Break loop, code below will return last_tool_result
+                        else:
+                             self.logger.error(f"Runner failed with Timeout and no data: {e}")
+                             raise e
                     else:
-                         self.logger.error(f"Runner failed with Timeout and no data: {e}")
-                         raise e
-                else:
-                    self.logger.error(f"Runner failed: {e}")
-                    # Validate if we have a valid package before raising
-                    if last_tool_result and isinstance(last_tool_result, dict) and last_tool_result.get("response_type") == "visual_package":
-                         self.logger.warning(f"⚠️ [RESILIENCE] Unknown Error ({error_msg}) but Tool Data captured. Returning data.")
-                         break
-                    raise e
-
-        print(f"--- [DEBUG] Final Response Length: {len(response_text)} ---")
+                        self.logger.error(f"Runner failed: {e}")
+                        # Validate if we have a valid package before raising
+                        if last_tool_result and isinstance(last_tool_result, dict) and last_tool_result.get("response_type") == "visual_package":
+                             self.logger.warning(f"⚠️ [RESILIENCE] Unknown Error ({error_msg}) but Tool Data captured. Returning data.")
+                             break
+                        raise e
+
+            print(f"--- [DEBUG] Final Response Length: {len(response_text)} ---")
         
-        # 6. Lógica de Respuesta Prioritaria (VisualDataPackage First)
-        if last_tool_result and isinstance(last_tool_result, dict):
-            if last_tool_result.get("response_type") == "visual_package":
-                # Inyectar telemetría para visibilidad en el frontend
-                last_tool_result["telemetry"] = {
-                    "model_turns": turn_count,
-                    "tools_executed": tools_called,
-                    "api_invocations_est": 1 + len(tools_called)
-                }
+            # 6. Lógica de Respuesta Prioritaria (VisualDataPackage First)
+            if last_tool_result and isinstance(last_tool_result, dict):
+                if last_tool_result.get("response_type") == "visual_package":
+                    # Inyectar telemetría para visibilidad en el frontend
+                    last_tool_result["telemetry"] = {
+                        **(last_tool_result.get("telemetry") or {}),
+                        "model_turns": turn_count,
+                        "tools_executed": tools_called,
+                        "api_invocations_est": 1 + len(tools_called)
+                    }
+                    return last_tool_result
+
+            # Fallback Logic
+            if not response_text and last_tool_result:
                 return last_tool_result
-
-        # Fallback Logic
-        if not response_text and last_tool_result:
-            return last_tool_result
         
-        return response_text or "No se pudo generar una respuesta."
+            return response_text or "No se pudo generar una respuesta."
 
 def get_router():
     return AgentRouter()
@@ -11,9 +11,14 @@ from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_excep
 import google.api_core.exceptions
 
 from app.core.config.config import get_settings
+from app.services.llm_hedging import get_llm_hedger
+from app.services.circuit_breaker import CircuitOpenError, LastGoodCache, get_circuit_breaker, is_dependency_failure
 
 logger = logging.getLogger(__name__)
 
+# Última narrativa buena por prompt (fallback si GenAI y el cache de Firestore no responden)
+_last_good_narratives = LastGoodCache(maxsize=512)
+
 
 def _extract_json(text: str) -> Optional[Dict]:
     """
@@ -162,6 +167,7 @@ class ReportInsightGenerator:
 
     def __init__(self):
         settings = get_settings()
+        self.served_stale = False  # True si alguna narrativa se sirvió del último resultado bueno
         try:
             self.client = Client(
                 vertexai=settings.GOOGLE_GENAI_USE_VERTEXAI,
@@ -182,18 +188,19 @@ class ReportInsightGenerator:
         """Generate a deterministic hash for the prompt."""
         return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
 
-    def _check_cache(self, key: str) -> Optional[str]:
-        """Check if insight exists in Firestore cache and is within TTL."""
+    def _check_cache(self, key: str, ignore_ttl: bool = False) -> Optional[str]:
+        """Check if insight exists in Firestore cache and is within TTL (any age if `ignore_ttl`)."""
         if not self.db: return None
 
         try:
             doc_ref = self.cache_collection.document(key)
-            doc = doc_ref.get()
+            with get_circuit_breaker("firestore").guard():
+                doc = doc_ref.get()
 
             if doc.exists:
                 data = doc.to_dict()
                 created_at = data.get('created_at')
-                if created_at:
+                if created_at and not ignore_ttl:
                     age = datetime.now(created_at.tzinfo) - created_at
                     if age.days > self.CACHE_TTL_DAYS:
                         logger.info(f"Cache expired for key {key[:8]}... (age: {age.days}d)")
@@ -210,10 +217,11 @@ class ReportInsightGenerator:
 
         try:
             doc_ref = self.cache_collection.document(key)
-            doc_ref.set({
-                'content': content,
-                'created_at': firestore.SERVER_TIMESTAMP
-            })
+            with get_circuit_breaker("firestore").guard():
+                doc_ref.set({
+                    'content': content,
+                    'created_at': firestore.SERVER_TIMESTAMP
+                })
         except Exception as e:
             logger.warning(f"Cache write failed: {e}")
 
@@ -240,11 +248,14 @@ class ReportInsightGenerator:
                 response_mime_type=response_mime_type
             )
 
-        response = self.client.models.generate_content(
-            model=self.model_name,
-            contents=prompt,
-            config=config
-        )
+        # Hedging por latencia (idempotente): el retry de 429 envuelve a ambos intentos.
+        # Con el circuito de GenAI abierto falla al instante (CircuitOpenError no se reintenta).
+        with get_circuit_breaker("genai").guard():
+            response = get_llm_hedger().call("report_insight", lambda: self.client.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=config
+            ))
         return response.text.strip()
 
     def _generate(self, prompt: str, max_tokens: int = 150, response_mime_type: Optional[str] = None) -> str:
@@ -264,15 +275,29 @@ class ReportInsightGenerator:
 
             # 3. Save Cache
             self._save_cache(cache_key, content)
+            _last_good_narratives.put(cache_key, content)
             return content
 
         except google.api_core.exceptions.ResourceExhausted:
             logger.error("Quota exceeded after retries.")
             return "[AI Narrative Unavailable - Quota Exceeded]"
         except Exception as e:
+            if isinstance(e, CircuitOpenError) or is_dependency_failure(e):
+                stale = self._stale_content(cache_key)
+                if stale:
+                    logger.warning(f"🔌 [CIRCUIT] GenAI degradado ({e}). Sirviendo narrativa previa (stale).")
+                    return stale
             logger.error(f"Error generating insight: {e}")
             return "[AI Narrative Unavailable]"
 
+    def _stale_content(self, cache_key: str) -> Optional[str]:
+        """Última narrativa buena para el prompt: memoria o cache de Firestore vencido."""
+        cached = _last_good_narratives.get(cache_key)
+        content = cached[0] if cached else self._check_cache(cache_key, ignore_ttl=True)
+        if content:
+            self.served_stale = True
+        return content
+
     def generate_report_narratives(self, snapshot: Dict[str, Any], period_display: str) -> Dict[str, str]:
         """
         Receives the full snapshot (results from all blocks) and generates
@@ -309,6 +334,8 @@ IMPORTANTE: Texto plano sin formato. No uses ** ni * ni # ni markdown. El campo
                 # Validate we got at least the critical keys
                 expected_keys = {"critical_insight", "strategic_conclusion", "recommendations"}
                 if expected_keys.intersection(parsed.keys()):
+                    if self.served_stale:
+                        parsed["stale"] = True
                     return parsed
                 logger.warning(f"JSON parsed but missing expected keys. Got: {list(parsed.keys())}")
 
@@ -346,4 +373,6 @@ IMPORTANTE: Texto plano sin formato. No uses ** ni * ni # ni markdown. El campo
                 logger.warning(f"Per-section fallback failed for '{key}': {e}")
                 result[key] = ""
 
+        if self.served_stale:
+            result["stale"] = True
         return result
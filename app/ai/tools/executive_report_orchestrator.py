@@ -1,5 +1,4 @@
 import logging
-import math
 import asyncio
 import re
 from concurrent.futures import ThreadPoolExecutor
@@ -9,10 +8,16 @@ from dateutil.relativedelta import relativedelta
 
 from app.ai.tools.universal_analyst import execute_semantic_query
 from app.ai.tools.executive_insights import ReportInsightGenerator
-from app.services.report_snapshot_service import ReportSnapshotService
+from app.services.report_snapshot_service import get_report_snapshot_service
+from app.services.data_freshness import get_data_freshness_service
+from app.services.query_stats import summarize_jobs
+from app.core.config.config import get_settings
+from app.core.utils.serialization import to_json_safe
 
 logger = logging.getLogger(__name__)
 
+settings = get_settings()
+
 # Thread pool for parallel BQ execution (shared across calls)
 _executor = ThreadPoolExecutor(max_workers=7)
 
@@ -340,11 +345,6 @@ async def generate_executive_report(
             label_period = parsed["display"]
         ctx_label = f"{label_period} | {scope}"
 
-        # Initialize snapshot
-        snapshot_svc = ReportSnapshotService()
-        report_id = snapshot_svc.create_snapshot(periodo_anomes, scope)
-        logger.info(f"Started Report: {report_id} (Granularity: {granularity})")
-
         # 1. Build deterministic query specs (NO Gemini calls)
         all_blocks = _build_report_blocks(parsed, prev_p, uo2_filter)
 
@@ -358,27 +358,48 @@ async def generate_executive_report(
 
         blocks_to_run = {k: all_blocks[k] for k in valid_sections}
 
+        # Memoization: reuse a COMPLETED snapshot for the same period/scope/sections/data version.
+        # Without a readable data version we can't prove the data is unchanged -> always recompute.
+        # Metadata/Firestore reads are sync clients: run them off the event loop.
+        loop = asyncio.get_running_loop()
+        snapshot_svc = get_report_snapshot_service()
+        data_version = await loop.run_in_executor(_executor, get_data_freshness_service().data_version)
+        report_key = None
+        if data_version:
+            report_key = snapshot_svc.build_report_key(periodo_anomes, scope, valid_sections, data_version)
+            cached = await loop.run_in_executor(_executor, snapshot_svc.find_completed_snapshot, report_key)
+            if cached:
+                logger.info(f"♻️ [REPORT MEMO] Reusing snapshot {cached['report_id']} (key {report_key[:8]}..., data {data_version})")
+                return _assemble_report(cached["report_id"], ctx_label, cached.get("blocks") or {}, cached.get("narratives") or {}, [])
+
+        # Fire-and-forget: snapshot writes go through the write-behind queue
+        report_id = snapshot_svc.create_snapshot(periodo_anomes, scope, report_key=report_key)
+        logger.info(f"Started Report: {report_id} (Granularity: {granularity})")
+
         # 3. Execute ALL blocks in parallel via ThreadPoolExecutor
-        loop = asyncio.get_event_loop()
         futures = [
             loop.run_in_executor(_executor, _execute_block, key, spec, ctx_label)
             for key, spec in blocks_to_run.items()
         ]
 
         logger.info(f"Dispatching {len(futures)} blocks in parallel...")
-        completed = await asyncio.gather(*futures)
 
-        # Collect results (includes both successes and graceful errors)
-        results = dict(completed)
+        # 4. Store each block as soon as it completes (batched by the writer)
+        completed = {}
+        for next_done in asyncio.as_completed(futures):
+            key, result = await next_done
+            completed[key] = result
+            snapshot_svc.save_block(report_id, key, result)
+        snapshot_svc.update_status(report_id, "DATA_GATHERED")
+
+        # Collect results in section order (includes both successes and graceful errors)
+        results = {k: completed[k] for k in blocks_to_run}
 
         # Count failures for logging
         failed = [k for k, v in results.items() if v.get("response_type") == "error"]
         if failed:
             logger.warning(f"Blocks with errors: {failed}")
 
-        # 4. Store snapshot
-        snapshot_svc.update_snapshot(report_id, results, status="DATA_GATHERED")
-
         # 5. Generate holistic narratives (only if we have meaningful data)
         successful_results = {k: v for k, v in results.items() if v.get("response_type") != "error"}
         ai_narratives = {}
@@ -390,70 +411,91 @@ async def generate_executive_report(
             )
             snapshot_svc.save_narratives(report_id, ai_narratives)
 
-        # 6. Assemble Visual Package
-        content_blocks = [
-            {"type": "text", "payload": f"Reporte Ejecutivo: {ctx_label}", "variant": "h2"},
-            {"type": "text", "payload": ai_narratives.get("critical_insight", "Generando resumen..."), "variant": "insight"}
-        ]
+            # Only fully successful (and fresh) reports are reusable
+            stale = ai_narratives.get("stale") or any(v.get("stale") for v in successful_results.values())
+            if report_key and not failed and not stale:
+                snapshot_svc.register_snapshot(report_key, report_id)
 
-        # Headline KPIs
-        if "headline_current" in results:
-            content_blocks.extend(results["headline_current"].get("content", []))
-
-        # Segmentation
-        if "segmentation" in results:
-            content_blocks.append({"type": "text", "payload": "Análisis por Segmento", "variant": "h3"})
-            content_blocks.extend(results["segmentation"].get("content", []))
-            content_blocks.append({"type": "text", "payload": ai_narratives.get("segmentation", ""), "variant": "standard"})
-
-        # Voluntary
-        if "voluntary" in results:
-            content_blocks.append({"type": "text", "payload": "Distribución de Rotación Voluntaria", "variant": "h3"})
-            content_blocks.extend(results["voluntary"].get("content", []))
-            content_blocks.append({"type": "text", "payload": ai_narratives.get("voluntary_trend", ""), "variant": "standard"})
-
-        # Talent
-        if "talent" in results and results["talent"].get("content"):
-            content_blocks.append({"type": "text", "payload": "Fuga de Talento Crítico", "variant": "h3"})
-            content_blocks.extend(results["talent"].get("content", []))
-            content_blocks.append({"type": "text", "payload": ai_narratives.get("talent_leakage", ""), "variant": "insight"})
-
-        # Trend
-        if "trend" in results:
-            content_blocks.append({"type": "text", "payload": "Evolución de Rotación", "variant": "h3"})
-            content_blocks.extend(results["trend"].get("content", []))
-
-        # Strategic Conclusion
-        content_blocks.append({"type": "text", "payload": "Conclusión Estratégica", "variant": "h3"})
-        content_blocks.append({"type": "text", "payload": ai_narratives.get("strategic_conclusion", ""), "variant": "standard"})
-
-        # Recommendations
-        recs = ai_narratives.get("recommendations")
-        if recs:
-            if isinstance(recs, list):
-                recs_text = "\n".join([f"• {r}" for r in recs])
-            else:
-                recs_text = str(recs)
-            content_blocks.append({"type": "text", "payload": "Recomendaciones Tácticas (AI Expert)", "variant": "h3"})
-            content_blocks.append({"type": "text", "payload": recs_text, "variant": "insight"})
-
-        return _sanitize_output({
-            "response_type": "visual_package",
-            "summary": f"Reporte Ejecutivo de Rotación - ID: {report_id}",
-            "content": content_blocks,
-            "metadata": {"report_id": report_id, "failed_blocks": failed}
-        })
+        # 6. Assemble Visual Package
+        return _assemble_report(report_id, ctx_label, results, ai_narratives, failed)
 
     except Exception as e:
         logger.error(f"Error in Executive Report Orchestrator: {e}", exc_info=True)
         return {"response_type": "error", "summary": f"Error: {str(e)}", "content": []}
 
 
+def _assemble_report(report_id: str, ctx_label: str, results: Dict[str, Any], ai_narratives: Dict[str, Any], failed: List[str]) -> Dict[str, Any]:
+    """Builds the final Visual Package from block results and narratives (fresh or memoized)."""
+    content_blocks = [
+        {"type": "text", "payload": f"Reporte Ejecutivo: {ctx_label}", "variant": "h2"},
+        {"type": "text", "payload": ai_narratives.get("critical_insight", "Generando resumen..."), "variant": "insight"}
+    ]
+
+    # Headline KPIs
+    if "headline_current" in results:
+        content_blocks.extend(results["headline_current"].get("content", []))
+
+    # Segmentation
+    if "segmentation" in results:
+        content_blocks.append({"type": "text", "payload": "Análisis por Segmento", "variant": "h3"})
+        content_blocks.extend(results["segmentation"].get("content", []))
+        content_blocks.append({"type": "text", "payload": ai_narratives.get("segmentation", ""), "variant": "standard"})
+
+    # Voluntary
+    if "voluntary" in results:
+        content_blocks.append({"type": "text", "payload": "Distribución de Rotación Voluntaria", "variant": "h3"})
+        content_blocks.extend(results["voluntary"].get("content", []))
+        content_blocks.append({"type": "text", "payload": ai_narratives.get("voluntary_trend", ""), "variant": "standard"})
+
+    # Talent
+    if "talent" in results and results["talent"].get("content"):
+        content_blocks.append({"type": "text", "payload": "Fuga de Talento Crítico", "variant": "h3"})
+        content_blocks.extend(results["talent"].get("content", []))
+        content_blocks.append({"type": "text", "payload": ai_narratives.get("talent_leakage", ""), "variant": "insight"})
+
+    # Trend
+    if "trend" in results:
+        content_blocks.append({"type": "text", "payload": "Evolución de Rotación", "variant": "h3"})
+        content_blocks.extend(results["trend"].get("content", []))
+
+    # Strategic Conclusion
+    content_blocks.append({"type": "text", "payload": "Conclusión Estratégica", "variant": "h3"})
+    content_blocks.append({"type": "text", "payload": ai_narratives.get("strategic_conclusion", ""), "variant": "standard"})
+
+    # Recommendations
+    recs = ai_narratives.get("recommendations")
+    if recs:
+        if isinstance(recs, list):
+            recs_text = "\n".join([f"• {r}" for r in recs])
+        else:
+            recs_text = str(recs)
+        content_blocks.append({"type": "text", "payload": "Recomendaciones Tácticas (AI Expert)", "variant": "h3"})
+        content_blocks.append({"type": "text", "payload": recs_text, "variant": "insight"})
+
+    return _sanitize_output({
+        "response_type": "visual_package",
+        "summary": f"Reporte Ejecutivo de Rotación - ID: {report_id}",
+        "content": content_blocks,
+        "metadata": {
+            "report_id": report_id,
+            "failed_blocks": failed,
+            # Bloques/narrativas servidos del último resultado bueno (dependencia degradada)
+            "stale_blocks": [k for k, v in results.items() if v.get("stale")],
+            "stale_narratives": bool(ai_narratives.get("stale")),
+            "bq_stats": _report_query_stats(results),
+        }
+    })
+
+
+def _report_query_stats(results: Dict[str, Any]) -> Dict[str, Any]:
+    """Estadísticas de BigQuery por bloque (telemetría de execute_semantic_query) + total del reporte."""
+    blocks = {k: (v.get("telemetry") or {}).get("bq_stats") for k, v in results.items()}
+    blocks = {k: stats for k, stats in blocks.items() if stats}
+    per_block = {k: {f: v for f, v in stats.items() if f != "by_job"} for k, stats in blocks.items()}
+    all_jobs = [job for stats in blocks.values() for job in stats.get("by_job", [])]
+    return {"blocks": per_block, "total": summarize_jobs(all_jobs)}
+
+
 def _sanitize_output(payload: Dict) -> Dict:
-    """Recursively clean payload for JSON safety (NaN, Inf → None)."""
-    def clean(obj):
-        if isinstance(obj, list): return [clean(x) for x in obj]
-        if isinstance(obj, dict): return {k: clean(v) for k, v in obj.items()}
-        if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)): return None
-        return obj
-    return clean(payload)
+    """Clean payload for JSON safety (NaN, Inf → None) in a single orjson pass."""
+    return to_json_safe(payload)
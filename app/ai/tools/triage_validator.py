@@ -1,6 +1,8 @@
 from typing import Optional, Dict, Any
 from app.services.bigquery import get_bq_service
 from app.core.config.config import get_settings
+from app.services.partition_pruning import month_index, periodo_range_predicate
+from app.services.data_freshness import get_data_freshness_service
 
 settings = get_settings()
 bq_service = get_bq_service()
@@ -43,25 +45,23 @@ def validate_dimensions(
 
     # Validar Datos del Año si se proporciona
     if year:
-        query_year = f"""
-            SELECT COUNT(*) as count
-            FROM `{table_id}`
-            WHERE EXTRACT(YEAR FROM fecha_corte) = {year}
-            OR EXTRACT(YEAR FROM fecha_cese) = {year}
-            LIMIT 1
-        """
-        df_year = bq_service.execute_query(query_year)
-        count = df_year.iloc[0]['count'] if not df_year.empty else 0
+        # Filas por año desde la metadata de frescura cacheada (sin consultar BigQuery)
+        freshness = get_data_freshness_service()
+        count = freshness.year_row_count(int(year))
+        if count is None:
+            # Metadata no disponible: rango literal sobre periodo (solo escanea ese año)
+            query_year = f"""
+                SELECT COUNT(*) as count
+                FROM `{table_id}`
+                WHERE {periodo_range_predicate(month_index(int(year), m) for m in range(1, 13))}
+                LIMIT 1
+            """
+            df_year = bq_service.execute_query(query_year)
+            count = df_year.iloc[0]['count'] if not df_year.empty else 0
         if count == 0:
             results["has_data_for_year"] = False
-            # Consultar y sugerir años disponibles
-            query_avail = f"""
-                SELECT DISTINCT EXTRACT(YEAR FROM fecha_corte) as y 
-                FROM `{table_id}` 
-                ORDER BY 1 DESC LIMIT 5
-            """
-            df_avail = bq_service.execute_query(query_avail)
-            avail_years = [str(int(r['y'])) for _, r in df_avail.iterrows()]
+            # Sugerir años disponibles
+            avail_years = [str(y) for y in freshness.available_years()[:5]]
             results["message"] += f"No hay datos para el año {year}. Años disponibles: {', '.join(avail_years)}. "
 
     if not results["message"]:
@@ -1,11 +1,17 @@
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Tuple, Union
 from app.services.bigquery import get_bq_service
-from app.services.query_generator import build_analytical_query
+from app.services.speculative_query import get_speculative_executor
+from app.services.trend_partition_cache import get_trend_partition_cache
+from app.services.comparison_group_cache import get_comparison_group_cache
+from app.services.query_generator import build_analytical_query, select_builder_name
+from app.services.query_cost import get_query_cost_estimator, suggest_narrowing
+from app.services.circuit_breaker import CircuitOpenError, LastGoodCache, is_dependency_failure
+from app.services.query_stats import collect_query_stats, summarize_jobs, get_query_stats_aggregator
 from app.schemas.analytics import SemanticRequest
 from app.schemas.payloads import (
     VisualDataPackage, KPIBlock, ChartBlock, TableBlock, 
     KPIItem, ChartPayload, Dataset, ChartMetadata, TablePayload,
-    MetricFormat
+    MetricFormat, TablePagination
 )
 from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
 import pandas as pd
@@ -14,17 +20,44 @@ import math
 
 from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY, DEFAULT_FILTERS
 import pandas as pd
+import numpy as np
 import json
 import math
+import hashlib
 import logging
 
+from app.core.utils.serialization import to_json_safe
+from app.core.utils.server_timing import record_timing
+from app.core.utils.perf_logger import log_perf
+from app.core.config.config import get_settings
+
 logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Último VisualDataPackage bueno por consulta: se sirve (stale) si BigQuery está degradado
+_last_good_packages = LastGoodCache(maxsize=256)
 
 # --- CONSTANTS ---
 # (Removed MONTH_MAP, now in Registry)
 
+# Prefijo del summary del paquete de error (execute_semantic_query no lanza excepciones)
+ERROR_SUMMARY_PREFIX = "⚠️ Error procesando consulta"
+
 # --- HELPER FUNCTIONS ---
 
+def _resolve_axis_domain(x_dim: str, req: SemanticRequest) -> Optional[List[Any]]:
+    """
+    Dominio completo esperado del Eje X.
+    
+    El dominio se deriva de la intención explícita del usuario: una lista de valores
+    en el filtro de la misma dimensión (ej: anio=[2024, 2025] o mes=[1..12]).
+    Si el filtro no es una lista, no hay "comparación explícita" que rellenar.
+    """
+    for f in req.cube_query.filters or []:
+        if f.dimension == x_dim:
+            return f.value if isinstance(f.value, list) else None
+    return None
+
 def _ensure_dataframe_completeness(df: pd.DataFrame, req: SemanticRequest) -> pd.DataFrame:
     """
     Middleware de Completitud: Garantiza que la estructura de datos
@@ -33,60 +66,44 @@ def _ensure_dataframe_completeness(df: pd.DataFrame, req: SemanticRequest) -> pd
     
     Estrategia: 'Zero-Filling' basado en Filtros Explícitos.
     Si el filtro es anio=[2024, 2025] y SQL solo trae 2025, inyectamos 2024=0.
+    Las filas faltantes se construyen en bloque (columnar), sin bucles por fila.
     """
     if not req.cube_query.dimensions:
         return df
 
-    # 1. Identificar Eje Principal (X-Axis)
+    # 1. Identificar Eje Principal (X-Axis) y su Dominio
     x_dim = req.cube_query.dimensions[0] 
+    domain = _resolve_axis_domain(x_dim, req)
     
-    # 2. Verificar filtros y Completeness
-    if req.cube_query.filters:
-        # Verificar si hay una intención explícita de rango/lista en ese eje
-        filter_vals = None
-        for f in req.cube_query.filters:
-            if f.dimension == x_dim:
-                filter_vals = f.value
-                break
-        
-        # Si no es una lista, no hay "comparación explícita" que rellenar
-        if isinstance(filter_vals, list):
-            # 3. Calcular Delta (Lo que esperamos vs Lo que llegó)
-            expected_keys = set(str(v) for v in filter_vals)
+    if domain is not None:
+        # 2. Calcular Delta (Lo que esperamos vs Lo que llegó)
+        expected_keys = set(str(v) for v in domain)
+        
+        if df.empty:
+            actual_keys = set()
+            # Si está vacío, necesitamos inicializar el DF con las columnas correctas
+            columns = req.cube_query.dimensions + req.cube_query.metrics
+            df = pd.DataFrame(columns=columns)
+        else:
+            actual_keys = set(df[x_dim].astype(str).unique())
             
-            if df.empty:
-                actual_keys = set()
-                # Si está vacío, necesitamos inicializar el DF con las columnas correctas
-                columns = req.cube_query.dimensions + req.cube_query.metrics
-                df = pd.DataFrame(columns=columns)
-            else:
-                actual_keys = set(df[x_dim].astype(str).unique())
-                
-            missing_keys = expected_keys - actual_keys
+        missing_keys = expected_keys - actual_keys
+        
+        if missing_keys:
+            print(f"🧱 [MIDDLEWARE] Data Completeness: Injecting missing keys for {x_dim}: {missing_keys}")
             
-            if missing_keys:
-                print(f"🧱 [MIDDLEWARE] Data Completeness: Injecting missing keys for {x_dim}: {missing_keys}")
-                
-                # 4. Inyectar Filas Faltantes (Zero-Filling)
-                new_rows = []
-                for mis in missing_keys:
-                    # Intentar mantener el tipo de dato original si es posible
-                    val = int(mis) if str(mis).isdigit() else mis
-                    
-                    row = {x_dim: val}
-                    
-                    # Rellenar métricas con NaN (= "no data", not "zero")
-                    # NaN → None in JSON → Chart.js breaks line (no point drawn)
-                    for m in req.cube_query.metrics:
-                        row[m] = float('nan')
-                        
-                    # Otras dimensiones: "N/A" o Contextual
-                    new_rows.append(row)
-                
-                df_fill = pd.DataFrame(new_rows)
-                df = pd.concat([df, df_fill], ignore_index=True)
+            # 3. Inyectar Filas Faltantes (Zero-Filling columnar)
+            # Intentar mantener el tipo de dato original si es posible
+            fill = {x_dim: [int(mis) if str(mis).isdigit() else mis for mis in missing_keys]}
+            
+            # Rellenar métricas con NaN (= "no data", not "zero")
+            # NaN → None in JSON → Chart.js breaks line (no point drawn)
+            for m in req.cube_query.metrics:
+                fill[m] = [float('nan')] * len(missing_keys)
+            
+            df = pd.concat([df, pd.DataFrame(fill)], ignore_index=True)
     
-    # 5. Ordenamiento (Crucial para series temporales)
+    # 4. Ordenamiento (Crucial para series temporales)
     # Usar metadata del registro si está disponible
     x_meta = DIMENSIONS_REGISTRY.get(x_dim, {})
     if x_meta.get("type") == "temporal" or x_meta.get("sorting") == "numeric":
@@ -98,6 +115,48 @@ def _ensure_dataframe_completeness(df: pd.DataFrame, req: SemanticRequest) -> pd
             
     return df
 
+def _build_series_grid(df: pd.DataFrame, x_dim: str, group_dim: str) -> tuple:
+    """
+    Motor de Balanceo Vectorizado (Pivot + Reindex) para gráficos multi-serie.
+    
+    Calcula, en una sola pasada, la posición de la primera fila de cada
+    combinación (grupo × etiqueta del Eje X). Las combinaciones sin datos quedan en -1.
+    
+    Returns:
+        (raw_labels, group_index, grid):
+        - raw_labels: Etiquetas del Eje X (str) en orden de aparición.
+        - group_index: Dict valor_grupo -> fila del grid.
+        - grid: np.ndarray [n_grupos, n_labels] con posiciones de fila o -1.
+    """
+    x_codes, x_uniques = pd.factorize(df[x_dim].astype(str), use_na_sentinel=False)
+    g_codes, g_uniques = pd.factorize(df[group_dim])
+    raw_labels = x_uniques.tolist()
+    
+    grid = np.full((len(g_uniques), len(raw_labels)), -1, dtype=np.int64)
+    valid = g_codes >= 0
+    if valid.any():
+        keys = g_codes[valid].astype(np.int64) * len(raw_labels) + x_codes[valid]
+        unique_keys, first_pos = np.unique(keys, return_index=True)
+        grid.flat[unique_keys] = np.flatnonzero(valid)[first_pos]
+    
+    # Una etiqueta nula nunca coincide por igualdad de texto: columna sin datos
+    null_labels = [i for i, lbl in enumerate(raw_labels) if pd.isna(lbl)]
+    if null_labels:
+        grid[:, null_labels] = -1
+    
+    group_index = {g: i for i, g in enumerate(g_uniques.tolist())}
+    return raw_labels, group_index, grid
+
+def _row_aligned_values(df: pd.DataFrame, col: str):
+    """
+    Retorna los valores de una columna con el mismo tipo escalar que produce
+    el acceso por fila (df.iloc[i][col]), para preservar el payload serializado.
+    """
+    row_dtype = df.iloc[0].dtype
+    if row_dtype == object:
+        return df[col].array
+    return df[col].astype(row_dtype).array
+
 def _format_kpi_block(df: pd.DataFrame, metrics: List[str]) -> KPIBlock:
     """Transforma una fila de resultados en bloque de KPIs."""
     items = []
@@ -173,7 +232,7 @@ def _format_chart_block(df: pd.DataFrame, req: SemanticRequest) -> ChartBlock:
     # 2. Generar Datasets
     if group_dim:
         # MODO A: AGRUPADO (Multi-Series por una Dimensión, solo 1ra métrica)
-        raw_labels = df[x_dim].astype(str).unique().tolist()
+        raw_labels, group_index, grid = _build_series_grid(df, x_dim, group_dim)
         
         if x_meta.get("label_mapping"):
             mapping = x_meta["label_mapping"]
@@ -192,34 +251,29 @@ def _format_chart_block(df: pd.DataFrame, req: SemanticRequest) -> ChartBlock:
         
         metric_key = req.cube_query.metrics[0] if req.cube_query.metrics else df.columns[0]
         
+        # Alineación de cada serie con los labels del eje X (sin escaneos por celda)
+        metric_values = _row_aligned_values(df, metric_key)
+        info_cols = [
+            i_key for i_key in METRICS_REGISTRY.get(metric_key, {}).get("informative_metrics", [])
+            if i_key in df.columns
+        ]
+        info_values = {i_key: _row_aligned_values(df, i_key) for i_key in info_cols}
+        missing_row = np.full(len(raw_labels), -1, dtype=np.int64)
+        
         for g_val in raw_groups:
-            # Subset para este grupo
-            subset = df[df[group_dim] == g_val].copy()
-            
-            # Asegurar alineación con labels del eje X
-            data_points = []
-            for lbl in raw_labels:
-                match = subset[subset[x_dim].astype(str) == lbl]
-                data_points.append(match.iloc[0][metric_key] if not match.empty else None)
+            positions = grid[group_index[g_val]] if g_val in group_index else missing_row
+            data_points = [metric_values[p] if p >= 0 else None for p in positions]
             
             ds_label = str(g_val)
             if group_meta.get("label_mapping"):
                 ds_label = group_meta["label_mapping"].get(str(g_val), str(g_val))
             
             # En modo agrupado, related_datasets se aplica a la misma métrica pero filtrada por grupo
-            # Rebalanceamos el subset para que coincida con raw_labels para las métricas informativas
-            balanced_subset = []
-            for lbl in raw_labels:
-                match = subset[subset[x_dim].astype(str) == lbl]
-                if not match.empty:
-                    balanced_subset.append(match.iloc[0])
-                else:
-                    # Fill with NaN for missing data points (not zero)
-                    row = {col: float('nan') for col in subset.columns}
-                    row[x_dim] = lbl
-                    balanced_subset.append(pd.Series(row))
-            
-            df_balanced = pd.DataFrame(balanced_subset)
+            # Las posiciones sin dato se rellenan con NaN (not zero)
+            df_balanced = pd.DataFrame({
+                i_key: pd.Series([vals[p] if p >= 0 else float('nan') for p in positions])
+                for i_key, vals in info_values.items()
+            })
             
             datasets.append(Dataset(
                 label=ds_label,
@@ -381,9 +435,11 @@ def _format_pie_strategy(df: pd.DataFrame, req: SemanticRequest) -> ChartBlock:
     )
 
 from app.core.utils.formatting import format_dataframe_for_export
-from app.core.auth.security import mask_document_id, mask_salary
+from app.core.auth.security import (
+    mask_document_id, mask_salary, create_listing_cursor, decode_listing_cursor, current_listing_owner
+)
 
-def _format_table_block(df: pd.DataFrame, title: str = "Detalle de Datos") -> TableBlock:
+def _format_table_block(df: pd.DataFrame, title: str = "Detalle de Datos", pagination: Optional[TablePagination] = None) -> TableBlock:
     """Transforma DF en Tabla (Formato Records para compatibilidad Schema)."""
     
     records = format_dataframe_for_export(df)
@@ -392,22 +448,53 @@ def _format_table_block(df: pd.DataFrame, title: str = "Detalle de Datos") -> Ta
             headers=df.columns.tolist(),
             rows=records
         ),
-        metadata=ChartMetadata(title=title, show_legend=False)
+        metadata=ChartMetadata(title=title, show_legend=False),
+        pagination=pagination
     )
 
 
+def _build_listing_pagination(
+    table_id: Optional[str], offset: int, page_size: int, total: int, owner: Optional[str]
+) -> Optional[TablePagination]:
+    """
+    Metadata de paginación; `next_cursor` solo si quedan filas en la tabla destino.
+    Sin usuario dueño (fuera de un request) no se emite cursor: nadie podría usarlo.
+    """
+    if not table_id or not owner:
+        return None
+    next_offset = offset + page_size
+    next_cursor = create_listing_cursor(table_id, next_offset, page_size, total, owner) if next_offset < total else None
+    return TablePagination(offset=offset, page_size=page_size, total=total, next_cursor=next_cursor)
+
+
+def fetch_listing_page(cursor: str, username: str, title: str = "Detalle de Datos") -> Dict[str, Any]:
+    """
+    Siguiente página de un LISTING a partir de su cursor.
+    Lee directamente la tabla destino del job original (list_rows): sin re-ejecutar SQL ni re-escanear.
+
+    Raises:
+        ValueError: Cursor inválido, expirado o emitido para otro usuario.
+    """
+    state = decode_listing_cursor(cursor, username)
+    table_id, offset, page_size, total = state["tbl"], state["off"], state["ps"], state["tot"]
+
+    df = get_bq_service().read_table_page(table_id, offset, page_size)
+    pagination = _build_listing_pagination(table_id, offset, page_size, total, username)
+
+    last = offset + len(df)
+    pkg = VisualDataPackage(
+        summary=f"✅ Mostrando registros {offset + 1:,}–{last:,} de {total:,}.",
+        content=[_format_table_block(df, title=title, pagination=pagination)]
+    )
+    return _sanitize_payload(pkg.model_dump())
+
+
 def _sanitize_payload(obj: Any) -> Any:
     """
-    Recursively replaces NaN and Infinity with None to ensure valid JSON for LLM.
+    Replaces NaN and Infinity with None to ensure valid JSON for LLM.
+    Single C pass (orjson) instead of a recursive Python walk.
     """
-    if isinstance(obj, dict):
-        return {k: _sanitize_payload(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_sanitize_payload(v) for v in obj]
-    elif isinstance(obj, float):
-        if math.isnan(obj) or math.isinf(obj):
-            return None
-    return obj
+    return to_json_safe(obj)
 
 
 def _generate_context_string(filters: Dict[str, Any]) -> str:
@@ -442,8 +529,243 @@ def _generate_context_string(filters: Dict[str, Any]) -> str:
         
     return " | ".join(parts)
 
+def _over_budget_package(estimated_bytes: int, budget_bytes: int, req: SemanticRequest, filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Respuesta amigable para consultas que superan el presupuesto de bytes (no se ejecutan)."""
+    suggestions = suggest_narrowing(filters, req.cube_query.dimensions, req.intent)
+    tips = "\n".join(f"   • {s}" for s in suggestions) or "   • Agrega filtros más específicos"
+    pkg = VisualDataPackage(
+        summary=f"💸 Esta consulta procesaría ~{estimated_bytes / 1e9:.2f} GB en BigQuery y supera "
+                f"el presupuesto por consulta ({budget_bytes / 1e9:.2f} GB).\n\n"
+                f"💡 **Por favor, acota tu consulta**:\n{tips}",
+        content=[]
+    )
+    result = pkg.model_dump()
+    result["telemetry"] = {"bq_estimated_bytes": estimated_bytes, "bq_rejected": True}
+    return result
+
 # --- MAIN EXECUTOR ---
 
+def _prepare_semantic_query(
+    intent: str,
+    cube_query: Dict[str, Any],
+    metadata: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    comparison_groups: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Normaliza el request del LLM y arma los parámetros del generador SQL.
+    Compartido por `execute_semantic_query` y el endpoint de exportación (misma SQL).
+
+    Returns:
+        Dict con `req` (SemanticRequest), `query_params`, `filters_dict`,
+        `final_title` y `limit` (límite efectivo tras SMART LIMITS).
+    """
+    # A. Resilience Layer: Corregir variaciones comunes del LLM antes de Pydantic
+    if metadata and "requested_viz" in metadata:
+        viz = str(metadata["requested_viz"]).upper()
+        mapping = {
+            "LINE": "LINE_CHART",
+            "BAR": "BAR_CHART",
+            "PIE": "PIE_CHART",
+            "TORTA": "PIE_CHART",
+            "PASTEL": "PIE_CHART",
+            "DONUT": "PIE_CHART",
+            "KPI": "KPI_ROW",
+            "GRAPH": "LINE_CHART",
+            "CHART": "SMART_AUTO"
+        }
+        if viz in mapping:
+            metadata["requested_viz"] = mapping[viz]
+
+    # 1. Parsear Request v2.1
+    full_payload = {
+        "intent": intent,
+        "cube_query": cube_query,
+        "metadata": metadata or {}
+    }
+
+    # --- BUSINESS RULE: DEFAULT FILTERS FROM REGISTRY ---
+    # Aplicar reglas de negocio definidas en Registry de forma agnóstica
+    intent_defaults = DEFAULT_FILTERS.get(intent, [])
+    if intent_defaults:
+        current_filters = cube_query.get("filters", [])
+        for rule in intent_defaults:
+            should_apply = True
+            # verificar missing conditions
+            if "condition_missing" in rule:
+                for dim_check in rule["condition_missing"]:
+                     # Chequear si esa dimension ya existe en los filtros actuales
+                     if any(str(f.get("dimension","")).lower() == dim_check for f in current_filters):
+                         should_apply = False
+                         break
+
+            if should_apply:
+                logger.info(f"🔍 [TRACE] Aplicando Default Rule: {rule['dimension']}={rule['value']}")
+                current_filters.append({"dimension": rule["dimension"], "value": rule["value"]})
+
+        cube_query["filters"] = current_filters
+    # ------------------------------------------------
+
+    req = SemanticRequest(**full_payload)
+
+    # 2. Construir SQL Optimizado
+    filters_dict = {}
+    # --- RESILIENCE: Validar intent ---
+    if req.intent not in ["COMPARISON", "TREND", "SNAPSHOT", "LISTING"]:
+        raise ValueError(f"Intent inválido: {req.intent}")
+
+
+    # --- SMART LIMITS para LISTING ---
+    # Permitir límite configurable desde cube_query con validación
+    MAX_LISTING_LIMIT = 5000  # Límite máximo de seguridad
+    DEFAULT_LISTING_LIMIT = 50  # Límite por defecto
+
+    if req.intent == "LISTING":
+        if limit:
+            # Si se especificó un límite explícito, validarlo
+            limit = min(limit, MAX_LISTING_LIMIT)
+            logger.info(f"🔍 [TRACE] LISTING query: usando límite solicitado de {limit} registros (max: {MAX_LISTING_LIMIT})")
+        else:
+            # Límite por defecto
+            limit = DEFAULT_LISTING_LIMIT
+            logger.info(f"🔍 [TRACE] LISTING query: aplicando límite default de {limit} registros")
+    elif limit is None:
+        limit = 5000  # Default para queries de métricas
+
+    # 2. Generar SQL (usando el Registry para validar dimensiones/métricas)
+    for f in req.cube_query.filters:
+        # --- STATIC GROUP EXPANSION (Registry) ---
+        # Si el valor del filtro coincide con una clave en 'value_groups', expandirlo.
+        expanded_values = []
+        raw_values = f.value if isinstance(f.value, list) else [f.value]
+
+        dim_def = DIMENSIONS_REGISTRY.get(f.dimension, {})
+
+        # [NEW] Normalización de Casing (Force Upper)
+        if dim_def.get("force_upper"):
+            # Preservar el tipo si no es string, pero si es string, upper
+            raw_values = [str(v).upper() if isinstance(v, str) else v for v in raw_values]
+            logger.info(f"🔠 [CASE NORM] Normalizando valores de {f.dimension} a UPPERCASE: {raw_values}")
+
+        has_groups = "value_groups" in dim_def
+
+        for val in raw_values:
+            if has_groups and val in dim_def["value_groups"]:
+                logger.info(f"✨ [GROUP EXPANSION] Expandiendo '{val}' -> {dim_def['value_groups'][val]}")
+                expanded_values.extend(dim_def["value_groups"][val])
+            else:
+                expanded_values.append(val)
+
+        # Actualizar filters_dict
+        if f.dimension in filters_dict:
+            current_val = filters_dict[f.dimension]
+            if not isinstance(current_val, list):
+                current_val = [current_val]
+            current_val.extend(expanded_values)
+            filters_dict[f.dimension] = list(set(current_val))
+        else:
+            # Si es un solo valor y no es lista, mantenerlo simple, sino lista
+            if len(expanded_values) == 1:
+                filters_dict[f.dimension] = expanded_values[0]
+            else:
+                filters_dict[f.dimension] = list(set(expanded_values))
+
+    # --- CONTEXTUAL TITLE GENERATION ---
+    # El agente ya incluye contexto en title_suggestion, no duplicar
+    base_title = req.metadata.title_suggestion or "Análisis de Datos"
+    final_title = base_title  # Usar título del agente sin modificar
+
+    req.metadata.title_suggestion = final_title
+    # -----------------------------------
+
+    # Usamos el limit opcional si viene, si no el default del generador (1000)
+    query_params = {
+        "metrics": req.cube_query.metrics,
+        "dimensions": req.cube_query.dimensions,
+        "filters": filters_dict
+    }
+    if limit:
+        query_params["limit"] = limit
+
+    if comparison_groups:
+        query_params["comparison_groups"] = comparison_groups
+
+    # --- DYNAMIC AD-HOC GROUPS ---
+    # Si el LLM definió grupos ad-hoc, los pasamos al generador
+    if hasattr(req.cube_query, "adhoc_groups") and req.cube_query.adhoc_groups:
+        query_params["adhoc_groups"] = req.cube_query.adhoc_groups
+
+        # También debemos asegurar que los valores del grupo estén permitidos en los filtros
+        # (Si no hay filtro explícito, el grupo actúa como filtro implícito)
+        for grp in req.cube_query.adhoc_groups:
+            if grp.dimension not in filters_dict:
+                logger.info(f"🧩 [AD-HOC FILTER] Aplicando filtro implícito para grupo: {grp.label}")
+                filters_dict[grp.dimension] = grp.values
+            else:
+                # Si ya hay filtro, aseguramos que los valores del grupo esten incluidos?
+                # Por ahora asumimos que el filtro explícito manda o ya incluye lo necesario.
+                pass
+
+    # --- AUTO-INJECT INFORMATIVE METRICS (Tooltip Enhancement) ---
+    # Si la métrica tiene "informative_metrics" definidos en Registry,
+    # los agregamos a la query aunque el usuario no los haya pedido explícitamente.
+    # Esto sirve para que el frontend tenga datos de contexto (ej: Denominador en un Ratio).
+
+    # 1. Identificar métricas extra necesarias
+    extra_metrics = set()
+    for m_key in req.cube_query.metrics:
+        m_def = METRICS_REGISTRY.get(m_key, {})
+        if "informative_metrics" in m_def:
+            for info_m in m_def["informative_metrics"]:
+                if info_m not in req.cube_query.metrics:
+                    extra_metrics.add(info_m)
+
+    # 2. Inyectar en query_params si hay extras
+    if extra_metrics:
+        logger.info(f"💉 [AUTO-INJECT] Agregando métricas informativas: {extra_metrics}")
+        # Importante: Agregamos al final para no alterar el orden de las métricas principales
+        # (que determina el color/orden principal del gráfico)
+        query_params["metrics"] = req.cube_query.metrics + list(extra_metrics)
+    # -------------------------------------------------------------
+
+    return {
+        "req": req,
+        "query_params": query_params,
+        "filters_dict": filters_dict,
+        "final_title": final_title,
+        "limit": limit
+    }
+
+
+def _last_good_key(req: SemanticRequest, sql_query: str, limit: Optional[int]) -> str:
+    return hashlib.sha256(json.dumps({
+        "intent": req.intent,
+        "sql": " ".join(sql_query.split()),
+        "metadata": req.metadata.model_dump(),
+        "limit": limit,
+    }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _stale_package(key: str, error: Exception) -> Optional[Dict[str, Any]]:
+    """Último resultado bueno de la consulta marcado como stale (None si nunca se ejecutó)."""
+    cached = _last_good_packages.get(key)
+    if cached is None:
+        return None
+    package, stored_at = cached
+    logger.warning(f"🔌 [CIRCUIT] BigQuery degradado ({error}). Sirviendo resultado previo de {stored_at}")
+    return {
+        **package,
+        "summary": f"{package.get('summary', '')}\n\n⚠️ Datos en caché del {stored_at} (BigQuery no disponible temporalmente).",
+        "stale": True,
+        "stale_as_of": stored_at,
+    }
+
+
+def is_error_package(package: Dict[str, Any]) -> bool:
+    """True si `execute_semantic_query` capturó un fallo (BigQuery, runtime) y retornó el paquete de error."""
+    return str(package.get("summary") or "").startswith(ERROR_SUMMARY_PREFIX)
+
+
 def execute_semantic_query(
     intent: str, 
     cube_query: Dict[str, Any], 
@@ -469,199 +791,133 @@ def execute_semantic_query(
     Returns:
         Dict con VisualDataPackage
     """
-    import time
-    t_start = time.time()
-    timing = {}
-    
-    try:
-        t_step = time.time()
-        # A. Resilience Layer: Corregir variaciones comunes del LLM antes de Pydantic
-        if metadata and "requested_viz" in metadata:
-            viz = str(metadata["requested_viz"]).upper()
-            mapping = {
-                "LINE": "LINE_CHART",
-                "BAR": "BAR_CHART",
-                "PIE": "PIE_CHART",
-                "TORTA": "PIE_CHART",
-                "PASTEL": "PIE_CHART",
-                "DONUT": "PIE_CHART",
-                "KPI": "KPI_ROW",
-                "GRAPH": "LINE_CHART",
-                "CHART": "SMART_AUTO"
-            }
-            if viz in mapping:
-                metadata["requested_viz"] = mapping[viz]
-
-        # 1. Parsear Request v2.1
-        full_payload = {
-            "intent": intent,
-            "cube_query": cube_query,
-            "metadata": metadata or {}
-        }
-        
-        # --- BUSINESS RULE: DEFAULT FILTERS FROM REGISTRY ---
-        # Aplicar reglas de negocio definidas en Registry de forma agnóstica
-        intent_defaults = DEFAULT_FILTERS.get(intent, [])
-        if intent_defaults:
-            current_filters = cube_query.get("filters", [])
-            for rule in intent_defaults:
-                should_apply = True
-                # verificar missing conditions
-                if "condition_missing" in rule:
-                    for dim_check in rule["condition_missing"]:
-                         # Chequear si esa dimension ya existe en los filtros actuales
-                         if any(str(f.get("dimension","")).lower() == dim_check for f in current_filters):
-                             should_apply = False
-                             break
-                
-                if should_apply:
-                    logger.info(f"🔍 [TRACE] Aplicando Default Rule: {rule['dimension']}={rule['value']}")
-                    current_filters.append({"dimension": rule["dimension"], "value": rule["value"]})
-            
-            cube_query["filters"] = current_filters
-        # ------------------------------------------------
+    with collect_query_stats() as bq_jobs:
+        result = _execute_semantic_query(intent, cube_query, metadata, limit, comparison_groups)
+    if bq_jobs:
+        _attach_query_stats(result, bq_jobs, cube_query)
+    return result
 
-        req = SemanticRequest(**full_payload)
-        
-        # 2. Construir SQL Optimizado
-        filters_dict = {}
-        # --- RESILIENCE: Validar intent ---
-        if req.intent not in ["COMPARISON", "TREND", "SNAPSHOT", "LISTING"]:
-            raise ValueError(f"Intent inválido: {req.intent}")
-        
-        
-        # --- SMART LIMITS para LISTING ---
-        # Permitir límite configurable desde cube_query con validación
-        MAX_LISTING_LIMIT = 5000  # Límite máximo de seguridad
-        DEFAULT_LISTING_LIMIT = 50  # Límite por defecto
-        
-        if req.intent == "LISTING":
-            if limit:
-                # Si se especificó un límite explícito, validarlo
-                limit = min(limit, MAX_LISTING_LIMIT)
-                logger.info(f"🔍 [TRACE] LISTING query: usando límite solicitado de {limit} registros (max: {MAX_LISTING_LIMIT})")
-            else:
-                # Límite por defecto
-                limit = DEFAULT_LISTING_LIMIT
-                logger.info(f"🔍 [TRACE] LISTING query: aplicando límite default de {limit} registros")
-        elif limit is None:
-            limit = 5000  # Default para queries de métricas
-        
-        # 2. Generar SQL (usando el Registry para validar dimensiones/métricas)
-        for f in req.cube_query.filters:
-            # --- STATIC GROUP EXPANSION (Registry) ---
-            # Si el valor del filtro coincide con una clave en 'value_groups', expandirlo.
-            expanded_values = []
-            raw_values = f.value if isinstance(f.value, list) else [f.value]
-            
-            dim_def = DIMENSIONS_REGISTRY.get(f.dimension, {})
 
-            # [NEW] Normalización de Casing (Force Upper)
-            if dim_def.get("force_upper"):
-                # Preservar el tipo si no es string, pero si es string, upper
-                raw_values = [str(v).upper() if isinstance(v, str) else v for v in raw_values]
-                logger.info(f"🔠 [CASE NORM] Normalizando valores de {f.dimension} a UPPERCASE: {raw_values}")
+def plan_semantic_query(
+    intent: str,
+    cube_query: Dict[str, Any],
+    metadata: Optional[Dict[str, Any]] = None,
+    limit: Optional[int] = None,
+    comparison_groups: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Normalización + SQL de la consulta, sin ejecutarla (para callers que necesitan la SQL
+    antes: ETag de /semantic/query, deduplicación del batch). Lanza excepción si la
+    consulta no es válida.
+    """
+    prepared = _prepare_semantic_query(intent, cube_query, metadata, limit, comparison_groups)
+    return {
+        **prepared,
+        "sql": build_analytical_query(**prepared["query_params"]),
+        "args": (intent, cube_query, metadata, limit, comparison_groups),
+    }
 
-            has_groups = "value_groups" in dim_def
-            
-            for val in raw_values:
-                if has_groups and val in dim_def["value_groups"]:
-                    logger.info(f"✨ [GROUP EXPANSION] Expandiendo '{val}' -> {dim_def['value_groups'][val]}")
-                    expanded_values.extend(dim_def["value_groups"][val])
-                else:
-                    expanded_values.append(val)
-            
-            # Actualizar filters_dict
-            if f.dimension in filters_dict:
-                current_val = filters_dict[f.dimension]
-                if not isinstance(current_val, list):
-                    current_val = [current_val]
-                current_val.extend(expanded_values)
-                filters_dict[f.dimension] = list(set(current_val))
-            else:
-                # Si es un solo valor y no es lista, mantenerlo simple, sino lista
-                if len(expanded_values) == 1:
-                    filters_dict[f.dimension] = expanded_values[0]
-                else:
-                    filters_dict[f.dimension] = list(set(expanded_values))
-        
-        # --- CONTEXTUAL TITLE GENERATION ---
-        # El agente ya incluye contexto en title_suggestion, no duplicar
-        base_title = req.metadata.title_suggestion or "Análisis de Datos"
-        final_title = base_title  # Usar título del agente sin modificar
-        
-        req.metadata.title_suggestion = final_title
-        # -----------------------------------
 
-        # Usamos el limit opcional si viene, si no el default del generador (1000)
-        query_params = {
-            "metrics": req.cube_query.metrics,
-            "dimensions": req.cube_query.dimensions,
-            "filters": filters_dict
-        }
-        if limit:
-            query_params["limit"] = limit
-        
-        if comparison_groups:
-            query_params["comparison_groups"] = comparison_groups
+def execute_planned_semantic_query(planned: Dict[str, Any]) -> Dict[str, Any]:
+    """Igual que `execute_semantic_query`, reutilizando el plan de `plan_semantic_query` (sin re-planificar)."""
+    intent, cube_query, metadata, limit, comparison_groups = planned["args"]
+    with collect_query_stats() as bq_jobs:
+        result = _execute_semantic_query(intent, cube_query, metadata, limit, comparison_groups, planned=planned)
+    if bq_jobs:
+        _attach_query_stats(result, bq_jobs, cube_query)
+    return result
 
-        # --- DYNAMIC AD-HOC GROUPS ---
-        # Si el LLM definió grupos ad-hoc, los pasamos al generador
-        if hasattr(req.cube_query, "adhoc_groups") and req.cube_query.adhoc_groups:
-            query_params["adhoc_groups"] = req.cube_query.adhoc_groups
-            
-            # También debemos asegurar que los valores del grupo estén permitidos en los filtros
-            # (Si no hay filtro explícito, el grupo actúa como filtro implícito)
-            for grp in req.cube_query.adhoc_groups:
-                if grp.dimension not in filters_dict:
-                    logger.info(f"🧩 [AD-HOC FILTER] Aplicando filtro implícito para grupo: {grp.label}")
-                    filters_dict[grp.dimension] = grp.values
-                else:
-                    # Si ya hay filtro, aseguramos que los valores del grupo esten incluidos?
-                    # Por ahora asumimos que el filtro explícito manda o ya incluye lo necesario.
-                    pass
 
-        # --- AUTO-INJECT INFORMATIVE METRICS (Tooltip Enhancement) ---
-        # Si la métrica tiene "informative_metrics" definidos en Registry,
-        # los agregamos a la query aunque el usuario no los haya pedido explícitamente.
-        # Esto sirve para que el frontend tenga datos de contexto (ej: Denominador en un Ratio).
-        
-        # 1. Identificar métricas extra necesarias
-        extra_metrics = set()
-        for m_key in req.cube_query.metrics:
-            m_def = METRICS_REGISTRY.get(m_key, {})
-            if "informative_metrics" in m_def:
-                for info_m in m_def["informative_metrics"]:
-                    if info_m not in req.cube_query.metrics:
-                        extra_metrics.add(info_m)
-        
-        # 2. Inyectar en query_params si hay extras
-        if extra_metrics:
-            logger.info(f"💉 [AUTO-INJECT] Agregando métricas informativas: {extra_metrics}")
-            # Importante: Agregamos al final para no alterar el orden de las métricas principales
-            # (que determina el color/orden principal del gráfico)
-            query_params["metrics"] = req.cube_query.metrics + list(extra_metrics)
-        # -------------------------------------------------------------
+def _attach_query_stats(result: Dict[str, Any], bq_jobs: List[Dict[str, Any]], cube_query: Dict[str, Any]):
+    """Estadísticas de los jobs de BigQuery -> telemetría del resultado + agregado por builder/métrica."""
+    telemetry = result.get("telemetry") or {}
+    builder = telemetry.get("bq_builder_variant") or "unknown"
+    metrics = list((cube_query or {}).get("metrics") or [])
+    summary = summarize_jobs(bq_jobs)
+    # Copia: el dict original de telemetría también lo referencia el cache de último resultado bueno
+    result["telemetry"] = {**telemetry, "bq_stats": {**summary, "by_job": bq_jobs}}
+    get_query_stats_aggregator().record(builder, metrics, bq_jobs)
+    log_perf("bq_query_stats", summary["exec_ms"] / 1000, {"builder": builder, "metrics": metrics, **summary})
+    logger.info(
+        f"📊 [BQ STATS] {builder} | {summary['jobs']} job(s) | {summary['bytes_processed']:,} bytes | "
+        f"{summary['slot_ms']:,} slot-ms | cola {summary['queue_ms']} ms | cache_hit={summary['cache_hit']} | "
+        f"{summary['rows']} filas"
+    )
+
+
+def _sql_with_limit(query_params: Dict[str, Any], limit: int) -> str:
+    """Misma consulta con otro LIMIT, generada por el builder (no por reemplazo de texto en la SQL)."""
+    return build_analytical_query(**{**query_params, "limit": limit})
+
+
+def _admission_check(sql_query: str, builder_variant: str, bq, timing: Dict[str, float]) -> Tuple[Optional[int], bool]:
+    """
+    Control de costo antes de consumir slots: dry run (cacheado) de la SQL que se va a
+    ejecutar. Retorna (bytes estimados, supera el presupuesto).
+    """
+    if not settings.QUERY_COST_CONTROL_ENABLED:
+        return None, False
+    import time
+    t_start = time.time()
+    cost_estimator = get_query_cost_estimator()
+    estimated_bytes = cost_estimator.estimate(sql_query, variant=builder_variant, bq=bq)
+    timing['dry_run'] = time.time() - t_start
+    over_budget = cost_estimator.is_over_budget(estimated_bytes)
+    if over_budget:
+        logger.warning(f"💸 [COST] Consulta rechazada: {estimated_bytes:,} bytes > presupuesto {cost_estimator.budget_bytes:,}")
+    return estimated_bytes, over_budget
+
+
+def _execute_semantic_query(
+    intent: str,
+    cube_query: Dict[str, Any],
+    metadata: Optional[Dict[str, Any]],
+    limit: Optional[int],
+    comparison_groups: Optional[List[Dict[str, Any]]],
+    planned: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    import time
+    t_start = time.time()
+    timing = {}
+    fallback_key = None
+    
+    try:
+        t_step = time.time()
+        prepared = planned or _prepare_semantic_query(intent, cube_query, metadata, limit, comparison_groups)
+        req, query_params, filters_dict = prepared["req"], prepared["query_params"], prepared["filters_dict"]
+        final_title, limit = prepared["final_title"], prepared["limit"]
 
         timing['prep'] = time.time() - t_step
         t_step = time.time()
         
         logger.info(f"🔍 [TRACE] Query params enviados a build_analytical_query: {query_params}")
-        sql_query = build_analytical_query(**query_params)
+        sql_query = prepared.get("sql") or build_analytical_query(**query_params)
         logger.info(f"🔍 [TRACE] SQL generado:\n{sql_query}")
+        fallback_key = _last_good_key(req, sql_query, limit)
         
         timing['sql_gen'] = time.time() - t_step
         t_step = time.time()
         
+        bq = get_bq_service()
+
+        # 2.5 Cost Control: el dry run (cacheado) se hace solo cuando la consulta va a ir a
+        # BigQuery (no si la sirve la ejecución especulativa o un cache) — ver _admission_check
+        builder_variant = select_builder_name(query_params["metrics"], query_params.get("comparison_groups"))
+        estimated_bytes = None
         
         # 3. Ejecutar en BigQuery con estrategia inteligente para LISTING
-        bq = get_bq_service()
         
         # Para LISTING, ejecutar COUNT primero para determinar límite óptimo
         overflow_detected = False
         total_available = None
+        listing_table = None  # Tabla destino del job (paginación por cursor)
         
         if req.intent == "LISTING":
+            estimated_bytes, over_budget = _admission_check(sql_query, builder_variant, bq, timing)
+            if over_budget:
+                return _over_budget_package(estimated_bytes, get_query_cost_estimator().budget_bytes, req, filters_dict)
+            t_step = time.time()
+
             # Paso 1: Ejecutar COUNT para saber cuántos registros hay
             count_sql = sql_query.split("LIMIT")[0]  # Remover LIMIT
             count_sql = f"SELECT COUNT(*) as total FROM ({count_sql}) AS subquery"
@@ -692,19 +948,23 @@ def execute_semantic_query(
                 elif total_available <= limit:
                     # Caso 2: Menos registros que el límite → Traer todos sin advertencia
                     logger.info(f"✅ [OPTIMAL] {total_available} registros ≤ límite {limit}. Trayendo todos.")
-                    df = bq.execute_query(sql_query.replace(f"LIMIT {limit}", f"LIMIT {total_available}"))
+                    df = bq.execute_query(_sql_with_limit(query_params, total_available))
                     overflow_detected = False
                 
                 else:
                     # Caso 3: Entre límite y 1000 → Traer con límite y advertir
+                    # El job materializa todas las filas en su tabla destino, pero solo descargamos
+                    # la primera página; las siguientes se leen vía cursor (POST /listing/page).
                     logger.info(f"⚠️ [PARTIAL] {total_available} registros > límite {limit}. Mostrando primeros {limit}.")
-                    df = bq.execute_query(sql_query)
+                    df, listing_table = bq.execute_query_first_page(
+                        _sql_with_limit(query_params, total_available), page_size=limit
+                    )
                     overflow_detected = True
                     
             except Exception as e:
                 # Si COUNT falla, usar estrategia legacy (LIMIT+1)
                 logger.warning(f"⚠️ COUNT query falló: {e}. Usando estrategia legacy.")
-                sql_with_overflow = sql_query.replace(f"LIMIT {limit}", f"LIMIT {limit + 1}")
+                sql_with_overflow = _sql_with_limit(query_params, limit + 1)
                 df = bq.execute_query(sql_with_overflow)
                 
                 if len(df) > limit:
@@ -713,7 +973,20 @@ def execute_semantic_query(
                     total_available = None  # No sabemos el total exacto
         else:
             # Para otros intents, ejecutar normalmente
-            df = bq.execute_query(sql_query)
+            # (salvo que el router ya haya lanzado esta misma SQL de forma especulativa)
+            df = get_speculative_executor().consume(sql_query)
+            if df is None and settings.TREND_CACHE_ENABLED:
+                # Series mensuales de headcount_base: solo se consultan los meses abiertos/faltantes
+                df = get_trend_partition_cache().execute(query_params)
+            if df is None and settings.COMPARISON_GROUP_CACHE_ENABLED:
+                # Comparaciones: solo se consultan los grupos que no estén en cache
+                df = get_comparison_group_cache().execute(query_params)
+            if df is None:
+                estimated_bytes, over_budget = _admission_check(sql_query, builder_variant, bq, timing)
+                if over_budget:
+                    return _over_budget_package(estimated_bytes, get_query_cost_estimator().budget_bytes, req, filters_dict)
+                t_step = time.time()
+                df = bq.execute_query(sql_query)
         
         timing['bq_exec'] = time.time() - t_step
         t_step = time.time()
@@ -815,7 +1088,8 @@ def execute_semantic_query(
             
         elif viz_hint == "TABLE":
             # Pasar título contextual al bloque de tabla
-            blocks.append(_format_table_block(df, title=final_title))
+            pagination = _build_listing_pagination(listing_table, 0, limit, total_available, current_listing_owner()) if listing_table else None
+            blocks.append(_format_table_block(df, title=final_title, pagination=pagination))
             
         # 5. Generar Summary (con contador de registros)
         visual_count = len(df)
@@ -854,20 +1128,33 @@ def execute_semantic_query(
         # Empaquetar
         pkg = VisualDataPackage(
             summary=summary,
-            content=blocks,
-            telemetry={
-                "model_turns": 1,
-                "tools_executed": ["execute_semantic_query"],
-                "api_invocations_est": 1
-            }
+            content=blocks
         )
 
-        return _sanitize_payload(pkg.model_dump())
+        result = _sanitize_payload(pkg.model_dump())
+        result["telemetry"] = {
+            "model_turns": 1,
+            "tools_executed": ["execute_semantic_query"],
+            "api_invocations_est": 1,
+            "bq_builder_variant": builder_variant,
+            "bq_estimated_bytes": estimated_bytes
+        }
+        _last_good_packages.put(fallback_key, dict(result))
+        return result
     
     except Exception as e:
+        if fallback_key and (isinstance(e, CircuitOpenError) or is_dependency_failure(e)):
+            stale = _stale_package(fallback_key, e)
+            if stale:
+                return stale
         logger.error(f"Error en execute_semantic_query: {e}", exc_info=True)
         return {
             "response_type": "visual_package",
-            "summary": f"⚠️ Error procesando consulta: {str(e)}",
+            "summary": f"{ERROR_SUMMARY_PREFIX}: {str(e)}",
             "content": []
         }
+    finally:
+        # Etapas medidas -> header Server-Timing del request (sq_prep, sq_sql_gen, sq_bq_exec, ...)
+        for stage, seconds in timing.items():
+            if stage != 'total':
+                record_timing(f"sq_{stage}", seconds)
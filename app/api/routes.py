@@ -1,16 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime
+from typing import Optional
+import hashlib
 import logging
 
 from app.core.config.config import get_settings
-from app.schemas.chat import ChatRequest, ChatResponse, Token, TokenData, ResetSessionRequest
-from app.core.auth.security import create_access_token, get_current_user
+from app.schemas.chat import ChatRequest, ChatResponse, Token, TokenData, ResetSessionRequest, ProfilerArmRequest
+from app.schemas.analytics import ExportRequest, ListingPageRequest, SemanticBatchRequest, SemanticQueryRequest
+from app.core.auth.security import bind_listing_owner, create_access_token, get_current_user, require_admin
 from app.core.auth.mock_users import get_user
+from app.core.utils.serialization import FastJSONResponse
+from app.core.utils.formatting import apply_table_format
 # Note: This import will be updated in Phase 6, but putting correct one now
 from app.ai.agents.router_logic import get_router 
+from app.ai.tools.universal_analyst import execute_planned_semantic_query, fetch_listing_page
 from app.services.bigquery import get_bq_service
 from app.services.storage import get_storage_service
 from app.services.firestore import get_firestore_service
+from app.services.export_service import get_export_service
+from app.services.semantic_batch import get_semantic_batch_service
+from app.services.data_freshness import get_data_freshness_service
+from app.services.circuit_breaker import circuit_snapshot
+from app.core.utils.sampling_profiler import get_sampling_profiler
+from app.services.query_stats import get_query_stats_aggregator
 
 logger = logging.getLogger(__name__)
 
@@ -32,7 +47,10 @@ async def root():
 
 @api_router.get("/health")
 async def health_check():
-    return {"status": "ok", "env": settings.APP_ENV}
+    # Dependencias con circuito abierto: la instancia sigue sana (200) pero se informa la degradación
+    circuits = circuit_snapshot()
+    degraded = any(c["state"] != "closed" for c in circuits.values())
+    return {"status": "degraded" if degraded else "ok", "env": settings.APP_ENV, "circuits": circuits}
 
 @api_router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -83,6 +101,7 @@ async def chat(request: ChatRequest, current_user: TokenData = Depends(get_curre
     """
     # Priorizar el perfil del token (seguro) sobre el del request (si existiera)
     user_profile = current_user.profile or request.context_profile or "EJECUTIVO"
+    bind_listing_owner(current_user.username)
     response_text = await ai_router.route(request.message, session_id=request.session_id, profile=user_profile)
     
     # Construir VisualDataPackage
@@ -138,11 +157,9 @@ async def chat(request: ChatRequest, current_user: TokenData = Depends(get_curre
     else:
         final_response_text = response_text
 
-    # SENSOR VISUAL: Imprimir el contrato JSON saliente para debug
+    # SENSOR VISUAL: Sólo metadatos (el dump completo del payload costaba más que la respuesta)
     if visual_package:
-        print("\n🔍 [SENSOR VISUAL] Outgoing JSON Payload:")
-        print(json.dumps(visual_package, indent=2, default=str))
-        print("-" * 60)
+        logger.debug(f"🔍 [SENSOR VISUAL] Outgoing payload: type={visual_package.get('response_type')} blocks={len(visual_package.get('content') or [])}")
 
     # Logic to populate alert_highlight
     alert_highlight_text = None
@@ -150,6 +167,19 @@ async def chat(request: ChatRequest, current_user: TokenData = Depends(get_curre
         # Si es un paquete visual, usamos el summary como alerta destacada
         alert_highlight_text = response_text.get("summary")
 
+        # FAST PATH: Paquete confiable (construido por nuestras tools con modelos Pydantic).
+        # Se serializa en una sola pasada con orjson, sin re-validar contra ChatResponse
+        # ni pasar por jsonable_encoder.
+        return FastJSONResponse({
+            "response": final_response_text,
+            "session_id": request.session_id,
+            "timestamp": datetime.utcnow(),
+            "metadata": {"agent_name": ai_router.name},
+            "alert_highlight": alert_highlight_text,
+            "response_type": visual_package["response_type"],
+            "content": apply_table_format(visual_package["content"], request.table_format),
+        })
+
     return ChatResponse(
         response=final_response_text,
         alert_highlight=alert_highlight_text,
@@ -159,6 +189,108 @@ async def chat(request: ChatRequest, current_user: TokenData = Depends(get_curre
         metadata={"agent_name": ai_router.name}
     )
 
+@api_router.post("/export")
+async def export_query(request: ExportRequest, current_user: TokenData = Depends(get_current_user)):
+    """
+    Exportación masiva (CSV/XLSX) de una consulta semántica, sin el tope de 1.000 filas del chat.
+    Ejecuta la misma SQL que `execute_semantic_query` y transmite el resultado por páginas.
+    """
+    export_svc = get_export_service()
+    try:
+        sql = export_svc.build_sql(request.intent, request.cube_query, request.metadata, request.comparison_groups)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Consulta de exportación inválida: {str(e)}")
+
+    logger.info(f"📤 [EXPORT] User: {current_user.username} | Intent: {request.intent} | Format: {request.format}")
+    filename = f"export_{request.intent.lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{request.format}"
+
+    # El job se ejecuta antes de responder: si supera el tope, el header lo indica
+    try:
+        pages, truncated = await run_in_threadpool(export_svc.run, sql)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error ejecutando la exportación: {str(e)}")
+
+    if request.format == "xlsx":
+        body = export_svc.iter_xlsx(pages)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = export_svc.iter_csv(pages)
+        media_type = "text/csv; charset=utf-8"
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if truncated:
+        headers["X-Export-Truncated"] = "true"
+        headers["X-Export-Max-Rows"] = str(settings.EXPORT_MAX_ROWS)
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@api_router.post("/listing/page")
+async def listing_page(request: ListingPageRequest, current_user: TokenData = Depends(get_current_user)):
+    """
+    Siguiente página de un LISTING truncado.
+    Lee la tabla destino del job original vía cursor: no re-ejecuta la consulta.
+    """
+    try:
+        pkg = await run_in_threadpool(fetch_listing_page, request.cursor, current_user.username)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pkg["content"] = apply_table_format(pkg["content"], request.table_format)
+    return FastJSONResponse(pkg)
+
+@api_router.post("/semantic/query")
+async def semantic_query(
+    request: SemanticQueryRequest,
+    if_none_match: Optional[str] = Header(None),
+    current_user: TokenData = Depends(get_current_user)
+):
+    """
+    Ejecuta una SemanticRequest directamente (sin triaje ni agente LLM).
+    ETag = consulta normalizada + versión de datos: si el cliente envía el mismo
+    `If-None-Match` y los datos no cambiaron, responde 304 sin consultar BigQuery.
+    """
+    batch_svc = get_semantic_batch_service()
+    try:
+        plan = await run_in_threadpool(batch_svc.plan_item, request)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Consulta semántica inválida: {str(e)}")
+
+    # Sin versión de datos legible no se puede probar que el resultado no cambió -> sin ETag
+    data_version = await run_in_threadpool(get_data_freshness_service().data_version)
+    etag = None
+    if data_version:
+        digest = hashlib.sha256(f"{plan['key']}|{data_version}|{request.table_format}".encode("utf-8")).hexdigest()
+        etag = f'"{digest[:32]}"'
+        if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+            logger.info(f"♻️ [SEMANTIC] 304 Not Modified | User: {current_user.username} | {request.intent}")
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    logger.info(f"🎯 [SEMANTIC] User: {current_user.username} | Intent: {request.intent} | Builder: {plan['builder']}")
+    bind_listing_owner(current_user.username)
+    # Ejecuta el plan ya construido para el ETag (sin re-planificar ni regenerar la SQL)
+    pkg = await run_in_threadpool(execute_planned_semantic_query, plan["planned"])
+    pkg["content"] = apply_table_format(pkg.get("content") or [], request.table_format)
+
+    headers = {"Cache-Control": "private, no-cache"}
+    # Resultados vacíos / errores no se versionan (no hay nada útil que revalidar)
+    if etag and pkg["content"]:
+        headers["ETag"] = etag
+    return FastJSONResponse(pkg, headers=headers)
+
+@api_router.post("/semantic/batch")
+async def semantic_batch(request: SemanticBatchRequest, current_user: TokenData = Depends(get_current_user)):
+    """
+    Varias consultas semánticas (widgets de un dashboard) en un solo round-trip, sin pasar
+    por triaje ni agente. Resultados en el mismo orden, con error por ítem.
+    """
+    logger.info(f"📦 [BATCH] User: {current_user.username} | Requests: {len(request.requests)}")
+    bind_listing_owner(current_user.username)
+    results = await get_semantic_batch_service().execute(request.requests)
+
+    for item in results:
+        if item["status"] == "ok":
+            item["package"]["content"] = apply_table_format(item["package"].get("content") or [], request.table_format)
+    return FastJSONResponse({"results": results})
+
 @api_router.post("/session/reset")
 async def reset_session(request: ResetSessionRequest, current_user: TokenData = Depends(get_current_user)):
     """
@@ -181,6 +313,34 @@ async def reset_session(request: ResetSessionRequest, current_user: TokenData =
 
 # --- Endpoints de Prueba de Infraestructura (Mock) ---
 
+@api_router.post("/admin/profiler")
+async def arm_profiler(request: ProfilerArmRequest, current_user: TokenData = Depends(require_admin)):
+    """
+    Arma el profiler de muestreo para los próximos N requests del worker que atiende esta llamada.
+    Los perfiles (folded stacks para flamegraph) se leen con GET /admin/profiler.
+    """
+    logger.info(f"🔬 [PROFILER] Armado por {current_user.username} | Requests: {request.requests}")
+    return get_sampling_profiler().arm(request.requests)
+
+@api_router.get("/admin/profiler")
+async def get_profiles(current_user: TokenData = Depends(require_admin)):
+    profiler = get_sampling_profiler()
+    return {**profiler.status(), "profiles": profiler.profiles()}
+
+@api_router.delete("/admin/profiler")
+async def clear_profiles(current_user: TokenData = Depends(require_admin)):
+    profiler = get_sampling_profiler()
+    profiler.clear()
+    return profiler.status()
+
+@api_router.get("/admin/bq-stats")
+async def get_bq_stats(current_user: TokenData = Depends(require_admin)):
+    """
+    Estadísticas de jobs de BigQuery del worker (bytes, slot-ms, cola, cache hits, filas)
+    agregadas por builder y por métrica, ordenadas por slot-ms total.
+    """
+    return get_query_stats_aggregator().snapshot()
+
 @api_router.get("/test/bigquery")
 async def test_bigquery():
     try:
@@ -1,4 +1,5 @@
 import re
+from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -63,6 +64,61 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         raise credentials_exception
     return token_data
 
+async def require_admin(current_user: TokenData = Depends(get_current_user)):
+    """Dependencia para endpoints operativos: solo perfil ADMIN."""
+    if current_user.profile != ProfileEnum.ADMIN.value:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requiere perfil ADMIN")
+    return current_user
+
+# --- CURSORES DE PAGINACIÓN (LISTING) ---
+
+# Las tablas destino anónimas de BigQuery viven ~24h: el cursor expira antes.
+LISTING_CURSOR_EXPIRE_HOURS = 23
+LISTING_CURSOR_TYPE = "listing_cursor"
+
+# Usuario del request en curso: dueño de los cursores que emita la ejecución (tool del
+# agente, /semantic/*), sin tener que pasarlo por toda la cadena de llamadas.
+_listing_owner: ContextVar[Optional[str]] = ContextVar("listing_owner", default=None)
+
+def bind_listing_owner(username: str):
+    """Asocia los cursores emitidos en el request actual a `username` (lo llaman las rutas)."""
+    _listing_owner.set(username)
+
+def current_listing_owner() -> Optional[str]:
+    """Usuario del request en curso (None fuera de un request: warmer, scripts)."""
+    return _listing_owner.get()
+
+def create_listing_cursor(table_id: str, offset: int, page_size: int, total: int, owner: str) -> str:
+    """
+    Cursor opaco y firmado hacia la tabla destino de un job de BigQuery ya completado.
+    La firma impide que el cliente apunte el cursor a otra tabla; el claim 'usr' lo
+    restringe al usuario que ejecutó la consulta.
+    Sin claim 'sub': no es utilizable como access token.
+    """
+    expire = datetime.now(timezone.utc) + timedelta(hours=LISTING_CURSOR_EXPIRE_HOURS)
+    payload = {
+        "typ": LISTING_CURSOR_TYPE,
+        "usr": owner,
+        "tbl": table_id,
+        "off": offset,
+        "ps": page_size,
+        "tot": total,
+        "exp": expire
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_listing_cursor(cursor: str, username: str) -> dict:
+    """Valida firma/expiración/dueño del cursor. Lanza ValueError si es inválido."""
+    try:
+        payload = jwt.decode(cursor, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError as e:
+        raise ValueError(f"Cursor inválido o expirado: {e}")
+    if payload.get("typ") != LISTING_CURSOR_TYPE:
+        raise ValueError("Cursor inválido: tipo incorrecto")
+    if payload.get("usr") != username:
+        raise ValueError("Cursor inválido: emitido para otro usuario")
+    return payload
+
 # --- FUNCIONES DE ANONIMIZACIÓN EXISTENTES ---
 
 def mask_document_id(doc_id: str) -> str:
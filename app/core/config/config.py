@@ -22,6 +22,54 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = "INFO"
     SECRET_KEY: str = "adk-talent-analytics-super-secret-key-2026-sota-security"
     GOOGLE_GENAI_USE_VERTEXAI: bool = True
+
+    # Presupuesto por consulta (maximum_bytes_billed + admisión vía dry run)
+    QUERY_MAX_BYTES_BILLED: int = 10**9
+    QUERY_COST_CONTROL_ENABLED: bool = True
+
+    # POST /export: filas máximas por archivo (más filas -> se marca como truncado)
+    EXPORT_MAX_ROWS: int = 200_000
+
+    # BigQuery especulativo (solapado con los turnos del LLM)
+    SPECULATIVE_QUERIES_ENABLED: bool = True
+
+    # POST /semantic/batch: consultas BigQuery simultáneas (presupuesto compartido por el proceso)
+    SEMANTIC_BATCH_MAX_CONCURRENCY: int = 6
+
+    # Cache incremental por mes de las series TREND (headcount_base)
+    TREND_CACHE_ENABLED: bool = True
+
+    # Cache de resultados por grupo de las comparaciones (comparison_groups)
+    COMPARISON_GROUP_CACHE_ENABLED: bool = True
+
+    # Metadata de frescura (min/max periodo, filas, última modificación) cacheada en memoria
+    DATA_FRESHNESS_TTL_SECONDS: int = 300
+
+    # Hedged requests al LLM (triaje y narrativas): duplicado tras el percentil de latencia observado
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_INITIAL_DELAY_SECONDS: float = 8.0
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 1.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_HEDGE_BUDGET: float = 0.1
+    LLM_HEDGE_QUOTA_COOLDOWN_SECONDS: int = 60
+    # Llamadas simultáneas al LLM por encima de las cuales no se lanzan hedges (las primarias no tienen cupo)
+    LLM_MAX_CONCURRENT_CALLS: int = 16
+
+    # Circuit breakers (BigQuery, GenAI, Firestore): fallo rápido + último resultado bueno
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RECOVERY_SECONDS: int = 30
+
+    # Observabilidad: header Server-Timing por request y profiler de muestreo bajo demanda (admin)
+    SERVER_TIMING_ENABLED: bool = True
+    PROFILER_SAMPLE_INTERVAL_MS: int = 10
+    PROFILER_MAX_REQUESTS: int = 20
+
+    # Cache Warmer (reportes ejecutivos precalculados tras cada carga de datos)
+    CACHE_WARMER_ENABLED: bool = False
+    CACHE_WARMER_INTERVAL_MINUTES: int = 60
+    CACHE_WARMER_CONCURRENCY: int = 2
     
     @property
     def APP_ENV(self):
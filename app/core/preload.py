@@ -0,0 +1,77 @@
+"""
+Preload de estado inmutable en el master de gunicorn (ver gunicorn.conf.py).
+
+Sin preload, cada worker importa por su cuenta pandas, google-adk, el registry y los
+prompts, y arma su propio catálogo de divisiones: N copias idénticas en memoria. Aquí el
+master importa una sola vez los módulos cuyo estado es inmutable y los workers lo heredan
+vía fork (copy-on-write):
+
+- Librerías pesadas (pandas/numpy, clientes de Google, ADK, genai).
+- Registry semántico compilado (METRICS/DIMENSIONS_REGISTRY, filtros, columnas).
+- Prompts del agente y del triaje, y catálogo de divisiones (una consulta a BigQuery).
+- Generadores de SQL y tablas estáticas de los builders.
+
+No se precarga `app.main`: el router crea clientes HTTP/gRPC (GenAI, Firestore) y esos no
+deben cruzar un fork. Los clientes que el preload sí crea (BigQuery, para el catálogo)
+se descartan en `reset_after_fork` y cada worker abre los suyos de forma lazy.
+
+`gc.freeze()` al final mueve todo lo cargado a la generación permanente: el GC de los
+workers no recorre esos objetos y no ensucia sus páginas (que de otro modo se copiarían
+en cada worker al primer ciclo de recolección).
+"""
+
+import gc
+import time
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_MODULES = (
+    "pandas",
+    "numpy",
+    "google.cloud.bigquery",
+    "google.cloud.firestore",
+    "google.genai",
+    "google.adk",
+    "app.core.analytics.registry",
+    "app.services.query_generator",
+    "app.ai.agents.hr_agent",       # HR_PROMPT_SEMANTIC + catálogo de divisiones
+    "app.ai.agents.router_logic",   # prompt de triaje (sin instanciar el router)
+)
+
+
+def preload_shared_state(modules=PRELOAD_MODULES) -> float:
+    """
+    Importa `modules` en el proceso actual (master) y congela el heap resultante.
+    El GC queda desactivado en el master (también para los workers que se re-crean) y se
+    reactiva en cada worker en `reset_after_fork`: evita dejar huecos en páginas compartidas
+    antes del fork. Retorna los segundos empleados.
+    """
+    t_start = time.time()
+    gc.disable()
+    for module in modules:
+        importlib.import_module(module)
+    gc.freeze()
+    duration = time.time() - t_start
+    logger.info(f"🧊 [PRELOAD] {len(modules)} módulos precargados en {duration:.2f}s | Objetos congelados: {gc.get_freeze_count():,}")
+    return duration
+
+
+def enable_gc():
+    """Reactiva el GC (worker tras el fork). Lo congelado sigue excluido."""
+    gc.enable()
+
+
+def reset_after_fork():
+    """
+    Hook post-fork del worker: descarta los clientes creados en el master durante el
+    preload (sockets/conexiones no se comparten entre procesos) y reactiva el GC.
+    """
+    from app.services.bigquery import BigQueryService
+    from app.services.firestore import FirestoreService
+
+    for service_cls in (BigQueryService, FirestoreService):
+        if service_cls._instance is not None:
+            service_cls._instance._client = None
+    enable_gc()
@@ -81,3 +81,52 @@ def format_dataframe_for_export(df: pd.DataFrame) -> List[Dict[str, Any]]:
     records = json.loads(df.to_json(orient="records", date_format="iso"))
     
     return records
+
+
+def encode_table_columnar(headers: List[str], rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Convert a records table (TablePayload) into the columnar wire format (ColumnarTablePayload).
+
+    - Headers are sent once; each column is a plain list aligned with `headers`.
+    - Low-cardinality string columns (uo2, segmento, motivo_cese...) are dictionary-encoded:
+      the column holds integer codes and `dictionaries[header]` the unique values.
+      A column is encoded only when it has at most half as many unique values as non-null cells.
+    """
+    columns = []
+    dictionaries = {}
+
+    for header in headers:
+        values = [row.get(header) for row in rows]
+        non_null = [v for v in values if v is not None]
+
+        if non_null and all(isinstance(v, str) for v in non_null):
+            uniques = list(dict.fromkeys(non_null))
+            if len(uniques) * 2 <= len(non_null):
+                code_of = {v: i for i, v in enumerate(uniques)}
+                values = [code_of[v] if v is not None else None for v in values]
+                dictionaries[header] = uniques
+
+        columns.append(values)
+
+    return {
+        "encoding": "columnar",
+        "headers": headers,
+        "row_count": len(rows),
+        "columns": columns,
+        "dictionaries": dictionaries,
+    }
+
+
+def apply_table_format(content: List[Dict[str, Any]], table_format: str) -> List[Dict[str, Any]]:
+    """Re-encode TABLE blocks of a visual package according to the negotiated `table_format`."""
+    if table_format != "columnar" or not content:
+        return content
+
+    encoded = []
+    for block in content:
+        payload = block.get("payload") if isinstance(block, dict) else None
+        if isinstance(payload, dict) and block.get("type") == "TABLE" and "rows" in payload:
+            headers = payload.get("headers") or (list(payload["rows"][0].keys()) if payload["rows"] else [])
+            block = {**block, "payload": encode_table_columnar(headers, payload["rows"])}
+        encoded.append(block)
+    return encoded
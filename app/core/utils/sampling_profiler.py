@@ -0,0 +1,174 @@
+"""
+Profiler de muestreo bajo demanda (diagnóstico en producción sin redeploy).
+
+Un admin lo arma para los próximos N requests (`POST /admin/profiler`). Mientras alguno
+de ellos está en curso, un hilo muestrea cada `PROFILER_SAMPLE_INTERVAL_MS` las pilas de
+todos los hilos del proceso (`sys._current_frames`, sin dependencias ni instrumentación)
+y las acumula en formato "folded stacks" (`hilo;mod.func;mod.func N`), la entrada
+estándar de flamegraph.pl, speedscope o inferno. `GET /admin/profiler` devuelve los
+perfiles capturados.
+
+Notas:
+- Estado por proceso: con gunicorn cada worker tiene su propio profiler; se perfila el
+  worker que atiende el POST de armado (repetir el armado para cubrir más workers).
+- El event loop es compartido: las muestras del hilo del loop incluyen el trabajo de
+  otros requests concurrentes. Los hilos en espera (select, locks, pools ociosos) se
+  descartan para que el flamegraph muestre solo CPU/trabajo real.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter, deque
+from typing import Dict, Any, List, Optional
+
+from app.core.config.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+MAX_STACK_DEPTH = 128
+
+# (archivo, función) de la hoja de la pila de un hilo bloqueado esperando trabajo/IO
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queues.py", "get"),
+}
+
+
+class ProfileSession:
+    """Muestras de un request perfilado."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.time()
+        self.t_start = time.perf_counter()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def to_dict(self, status_code: Optional[int]) -> Dict[str, Any]:
+        return {
+            "request": self.label,
+            "status_code": status_code,
+            "started_at": self.started_at,
+            "duration_ms": round((time.perf_counter() - self.t_start) * 1000, 1),
+            "samples": self.samples,
+            "interval_ms": settings.PROFILER_SAMPLE_INTERVAL_MS,
+            "folded": [f"{stack} {count}" for stack, count in self.stacks.most_common()],
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__") or os.path.basename(code.co_filename)
+    return f"{module}.{code.co_name}"
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+
+
+def _folded_stack(thread_name: str, frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name)
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SamplingProfiler, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._remaining = 0
+            cls._instance._active = []
+            cls._instance._profiles = deque(maxlen=settings.PROFILER_MAX_REQUESTS)
+            cls._instance._thread = None
+        return cls._instance
+
+    def arm(self, requests: int) -> Dict[str, Any]:
+        """Perfila los próximos `requests` requests de este worker (acotado a PROFILER_MAX_REQUESTS)."""
+        with self._lock:
+            self._remaining = max(0, min(requests, settings.PROFILER_MAX_REQUESTS))
+        logger.info(f"🔬 [PROFILER] Armado para {self._remaining} request(s) | pid={os.getpid()}")
+        return self.status()
+
+    def begin(self, label: str) -> Optional[ProfileSession]:
+        """Inicia la captura del request si el profiler está armado (None si no)."""
+        if not self._remaining:
+            return None
+        with self._lock:
+            if not self._remaining:
+                return None
+            self._remaining -= 1
+            session = ProfileSession(label)
+            self._active.append(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def end(self, session: ProfileSession, status_code: Optional[int] = None):
+        with self._lock:
+            if session in self._active:
+                self._active.remove(session)
+            self._profiles.append(session.to_dict(status_code))
+        logger.info(f"🔬 [PROFILER] {session.label}: {session.samples} muestras")
+
+    def _sample_loop(self):
+        interval = settings.PROFILER_SAMPLE_INTERVAL_MS / 1000
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                with self._lock:
+                    # Sin requests perfilados en curso el hilo termina (overhead cero en reposo)
+                    if not self._active:
+                        self._thread = None
+                        return
+                continue
+
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = [
+                _folded_stack(names.get(thread_id, f"thread-{thread_id}"), frame)
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id and not _is_idle(frame)
+            ]
+            with self._lock:
+                for session in active:
+                    session.samples += 1
+                    session.stacks.update(stacks)
+            time.sleep(interval)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "armed_requests": self._remaining,
+                "in_flight": len(self._active),
+                "captured": len(self._profiles),
+            }
+
+    def profiles(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._profiles)
+
+    def clear(self):
+        with self._lock:
+            self._remaining = 0
+            self._profiles.clear()
+
+
+def get_sampling_profiler() -> SamplingProfiler:
+    return SamplingProfiler()
@@ -0,0 +1,59 @@
+from typing import Any
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# NaN/Inf -> null lo resuelve orjson de forma nativa (floats Python y numpy),
+# por lo que no hace falta recorrer el payload en Python antes de serializar.
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Fallback para tipos que orjson no conoce (BigQuery/pandas/pydantic)."""
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (pd.Timestamp, datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializa a JSON en una sola pasada (C).
+    NaN e Infinity se emiten como null, igual que el antiguo sanitizador recursivo.
+    """
+    return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+
+def to_json_safe(obj: Any) -> Any:
+    """
+    Devuelve una copia del payload compuesta solo por tipos JSON nativos
+    (NaN/Inf -> None, numpy -> Python). Reemplaza los recorridos recursivos en Python
+    que se usaban antes de entregar resultados de tools al LLM.
+    """
+    return orjson.loads(dumps(obj))
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Respuesta JSON serializada con orjson.
+    Al retornarla directamente desde un endpoint, FastAPI omite la re-validación
+    contra `response_model` y el `jsonable_encoder` (payloads confiables).
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,61 @@
+"""
+Server-Timing por request.
+
+Las etapas ya medidas (execute_semantic_query, AgentRouter.route) se registran en un
+colector del request actual (ContextVar) y el middleware de main.py las publica en el
+header `Server-Timing` (visible en DevTools > Network > Timing):
+
+    Server-Timing: session_fetch;dur=41.2, triage_llm;dur=812.0, sq_bq_exec;dur=640.3;desc="x2", app;dur=2310.4
+
+Las etapas repetidas en un mismo request (varias tools, varios turnos del runner) se
+suman y `desc` indica cuántas veces ocurrieron. Fuera de un request (warmer, tests) el
+registro es un no-op.
+"""
+
+import threading
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+
+class RequestTimings:
+    """Etapas medidas de un request (thread-safe: run_in_threadpool/to_thread copian el contexto)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, List[float]] = {}  # nombre -> [segundos acumulados, veces]
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            stage = self._stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += 1
+
+    def header_value(self, total_seconds: Optional[float] = None) -> str:
+        with self._lock:
+            stages = list(self._stages.items())
+        metrics = []
+        for name, (seconds, count) in stages:
+            metric = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                metric += f';desc="x{count}"'
+            metrics.append(metric)
+        if total_seconds is not None:
+            metrics.append(f"app;dur={total_seconds * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("server_timing", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    """Abre el colector del request actual (lo llama el middleware antes de `call_next`)."""
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float):
+    """Suma `seconds` a la etapa `name` del request en curso (no-op fuera de un request)."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
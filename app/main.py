@@ -2,9 +2,16 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config.config import get_settings
 from app.api.routes import api_router
+from app.services.report_snapshot_service import flush_snapshot_writes
+from app.services.report_cache_warmer import get_report_cache_warmer
+from app.core.utils.server_timing import start_request_timings
+from app.core.utils.sampling_profiler import get_sampling_profiler
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 import sys
 import os
+import time
 from datetime import datetime
 
 # Persistent debug file for catching "0%" bug
@@ -38,10 +45,28 @@ if not root_logger.handlers:
 logger = logging.getLogger(__name__)
 logger.info(f"🚀 Iniciando ADK Talent Analytics API en modo {settings.ENV}")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Scheduler in-process opcional. Con varios workers solo uno precalienta cada periodo (lease en Firestore).
+    warmer_task = None
+    if settings.CACHE_WARMER_ENABLED:
+        warmer = get_report_cache_warmer(settings.CACHE_WARMER_CONCURRENCY)
+        warmer_task = asyncio.create_task(warmer.run_forever(settings.CACHE_WARMER_INTERVAL_MINUTES * 60))
+        logger.info(f"🔥 Cache warmer activo (cada {settings.CACHE_WARMER_INTERVAL_MINUTES} min)")
+
+    yield
+
+    if warmer_task:
+        warmer_task.cancel()
+    # Shutdown: drenar escrituras pendientes (write-behind) antes de que el worker termine
+    if not flush_snapshot_writes(timeout=10.0):
+        logger.warning("⚠️ Shutdown con escrituras de snapshots pendientes.")
+
 app = FastAPI(
     title="ADK Talent Analytics API",
     description="API para el ecosistema multi-agente de People Analytics (SOTA 2026)",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configuración de CORS
@@ -54,8 +79,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # El frontend lee el nombre del archivo y el aviso de truncado de /export
+    expose_headers=["Content-Disposition", "X-Export-Truncated", "X-Export-Max-Rows"],
 )
 
+# Compresión de respuestas (listados de hasta 5.000 filas viajan como JSON repetitivo)
+# Brotli si está disponible (con fallback a gzip según Accept-Encoding); si no, gzip nativo de Starlette.
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+except ImportError:
+    from fastapi.middleware.gzip import GZipMiddleware
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# Observabilidad por request: etapas medidas -> header Server-Timing; profiler de muestreo si un admin lo armó
+PROFILER_PATHS = ("/admin/profiler", "/api/admin/profiler")
+
+@app.middleware("http")
+async def server_timing_middleware(request, call_next):
+    profiler = get_sampling_profiler()
+    profile = None if request.url.path in PROFILER_PATHS else profiler.begin(f"{request.method} {request.url.path}")
+    timings = start_request_timings()
+    t_start = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+    finally:
+        if profile:
+            profiler.end(profile, response.status_code if response else None)
+    if settings.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timings.header_value(time.perf_counter() - t_start)
+    return response
+
 # Incluir rutas aisladas (Ahora en raíz, sin prefijo /api)
 app.include_router(api_router)
 # Compatibilidad con frontend legacy que busca /api
@@ -38,3 +38,29 @@ class SemanticRequest(BaseModel):
     intent: Literal["COMPARISON", "TREND", "SNAPSHOT", "LISTING"]
     cube_query: CubeQuery
     metadata: RequestMetadata = Field(default_factory=RequestMetadata)
+
+class SemanticQueryRequest(SemanticRequest):
+    """Una consulta semántica directa (POST /semantic/query)."""
+    table_format: Literal["rows", "columnar"] = "rows"
+
+# --- BATCH PAYLOAD ---
+
+class SemanticBatchRequest(BaseModel):
+    """Varias consultas semánticas en un solo round-trip (dashboards con muchos widgets)."""
+    requests: List[SemanticRequest] = Field(..., min_length=1, max_length=50, description="Consultas; la respuesta respeta este orden")
+    table_format: Literal["rows", "columnar"] = "rows"
+
+# --- EXPORT PAYLOAD ---
+
+class ExportRequest(BaseModel):
+    """Exportación masiva (sin el tope de 1.000 filas del chat). Misma semántica que execute_semantic_query."""
+    intent: Literal["COMPARISON", "TREND", "SNAPSHOT", "LISTING"] = "LISTING"
+    cube_query: Dict[str, Any] = Field(..., description="Query semántica con metrics, dimensions, filters")
+    metadata: Optional[Dict[str, Any]] = None
+    comparison_groups: Optional[List[Dict[str, Any]]] = None
+    format: Literal["csv", "xlsx"] = "csv"
+
+class ListingPageRequest(BaseModel):
+    """Siguiente página de un LISTING (lee la tabla destino del job, sin re-ejecutar SQL)."""
+    cursor: str = Field(..., description="Cursor opaco recibido en TableBlock.pagination.next_cursor")
+    table_format: Literal["rows", "columnar"] = "rows"
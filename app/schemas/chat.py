@@ -1,11 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Literal
 from datetime import datetime
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="El mensaje del usuario.")
     session_id: str = Field(..., description="ID único de sesión.")
     context_profile: Optional[str] = Field(None, description="Perfil opcional para ajustar instrucciones.")
+    table_format: Literal["rows", "columnar"] = Field("rows", description="Codificación de bloques TABLE: 'rows' (records) o 'columnar' (headers una vez + columnas con diccionario).")
 
 class ChatResponse(BaseModel):
     response: Optional[str] = None # Deprecated but kept for compatibility
@@ -28,3 +29,6 @@ class TokenData(BaseModel):
 
 class ResetSessionRequest(BaseModel):
     session_id: str = Field(..., description="ID de sesión a limpiar.")
+
+class ProfilerArmRequest(BaseModel):
+    requests: int = Field(1, ge=1, description="Cantidad de próximos requests (de este worker) a perfilar.")
@@ -58,10 +58,30 @@ class TablePayload(BaseModel):
     headers: List[str]
     rows: List[Dict[str, Any]]
 
+class ColumnarTablePayload(BaseModel):
+    """
+    Codificación columnar opt-in (ChatRequest.table_format="columnar").
+    `columns[i]` contiene los valores de `headers[i]`. Si el header aparece en
+    `dictionaries`, la columna contiene índices (o null) sobre esa lista de valores únicos.
+    """
+    encoding: Literal["columnar"] = "columnar"
+    headers: List[str]
+    row_count: int
+    columns: List[List[Any]]
+    dictionaries: Dict[str, List[Any]] = Field(default_factory=dict)
+
+class TablePagination(BaseModel):
+    """Paginación por cursor (LISTING). `next_cursor` se envía a POST /listing/page."""
+    offset: int
+    page_size: int
+    total: int
+    next_cursor: Optional[str] = None
+
 class TableBlock(BaseModel):
     type: Literal["TABLE"] = "TABLE"
-    payload: TablePayload
+    payload: Union[TablePayload, ColumnarTablePayload]
     metadata: Optional[ChartMetadata] = None
+    pagination: Optional[TablePagination] = None
 
 # 5. DEBUG BLOCKS
 class DebugBlock(BaseModel):
@@ -2,6 +2,7 @@ from google.adk.sessions import BaseSessionService, Session
 from google.adk.events.event import Event
 from google.cloud import firestore
 from app.services.firestore import get_firestore_service
+from app.services.session_compaction import compact_history, MAX_RAW_EVENTS
 from typing import Optional, Any
 
 class FirestoreADKSessionService(BaseSessionService):
@@ -25,14 +26,18 @@ class FirestoreADKSessionService(BaseSessionService):
         if not data:
             return None
             
+        # Documentos previos a la compactación: plegar turnos antiguos al cargar
+        state = dict(data.get("state") or {})
+        history = compact_history(data.get("history") or [], state)
+
         # Reconstruir objeto Session desde dict
         # NOTA: ADK Session usa 'id' y 'events'. Firestore usaba 'session_id' y 'history'.
         return Session(
             app_name=data.get("app_name", app_name),
             user_id=data.get("user_id", user_id),
             id=session_id, # Pydantic field is 'id'
-            events=self._map_history_to_events(data.get("history", [])), 
-            state=data.get("state", {})
+            events=self._map_history_to_events(history),
+            state=state
         )
 
     def _map_history_to_events(self, history: list) -> list[Event]:
@@ -40,7 +45,8 @@ class FirestoreADKSessionService(BaseSessionService):
         adapted = []
         # OPTIMIZACIÓN DE LATENCIA:
         # Solo cargamos los últimos 20 mensajes para evitar payloads gigantes de 4.5s
-        recent_history = history[-20:] if history else []
+        # (get_session ya plegó los anteriores en el resumen de la conversación)
+        recent_history = history[-MAX_RAW_EVENTS:] if history else []
         
         for event in recent_history:
             # Crear copia para no mutar original
@@ -99,14 +105,20 @@ class FirestoreADKSessionService(BaseSessionService):
 
     # --- Método Auxiliar de Persistencia ---
     async def save_session_data(self, session: Session):
-        """Helper para guardar datos en Firestore."""
+        """
+        Helper para guardar datos en Firestore.
+        Los turnos antiguos se pliegan en `state.conversation_summary` solo en la copia
+        persistida: la sesión en memoria (en uso por el Runner) no se modifica.
+        """
+        state = dict(session.state)
+        history = compact_history([self._serialize_event(e) for e in session.events], state)
         data = {
             "app_name": session.app_name,
             "user_id": session.user_id,
             "session_id": session.id, # DB seguirá usando session_id como key para compatibilidad
             # Serializar eventos/history. 
-            "history": [self._serialize_event(e) for e in session.events], # Guardar en DB como 'history'
-            "state": session.state,
+            "history": history, # Guardar en DB como 'history'
+            "state": state,
             "updated_at": firestore.SERVER_TIMESTAMP # Para TTL Policy
         }
         await self.firestore.save_session(session.id, data)
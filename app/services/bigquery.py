@@ -1,5 +1,11 @@
+import logging
+from typing import Iterator, Optional, Tuple
 from google.cloud import bigquery
 from app.core.config.config import get_settings
+from app.services.circuit_breaker import CLOSED, CircuitOpenError, get_circuit_breaker
+from app.services.query_stats import record_job
+
+logger = logging.getLogger(__name__)
 
 class BigQueryService:
     _instance = None
@@ -8,6 +14,8 @@ class BigQueryService:
         if cls._instance is None:
             cls._instance = super(BigQueryService, cls).__new__(cls)
             cls._instance._client = None
+            # Fallo rápido si BigQuery está degradado (ver circuit_breaker.py)
+            cls._instance._breaker = get_circuit_breaker("bigquery")
         return cls._instance
 
     @property
@@ -17,14 +25,104 @@ class BigQueryService:
             self._client = bigquery.Client(project=settings.PROJECT_ID)
         return self._client
 
-    def execute_query(self, query: str):
-        """Ejecuta una consulta SQL en BigQuery con Cost Guardrails (1 GB Limit)."""
-        job_config = bigquery.QueryJobConfig(
-            maximum_bytes_billed=10**9,  # 1 GB Limit (~$0.005 USD) per query
+    @staticmethod
+    def _job_config() -> bigquery.QueryJobConfig:
+        """Cost Guardrails comunes a todas las consultas."""
+        return bigquery.QueryJobConfig(
+            maximum_bytes_billed=get_settings().QUERY_MAX_BYTES_BILLED,  # 1 GB Limit (~$0.005 USD) per query
             use_query_cache=True
         )
-        query_job = self.client.query(query, job_config=job_config)
-        return query_job.to_dataframe()
+
+    def dry_run(self, query: str) -> int:
+        """Bytes que procesaría la consulta (dry run: sin costo ni slots, solo valida y estima)."""
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        with self._breaker.guard():
+            query_job = self.client.query(query, job_config=job_config)
+        return int(query_job.total_bytes_processed or 0)
+
+    def execute_query(self, query: str):
+        """Ejecuta una consulta SQL en BigQuery con Cost Guardrails (1 GB Limit)."""
+        with self._breaker.guard():
+            query_job = self.client.query(query, job_config=self._job_config())
+            df = query_job.to_dataframe()
+        record_job(query_job, rows=len(df))
+        return df
+
+    def start_query(self, query: str) -> bigquery.QueryJob:
+        """
+        Lanza la consulta sin esperar el resultado (el job puede cancelarse con `job.cancel()`).
+        Que el job se acepte no prueba que la dependencia esté sana: no registra éxito en el
+        breaker (lo hace quien lee el resultado) y con el circuito no cerrado no se lanza,
+        para no consumir la llamada de prueba del half-open.
+        """
+        if get_settings().CIRCUIT_BREAKER_ENABLED and self._breaker.state != CLOSED:
+            raise CircuitOpenError(self._breaker.name, self._breaker.snapshot()["retry_after_s"])
+        try:
+            return self.client.query(query, job_config=self._job_config())
+        except Exception as e:
+            self._breaker.record_failure(e)
+            raise
+
+    def execute_query_first_page(self, query: str, page_size: int):
+        """
+        Ejecuta la consulta completa pero descarga solo la primera página.
+        Retorna (DataFrame, tabla destino 'project.dataset.table'): las páginas siguientes
+        se leen de la tabla destino del job con `read_table_page`, sin re-ejecutar SQL.
+        """
+        with self._breaker.guard():
+            query_job = self.client.query(query, job_config=self._job_config())
+            rows = query_job.result(max_results=page_size)
+            df = rows.to_dataframe()
+        record_job(query_job, rows=rows.total_rows)
+        dest = query_job.destination
+        return df, f"{dest.project}.{dest.dataset_id}.{dest.table_id}"
+
+    def read_table_page(self, table_id: str, start_index: int, page_size: int):
+        """Lee una página de una tabla (tabledata.list): sin costo de escaneo."""
+        with self._breaker.guard():
+            rows = self.client.list_rows(table_id, start_index=start_index, max_results=page_size)
+            return rows.to_dataframe()
+
+    def query_pages(self, query: str, page_size: int = 10_000) -> Tuple[int, Iterator]:
+        """
+        Ejecuta la consulta (espera el job) y retorna (filas totales, páginas): el total se
+        conoce antes de leer la primera página. Las páginas son un DataFrame cada una:
+        memoria constante, nunca materializa el resultado completo (exportaciones masivas).
+        Mismos Cost Guardrails que execute_query.
+        """
+        with self._breaker.guard():
+            query_job = self.client.query(query, job_config=self._job_config())
+            rows = query_job.result(page_size=page_size)
+
+        def pages():
+            with self._breaker.guard():
+                yield from rows.to_dataframe_iterable()
+            record_job(query_job, rows=rows.total_rows)
+
+        return int(rows.total_rows or 0), pages()
+
+    def get_table_last_modified(self, table_id: str) -> Optional[str]:
+        """Última modificación de la tabla (metadata, sin costo). None si no se puede leer."""
+        try:
+            with self._breaker.guard():
+                table = self.client.get_table(table_id)
+            return table.modified.isoformat() if table.modified else None
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer metadata de {table_id}: {e}")
+            return None
+
+    def get_table_metadata(self, table_id: str) -> Optional[dict]:
+        """Última modificación y filas de la tabla (metadata, sin costo). None si no se puede leer."""
+        try:
+            with self._breaker.guard():
+                table = self.client.get_table(table_id)
+            return {
+                "modified": table.modified.isoformat() if table.modified else None,
+                "num_rows": int(table.num_rows or 0),
+            }
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer metadata de {table_id}: {e}")
+            return None
 
 def get_bq_service():
     return BigQueryService()
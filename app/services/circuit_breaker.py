@@ -0,0 +1,206 @@
+"""
+Circuit Breakers (BigQuery, GenAI, Firestore)
+
+Cuando una dependencia se degrada, cada request seguía pagando timeouts y reintentos
+completos. Un breaker por dependencia cuenta fallos de infraestructura consecutivos
+(5xx, timeouts, errores de red; los 4xx/validación no cuentan):
+
+- CLOSED: las llamadas pasan normalmente.
+- OPEN: tras `CIRCUIT_FAILURE_THRESHOLD` fallos, las llamadas fallan al instante con
+  `CircuitOpenError` durante `CIRCUIT_RECOVERY_SECONDS` (sin ocupar workers).
+- HALF_OPEN: vencido ese plazo se deja pasar una sola llamada de prueba; si responde se
+  cierra el circuito, si falla se vuelve a abrir.
+
+Los consumidores sirven el último resultado bueno (`LastGoodCache`) marcado como stale.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+
+from app.core.config.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_TIMEOUT_MARKERS = ("timeout", "timed out", "deadline exceeded", "readoperation")
+
+
+class CircuitOpenError(Exception):
+    """La dependencia está marcada como caída: se falla rápido sin llamarla."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito '{name}' abierto: dependencia degradada (reintento en {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_dependency_failure(error: BaseException) -> bool:
+    """True si el error indica una dependencia degradada (no un error de la request)."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code >= 500:
+        return True
+    if type(error).__name__ in ("RetryError", "TransportError", "ConnectTimeout", "ReadTimeout"):
+        return True
+    text = str(error).lower()
+    return any(marker in text for marker in _TIMEOUT_MARKERS)
+
+
+class CircuitBreaker:
+    """Breaker de una dependencia (ver docstring del módulo). Thread-safe."""
+
+    def __init__(self, name: str, failure_threshold: int, recovery_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._last_error = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Lanza `CircuitOpenError` si la llamada no debe hacerse (abierto o prueba en curso)."""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                logger.info(f"🔌 [CIRCUIT] '{self.name}' half-open: llamada de prueba")
+                return
+            self._rejected += 1
+            retry_after = max(0.0, self._opened_at + self.recovery_seconds - time.monotonic())
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"🔌 [CIRCUIT] '{self.name}' cerrado: la dependencia respondió")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: BaseException):
+        """Registra el resultado de una llamada fallida (solo los fallos de infraestructura cuentan)."""
+        if isinstance(error, CircuitOpenError):
+            # Falló rápido otra dependencia dentro del bloque: no dice nada de esta
+            self._release_probe()
+            return
+        if not is_dependency_failure(error):
+            # La dependencia respondió (p.ej. 400 por SQL inválida): está sana
+            self.record_success()
+            return
+        with self._lock:
+            self._failures += 1
+            self._last_error = f"{type(error).__name__}: {error}"[:200]
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"🔌 [CIRCUIT] '{self.name}' abierto tras {self._failures} fallos: {self._last_error}")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def _release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        """`with breaker.guard(): llamada()` — falla rápido si está abierto y registra el resultado."""
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        except BaseException:
+            # Cancelación / cierre del generador: no dice nada de la dependencia
+            self._release_probe()
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "rejected_calls": self._rejected,
+                "retry_after_s": round(max(0.0, self._opened_at + self.recovery_seconds - time.monotonic()), 1) if state == OPEN else 0.0,
+                "last_error": self._last_error,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Breaker compartido por el proceso para la dependencia `name` (bigquery, genai, firestore)."""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RECOVERY_SECONDS
+            )
+        return _breakers[name]
+
+
+def circuit_snapshot() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
+
+
+class LastGoodCache:
+    """LRU en memoria con el último resultado bueno por clave (fallback con circuito abierto)."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[Any, str]]" = OrderedDict()
+
+    def put(self, key: str, value: Any):
+        stored_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self._lock:
+            self._items[key] = (value, stored_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Tuple[Any, str]]:
+        """(valor, fecha ISO en que se guardó) o None."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,208 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from app.core.config.config import get_settings
+from app.services.bigquery import get_bq_service
+from app.services.data_freshness import get_data_freshness_service
+from app.services.query_builders.emitter import emit_union
+from app.services.query_builders.optimizer import optimize, merge_union
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+GROUP_COLUMN = "comparison_group"
+
+
+def _values(value) -> set:
+    return {str(v) for v in (value if isinstance(value, list) else [value])}
+
+
+def _disjoint(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """True si ninguna fila puede cumplir los filtros de ambos grupos."""
+    return any(not (_values(a[dim]) & _values(b[dim])) for dim in a if dim in b)
+
+
+def _differ_only_in_year(groups: List[Dict[str, Any]]) -> bool:
+    """True si los grupos tienen los mismos filtros salvo `anio` (un año distinto por grupo)."""
+    years = [g["filters"].get("anio") for g in groups]
+    if any(y is None or isinstance(y, list) for y in years) or len({str(y) for y in years}) != len(years):
+        return False
+    rest = [{k: v for k, v in g["filters"].items() if k != "anio"} for g in groups]
+    return all(r == rest[0] for r in rest)
+
+
+class ComparisonGroupCache:
+    """
+    Cache de resultados parciales por grupo para consultas con `comparison_groups`.
+
+    Los builders de comparación resuelven todos los grupos en un solo scan (filtros
+    fusionados en IN-lists + CASE WHEN por etiqueta), así que "Q1 2024 vs Q1 2025" y
+    "Q1 2025 vs Q1 2026" recalculan Q1 2025 desde cero. Aquí la comparación se
+    descompone en una consulta por grupo (el mismo builder con ese único grupo):
+
+    - Cada grupo se cachea por (filtros del grupo, métricas, dimensiones, límite,
+      versión de datos); la etiqueta no forma parte de la clave.
+    - Solo los grupos faltantes se consultan, juntos en un UNION ALL (un round-trip).
+    - El DataFrame de la comparación se arma localmente: etiqueta de cada grupo +
+      ORDER BY dimensiones, comparison_group + LIMIT, igual que la SQL completa.
+
+    El resultado debe ser idéntico al de la SQL completa (fallback), así que solo aplica
+    si el resultado de cada grupo no depende de los demás:
+    - Builder `comparison` (agregación directa): con grupos disjuntos (cada fila
+      pertenece a un único grupo) y las mismas dimensiones de filtro, cada grupo agrega
+      exactamente las mismas filas que en el scan fusionado. El LIMIT por grupo no pierde
+      filas: el orden global (dimensiones, grupo) respeta el orden dentro de cada grupo.
+    - `comparison_cte` (ventanas sobre headcount_base) solo si los grupos difieren
+      únicamente en `anio` ("Q1 2024 vs Q1 2025"): el optimizador amplía el scan de cada
+      grupo a los meses que sus ventanas necesitan (mes previo del LAG, enero del YTD) y
+      los acumulados YTD se particionan por `anio`, así que cada grupo ve las mismas filas
+      anteriores que en el scan fusionado. Con grupos del mismo año (Q1 vs Q2) las
+      ventanas de un grupo sí ven los meses del otro: no se descompone.
+    """
+    _instance = None
+
+    # Resultados de grupo retenidos en memoria (LRU)
+    MAX_ENTRIES = 512
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ComparisonGroupCache, cls).__new__(cls)
+            cls._instance._entries = OrderedDict()
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    # --- PLANNING ---
+
+    @staticmethod
+    def plan(query_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Plan de ejecución por grupo; None si la comparación no es descomponible."""
+        groups = query_params.get("comparison_groups") or []
+        if len(groups) < 2 or query_params.get("adhoc_groups"):
+            return None
+        if any(not isinstance(g.get("filters"), dict) or not g["filters"] for g in groups):
+            return None
+        labels = [g.get("label") for g in groups]
+        if not all(isinstance(label, str) for label in labels) or len(set(labels)) != len(labels):
+            return None
+        if len({frozenset(g["filters"]) for g in groups}) != 1:
+            return None
+        if not all(_disjoint(a["filters"], b["filters"]) for i, a in enumerate(groups) for b in groups[i + 1:]):
+            return None
+
+        metrics = list(query_params.get("metrics") or [])
+        # Import diferido (mismo patrón que _group_query)
+        from app.services.query_generator import select_builder_name
+        builder = select_builder_name(metrics, groups)
+        if builder == "comparison_cte":
+            if not _differ_only_in_year(groups):
+                return None
+        elif builder != "comparison":
+            return None
+        dimensions = list(query_params.get("dimensions") or [])
+        limit = query_params.get("limit") or 5000
+        keys = []
+        for group in groups:
+            normalized = {k: sorted(v, key=str) if isinstance(v, list) else v for k, v in group["filters"].items()}
+            keys.append(hashlib.sha256(json.dumps({
+                "filters": normalized,
+                "metrics": metrics,
+                "dimensions": dimensions,
+                "limit": limit,
+            }, sort_keys=True, default=str).encode("utf-8")).hexdigest())
+
+        return {"groups": groups, "keys": keys, "metrics": metrics, "dimensions": dimensions, "limit": limit}
+
+    # --- EXECUTION ---
+
+    @staticmethod
+    def _group_query(plan: Dict[str, Any], group: Dict[str, Any]):
+        from app.services.query_generator import plan_analytical_query
+        return optimize(plan_analytical_query(
+            metrics=plan["metrics"], dimensions=plan["dimensions"],
+            comparison_groups=[group], limit=plan["limit"]
+        ))
+
+    def _union_sql(self, plan: Dict[str, Any], indices: List[int]) -> str:
+        """UNION ALL de las consultas por grupo con un solo WITH (CTEs idénticos se comparten)."""
+        ctes, bodies = merge_union([self._group_query(plan, plan["groups"][i]) for i in indices])
+        return emit_union(ctes, bodies)
+
+    def execute(self, query_params: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Resultado completo de la comparación (mismas columnas que la SQL de comparación).
+        Retorna None si no es descomponible o si falla (el caller ejecuta la SQL completa).
+        """
+        plan = self.plan(query_params)
+        if not plan:
+            return None
+
+        try:
+            # Sin versión de datos no se puede saber si lo cacheado sigue vigente: se consulta todo sin guardar
+            data_version = get_data_freshness_service().data_version()
+            cached = self._lookup(plan["keys"], data_version) if data_version else {}
+            missing = [i for i in range(len(plan["groups"])) if plan["keys"][i] not in cached]
+
+            fetched = {}
+            if missing:
+                sql = self._union_sql(plan, missing)
+                df = get_bq_service().execute_query(sql)
+                for i in missing:
+                    rows = df[df[GROUP_COLUMN] == plan["groups"][i]["label"]] if not df.empty else df
+                    fetched[plan["keys"][i]] = rows.drop(columns=[GROUP_COLUMN]).reset_index(drop=True)
+                if data_version:
+                    self._store(fetched, data_version)
+
+            logger.info(
+                f"🧊 [COMPARISON CACHE] {len(cached)}/{len(plan['groups'])} grupos desde cache, "
+                f"{len(missing)} consultados en BigQuery"
+            )
+            return self._assemble(plan, {**cached, **fetched})
+        except Exception as e:
+            logger.warning(f"🧊 [COMPARISON CACHE] Fallback a consulta completa: {e}")
+            return None
+
+    def _lookup(self, keys: List[str], data_version: str) -> Dict[str, pd.DataFrame]:
+        with self._lock:
+            found = {}
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry and entry["version"] == data_version:
+                    self._entries.move_to_end(key)
+                    found[key] = entry["rows"]
+            return found
+
+    def _store(self, fetched: Dict[str, pd.DataFrame], data_version: str):
+        """Guarda también los grupos vacíos (también son un resultado)."""
+        with self._lock:
+            for key, rows in fetched.items():
+                self._entries[key] = {"rows": rows, "version": data_version}
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _assemble(plan: Dict[str, Any], results: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        """Etiqueta cada grupo y replica ORDER BY dimensiones, comparison_group + LIMIT."""
+        frames = []
+        for group, key in zip(plan["groups"], plan["keys"]):
+            rows = results[key]
+            frames.append(pd.concat([pd.DataFrame({GROUP_COLUMN: [group["label"]] * len(rows)}), rows], axis=1))
+        df = pd.concat(frames, ignore_index=True)
+        # BigQuery ordena NULL primero en ASC
+        df = df.sort_values(plan["dimensions"] + [GROUP_COLUMN], kind="stable", na_position="first", ignore_index=True)
+        return df.head(plan["limit"])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_comparison_group_cache() -> ComparisonGroupCache:
+    return ComparisonGroupCache()
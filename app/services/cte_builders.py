@@ -6,83 +6,133 @@ necesarias para calcular métricas que requieren Window Functions.
 """
 
 from typing import List, Dict, Any, Optional
-from app.core.analytics.registry import DIMENSIONS_REGISTRY
+from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
 from app.core.config.config import get_settings
+from app.services.partition_pruning import month_index, periodo_range_predicate
+from app.services.query_builders.ir import Select, Column, Predicate, WINDOW_LAG, WINDOW_YTD
+from app.services.query_builders.emitter import emit_ctes
+from app.services.query_builders.utils import adhoc_group_map, dimension_sql
 
 settings = get_settings()
 CUBE_SOURCE = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
 
+TEMPORAL_DIMENSIONS = ["periodo", "anio", "mes", "month", "year", "trimestre", "q"]
+# Temporales derivados de `periodo` que MonthlySnapshots solo proyecta si se piden como
+# dimensión: no son partition key de las ventanas (LAG/YTD cruzan trimestres)
+QUARTER_DIMENSIONS = ["trimestre", "q"]
 
-def build_headcount_base_cte(
+# Agregados mensuales base de headcount_base (Paso 1). Todo lo demás (LAG, acumulados,
+# tasas) se deriva de estas 4 columnas, por eso también las usa el cache de tendencias.
+MONTHLY_SNAPSHOT_COLUMNS = {
+    "hc_final": "COUNT(DISTINCT CASE WHEN estado = 'Activo' THEN codigo_persona END)",
+    "ceses": "COUNT(DISTINCT CASE WHEN estado = 'Cesado' THEN codigo_persona END)",
+    "ceses_voluntarios": "COUNT(DISTINCT CASE WHEN estado = 'Cesado' AND LOWER(motivo_cese) LIKE '%renuncia%' THEN codigo_persona END)",
+    "ceses_involuntarios": "COUNT(DISTINCT CASE WHEN estado = 'Cesado' AND LOWER(motivo_cese) NOT LIKE '%renuncia%' THEN codigo_persona END)",
+}
+MONTHLY_SNAPSHOT_MEASURES = ",\n                ".join(f"{sql} AS {name}" for name, sql in MONTHLY_SNAPSHOT_COLUMNS.items())
+
+# Métricas del Registry cuyo valor es una columna de headcount_base con otro nombre
+HEADCOUNT_BASE_METRIC_COLUMNS = {
+    "ceses_totales": "ceses",
+    "ceses_voluntarios": "ceses_voluntarios",
+    "ceses_involuntarios": "ceses_involuntarios",
+    "headcount_promedio_acumulado": "hc_promedio_acumulado",
+}
+
+
+def headcount_base_column(metric_key: str) -> Optional[str]:
+    """Columna de headcount_base que materializa la métrica (None si no es una columna del CTE)."""
+    if metric_key in HEADCOUNT_BASE_METRIC_COLUMNS:
+        return HEADCOUNT_BASE_METRIC_COLUMNS[metric_key]
+    metric_def = METRICS_REGISTRY.get(metric_key, {})
+    return metric_def.get("sql") if metric_def.get("requires_cte") == "headcount_base" else None
+
+
+def headcount_base_months(years: List[int]) -> List[int]:
+    """
+    Meses (índices) que lee headcount_base para los años pedidos: Enero-Diciembre de cada
+    año más el Diciembre previo (HC inicial de Enero vía LAG). Años intermedios no pedidos
+    no se escanean.
+    """
+    return sorted({m for y in years for m in range(month_index(y - 1, 12), month_index(y, 12) + 1)})
+
+
+def build_dimension_filter_clauses(filters: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Cláusulas WHERE para los filtros NO temporales (se aplican antes del LAG).
+    Los temporales (periodo/anio/mes/trimestre) los resuelve cada caller: en el scan
+    recortarían las filas que leen las ventanas.
+    """
+    where_clauses = []
+    if not filters:
+        return where_clauses
+
+    for dim_key, value in filters.items():
+        if dim_key in TEMPORAL_DIMENSIONS:
+            continue  # Filtros temporales se aplican después de LAG
+        
+        dim_def = DIMENSIONS_REGISTRY.get(dim_key)
+        if not dim_def:
+            continue
+        
+        col_sql = dim_def["sql"] if isinstance(dim_def, dict) else dim_def
+        
+        # Determinar si es numérico
+        is_numeric = False
+        if isinstance(dim_def, dict):
+            if dim_def.get("sorting") == "numeric" or dim_def.get("type") in ["integer", "float", "number", "numeric"]:
+                is_numeric = True
+        
+        def format_val(v):
+            if isinstance(v, (int, float)):
+                return str(v)
+            if isinstance(v, str) and is_numeric and v.replace(".", "", 1).isdigit():
+                return v
+            return f"'{v}'"
+        
+        if isinstance(value, list):
+            vals = ", ".join([format_val(v) for v in value])
+            where_clauses.append(f"{col_sql} IN ({vals})")
+        else:
+            where_clauses.append(f"{col_sql} = {format_val(value)}")
+
+    return where_clauses
+
+
+def _stage(previous: Select, name_source: str, new_columns: List[Column]) -> Select:
+    """Etapa que conserva las columnas de la anterior y agrega `new_columns`."""
+    return Select(columns=[Column.ref(c.name) for c in previous.columns] + new_columns, source=name_source)
+
+
+def headcount_base_stages(
     dimensions: List[str],
     filters: Optional[Dict[str, Any]] = None,
-    adhoc_groups: List[Any] = None  # NUEVO
-) -> str:
+    adhoc_groups: List[Any] = None
+) -> Dict[str, Select]:
     """
-    Genera el CTE 'headcount_base' que calcula métricas de Headcount y Rotación
-    usando Window Functions (LAG, AVG OVER, SUM OVER).
-    
-    Este CTE es la base para todas las métricas complejas de headcount y rotación.
-    
+    CTEs (IR) que calculan headcount_base: métricas de Headcount y Rotación con Window
+    Functions (LAG, AVG OVER, SUM OVER). La última etapa se llama `headcount_base`.
+
+    Se declaran todas las columnas: el optimizador poda las ventanas y agregados que la
+    consulta no lee y ajusta el rango de meses del scan (ver query_builders/optimizer.py).
+
     Args:
         dimensions: Lista de dimensiones para agrupar (además de periodo/anio/mes)
         filters: Filtros aplicados
         adhoc_groups: Grupos dinámicos
-    
+
     Returns:
-        str: SQL del CTE completo
+        Dict nombre -> Select, en orden de dependencia
     """
-    
-    # Pre-procesar grupos ad-hoc
-    adhoc_map = {}
-    if adhoc_groups:
-        for grp in adhoc_groups:
-            dim = getattr(grp, "dimension", None) or grp.get("dimension")
-            if dim:
-                adhoc_map[dim] = grp
-
-    # 1. Construir dimensiones dinámicas para GROUP BY y PARTITION BY
-    dim_select = ""
-    dim_group = ""
-    dim_partition = ""
-    dim_partition_clean = "1"
-    
-    # Determinar si hay dimensión de agrupación (además de temporales)
-    group_dims = [d for d in dimensions if d not in ["periodo", "anio", "mes", "month", "year"]]
-    
-    if group_dims:
-        # Usar la primera dimensión no-temporal como partition key
-        group_by_dim = group_dims[0]
-        
-        if group_by_dim in DIMENSIONS_REGISTRY:
-            dim_def = DIMENSIONS_REGISTRY[group_by_dim]
-            base_col_sql = dim_def.get("sql", group_by_dim) if isinstance(dim_def, dict) else group_by_dim
-            
-            # --- AD-HOC LOGIC ---
-            if group_by_dim in adhoc_map:
-                grp = adhoc_map[group_by_dim]
-                label = getattr(grp, "label", None) or grp.get("label")
-                values = getattr(grp, "values", None) or grp.get("values")
-                vals_str = ", ".join([f"'{v}'" for v in values])
-                col_sql = f"CASE WHEN {base_col_sql} IN ({vals_str}) THEN '{label}' ELSE {base_col_sql} END"
-            else:
-                col_sql = base_col_sql
-            # --------------------
-
-            dim_select = f"{col_sql} AS {group_by_dim},"
-            dim_group = f", {group_by_dim}"
-            dim_partition = f", {col_sql}"
-            # CRITICAL: Usar el ALIAS en CTEs internos, no el SQL raw
-            dim_partition_clean = group_by_dim
-        else:
-            dim_partition_clean = "1"
-    else:
-        dim_partition_clean = "1"
-
-    
-    # 2. Construir filtros WHERE
-    where_clauses = ["segmento != 'PRACTICANTE'"]
-    
+    # 1. Dimensión de agrupación: la primera no temporal es la partition key de las ventanas
+    group_dims = [d for d in dimensions if d not in TEMPORAL_DIMENSIONS]
+    group_dim = group_dims[0] if group_dims and group_dims[0] in DIMENSIONS_REGISTRY else None
+    partition = group_dim or "1"
+    partition_uses = {group_dim} if group_dim else set()
+
+    # 2. Filtros WHERE
+    where = [Predicate("segmento != 'PRACTICANTE'")]
+
     # Detectar año(s) para ampliar rango (necesitamos Diciembre del año anterior para LAG)
     years = []
     if filters:
@@ -94,136 +144,91 @@ def build_headcount_base_cte(
                     years = [int(value)]
                 break
 
-    # Rango ampliado de fechas — use min/max to cover all requested years
+    # Rango literal de periodo por año pedido (+ Diciembre previo): poda particiones
     if years:
-        min_year = min(years)
-        max_year = max(years)
-        where_clauses.append(f"periodo BETWEEN DATE('{min_year-1}-12-01') AND DATE('{max_year}-12-31')")
-    
-    # Agregar filtros adicionales (excepto temporales que se aplicarán al final)
-    if filters:
-        for dim_key, value in filters.items():
-            if dim_key in ["periodo", "anio", "mes", "month", "year"]:
-                continue  # Filtros temporales se aplican después de LAG
-            
-            dim_def = DIMENSIONS_REGISTRY.get(dim_key)
-            if not dim_def:
-                continue
-            
-            col_sql = dim_def["sql"] if isinstance(dim_def, dict) else dim_def
-            
-            # Determinar si es numérico
-            is_numeric = False
-            if isinstance(dim_def, dict):
-                if dim_def.get("sorting") == "numeric" or dim_def.get("type") in ["integer", "float", "number", "numeric"]:
-                    is_numeric = True
-            
-            def format_val(v):
-                if isinstance(v, (int, float)):
-                    return str(v)
-                if isinstance(v, str) and is_numeric and v.replace(".", "", 1).isdigit():
-                    return v
-                return f"'{v}'"
-            
-            if isinstance(value, list):
-                vals = ", ".join([format_val(v) for v in value])
-                where_clauses.append(f"{col_sql} IN ({vals})")
-            else:
-                where_clauses.append(f"{col_sql} = {format_val(value)}")
-    
-    where_block = " AND ".join(where_clauses)
-    
-    # 3. Generar SQL del CTE
-    cte_sql = f"""
-    headcount_base AS (
-        -- Paso 1: Snapshots Mensuales (Agregación Base)
-        WITH MonthlySnapshots AS (
-            SELECT
-                periodo,
-                EXTRACT(YEAR FROM periodo) as anio,
-                EXTRACT(MONTH FROM periodo) as mes,
-                {dim_select}
-                COUNT(DISTINCT CASE WHEN estado = 'Activo' THEN codigo_persona END) AS hc_final,
-                COUNT(DISTINCT CASE WHEN estado = 'Cesado' THEN codigo_persona END) AS ceses,
-                COUNT(DISTINCT CASE WHEN estado = 'Cesado' AND LOWER(motivo_cese) LIKE '%renuncia%' THEN codigo_persona END) AS ceses_voluntarios,
-                COUNT(DISTINCT CASE WHEN estado = 'Cesado' AND LOWER(motivo_cese) NOT LIKE '%renuncia%' THEN codigo_persona END) AS ceses_involuntarios
-            FROM {CUBE_SOURCE}
-            WHERE {where_block}
-            GROUP BY periodo, anio, mes{dim_group}
-        ),
-        
-        -- Paso 2: Calcular HC Inicial (LAG)
-        MetricsCalculation AS (
-            SELECT
-                *,
-                LAG(hc_final) OVER (PARTITION BY {dim_partition_clean} ORDER BY periodo) AS hc_inicial_raw
-            FROM MonthlySnapshots
-        ),
-        
-        -- Paso 3: Ajustar HC Inicial (Fallback para NULL)
-        AdjustedMetrics AS (
-            SELECT
-                *,
-                CASE 
-                    WHEN hc_inicial_raw IS NULL THEN hc_final
-                    ELSE hc_inicial_raw 
-                END AS hc_inicial
-            FROM MetricsCalculation
-        ),
-        
-        -- Paso 4: Calcular Métricas Finales (Promedios, Acumulados, Tasas)
-        FinalMetrics AS (
-            SELECT
-                *,
-                -- HC Promedio Mensual (para compatibilidad con reportes legacy)
-                SAFE_DIVIDE(hc_inicial + hc_final, 2) AS headcount_promedio_mensual,
-                
-                -- HC Promedio Acumulado (YTD) - PROMEDIO SIMPLE de HC Finales
-                -- Fórmula de Negocio: (HC_ene + HC_feb + ... + HC_mes) / n_meses
-                AVG(hc_final) OVER (
-                    PARTITION BY anio, {dim_partition_clean} 
-                    ORDER BY mes 
-                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                ) as hc_promedio_acumulado,
-                
-                -- Ceses Acumulados (YTD)
-                SUM(ceses) OVER (
-                    PARTITION BY anio, {dim_partition_clean} 
-                    ORDER BY mes 
-                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                ) as ceses_acumulado,
-                SUM(ceses_voluntarios) OVER (
-                    PARTITION BY anio, {dim_partition_clean} 
-                    ORDER BY mes 
-                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                ) as ceses_voluntarios_acumulado,
-                SUM(ceses_involuntarios) OVER (
-                    PARTITION BY anio, {dim_partition_clean} 
-                    ORDER BY mes 
-                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
-                ) as ceses_involuntarios_acumulado
-            FROM AdjustedMetrics
-        )
-        
-        -- Paso 5: Calcular Tasas de Rotación (FUENTE DE VERDAD)
-        SELECT
-            *,
-            -- Tasas Mensuales: Ceses del mes / HC Final del mes anterior
-            -- hc_inicial = HC Final del mes anterior (LAG)
-            SAFE_DIVIDE(ceses, hc_inicial) * 100 AS tasa_rotacion_mensual,
-            SAFE_DIVIDE(ceses_voluntarios, hc_inicial) * 100 AS tasa_rotacion_mensual_voluntaria,
-            SAFE_DIVIDE(ceses_involuntarios, hc_inicial) * 100 AS tasa_rotacion_mensual_involuntaria,
-            
-            -- Tasas Anuales (YTD): Ceses acumulados / HC Promedio YTD
-            -- hc_promedio_acumulado = Promedio simple de HC Finales
-            SAFE_DIVIDE(ceses_acumulado, hc_promedio_acumulado) * 100 AS tasa_rotacion_anual,
-            SAFE_DIVIDE(ceses_voluntarios_acumulado, hc_promedio_acumulado) * 100 AS tasa_rotacion_anual_voluntaria,
-            SAFE_DIVIDE(ceses_involuntarios_acumulado, hc_promedio_acumulado) * 100 AS tasa_rotacion_anual_involuntaria
-        FROM FinalMetrics
+        months = headcount_base_months(years)
+        where.append(Predicate(periodo_range_predicate(months), frozenset({"periodo"}), frozenset(months), scan_range=True))
+
+    # Filtros adicionales (excepto temporales, que se aplican después de las ventanas)
+    where.extend(Predicate(clause) for clause in build_dimension_filter_clauses(filters))
+
+    # Paso 1: Snapshots Mensuales (Agregación Base)
+    snapshot_columns = [
+        Column.ref("periodo"),
+        Column("anio", "EXTRACT(YEAR FROM periodo)"),
+        Column("mes", "EXTRACT(MONTH FROM periodo)"),
+    ]
+    quarter_dims = [d for d in QUARTER_DIMENSIONS if d in dimensions]
+    snapshot_columns.extend(Column(d, dimension_sql(d)) for d in quarter_dims)
+    if group_dim:
+        snapshot_columns.append(Column(group_dim, dimension_sql(group_dim, adhoc_group_map(adhoc_groups))))
+    snapshot_columns.extend(Column(name, sql) for name, sql in MONTHLY_SNAPSHOT_COLUMNS.items())
+    monthly = Select(
+        columns=snapshot_columns,
+        source=CUBE_SOURCE,
+        where=where,
+        group_by=["periodo", "anio", "mes"] + quarter_dims + ([group_dim] if group_dim else []),
     )
+
+    def ytd(expr: str, name: str, column: str) -> Column:
+        return Column(
+            name,
+            f"{expr}({column}) OVER (PARTITION BY anio, {partition} ORDER BY mes ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)",
+            frozenset({column, "anio", "mes"} | partition_uses),
+            window=WINDOW_YTD,
+        )
+
+    def rate(name: str, numerator: str, denominator: str) -> Column:
+        return Column(name, f"SAFE_DIVIDE({numerator}, {denominator}) * 100", frozenset({numerator, denominator}))
+
+    # Paso 2: HC Inicial (LAG)
+    lagged = _stage(monthly, "MonthlySnapshots", [
+        Column("hc_inicial_raw", f"LAG(hc_final) OVER (PARTITION BY {partition} ORDER BY periodo)",
+               frozenset({"hc_final", "periodo"} | partition_uses), window=WINDOW_LAG),
+    ])
+    # Paso 3: Ajustar HC Inicial (Fallback para NULL)
+    adjusted = _stage(lagged, "MetricsCalculation", [
+        Column("hc_inicial", "CASE WHEN hc_inicial_raw IS NULL THEN hc_final ELSE hc_inicial_raw END",
+               frozenset({"hc_inicial_raw", "hc_final"})),
+    ])
+    # Paso 4: Promedios y Acumulados (YTD). HC Promedio Acumulado = promedio simple de HC Finales
+    final = _stage(adjusted, "AdjustedMetrics", [
+        Column("headcount_promedio_mensual", "SAFE_DIVIDE(hc_inicial + hc_final, 2)", frozenset({"hc_inicial", "hc_final"})),
+        ytd("AVG", "hc_promedio_acumulado", "hc_final"),
+        ytd("SUM", "ceses_acumulado", "ceses"),
+        ytd("SUM", "ceses_voluntarios_acumulado", "ceses_voluntarios"),
+        ytd("SUM", "ceses_involuntarios_acumulado", "ceses_involuntarios"),
+    ])
+    # Paso 5: Tasas de Rotación (FUENTE DE VERDAD). Mensual: ceses / HC Final del mes
+    # anterior (hc_inicial). Anual (YTD): ceses acumulados / HC Promedio YTD
+    base = _stage(final, "FinalMetrics", [
+        rate("tasa_rotacion_mensual", "ceses", "hc_inicial"),
+        rate("tasa_rotacion_mensual_voluntaria", "ceses_voluntarios", "hc_inicial"),
+        rate("tasa_rotacion_mensual_involuntaria", "ceses_involuntarios", "hc_inicial"),
+        rate("tasa_rotacion_anual", "ceses_acumulado", "hc_promedio_acumulado"),
+        rate("tasa_rotacion_anual_voluntaria", "ceses_voluntarios_acumulado", "hc_promedio_acumulado"),
+        rate("tasa_rotacion_anual_involuntaria", "ceses_involuntarios_acumulado", "hc_promedio_acumulado"),
+    ])
+
+    return {
+        "MonthlySnapshots": monthly,
+        "MetricsCalculation": lagged,
+        "AdjustedMetrics": adjusted,
+        "FinalMetrics": final,
+        "headcount_base": base,
+    }
+
+
+def build_headcount_base_cte(
+    dimensions: List[str],
+    filters: Optional[Dict[str, Any]] = None,
+    adhoc_groups: List[Any] = None  # NUEVO
+) -> str:
+    """
+    SQL del CTE 'headcount_base' completo (todas las columnas, sin optimizar), para usar
+    después de `WITH`. Los builders usan `headcount_base_stages` + optimizador.
     """
-    
-    return cte_sql
+    return emit_ctes(headcount_base_stages(dimensions, filters, adhoc_groups))
 
 
 # Registro de CTEs disponibles
@@ -0,0 +1,258 @@
+import re
+import time
+import logging
+import threading
+from datetime import date, datetime, timezone
+from typing import Dict, Any, List, Optional, Callable
+
+from app.core.config.config import get_settings
+from app.services.bigquery import get_bq_service
+from app.services.partition_pruning import PARTITION_COLUMN, month_index
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+TURNOVER_TABLE_ID = f"{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}"
+CUBE_SOURCE = f"`{TURNOVER_TABLE_ID}`"
+
+# Particiones diarias (YYYYMMDD) o mensuales (YYYYMM); el resto (__NULL__, __UNPARTITIONED__) se ignora
+_PARTITION_ID_RE = re.compile(r"^(\d{4})(\d{2})(\d{2})?$")
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if value is None or value != value:  # NULL / NaT
+        return None
+    return date(value.year, value.month, value.day)
+
+
+class DataFreshnessService:
+    """
+    Metadata de frescura de la tabla de rotación, cacheada en memoria.
+
+    - Cada `DATA_FRESHNESS_TTL_SECONDS` se lee la metadata de la tabla (`get_table`: sin costo).
+    - Solo si cambió la última modificación se recalculan las estadísticas por mes
+      (INFORMATION_SCHEMA.PARTITIONS; si la tabla no está particionada por mes/día,
+      un agregado por `periodo`).
+    - Con eso se resuelven sin consultar BigQuery: MIN/MAX(periodo) global y por año,
+      filas por año, años disponibles y la versión de datos.
+    - Los caches de resultados se suscriben (`subscribe`) y se invalidan cuando cambia
+      la versión de datos.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(DataFreshnessService, cls).__new__(cls)
+            cls._instance._state = None
+            cls._instance._checked_at = float("-inf")
+            cls._instance._lock = threading.Lock()
+            cls._instance._refresh_lock = threading.Lock()
+            cls._instance._listeners = []
+        return cls._instance
+
+    # --- INVALIDATION ---
+
+    def subscribe(self, callback: Callable[[str], None]):
+        """Registra `callback(nueva_version)`; se invoca cuando cambian los datos de la tabla."""
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def _notify(self, version: str):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(version)
+            except Exception as e:
+                logger.warning(f"🗓️ [FRESHNESS] Listener de invalidación falló: {e}")
+
+    # --- REFRESH ---
+
+    def refresh(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Estado vigente (None si nunca se pudo leer). Relee la metadata si venció el TTL;
+        mientras otro hilo refresca se sirve el estado anterior.
+        """
+        if not force and time.monotonic() - self._checked_at < settings.DATA_FRESHNESS_TTL_SECONDS:
+            return self._state
+
+        if not self._refresh_lock.acquire(blocking=force or self._state is None):
+            return self._state
+        try:
+            if not force and time.monotonic() - self._checked_at < settings.DATA_FRESHNESS_TTL_SECONDS:
+                return self._state
+
+            bq = get_bq_service()
+            meta = bq.get_table_metadata(TURNOVER_TABLE_ID)
+            previous = self._state
+            if meta is None or (previous and meta["modified"] == previous["version"]):
+                self._checked_at = time.monotonic()
+                return previous
+
+            months = self._load_month_stats(bq)
+            self._checked_at = time.monotonic()
+            if months is None:
+                return previous
+
+            state = {
+                "version": meta["modified"],
+                "num_rows": meta["num_rows"],
+                "months": months,
+                "refreshed_at": datetime.now(timezone.utc).isoformat(),
+            }
+            with self._lock:
+                self._state = state
+            logger.info(f"🗓️ [FRESHNESS] Datos versión {state['version']} ({len(months)} meses, {state['num_rows']:,} filas)")
+
+            if previous and previous["version"] != state["version"]:
+                self._notify(state["version"])
+            return state
+        finally:
+            self._refresh_lock.release()
+
+    def _load_month_stats(self, bq) -> Optional[Dict[int, Dict[str, Any]]]:
+        """Filas, MIN/MAX(periodo) y versión por mes; None si no se pudo leer."""
+        try:
+            months = self._months_from_partitions(bq.execute_query(f"""
+                SELECT partition_id, total_rows, last_modified_time
+                FROM `{settings.PROJECT_ID}.{settings.BQ_DATASET}.INFORMATION_SCHEMA.PARTITIONS`
+                WHERE table_name = '{settings.BQ_TABLE_TURNOVER}'
+            """))
+            if months:
+                return months
+        except Exception as e:
+            logger.warning(f"🗓️ [FRESHNESS] Sin metadata de particiones, se usa agregado: {e}")
+
+        try:
+            df = bq.execute_query(f"""
+                SELECT
+                    DATE_TRUNC({PARTITION_COLUMN}, MONTH) AS mes,
+                    MIN({PARTITION_COLUMN}) AS min_periodo,
+                    MAX({PARTITION_COLUMN}) AS max_periodo,
+                    COUNT(*) AS filas
+                FROM {CUBE_SOURCE}
+                WHERE {PARTITION_COLUMN} IS NOT NULL
+                GROUP BY 1
+            """)
+        except Exception as e:
+            logger.warning(f"🗓️ [FRESHNESS] No se pudo leer estadísticas de periodo: {e}")
+            return None
+
+        months = {}
+        for _, row in df.iterrows():
+            mes = _as_date(row["mes"])
+            if mes:
+                months[month_index(mes.year, mes.month)] = {
+                    "rows": int(row["filas"]),
+                    "min": _as_date(row["min_periodo"]),
+                    "max": _as_date(row["max_periodo"]),
+                    "version": None,  # sin metadata por partición
+                }
+        return months
+
+    @staticmethod
+    def _months_from_partitions(df) -> Optional[Dict[int, Dict[str, Any]]]:
+        """Agrupa particiones diarias/mensuales por mes; None si la tabla no usa ese esquema."""
+        months = {}
+        for _, row in df.iterrows():
+            match = _PARTITION_ID_RE.match(str(row["partition_id"]))
+            if not match or not 1 <= int(match.group(2)) <= 12:
+                continue
+            year, month = int(match.group(1)), int(match.group(2))
+            rows = int(row["total_rows"] or 0)
+            if rows == 0:
+                continue
+            idx = month_index(year, month)
+            day = date(year, month, int(match.group(3) or 1))
+            modified = row["last_modified_time"]
+            version = modified.isoformat() if modified is not None and modified == modified else None
+
+            entry = months.setdefault(idx, {"rows": 0, "min": day, "max": day, "version": version})
+            entry["rows"] += rows
+            entry["min"], entry["max"] = min(entry["min"], day), max(entry["max"], day)
+            if version and (entry["version"] is None or version > entry["version"]):
+                entry["version"] = version
+        return months or None
+
+    # --- ACCESSORS ---
+
+    def _months(self, year: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+        state = self.refresh()
+        if not state:
+            return {}
+        if year is None:
+            return state["months"]
+        lo, hi = month_index(int(year), 1), month_index(int(year), 12)
+        return {idx: e for idx, e in state["months"].items() if lo <= idx <= hi}
+
+    def data_version(self) -> Optional[str]:
+        """Última modificación de la tabla (ISO); None si no se pudo leer."""
+        state = self.refresh()
+        return state["version"] if state else None
+
+    def latest_periodo(self, year: Optional[int] = None) -> Optional[date]:
+        """MAX(periodo) global o dentro de `year`; None si no hay datos/metadata."""
+        months = self._months(year)
+        return months[max(months)]["max"] if months else None
+
+    def earliest_periodo(self, year: Optional[int] = None) -> Optional[date]:
+        """MIN(periodo) global o dentro de `year`; None si no hay datos/metadata."""
+        months = self._months(year)
+        return months[min(months)]["min"] if months else None
+
+    def year_row_count(self, year: int) -> Optional[int]:
+        """Filas del año (0 si no hay datos); None si la metadata no está disponible."""
+        if not self.refresh():
+            return None
+        return sum(e["rows"] for e in self._months(year).values())
+
+    def available_years(self) -> List[int]:
+        """Años con datos, del más reciente al más antiguo."""
+        return sorted({divmod(idx, 12)[0] for idx in self._months()}, reverse=True)
+
+    def month_version(self, idx: int) -> Optional[str]:
+        """
+        Última modificación de la partición del mes `idx`. Si no se conoce (fallback por
+        agregado sin INFORMATION_SCHEMA.PARTITIONS, o mes sin datos) se usa la versión de
+        la tabla: cualquier recarga invalida. None solo si no hay metadata.
+        """
+        state = self.refresh()
+        if not state:
+            return None
+        entry = state["months"].get(idx)
+        return (entry["version"] if entry else None) or state["version"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Resumen serializable (min/max periodo global y por año, filas, versión)."""
+        state = self.refresh()
+        if not state:
+            return {"available": False}
+
+        years = {}
+        for year in self.available_years():
+            months = self._months(year)
+            years[str(year)] = {
+                "min_periodo": str(months[min(months)]["min"]),
+                "max_periodo": str(months[max(months)]["max"]),
+                "rows": sum(e["rows"] for e in months.values()),
+            }
+        latest, earliest = self.latest_periodo(), self.earliest_periodo()
+        return {
+            "available": True,
+            "data_version": state["version"],
+            "refreshed_at": state["refreshed_at"],
+            "num_rows": state["num_rows"],
+            "min_periodo": str(earliest) if earliest else None,
+            "max_periodo": str(latest) if latest else None,
+            "years": years,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._state = None
+            self._checked_at = float("-inf")
+
+
+def get_data_freshness_service() -> DataFreshnessService:
+    return DataFreshnessService()
@@ -0,0 +1,135 @@
+import copy
+import csv
+import io
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from openpyxl import Workbook
+
+from app.core.config.config import get_settings
+from app.core.utils.formatting import format_dataframe_for_export
+from app.services.bigquery import get_bq_service
+from app.services.query_generator import build_analytical_query
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Filas por página leída desde BigQuery (y por chunk formateado)
+EXPORT_PAGE_SIZE = 10_000
+# Bytes por chunk al transmitir el XLSX ya generado
+XLSX_STREAM_CHUNK = 64 * 1024
+
+
+class ExportService:
+    """
+    Exportación masiva de consultas semánticas a CSV/XLSX.
+
+    - Reutiliza la misma normalización y SQL que `execute_semantic_query`.
+    - Tope de filas `EXPORT_MAX_ROWS` (el chat se limita a 1.000 / 5.000): la SQL pide una
+      fila extra para detectar que el resultado no entra completo y marcarlo como truncado.
+    - Lee BigQuery por páginas y aplica `format_dataframe_for_export` (masking, fechas,
+      ratios) por chunk: memoria constante sin importar el tamaño del resultado.
+    - Los generadores son síncronos: StreamingResponse los itera en el threadpool,
+      sin bloquear el event loop del worker.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ExportService, cls).__new__(cls)
+        return cls._instance
+
+    def build_sql(
+        self,
+        intent: str,
+        cube_query: Dict[str, Any],
+        metadata: Optional[Dict[str, Any]] = None,
+        comparison_groups: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """Genera la SQL del export (misma que el chat, con LIMIT del tope + 1 para detectar truncado)."""
+        # Import diferido: universal_analyst importa el stack de tools del agente
+        from app.ai.tools.universal_analyst import _prepare_semantic_query
+
+        prepared = _prepare_semantic_query(
+            intent, copy.deepcopy(cube_query), copy.deepcopy(metadata), None, comparison_groups
+        )
+        query_params = prepared["query_params"]
+        query_params["limit"] = settings.EXPORT_MAX_ROWS + 1
+        return build_analytical_query(**query_params)
+
+    def run(self, sql: str) -> Tuple[Iterator[List[Dict[str, Any]]], bool]:
+        """
+        Ejecuta la SQL del export antes de empezar a transmitir (el truncado va en los headers).
+        Retorna (páginas formateadas, truncado): como máximo EXPORT_MAX_ROWS filas.
+        """
+        total, pages = get_bq_service().query_pages(sql, page_size=EXPORT_PAGE_SIZE)
+        truncated = total > settings.EXPORT_MAX_ROWS
+        if truncated:
+            logger.warning(f"📤 [EXPORT] Resultado supera el tope de {settings.EXPORT_MAX_ROWS:,} filas: se exporta truncado.")
+        return self._iter_records(pages, settings.EXPORT_MAX_ROWS), truncated
+
+    @staticmethod
+    def _iter_records(pages: Iterator, max_rows: int) -> Iterator[List[Dict[str, Any]]]:
+        """Páginas de BigQuery ya formateadas para export (lista de records por página)."""
+        total = 0
+        for chunk in pages:
+            chunk = chunk.head(max_rows - total)  # Descarta la fila extra del LIMIT
+            total += len(chunk)
+            yield format_dataframe_for_export(chunk)
+        logger.info(f"📤 [EXPORT] {total} registros exportados.")
+
+    def iter_csv(self, pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+        """CSV en streaming (UTF-8 con BOM para que Excel respete tildes y eñes)."""
+        header_written = False
+        for records in pages:
+            if not records:
+                continue
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=list(records[0].keys()), extrasaction="ignore")
+            if not header_written:
+                buffer.write("\ufeff")
+                writer.writeheader()
+                header_written = True
+            writer.writerows(records)
+            yield buffer.getvalue().encode("utf-8")
+
+        if not header_written:
+            # Resultado vacío: archivo válido con solo el BOM
+            yield "\ufeff".encode("utf-8")
+
+    def iter_xlsx(self, pages: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+        """
+        XLSX con openpyxl en modo write-only (las filas se vuelcan a disco, no a memoria).
+        El formato zip exige cerrar el archivo antes de enviarlo: se guarda en un
+        temporal y se transmite por chunks.
+        """
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Export")
+        headers = None
+
+        for records in pages:
+            for record in records:
+                if headers is None:
+                    headers = list(record.keys())
+                    ws.append(headers)
+                ws.append([record.get(h) for h in headers])
+
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            wb.save(path)
+            with open(path, "rb") as f:
+                while True:
+                    data = f.read(XLSX_STREAM_CHUNK)
+                    if not data:
+                        break
+                    yield data
+        finally:
+            os.remove(path)
+
+
+def get_export_service():
+    return ExportService()
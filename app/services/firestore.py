@@ -1,5 +1,6 @@
 from google.cloud import firestore
 from app.core.config.config import get_settings
+from app.services.circuit_breaker import get_circuit_breaker
 
 class FirestoreService:
     _instance = None
@@ -8,6 +9,7 @@ class FirestoreService:
         if cls._instance is None:
             cls._instance = super(FirestoreService, cls).__new__(cls)
             cls._instance._client = None
+            cls._instance._breaker = get_circuit_breaker("firestore")
         return cls._instance
 
     @property
@@ -24,13 +26,15 @@ class FirestoreService:
         """Guarda o actualiza una sesión en Firestore."""
         settings = get_settings()
         doc_ref = self.client.collection(settings.FIRESTORE_COLLECTION).document(session_id)
-        await doc_ref.set(data, merge=True)
+        with self._breaker.guard():
+            await doc_ref.set(data, merge=True)
 
     async def get_session(self, session_id: str) -> dict:
         """Recupera los datos de una sesión."""
         settings = get_settings()
         doc_ref = self.client.collection(settings.FIRESTORE_COLLECTION).document(session_id)
-        doc = await doc_ref.get()
+        with self._breaker.guard():
+            doc = await doc_ref.get()
         return doc.to_dict() if doc.exists else None
 
 def get_firestore_service():
@@ -0,0 +1,217 @@
+"""
+Hedged LLM Requests (tail latency)
+
+Para llamadas idempotentes y de pocos tokens (triaje, narrativas del reporte): si la
+respuesta no llegó tras el percentil `LLM_HEDGE_PERCENTILE` de la latencia observada
+para esa llamada, se lanza un duplicado y se usa la primera respuesta exitosa.
+
+- Primarias sin cupo: cada llamada primaria corre en su propio thread, igual que sin
+  hedging (nunca se encola detrás de otras primarias ni de hedges).
+- Cupo solo para hedges: un hedge se lanza únicamente si las llamadas en vuelo
+  (primarias + hedges) están por debajo de `LLM_MAX_CONCURRENT_CALLS`; bajo carga no hay
+  duplicados. Los hedges corren en un pool de ese mismo tamaño, que por lo tanto nunca encola.
+- Presupuesto: como máximo `LLM_HEDGE_BUDGET` de las últimas llamadas llevan hedge.
+- Cuota: ante un 429 / RESOURCE_EXHAUSTED se suspenden los hedges por
+  `LLM_HEDGE_QUOTA_COOLDOWN_SECONDS`.
+- La llamada perdedora se cancela si aún no arrancó; si ya está en vuelo, su resultado
+  se descarta (el SDK síncrono no permite abortar el HTTP) y libera el cupo al terminar.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Any, Callable, Optional, TypeVar
+
+from app.core.config.config import get_settings
+from app.core.utils.perf_logger import log_perf
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+LATENCY_WINDOW = 200
+BUDGET_WINDOW = 100
+
+# Pool solo para hedges: se lanzan con en vuelo < LLM_MAX_CONCURRENT_CALLS, así que nunca encola
+_hedge_executor = ThreadPoolExecutor(max_workers=settings.LLM_MAX_CONCURRENT_CALLS, thread_name_prefix="llm-hedge")
+
+
+def _run_in_thread(fn: Callable[[], T]) -> "Future[T]":
+    """Future ejecutado en un thread propio (llamadas primarias: sin pool ni cupo)."""
+    future: Future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, name="llm-primary", daemon=True).start()
+    return future
+
+
+def _is_quota_error(error: BaseException) -> bool:
+    if getattr(error, "code", None) == 429:
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "ResourceExhausted" in type(error).__name__
+
+
+class HedgedLLMCaller:
+    """
+    Ejecuta llamadas al LLM con hedging por percentil de latencia (ver docstring del módulo).
+    Las estadísticas (`stats`) reportan cuántos hedges se lanzaron y cuántos ganaron.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(HedgedLLMCaller, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._latencies = {}
+            cls._instance._recent_hedges = {}
+            cls._instance._stats = {}
+            cls._instance._in_flight = 0
+            cls._instance._quota_cooldown_until = 0.0
+        return cls._instance
+
+    # --- POLICY ---
+
+    def hedge_delay(self, name: str) -> float:
+        """Segundos de espera antes del hedge: percentil observado o el delay inicial."""
+        with self._lock:
+            samples = sorted(self._latencies.get(name, ()))
+        if len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_INITIAL_DELAY_SECONDS
+        idx = min(len(samples) - 1, int(len(samples) * settings.LLM_HEDGE_PERCENTILE / 100))
+        return max(settings.LLM_HEDGE_MIN_DELAY_SECONDS, samples[idx])
+
+    def _hedge_blocked(self, name: str) -> Optional[str]:
+        """Motivo por el que no se puede lanzar un hedge ahora (None si se puede)."""
+        with self._lock:
+            if time.monotonic() < self._quota_cooldown_until:
+                return "quota_cooldown"
+            if self._in_flight >= settings.LLM_MAX_CONCURRENT_CALLS:
+                return "no_capacity"
+            if sum(self._recent_hedges.get(name, ())) >= settings.LLM_HEDGE_BUDGET * BUDGET_WINDOW:
+                return "budget"
+        return None
+
+    # --- EXECUTION ---
+
+    def _submit(self, name: str, fn: Callable[[], T], hedge: bool = False) -> "Future[T]":
+        def run():
+            t0 = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                if _is_quota_error(e):
+                    with self._lock:
+                        self._quota_cooldown_until = time.monotonic() + settings.LLM_HEDGE_QUOTA_COOLDOWN_SECONDS
+                raise
+            with self._lock:
+                self._latencies.setdefault(name, deque(maxlen=LATENCY_WINDOW)).append(time.perf_counter() - t0)
+            return result
+
+        with self._lock:
+            self._in_flight += 1
+        future = _hedge_executor.submit(run) if hedge else _run_in_thread(run)
+        future.add_done_callback(self._release)  # también si se cancela antes de arrancar
+        return future
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def call(self, name: str, fn: Callable[[], T]) -> T:
+        """
+        Ejecuta `fn` (idempotente, sin efectos fuera de su propio resultado) con hedging.
+        Bloqueante: desde código async usar `asyncio.to_thread(hedger.call, ...)`.
+        """
+        if not settings.LLM_HEDGE_ENABLED:
+            return fn()
+
+        t0 = time.perf_counter()
+        delay = self.hedge_delay(name)
+        primary = self._submit(name, fn)
+        roles = {primary: "primary"}
+        skipped = None
+
+        if not wait([primary], timeout=delay).done:
+            skipped = self._hedge_blocked(name)
+            if skipped is None:
+                roles[self._submit(name, fn, hedge=True)] = "hedge"
+                logger.info(f"🪞 [HEDGE] '{name}' sin respuesta tras {delay:.2f}s: lanzando duplicado")
+
+        # Gana la primera respuesta exitosa; si una falla se espera a la otra
+        winner, error, pending = None, None, set(roles)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = future
+                    break
+                error = error or future.exception()
+        for future in pending:
+            future.cancel()
+
+        self._record(name, roles, winner, skipped, delay, time.perf_counter() - t0)
+        if winner is None:
+            raise error
+        return winner.result()
+
+    # --- TELEMETRY ---
+
+    def _record(self, name, roles, winner, skipped, delay, elapsed):
+        hedged = len(roles) > 1
+        winner_role = roles[winner] if winner else None
+        with self._lock:
+            self._recent_hedges.setdefault(name, deque(maxlen=BUDGET_WINDOW)).append(hedged)
+            stats = self._stats.setdefault(name, {"calls": 0, "hedged": 0, "hedge_wins": 0, "skipped": {}, "errors": 0})
+            stats["calls"] += 1
+            stats["hedged"] += hedged
+            stats["hedge_wins"] += winner_role == "hedge"
+            stats["errors"] += winner is None
+            if skipped:
+                stats["skipped"][skipped] = stats["skipped"].get(skipped, 0) + 1
+            totals = dict(stats, skipped=dict(stats["skipped"]))
+
+        if winner_role == "hedge":
+            logger.info(f"🪞 [HEDGE] '{name}': el duplicado ganó ({elapsed:.2f}s, hedge tras {delay:.2f}s)")
+        log_perf("llm_hedge", elapsed, {
+            "call": name,
+            "hedged": hedged,
+            "winner": winner_role,
+            "hedge_delay_s": round(delay, 3),
+            "skipped": skipped,
+            "hedge_wins_total": totals["hedge_wins"],
+            "hedged_total": totals["hedged"],
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        """Por llamada: totales, hedges lanzados, hedges ganadores, omitidos y delay vigente."""
+        with self._lock:
+            names = list(self._stats)
+            snapshot = {n: dict(s, skipped=dict(s["skipped"])) for n, s in self._stats.items()}
+        for name in names:
+            s = snapshot[name]
+            s["hedge_win_rate"] = round(s["hedge_wins"] / s["hedged"], 3) if s["hedged"] else 0.0
+            s["hedge_delay_s"] = round(self.hedge_delay(name), 3)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._latencies.clear()
+            self._recent_hedges.clear()
+            self._stats.clear()
+            self._quota_cooldown_until = 0.0
+
+
+def get_llm_hedger() -> HedgedLLMCaller:
+    return HedgedLLMCaller()
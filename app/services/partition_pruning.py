@@ -0,0 +1,165 @@
+"""
+Partition Pruning (predicate rewrite)
+
+La tabla de rotación está particionada por `periodo` (DATE, primer día del mes).
+BigQuery solo poda particiones con predicados literales sobre esa columna:
+`anio = 2025`, `EXTRACT(MONTH FROM periodo) = 3` o `periodo = (SELECT MAX(...))`
+escanean la tabla completa.
+
+Este módulo reescribe los filtros temporales (año, trimestre, mes, periodo YYYYMM y MAX)
+a rangos literales `periodo BETWEEN DATE(...) AND DATE(...)`. Lo usan todos los builders
+(simple, ytd_*, comparison_* y cte_builders).
+"""
+
+import re
+import calendar
+import logging
+from datetime import date
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMN = "periodo"
+
+_YEAR_KEYS = ["anio"]
+_QUARTER_KEYS = ["trimestre", "q"]
+_MONTH_KEYS = ["mes"]
+_YYYYMM_RE = re.compile(r"^(\d{4})(\d{2})$")
+
+
+def month_index(year: int, month: int) -> int:
+    return year * 12 + (month - 1)
+
+
+def month_bounds(idx: int) -> Tuple[date, date]:
+    """(primer día, último día) del mes `idx`."""
+    year, month = divmod(idx, 12)
+    month += 1
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def periodo_range_predicate(months: Iterable[int], column: str = PARTITION_COLUMN) -> str:
+    """Predicado literal para un conjunto de meses: un BETWEEN por tramo contiguo."""
+    months = sorted(set(months))
+    if not months:
+        return "FALSE"
+
+    ranges, start = [], months[0]
+    for prev, cur in zip(months, months[1:] + [None]):
+        if cur != prev + 1:
+            ranges.append((month_bounds(start)[0], month_bounds(prev)[1]))
+            start = cur
+
+    parts = [f"{column} BETWEEN DATE('{lo}') AND DATE('{hi}')" for lo, hi in ranges]
+    return parts[0] if len(parts) == 1 else f"({' OR '.join(parts)})"
+
+
+def _as_int_list(value: Any, valid: range) -> Optional[List[int]]:
+    """Normaliza un valor de filtro (escalar o lista) a enteros dentro de `valid`; None si no aplica."""
+    values = value if isinstance(value, list) else [value]
+    try:
+        parsed = [int(str(v).strip()) for v in values]
+    except (TypeError, ValueError):
+        return None
+    if not parsed or any(v not in valid for v in parsed):
+        return None
+    return parsed
+
+
+def _first_present(filters: Dict[str, Any], keys: List[str]) -> Tuple[Optional[str], Any]:
+    for key in keys:
+        if key in filters:
+            return key, filters[key]
+    return None, None
+
+
+def filter_months(filters: Dict[str, Any]) -> Tuple[Optional[List[int]], List[str]]:
+    """
+    Meses (índices) implicados por los filtros temporales y las claves que quedan
+    cubiertas por el rango. (None, []) si no hay un rango finito (sin año ni periodo YYYYMM).
+    """
+    if not filters:
+        return None, []
+
+    # periodo explícito en formato YYYYMM (ej: 202503 o ["202501", "202502"])
+    if PARTITION_COLUMN in filters:
+        raw = filters[PARTITION_COLUMN]
+        values = raw if isinstance(raw, list) else [raw]
+        matches = [_YYYYMM_RE.match(str(v).strip()) for v in values]
+        if all(matches) and all(1 <= int(m.group(2)) <= 12 for m in matches):
+            return [month_index(int(m.group(1)), int(m.group(2))) for m in matches], [PARTITION_COLUMN]
+        return None, []
+
+    year_key, year_val = _first_present(filters, _YEAR_KEYS)
+    years = _as_int_list(year_val, range(1900, 2201)) if year_key else None
+    if not years:
+        return None, []
+
+    covered = [year_key]
+    candidate_months = set(range(1, 13))
+
+    quarter_key, quarter_val = _first_present(filters, _QUARTER_KEYS)
+    if quarter_key:
+        quarters = _as_int_list(quarter_val, range(1, 5))
+        if quarters:
+            candidate_months &= {m for q in quarters for m in range(3 * q - 2, 3 * q + 1)}
+            covered.append(quarter_key)
+
+    month_key, month_val = _first_present(filters, _MONTH_KEYS)
+    if month_key:
+        months = _as_int_list(month_val, range(1, 13))
+        if months:
+            candidate_months &= set(months)
+            covered.append(month_key)
+
+    return [month_index(y, m) for y in years for m in candidate_months], covered
+
+
+def pruning_predicate(filters: Dict[str, Any]) -> Optional[str]:
+    """Rango literal de `periodo` implicado por los filtros (sin consumirlos); None si no hay."""
+    months, _ = filter_months(filters)
+    return periodo_range_predicate(months) if months is not None else None
+
+
+def resolve_latest_periodo(year: Optional[int] = None) -> Optional[date]:
+    """
+    MAX(periodo) (global o dentro de `year`) como literal, desde la metadata de frescura cacheada.
+    None si no se pudo resolver (el caller mantiene la subconsulta).
+    """
+    try:
+        # Import diferido: los builders son puros salvo por esta resolución
+        from app.services.data_freshness import get_data_freshness_service
+        return get_data_freshness_service().latest_periodo(year)
+    except Exception as e:
+        logger.warning(f"✂️ [PRUNING] No se pudo resolver MAX(periodo): {e}")
+        return None
+
+
+def rewrite_temporal_filters(filters: Dict[str, Any], cube_source: str) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Reescribe los filtros temporales a predicados literales sobre `periodo`.
+
+    Returns:
+        (cláusulas de poda, filtros restantes a aplicar de forma normal)
+    """
+    if not filters:
+        return [], filters or {}
+
+    # periodo = MAX -> literal (relativo al año si hay uno solo)
+    periodo_val = filters.get(PARTITION_COLUMN)
+    if isinstance(periodo_val, str) and periodo_val.upper() == "MAX":
+        _, year_val = _first_present(filters, _YEAR_KEYS)
+        years = _as_int_list(year_val, range(1900, 2201)) if year_val is not None else None
+        if year_val is None or (years and len(years) == 1):
+            latest = resolve_latest_periodo(years[0] if years else None)
+            if latest:
+                remaining = {k: v for k, v in filters.items() if k not in [PARTITION_COLUMN] + _YEAR_KEYS}
+                return [f"{PARTITION_COLUMN} = DATE('{latest}')"], remaining
+        return [], filters
+
+    months, covered = filter_months(filters)
+    if months is None:
+        return [], filters
+
+    remaining = {k: v for k, v in filters.items() if k not in covered}
+    return [periodo_range_predicate(months)], remaining
@@ -7,21 +7,24 @@ we need to use the CTE instead of querying the raw table directly.
 """
 
 from typing import List, Dict, Any
-from app.services.cte_builders import build_headcount_base_cte
 from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
 from app.core.config.config import get_settings
+from app.services.query_builders.ir import Query, Select, Column, Predicate
+from app.services.query_builders.emitter import emit
+from app.services.query_builders.optimizer import optimize
+from app.services.query_builders.utils import group_condition, groups_months
 
 settings = get_settings()
 
 
-def build_ytd_comparison_with_cte(
+def plan_ytd_comparison_with_cte(
     metrics: List[str],
     dimensions: List[str],
     comparison_groups: List[Dict[str, Any]],
     limit: int = 5000
-) -> str:
+) -> Query:
     """
-    Genera query de comparación usando el CTE para métricas calculadas.
+    IR de la query de comparación usando el CTE para métricas calculadas.
     
     Estrategia:
     1. Generar el CTE con todas las dimensiones de comparación
@@ -35,8 +38,10 @@ def build_ytd_comparison_with_cte(
         limit: Límite de resultados
     
     Returns:
-        str: SQL con CTE + comparación
+        Query (IR)
     """
+    # Import diferido: cte_builders importa este paquete
+    from app.services.cte_builders import headcount_base_stages, headcount_base_column
     
     # 1. Recopilar todos los filtros de todos los grupos
     all_filters = {}
@@ -62,114 +67,56 @@ def build_ytd_comparison_with_cte(
     
     # 2. Construir CTE con todas las dimensiones de comparación
     cte_dimensions = list(dimensions) + list(comparison_dimensions)
-    cte_sql = build_headcount_base_cte(cte_dimensions, all_filters)
+    ctes = headcount_base_stages(cte_dimensions, all_filters)
     
     # 3. Construir CASE WHEN para comparison_group
-    case_when_parts = []
-    
-    for group in comparison_groups:
-        label = group["label"]
-        filters = group["filters"]
-        
-        conditions = []
-        for dim, value in filters.items():
-            # CRITICAL: Usar el alias (dim), no el SQL raw para el CASE WHEN
-            # porque ya fue calculado en el CTE
-            col_sql = dim
-            
-            if isinstance(value, list):
-                formatted_values = []
-                for v in value:
-                    if isinstance(v, str):
-                        formatted_values.append(f"'{v}'")
-                    else:
-                        formatted_values.append(str(v))
-                conditions.append(f"{col_sql} IN ({', '.join(formatted_values)})")
-            else:
-                if isinstance(value, str):
-                    conditions.append(f"{col_sql} = '{value}'")
-                else:
-                    conditions.append(f"{col_sql} = {value}")
-        
-        condition_str = " AND ".join(conditions)
-        case_when_parts.append(f"        WHEN {condition_str} THEN '{label}'")
-    
-    case_when_sql = f"""CASE
-{chr(10).join(case_when_parts)}
-    END AS comparison_group"""
-    
-    # Mapeo de métricas simples a columnas del CTE headcount_base
-    CTE_METRIC_MAPPING = {
-        "ceses_totales": "ceses",
-        "ceses_voluntarios": "ceses_voluntarios",
-        "ceses_involuntarios": "ceses_involuntarios"
-    }
-    
-    # 4. Construir SELECT items
-    select_items = [case_when_sql]
-    
-    # Agregar dimensiones temporales
-    for dim in dimensions:
-        select_items.append(dim)
-    
-    # Agregar métricas
+    # CRITICAL: Usar el alias (dim), no el SQL raw para el CASE WHEN
+    # porque ya fue calculado en el CTE
+    case_when_parts = [
+        f"    WHEN {group_condition(group['filters'])} THEN '{group['label']}'"
+        for group in comparison_groups
+    ]
+    columns = [Column(
+        "comparison_group",
+        "CASE\n" + "\n".join(case_when_parts) + "\nEND",
+        frozenset(comparison_dimensions)
+    )]
+    
+    # 4. Dimensiones temporales y métricas (columnas del CTE, no el SQL del Registry)
+    columns.extend(Column.ref(dim) for dim in dimensions)
     for metric in metrics:
-        if metric in CTE_METRIC_MAPPING:
-            col_name = CTE_METRIC_MAPPING[metric]
-            select_items.append(f"{col_name} AS {metric}")
-            continue
-
-        metric_def = METRICS_REGISTRY.get(metric, {})
-        
-        # Si la métrica tiene requires_cte, su SQL ya es el nombre de la columna en el CTE
-        if metric_def.get("requires_cte") == "headcount_base":
-            col_name = metric_def.get("sql", metric)
-            select_items.append(f"{col_name} AS {metric}")
+        col_name = headcount_base_column(metric)
+        if col_name == metric:
+            columns.append(Column.ref(metric))
+        elif col_name:
+            columns.append(Column(metric, col_name, frozenset({col_name})))
         else:
             # Fallback for other metrics
-            metric_sql = metric_def.get("sql", metric)
-            if metric_sql != metric:
-                select_items.append(f"{metric_sql} AS {metric}")
-            else:
-                select_items.append(metric)
-    
-    # 5. Construir ORDER BY
-    order_by_cols = []
-    for dim in dimensions:
-        order_by_cols.append(f"{dim} ASC")
-    order_by_cols.append("comparison_group ASC")
-    
-    # 6. Ensamblar SQL final
-    select_clause = ',\n    '.join(select_items)
-    
-    # 7. Build WHERE to exclude rows that don't match any comparison group
-    # (e.g., December of prior year fetched for LAG but not part of the comparison)
-    group_conditions = []
-    for group in comparison_groups:
-        parts = []
-        for dim, value in group["filters"].items():
-            col_sql = dim
-            if isinstance(value, list):
-                formatted = [f"'{v}'" if isinstance(v, str) else str(v) for v in value]
-                parts.append(f"{col_sql} IN ({', '.join(formatted)})")
-            else:
-                if isinstance(value, str):
-                    parts.append(f"{col_sql} = '{value}'")
-                else:
-                    parts.append(f"{col_sql} = {value}")
-        group_conditions.append(f"({' AND '.join(parts)})")
+            metric_sql = METRICS_REGISTRY.get(metric, {}).get("sql", metric)
+            columns.append(Column.ref(metric) if metric_sql == metric else Column(metric, metric_sql))
+    
+    # 5. WHERE para excluir filas que no pertenecen a ningún grupo
+    # (e.g., December of prior year fetched for LAG but not part of the comparison).
+    # Sus meses acotan lo que el optimizador deja leer al scan.
+    where_clause = " OR ".join(f"({group_condition(group['filters'])})" for group in comparison_groups)
+    
+    return Query(
+        ctes=ctes,
+        body=Select(
+            columns=columns,
+            source="headcount_base",
+            where=[Predicate(where_clause, frozenset(comparison_dimensions), groups_months(comparison_groups))],
+            order_by=[f"{dim} ASC" for dim in dimensions] + ["comparison_group ASC"],
+            limit=limit
+        )
+    )
 
-    where_clause = " OR ".join(group_conditions)
 
-    sql = f"""
-WITH {cte_sql}
-
-SELECT
-    {select_clause}
-FROM headcount_base
-WHERE {where_clause}
-ORDER BY {', '.join(order_by_cols)}
-LIMIT {limit}
-"""
-
-    return sql.strip()
+def build_ytd_comparison_with_cte(
+    metrics: List[str],
+    dimensions: List[str],
+    comparison_groups: List[Dict[str, Any]],
+    limit: int = 5000
+) -> str:
+    """Genera query de comparación usando el CTE para métricas calculadas."""
+    return emit(optimize(plan_ytd_comparison_with_cte(metrics, dimensions, comparison_groups, limit)))
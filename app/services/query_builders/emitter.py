@@ -0,0 +1,57 @@
+"""
+SQL Emitter
+
+Único punto donde el IR (ir.py) se convierte en texto SQL (BigQuery Standard SQL).
+"""
+
+from typing import List, Dict
+
+from app.services.query_builders.ir import Query, Select
+
+INDENT = "    "
+
+
+def _indent(text: str, prefix: str = INDENT) -> str:
+    return "\n".join(prefix + line if line else line for line in text.split("\n"))
+
+
+def emit_select(select: Select) -> str:
+    columns = [f"{c.expr} AS {c.name}" if c.aliased else c.expr for c in select.columns]
+    lines = ["SELECT", _indent(",\n".join(columns))]
+
+    if isinstance(select.source, Select):
+        lines.append("FROM (")
+        lines.append(_indent(emit_select(select.source)))
+        lines.append(")")
+    else:
+        lines.append(f"FROM {select.source}")
+
+    if select.where:
+        lines.append(f"WHERE {' AND '.join(p.sql for p in select.where)}")
+    if select.group_by:
+        lines.append(f"GROUP BY {', '.join(select.group_by)}")
+    if select.order_by:
+        lines.append(f"ORDER BY {', '.join(select.order_by)}")
+    if select.limit:
+        lines.append(f"LIMIT {select.limit}")
+    return "\n".join(lines)
+
+
+def emit_ctes(ctes: Dict[str, Select]) -> str:
+    """Definiciones `nombre AS (...)` separadas por coma (lo que va después de WITH)."""
+    return ",\n".join(f"{name} AS (\n{_indent(emit_select(select))}\n)" for name, select in ctes.items())
+
+
+def emit(query: Query) -> str:
+    body = emit_select(query.body)
+    if not query.ctes:
+        return body
+    return f"WITH {emit_ctes(query.ctes)}\n{body}"
+
+
+def emit_union(ctes: Dict[str, Select], bodies: List[Select]) -> str:
+    """UNION ALL de varias consultas con un solo WITH (ver optimizer.merge_union)."""
+    parts = "\nUNION ALL\n".join(f"({emit_select(body)})" for body in bodies)
+    if not ctes:
+        return parts
+    return f"WITH {emit_ctes(ctes)}\n{parts}"
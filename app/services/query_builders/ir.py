@@ -0,0 +1,77 @@
+"""
+Query IR (representación intermedia tipada de las consultas del cubo)
+
+Los builders ya no concatenan SQL: describen la consulta como relaciones (`Select`)
+encadenadas por nombre (CTEs) o anidadas (subconsultas). Cada columna y predicado
+declara qué columnas de su entrada lee y, si es una ventana, qué filas extra necesita.
+Con eso el optimizador (optimizer.py) poda columnas/ventanas sin uso, empuja los rangos
+temporales hasta el scan y deduplica CTEs, y un único emisor (emitter.py) genera el SQL.
+
+`uses=None` significa "desconocido" (expresión libre): los passes lo tratan de forma
+conservadora (se conservan todas las columnas de la entrada).
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, FrozenSet, Union
+
+# Ventanas sobre la serie mensual y las filas (meses) adicionales que leen
+WINDOW_LAG = "lag"  # mes anterior (LAG ... ORDER BY periodo)
+WINDOW_YTD = "ytd"  # enero..mes del mismo año (PARTITION BY anio ... ORDER BY mes, acumulado)
+
+
+@dataclass(frozen=True)
+class Column:
+    """Columna proyectada: `expr AS name` (o solo `name` si `aliased` es False)."""
+    name: str
+    expr: str
+    uses: Optional[FrozenSet[str]] = None
+    window: Optional[str] = None
+    aliased: bool = True
+
+    @classmethod
+    def ref(cls, name: str) -> "Column":
+        """Columna de la entrada proyectada tal cual."""
+        return cls(name, name, frozenset({name}), aliased=False)
+
+    @property
+    def passthrough(self) -> bool:
+        return self.expr == self.name and self.window is None
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """
+    Condición del WHERE. `months`: índices de mes (partition_pruning.month_index) que
+    pueden pasar el filtro (superconjunto), None si no acota el tiempo.
+    `scan_range`: rango literal de partición de un scan, reemplazable por el pushdown.
+    """
+    sql: str
+    uses: Optional[FrozenSet[str]] = None
+    months: Optional[FrozenSet[int]] = None
+    scan_range: bool = False
+
+
+@dataclass
+class Select:
+    """SELECT columnas FROM source [WHERE] [GROUP BY] [ORDER BY] [LIMIT]."""
+    columns: List[Column]
+    source: Union[str, "Select"]  # tabla / nombre de CTE, o subconsulta
+    where: List[Predicate] = field(default_factory=list)
+    group_by: List[str] = field(default_factory=list)
+    order_by: List[str] = field(default_factory=list)  # "expr [ASC|DESC]"
+    limit: Optional[int] = None
+
+    def column_names(self) -> List[str]:
+        return [c.name for c in self.columns]
+
+
+@dataclass
+class Query:
+    """CTEs (en orden de dependencia) + SELECT final."""
+    body: Select
+    ctes: Dict[str, Select] = field(default_factory=dict)
+
+
+def order_key(item: str) -> str:
+    """Columna de un ítem de ORDER BY ("mes ASC" -> "mes")."""
+    return item.split()[0]
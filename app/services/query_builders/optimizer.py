@@ -0,0 +1,222 @@
+"""
+Query Optimizer (passes sobre el IR)
+
+- prune_projections: cada CTE proyecta solo las columnas que algún consumidor lee.
+  Como las ventanas (LAG, AVG/SUM OVER) y los COUNT DISTINCT de headcount_base son
+  columnas más, una tasa mensual ya no calcula acumulados YTD ni ceses que no pidió.
+- collapse_passthrough: elimina las etapas que quedaron sin cálculo propio (ventanas podadas).
+- push_down_predicates: los filtros temporales del SELECT que lee la cadena de CTEs se
+  empujan hasta el scan como rango literal de `periodo`, ampliado con las filas que
+  necesitan las ventanas conservadas (mes anterior para LAG, enero..mes para YTD).
+- dedupe_ctes: CTEs con la misma definición se emiten una sola vez.
+"""
+
+from dataclasses import replace
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.services.partition_pruning import month_index, periodo_range_predicate, PARTITION_COLUMN
+from app.services.query_builders.emitter import emit_select
+from app.services.query_builders.ir import Query, Select, Column, Predicate, WINDOW_LAG, WINDOW_YTD, order_key
+
+
+def optimize(query: Query) -> Query:
+    return dedupe_ctes(push_down_predicates(collapse_passthrough(prune_projections(query))))
+
+
+def _map_sources(select: Select, fn) -> Select:
+    """Aplica `fn` al nombre de la relación de origen (recorre subconsultas)."""
+    if isinstance(select.source, Select):
+        return replace(select, source=_map_sources(select.source, fn))
+    return replace(select, source=fn(select.source))
+
+
+# --- PROJECTION PRUNING ---
+
+def _is_identifier(expr: str) -> bool:
+    return expr.replace("_", "").isalnum()
+
+
+def _kept_columns(select: Select, required: Optional[Set[str]]) -> List[Column]:
+    if required is None:
+        return list(select.columns)
+    keys = {order_key(o) for o in select.order_by} | set(select.group_by)
+    kept = [c for c in select.columns if c.name in required or c.name in keys]
+    return kept or select.columns[:1]
+
+
+def _input_requirements(select: Select) -> Optional[Set[str]]:
+    """Columnas de la entrada que lee `select` (None = desconocido: todas)."""
+    needs: Set[str] = set()
+    for uses in [c.uses for c in select.columns] + [p.uses for p in select.where]:
+        if uses is None:
+            return None
+        needs |= uses
+    for expr in select.group_by + [order_key(o) for o in select.order_by]:
+        if not _is_identifier(expr):
+            return None
+        needs.add(expr)
+    return needs
+
+
+def _merge(required: Dict[str, Optional[Set[str]]], name: str, needs: Optional[Set[str]]):
+    if name in required and required[name] is None:
+        return
+    required[name] = None if needs is None else required.get(name, set()) | needs
+
+
+def prune_projections(query: Query) -> Query:
+    required: Dict[str, Optional[Set[str]]] = {}
+
+    def visit(select: Select, outputs: Optional[Set[str]]) -> Select:
+        pruned = replace(select, columns=_kept_columns(select, outputs))
+        needs = _input_requirements(pruned)
+        if isinstance(pruned.source, Select):
+            return replace(pruned, source=visit(pruned.source, needs))
+        if pruned.source in query.ctes:
+            _merge(required, pruned.source, needs)
+        return pruned
+
+    body = visit(query.body, None)
+    ctes = {}
+    for name in reversed(list(query.ctes)):
+        if name in required:  # CTEs sin consumidores se descartan
+            ctes[name] = visit(query.ctes[name], required[name])
+    return Query(body=body, ctes=dict(reversed(list(ctes.items()))))
+
+
+# --- STAGE COLLAPSE ---
+
+def collapse_passthrough(query: Query) -> Query:
+    redirect: Dict[str, str] = {}
+    ctes = {}
+    for name, select in query.ctes.items():
+        select = _map_sources(select, lambda s: redirect.get(s, s))
+        trivial = (
+            isinstance(select.source, str) and select.source in ctes and
+            all(c.passthrough for c in select.columns) and
+            not (select.where or select.group_by or select.order_by or select.limit)
+        )
+        if trivial:
+            redirect[name] = select.source
+        else:
+            ctes[name] = select
+    body = _map_sources(query.body, lambda s: redirect.get(s, s))
+    return Query(body=body, ctes=ctes)
+
+
+# --- PREDICATE PUSHDOWN ---
+
+def _expand(months: Set[int], window: Optional[str]) -> Set[int]:
+    if window == WINDOW_LAG:
+        return months | {m - 1 for m in months}
+    if window == WINDOW_YTD:
+        return {x for m in months for x in range(month_index(m // 12, 1), m + 1)}
+    return months
+
+
+def _reader(select: Select) -> Select:
+    """SELECT más interno (el que lee la relación base de la consulta)."""
+    while isinstance(select.source, Select):
+        select = select.source
+    return select
+
+
+def _requested_months(select: Select) -> Optional[Set[int]]:
+    months = None
+    for predicate in select.where:
+        if predicate.months is not None:
+            months = set(predicate.months) if months is None else months & predicate.months
+    return months
+
+
+def _add_demand(demand: Dict[str, Dict[str, Set[int]]], relation: Select, uses: Optional[Set[str]], months: Set[int]):
+    """Registra que las columnas `uses` de `relation` se leen en `months` (None = todas)."""
+    target = demand.setdefault(id(relation), {})
+    for name in (relation.column_names() if uses is None else uses):
+        target[name] = target.get(name, set()) | months
+
+
+def push_down_predicates(query: Query) -> Query:
+    reader = _reader(query.body)
+    requested = _requested_months(reader)
+    if requested is None or reader.source not in query.ctes:
+        return query
+
+    # Demanda (columna -> meses) por relación, desde el lector hacia el scan
+    demand: Dict[int, Dict[str, Set[int]]] = {}
+    stages = {name: select for name, select in query.ctes.items()}
+    for uses in [c.uses for c in reader.columns] + [p.uses for p in reader.where]:
+        _add_demand(demand, stages[reader.source], uses, requested)
+    for expr in reader.group_by + [order_key(o) for o in reader.order_by]:
+        _add_demand(demand, stages[reader.source], {expr} if _is_identifier(expr) else None, requested)
+
+    ctes = dict(query.ctes)
+    for name in reversed(list(query.ctes)):
+        select = stages[name]
+        wanted = demand.get(id(select))
+        if not wanted:
+            continue
+        expanded: List[Tuple[Optional[Set[str]], Set[int]]] = []
+        for column in select.columns:
+            if column.name in wanted:
+                expanded.append((column.uses, _expand(wanted[column.name], column.window)))
+        all_months = set().union(*(m for _, m in expanded))
+        expanded.extend((p.uses, all_months) for p in select.where)
+
+        if isinstance(select.source, str) and select.source in stages:
+            for uses, months in expanded:
+                _add_demand(demand, stages[select.source], uses, months)
+        elif isinstance(select.source, str):
+            ctes[name] = _narrow_scan(select, all_months)
+    return Query(body=query.body, ctes=ctes)
+
+
+def _narrow_scan(select: Select, months: Set[int]) -> Select:
+    """Reemplaza (o agrega) el rango de partición del scan por los meses necesarios."""
+    where, found = [], False
+    for predicate in select.where:
+        if predicate.scan_range:
+            found = True
+            narrowed = months & predicate.months if predicate.months is not None else months
+            predicate = Predicate(periodo_range_predicate(narrowed), frozenset({PARTITION_COLUMN}), frozenset(narrowed), True)
+        where.append(predicate)
+    if not found:
+        where.append(Predicate(periodo_range_predicate(months), frozenset({PARTITION_COLUMN}), frozenset(months), True))
+    return replace(select, where=where)
+
+
+# --- CTE DEDUPLICATION ---
+
+def _dedupe(ctes: Dict[str, Select], bodies: List[Select]) -> Tuple[Dict[str, Select], List[Select]]:
+    rename: Dict[str, str] = {}
+    by_definition: Dict[str, str] = {}
+    unique = {}
+    for name, select in ctes.items():
+        select = _map_sources(select, lambda s: rename.get(s, s))
+        definition = emit_select(select)
+        if definition in by_definition:
+            rename[name] = by_definition[definition]
+        else:
+            by_definition[definition] = name
+            unique[name] = select
+    return unique, [_map_sources(b, lambda s: rename.get(s, s)) for b in bodies]
+
+
+def dedupe_ctes(query: Query) -> Query:
+    ctes, (body,) = _dedupe(query.ctes, [query.body])
+    return Query(body=body, ctes=ctes)
+
+
+def merge_union(queries: List[Query]) -> Tuple[Dict[str, Select], List[Select]]:
+    """
+    CTEs de varias consultas (ya optimizadas) bajo un solo WITH para un UNION ALL:
+    los nombres repetidos se renombran y las definiciones idénticas se comparten.
+    """
+    ctes: Dict[str, Select] = {}
+    bodies = []
+    for i, query in enumerate(queries):
+        rename = {name: name if name not in ctes else f"{name}_{i}" for name in query.ctes}
+        for name, select in query.ctes.items():
+            ctes[rename[name]] = _map_sources(select, lambda s: rename.get(s, s))
+        bodies.append(_map_sources(query.body, lambda s: rename.get(s, s)))
+    return _dedupe(ctes, bodies)
@@ -1,16 +1,76 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from app.core.analytics.registry import DIMENSIONS_REGISTRY
+from app.services.partition_pruning import rewrite_temporal_filters, filter_months
+from app.services.query_builders.ir import Predicate
+
+
+def adhoc_group_map(adhoc_groups: Optional[List[Any]]) -> Dict[str, Any]:
+    """Grupos ad-hoc por dimensión (acepta modelos Pydantic o dicts)."""
+    adhoc_map = {}
+    for grp in adhoc_groups or []:
+        dim = getattr(grp, "dimension", None) or grp.get("dimension")
+        if dim:
+            adhoc_map[dim] = grp
+    return adhoc_map
+
+
+def dimension_sql(dim_key: str, adhoc_map: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Expresión SQL de una dimensión del Registry. Si la dimensión tiene un grupo ad-hoc:
+    CASE WHEN col IN ('A', 'B') THEN 'Label' ELSE col END
+    """
+    dim_def = DIMENSIONS_REGISTRY[dim_key]
+    col_sql = dim_def.get("sql", dim_key) if isinstance(dim_def, dict) else dim_key
+    grp = (adhoc_map or {}).get(dim_key)
+    if not grp:
+        return col_sql
+    label = getattr(grp, "label", None) or grp.get("label")
+    values = getattr(grp, "values", None) or grp.get("values")
+    vals_str = ", ".join([f"'{v}'" for v in values])
+    return f"CASE WHEN {col_sql} IN ({vals_str}) THEN '{label}' ELSE {col_sql} END"
+
+
+def sql_literal(value: Any) -> str:
+    return f"'{value}'" if isinstance(value, str) else str(value)
+
+
+def group_condition(filters: Dict[str, Any], column_sql=None) -> str:
+    """Condición AND de los filtros de un grupo de comparación (`column_sql(dim)` -> columna)."""
+    conditions = []
+    for dim, value in filters.items():
+        col_sql = column_sql(dim) if column_sql else dim
+        if isinstance(value, list):
+            conditions.append(f"{col_sql} IN ({', '.join(sql_literal(v) for v in value)})")
+        else:
+            conditions.append(f"{col_sql} = {sql_literal(value)}")
+    return " AND ".join(conditions)
+
+
+def groups_months(comparison_groups: List[Dict[str, Any]]):
+    """Unión de los meses que acotan los grupos (None si algún grupo no acota el tiempo)."""
+    months = set()
+    for group in comparison_groups:
+        group_months, _ = filter_months(group["filters"])
+        if group_months is None:
+            return None
+        months.update(group_months)
+    return frozenset(months)
+
 
 def build_where_clauses(filters: Dict[str, Any], cube_source: str) -> List[str]:
     """
     Construye cláusulas WHERE a partir de filtros vinculados al Registry.
     Soporta la lógica de Periodo Dinámico (MAX) relativo al año si está presente.
+    Los filtros temporales se reescriben a rangos literales de `periodo` (partition pruning).
     """
     where_clauses = ["segmento != 'PRACTICANTE'"]
     
     if not filters:
         return where_clauses
     
+    pruning_clauses, filters = rewrite_temporal_filters(filters, cube_source)
+    where_clauses.extend(pruning_clauses)
+    
     for dim_key, value in filters.items():
         dim_def = DIMENSIONS_REGISTRY.get(dim_key)
         if not dim_def:
@@ -52,3 +112,8 @@ def build_where_clauses(filters: Dict[str, Any], cube_source: str) -> List[str]:
             where_clauses.append(f"{col_sql} = {format_val(value)}")
     
     return where_clauses
+
+
+def build_where_predicates(filters: Dict[str, Any], cube_source: str) -> List[Predicate]:
+    """`build_where_clauses` como predicados del IR (scan directo de la tabla)."""
+    return [Predicate(clause) for clause in build_where_clauses(filters, cube_source)]
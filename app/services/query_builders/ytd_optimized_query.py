@@ -12,24 +12,28 @@ Estrategia:
 from typing import List, Dict, Any
 from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
 from app.core.config.config import get_settings
-from app.services.query_builders.utils import build_where_clauses
+from app.services.partition_pruning import filter_months, periodo_range_predicate
+from app.services.query_builders.ir import Query, Select, Column, Predicate
+from app.services.query_builders.emitter import emit
+from app.services.query_builders.optimizer import optimize
+from app.services.query_builders.utils import build_where_predicates, adhoc_group_map, dimension_sql
 
 settings = get_settings()
 CUBE_SOURCE = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
 
 
-def build_ytd_optimized_query(
+def plan_ytd_optimized_query(
     metrics: List[str],
     dimensions: List[str],
     filters: Dict[str, Any],
     limit: int = 5000,
-    adhoc_groups: List[Any] = None  # NUEVO
-) -> str:
+    adhoc_groups: List[Any] = None
+) -> Query:
     """
-    Genera query optimizada para métricas YTD.
+    IR de la query para métricas YTD.
     
     Si NO hay dimensión 'mes': Query simple con agregaciones directas
-    Si SÍ hay dimensión 'mes': Query con Window Functions mínimas
+    Si SÍ hay dimensión 'mes': Serie de headcount_base (Window Functions)
     
     Args:
         metrics: Lista de métricas a calcular
@@ -39,7 +43,7 @@ def build_ytd_optimized_query(
         adhoc_groups: Grupos dinámicos
     
     Returns:
-        str: SQL optimizado
+        Query (IR)
     """
     
     has_mes = "mes" in dimensions or "periodo" in dimensions
@@ -53,102 +57,73 @@ def build_ytd_optimized_query(
     
     if not has_mes and not requires_monthly_granularity:
         # Sin dimensión mes y métricas simples → Query simple super rápida
-        return _build_ytd_snapshot_query(metrics, dimensions, filters, limit, adhoc_groups)
-    else:
-        # Con dimensión mes O métricas complejas → Usar CTE (Series Query)
-        # CRITICAL FIX: Si el usuario NO pidió 'mes', pero necesitamos 'mes' para el window function,
-        # inyectamos 'mes' en la query interna y luego lo excluimos en el wrapper
-        query_dimensions = list(dimensions)
-        if not has_mes:
-            query_dimensions.append("mes")
-        
-        series_sql = _build_ytd_series_query(metrics, query_dimensions, filters, limit=None, adhoc_groups=adhoc_groups) # Sin limit interno
-        
-        # Separar la CTE del SELECT para poder envolver la query
-        # El formato esperado es "WITH ... \n\nSELECT ..."
-        parts = series_sql.split("\n\nSELECT", 1)
-        
-        if len(parts) == 2:
-            cte_part = parts[0]
-            select_part = f"SELECT{parts[1]}"
-        else:
-            # Fallback por si el formato cambia (aunque no debería)
-            cte_part = ""
-            select_part = series_sql
-        
-        if has_mes:
-            # Si pidió mes, devolver la serie completa
-            return series_sql + (f" LIMIT {limit}" if limit else "")
-        else:
-            # Si NO pidió mes pero era compleja, tomar el último valor acumulado
-            # CRITICAL: Si hay un LIMIT (ej: Top 5), debemos ordenar por la métrica principal DESC
-            # para que el límite tome los valores más altos, no los primeros de la lista.
-            order_by_metric = ""
-            if limit and limit < 5000: # Heurística: si el límite es pequeño, es un Top N
-                primary_metric = metrics[0] if metrics else None
-                if primary_metric:
-                    order_by_metric = f"ORDER BY {primary_metric} DESC"
-
-            wrapper_sql = f"""
-{cte_part}
+        return _plan_ytd_snapshot_query(metrics, dimensions, filters, limit, adhoc_groups)
+
+    if has_mes:
+        # Si pidió mes, devolver la serie completa
+        return _plan_ytd_series_query(metrics, dimensions, filters, limit, adhoc_groups)
+
+    # CRITICAL FIX: Si el usuario NO pidió 'mes', pero necesitamos 'mes' para el window function,
+    # inyectamos 'mes' en la serie interna y tomamos el último valor acumulado de cada grupo
+    series = _plan_ytd_series_query(metrics, list(dimensions) + ["mes"], filters, None, adhoc_groups, ordered=False)
+    ranked = Select(
+        columns=[Column.ref(c.name) for c in series.body.columns] + [Column(
+            "rn",
+            f"ROW_NUMBER() OVER (PARTITION BY {', '.join(dimensions) if dimensions else '1'} ORDER BY mes DESC)",
+            frozenset(dimensions) | {"mes"}
+        )],
+        source=series.body
+    )
 
-SELECT * EXCEPT(mes, rn)
-FROM (
-    SELECT *, ROW_NUMBER() OVER (PARTITION BY {', '.join(dimensions) if dimensions else '1'} ORDER BY mes DESC) as rn
-    FROM (
-{select_part}
+    # CRITICAL: Si hay un LIMIT (ej: Top 5), debemos ordenar por la métrica principal DESC
+    # para que el límite tome los valores más altos, no los primeros de la lista.
+    order_by = []
+    if limit and limit < 5000 and metrics:  # Heurística: si el límite es pequeño, es un Top N
+        order_by = [f"{metrics[0]} DESC"]
+
+    return Query(
+        ctes=series.ctes,
+        body=Select(
+            columns=[Column.ref(d) for d in dimensions] + [Column.ref(c.name) for c in series.body.columns[len(dimensions) + 1:]],
+            source=ranked,
+            where=[Predicate("rn = 1", frozenset({"rn"}))],
+            order_by=order_by,
+            limit=limit
+        )
     )
-)
-WHERE rn = 1
-{order_by_metric}
-LIMIT {limit}
-"""
-            return wrapper_sql.strip()
 
 
+def build_ytd_optimized_query(
+    metrics: List[str],
+    dimensions: List[str],
+    filters: Dict[str, Any],
+    limit: int = 5000,
+    adhoc_groups: List[Any] = None  # NUEVO
+) -> str:
+    """Genera query optimizada para métricas YTD (serie mensual o último acumulado)."""
+    return emit(optimize(plan_ytd_optimized_query(metrics, dimensions, filters, limit, adhoc_groups)))
+
 
-def _build_ytd_snapshot_query(
+def _plan_ytd_snapshot_query(
     metrics: List[str],
     dimensions: List[str],
     filters: Dict[str, Any],
     limit: int,
     adhoc_groups: List[Any] = None  # NUEVO
-) -> str:
+) -> Query:
     """
     Query optimizada para métricas YTD sin desglose mensual.
     Retorna un solo valor acumulado del año.
     
     Ejemplo: "Tasa rotación anual 2025" → 1 fila con el valor YTD
     """
-    
-    # Pre-procesar grupos ad-hoc
-    adhoc_map = {}
-    if adhoc_groups:
-        for grp in adhoc_groups:
-            dim = getattr(grp, "dimension", None) or grp.get("dimension")
-            if dim:
-                adhoc_map[dim] = grp
-
-    select_items = []
+    adhoc_map = adhoc_group_map(adhoc_groups)
+    columns = []
     
     # Dimensiones de agrupación (sin temporales)
     group_dims = [d for d in dimensions if d not in ['mes', 'periodo', 'month']]
     for dim_key in group_dims:
-        dim_def = DIMENSIONS_REGISTRY[dim_key]
-        base_col_sql = dim_def.get("sql", dim_key) if isinstance(dim_def, dict) else dim_key
-        
-        # --- AD-HOC LOGIC ---
-        if dim_key in adhoc_map:
-            grp = adhoc_map[dim_key]
-            label = getattr(grp, "label", None) or grp.get("label")
-            values = getattr(grp, "values", None) or grp.get("values")
-            vals_str = ", ".join([f"'{v}'" for v in values])
-            col_sql = f"CASE WHEN {base_col_sql} IN ({vals_str}) THEN '{label}' ELSE {base_col_sql} END"
-        else:
-            col_sql = base_col_sql
-        # --------------------
-
-        select_items.append(f"{col_sql} AS {dim_key}")
+        columns.append(Column(dim_key, dimension_sql(dim_key, adhoc_map)))
     
     # Métricas YTD
     for metric_key in metrics:
@@ -173,135 +148,99 @@ def _build_ytd_snapshot_query(
             # Contar activos únicos y dividir por número de meses en el periodo
             den_sql = "(COUNT(DISTINCT CASE WHEN estado = 'Activo' THEN codigo_persona END) / COUNT(DISTINCT EXTRACT(MONTH FROM periodo)))"
             
-            select_items.append(f"SAFE_DIVIDE({num_sql}, {den_sql}) * 100 AS {metric_key}")
+            columns.append(Column(metric_key, f"SAFE_DIVIDE({num_sql}, {den_sql}) * 100"))
         
-        elif metric_key in ["ceses_totales", "ceses_voluntarios", "ceses_involuntarios"]:
+        elif metric_key == "ceses_totales":
             # Métricas simples - usar columnas ya calculadas en la CTE, NO el SQL del Registry
             # porque el Registry usa 'estado' que no existe en la CTE
-            if metric_key == "ceses_totales":
-                select_items.append("ceses AS ceses_totales")
-            elif metric_key == "ceses_voluntarios":
-                select_items.append("ceses_voluntarios")
-            elif metric_key == "ceses_involuntarios":
-                select_items.append("ceses_involuntarios")
-        
-
+            columns.append(Column("ceses_totales", "ceses"))
+        elif metric_key in ["ceses_voluntarios", "ceses_involuntarios"]:
+            columns.append(Column.ref(metric_key))
         
         else:
             # Otras métricas YTD (headcount, etc.)
-            metric_sql = metric_def.get("sql", metric_key)
-            select_items.append(f"{metric_sql} AS {metric_key}")
-    
-    # WHERE
-    where_clauses = build_where_clauses(filters, CUBE_SOURCE)
-    where_block = " AND ".join(where_clauses) if where_clauses else "1=1"
+            columns.append(Column(metric_key, metric_def.get("sql", metric_key)))
     
     # GROUP BY (solo si hay dimensiones no-temporales)
-    group_by = ""
-    order_by = ""
+    group_by, order_by = [], []
     if group_dims:
-        dim_cols = []
-        for dim_key in group_dims:
-            dim_def = DIMENSIONS_REGISTRY[dim_key]
-            col_sql = dim_def.get("sql", dim_key) if isinstance(dim_def, dict) else dim_key
-            dim_cols.append(col_sql)
-        group_by = f"GROUP BY {', '.join(dim_cols)}"
+        group_by = [dimension_sql(d) for d in group_dims]
         
         # RANKING LOGIC: Si hay un límite pequeño, ordenar por la métrica principal DESC
-        if limit and limit < 5000:
-            primary_metric = metrics[0] if metrics else None
-            if primary_metric:
-                order_by = f"ORDER BY {primary_metric} DESC"
-            else:
-                order_by = f"ORDER BY {dim_cols[0]} ASC"
+        if limit and limit < 5000 and metrics:
+            order_by = [f"{metrics[0]} DESC"]
         else:
-            order_by = f"ORDER BY {dim_cols[0]} ASC"
-    
-    # Ensamblar SQL
-    select_str = ",\n    ".join(select_items)
+            order_by = [f"{group_by[0]} ASC"]
     
-    sql = f"""
-SELECT 
-    {select_str}
-FROM {CUBE_SOURCE}
-WHERE {where_block}
-{group_by}
-{order_by}
-LIMIT {limit}
-"""
-    
-    return sql.strip()
+    return Query(body=Select(
+        columns=columns,
+        source=CUBE_SOURCE,
+        where=build_where_predicates(filters, CUBE_SOURCE),
+        group_by=group_by,
+        order_by=order_by,
+        limit=limit
+    ))
 
 
-def _build_ytd_series_query(
+def _series_time_filter(filters: Dict[str, Any]) -> List[Predicate]:
+    """
+    Filtro temporal sobre las filas de headcount_base (después de las ventanas).
+    Año, trimestre, mes y periodo YYYYMM se traducen a un rango de `periodo` que además
+    informa los meses pedidos: el optimizador lo empuja hasta el scan. Los temporales que
+    el rango no cubre (ej: mes o trimestre sin año) se filtran sobre las columnas del CTE.
+    """
+    months, covered = filter_months(filters or {})
+    predicates = []
+    if months is not None:
+        predicates.append(Predicate(periodo_range_predicate(months), frozenset({"periodo"}), frozenset(months)))
+    
+    columns = {"anio": "anio", "year": "anio", "mes": "mes", "month": "mes",
+               "trimestre": "EXTRACT(QUARTER FROM periodo)", "q": "EXTRACT(QUARTER FROM periodo)"}
+    for dim_key, value in (filters or {}).items():
+        if dim_key not in columns or dim_key in covered:
+            continue
+        col_sql = columns[dim_key]
+        uses = frozenset({"periodo"}) if "periodo" in col_sql else frozenset({col_sql})
+        sql = f"{col_sql} = {value}" if not isinstance(value, list) else f"{col_sql} IN ({', '.join(map(str, value))})"
+        predicates.append(Predicate(sql, uses))
+    return predicates
+
+
+def _plan_ytd_series_query(
     metrics: List[str],
     dimensions: List[str],
     filters: Dict[str, Any],
     limit: int,
-    adhoc_groups: List[Any] = None  # NUEVO
-) -> str:
+    adhoc_groups: List[Any] = None,  # NUEVO
+    ordered: bool = True
+) -> Query:
     """
-    Query optimizada para métricas YTD con desglose mensual.
-    Usa Window Functions pero de forma más eficiente que el CTE gigante.
+    Serie mensual de headcount_base para métricas YTD (Window Functions).
     
     Ejemplo: "Evolución de rotación mensual 2025" → 12 filas (una por mes)
     """
+    # Import diferido: cte_builders importa este paquete
+    from app.services.cte_builders import headcount_base_stages, headcount_base_column
     
-    # Por ahora, delegar al CTE builder existente
-    # TODO: Optimizar esto en una segunda iteración
-    from app.services.cte_builders import build_headcount_base_cte
-    
-    cte_sql = build_headcount_base_cte(dimensions, filters, adhoc_groups=adhoc_groups)
-    
-    # Construir SELECT final
-    select_items = []
-    
-    for dim_key in dimensions:
-        select_items.append(dim_key)
+    columns = [Column.ref(dim_key) for dim_key in dimensions]
     
     for metric_key in metrics:
-        metric_def = METRICS_REGISTRY.get(metric_key, {})
-        
-        # Para métricas de ceses, usar columnas de la CTE en lugar del SQL del Registry
-        if metric_key == "ceses_totales":
-            select_items.append("ceses AS ceses_totales")
-        elif metric_key == "ceses_voluntarios":
-            select_items.append("ceses_voluntarios")
-        elif metric_key == "ceses_involuntarios":
-            select_items.append("ceses_involuntarios")
-        elif metric_key == "headcount_promedio_acumulado":
-            # La CTE ya calcula 'hc_promedio_acumulado', mapearlo correctamente
-            select_items.append("hc_promedio_acumulado AS headcount_promedio_acumulado")
+        # Columna del CTE (no el SQL del Registry: 'estado' no existe en headcount_base)
+        col_name = headcount_base_column(metric_key)
+        if col_name == metric_key:
+            columns.append(Column.ref(metric_key))
+        elif col_name:
+            columns.append(Column(metric_key, col_name, frozenset({col_name})))
         else:
-            # Para otras métricas (tasas, headcount), usar el nombre de columna de la CTE
-            col_name = metric_def.get("sql", metric_key)
-            select_items.append(f"{col_name} AS {metric_key}")
-    
-    select_str = ",\n    ".join(select_items)
-    
-    # Filtros POST-CTE
-    where_clauses = []
-    if filters:
-        for dim_key, value in filters.items():
-            if dim_key in ["anio", "year"]:
-                where_clauses.append(f"anio = {value}" if not isinstance(value, list) else f"anio IN ({', '.join(map(str, value))})")
-    
-    where_block = " AND ".join(where_clauses) if where_clauses else "1=1"
-    
-    limit_clause = f"LIMIT {limit}" if limit else ""
-    
-    sql = f"""
-WITH {cte_sql}
-
-SELECT 
-    {select_str}
-FROM headcount_base
-WHERE {where_block}
-ORDER BY anio, mes ASC
-{limit_clause}
-"""
-
-    
-    return sql.strip()
-
-
+            columns.append(Column(metric_key, METRICS_REGISTRY.get(metric_key, {}).get("sql", metric_key)))
+    
+    return Query(
+        ctes=headcount_base_stages(dimensions, filters, adhoc_groups=adhoc_groups),
+        body=Select(
+            columns=columns,
+            source="headcount_base",
+            where=_series_time_filter(filters),
+            order_by=["anio", "mes ASC"] if ordered else [],
+            limit=limit
+        )
+    )
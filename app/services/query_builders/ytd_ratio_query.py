@@ -13,21 +13,25 @@ Estrategia:
 from typing import List, Dict, Any
 from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
 from app.core.config.config import get_settings
-from app.services.query_builders.utils import build_where_clauses
+from app.services.query_builders.ir import Query, Select, Column
+from app.services.query_builders.emitter import emit
+from app.services.query_builders.optimizer import optimize
+from app.services.query_builders.utils import build_where_predicates, adhoc_group_map, dimension_sql
 
 settings = get_settings()
 CUBE_SOURCE = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
 
 
-def build_ytd_ratio_query(
+def plan_ytd_ratio_query(
     metrics: List[str],
     dimensions: List[str],
     filters: Dict[str, Any],
     limit: int = 5000,
-    adhoc_groups: List[Any] = None  # NUEVO
-) -> str:
+    adhoc_groups: List[Any] = None
+) -> Query:
     """
-    Genera query optimizada para métricas YTD (ratios anuales).
+    IR de la query YTD (ratios anuales): CTE `yearly_aggregates` con numerador y
+    denominador por métrica + SELECT final que aplica la fórmula.
     
     Args:
         metrics: Lista de métricas a calcular
@@ -37,115 +41,63 @@ def build_ytd_ratio_query(
         adhoc_groups: Grupos dinámicos
     
     Returns:
-        str: SQL optimizado
+        Query (IR)
     """
-    
-    # Pre-procesar grupos ad-hoc
-    adhoc_map = {}
-    if adhoc_groups:
-        for grp in adhoc_groups:
-            dim = getattr(grp, "dimension", None) or grp.get("dimension")
-            if dim:
-                adhoc_map[dim] = grp
+    adhoc_map = adhoc_group_map(adhoc_groups)
 
     # Separar métricas por tipo
-    ytd_metrics = []
-    simple_metrics = []
-    
-    for metric_key in metrics:
-        metric_def = METRICS_REGISTRY.get(metric_key, {})
-        complexity = metric_def.get('complexity', 'simple')
-        
-        if complexity == 'ytd_ratio':
-            ytd_metrics.append(metric_key)
-        else:
-            simple_metrics.append(metric_key)
+    ytd_metrics = [m for m in metrics if METRICS_REGISTRY.get(m, {}).get('complexity', 'simple') == 'ytd_ratio']
+    simple_metrics = [m for m in metrics if m not in ytd_metrics]
     
-    # Construir SELECT del CTE (agregaciones base)
-    cte_select = []
-    final_select = []
+    cte_columns = []
+    final_columns = []
     
     # Dimensiones de agrupación (sin temporales para YTD)
     group_dims = [d for d in dimensions if d not in ['mes', 'periodo', 'month']]
-    
-    # Agregar dimensiones al SELECT
     for dim_key in group_dims:
-        dim_def = DIMENSIONS_REGISTRY[dim_key]
-        base_col_sql = dim_def.get("sql", dim_key) if isinstance(dim_def, dict) else dim_key
-        
-        # --- AD-HOC LOGIC ---
-        if dim_key in adhoc_map:
-            grp = adhoc_map[dim_key]
-            label = getattr(grp, "label", None) or grp.get("label")
-            values = getattr(grp, "values", None) or grp.get("values")
-            vals_str = ", ".join([f"'{v}'" for v in values])
-            col_sql = f"CASE WHEN {base_col_sql} IN ({vals_str}) THEN '{label}' ELSE {base_col_sql} END"
-        else:
-            col_sql = base_col_sql
-        # --------------------
-
-        cte_select.append(f"{col_sql} AS {dim_key}")
-        final_select.append(dim_key)
+        if dim_key not in DIMENSIONS_REGISTRY:
+            raise ValueError(f"Dimensión no autorizada: '{dim_key}'")
+        cte_columns.append(Column(dim_key, dimension_sql(dim_key, adhoc_map)))
+        final_columns.append(Column.ref(dim_key))
     
-    # Procesar métricas YTD
+    # Métricas YTD: numerador y denominador en el CTE, fórmula en el SELECT final
     for metric_key in ytd_metrics:
         metric_def = METRICS_REGISTRY[metric_key]
-        
-        # Obtener numerador y denominador
-        num_sql = metric_def['numerator']['sql']
-        den_sql = metric_def['denominator']['sql']
-        
-        # Agregar al CTE
-        cte_select.append(f"{num_sql} AS {metric_key}_num")
-        cte_select.append(f"{den_sql} AS {metric_key}_den")
-        
-        # Construir fórmula para SELECT final
-        formula = metric_def['formula']
-        formula = formula.replace('numerator', f'{metric_key}_num')
-        formula = formula.replace('denominator', f'{metric_key}_den')
-        
-        final_select.append(f"{formula} AS {metric_key}")
+        num, den = f"{metric_key}_num", f"{metric_key}_den"
+        cte_columns.append(Column(num, metric_def['numerator']['sql']))
+        cte_columns.append(Column(den, metric_def['denominator']['sql']))
+        formula = metric_def['formula'].replace('numerator', num).replace('denominator', den)
+        final_columns.append(Column(metric_key, formula, frozenset({num, den})))
     
-    # Procesar métricas simples
+    # Métricas simples
     for metric_key in simple_metrics:
-        metric_def = METRICS_REGISTRY[metric_key]
-        sql = metric_def.get('sql', metric_key)
-        
-        cte_select.append(f"{sql} AS {metric_key}")
-        final_select.append(metric_key)
-    
-    # Construir WHERE
-    where_clauses = build_where_clauses(filters, CUBE_SOURCE)
-    where_block = " AND ".join(where_clauses) if where_clauses else "1=1"
-    
-    # Construir GROUP BY
-    group_by = f"GROUP BY {', '.join(group_dims)}" if group_dims else ""
+        if metric_key not in METRICS_REGISTRY:
+            raise ValueError(f"Métrica no definida: '{metric_key}'")
+        cte_columns.append(Column(metric_key, METRICS_REGISTRY[metric_key].get('sql', metric_key)))
+        final_columns.append(Column.ref(metric_key))
     
-    # Ensamblar SQL
-    cte_select_str = ",\n        ".join(cte_select)
-    final_select_str = ",\n    ".join(final_select)
+    # ORDER BY si hay un límite pequeño (Top N)
+    order_by = []
+    if limit and limit < 5000 and metrics:
+        order_by = [f"{metrics[0]} DESC"]
     
-    # Construir ORDER BY si hay un límite pequeño (Top N)
-    order_by = ""
-    if limit and limit < 5000:
-        primary_metric = metrics[0] if metrics else None
-        if primary_metric:
-            order_by = f"\nORDER BY {primary_metric} DESC"
-    
-    sql = f"""
-WITH yearly_aggregates AS (
-    SELECT 
-        {cte_select_str}
-    FROM {CUBE_SOURCE}
-    WHERE {where_block}
-    {group_by}
-)
-SELECT 
-    {final_select_str}
-FROM yearly_aggregates{order_by}
-LIMIT {limit}
-"""
-    
-    return sql.strip()
+    return Query(
+        ctes={"yearly_aggregates": Select(
+            columns=cte_columns,
+            source=CUBE_SOURCE,
+            where=build_where_predicates(filters, CUBE_SOURCE),
+            group_by=group_dims
+        )},
+        body=Select(columns=final_columns, source="yearly_aggregates", order_by=order_by, limit=limit)
+    )
 
 
+def build_ytd_ratio_query(
+    metrics: List[str],
+    dimensions: List[str],
+    filters: Dict[str, Any],
+    limit: int = 5000,
+    adhoc_groups: List[Any] = None  # NUEVO
+) -> str:
+    """Genera query optimizada para métricas YTD (ratios anuales)."""
+    return emit(optimize(plan_ytd_ratio_query(metrics, dimensions, filters, limit, adhoc_groups)))
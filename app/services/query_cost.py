@@ -0,0 +1,108 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from app.core.config.config import get_settings
+from app.core.utils.perf_logger import log_perf
+from app.services.bigquery import get_bq_service
+from app.services.data_freshness import get_data_freshness_service
+
+logger = logging.getLogger(__name__)
+
+
+def _sql_key(sql: str) -> str:
+    return hashlib.sha256(" ".join(sql.split()).encode("utf-8")).hexdigest()
+
+
+def suggest_narrowing(filters: Dict[str, Any], dimensions: List[str], intent: Optional[str] = None) -> List[str]:
+    """Sugerencias para acotar una consulta que supera el presupuesto de bytes."""
+    suggestions = []
+    anio = filters.get("anio")
+    if anio is None and "periodo" not in filters:
+        suggestions.append("Filtra por un año o periodo específico")
+    elif isinstance(anio, list) and len(anio) > 1:
+        suggestions.append(f"Consulta un solo año a la vez (pediste {len(anio)})")
+    elif "mes" not in filters and "periodo" not in filters and "trimestre" not in filters:
+        suggestions.append("Limita a un periodo más corto (mes, trimestre)")
+
+    if not any(k in filters for k in ["uo2", "division"]):
+        suggestions.append("Filtra por una división específica")
+    if intent == "LISTING" or len(dimensions) > 2:
+        suggestions.append("Reduce las dimensiones o columnas solicitadas")
+    return suggestions
+
+
+class QueryCostEstimator:
+    """
+    Estimación de costo previa a la ejecución (BigQuery dry run).
+
+    - `estimate(sql)`: bytes a procesar, cacheado por SQL normalizada (el dry run tarda
+      ~100-300 ms; las mismas consultas se repiten mucho entre usuarios).
+    - `is_over_budget(bytes)`: control de admisión antes de consumir slots (solo para
+      consultas que sí van a BigQuery: no las servidas por especulación o caches).
+    Cada estimación se registra en la telemetría de rendimiento (`log_perf`).
+    """
+    _instance = None
+
+    # Las tablas se recargan mensualmente: una estimación vieja sigue siendo representativa
+    ESTIMATE_TTL_SECONDS = 15 * 60
+    MAX_ENTRIES = 1024
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(QueryCostEstimator, cls).__new__(cls)
+            cls._instance._estimates = OrderedDict()
+            cls._instance._lock = threading.Lock()
+            # Nueva carga de datos -> los bytes por consulta cambian
+            get_data_freshness_service().subscribe(cls._instance._on_data_change)
+        return cls._instance
+
+    def _on_data_change(self, version: str):
+        logger.info(f"💸 [COST] Datos actualizados ({version}): se descartan las estimaciones")
+        self.clear()
+
+    @property
+    def budget_bytes(self) -> int:
+        return get_settings().QUERY_MAX_BYTES_BILLED
+
+    def estimate(self, sql: str, variant: Optional[str] = None, bq=None) -> Optional[int]:
+        """Bytes estimados para `sql`; None si el dry run falla."""
+        key = _sql_key(sql)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._estimates.get(key)
+            if cached and now - cached["at"] < self.ESTIMATE_TTL_SECONDS:
+                self._estimates.move_to_end(key)
+                log_perf("bq_dry_run", 0.0, {"sql_hash": key[:12], "variant": variant, "bytes": cached["bytes"], "cache_hit": True})
+                return cached["bytes"]
+
+        t_start = time.time()
+        try:
+            total_bytes = int((bq or get_bq_service()).dry_run(sql))
+        except Exception as e:
+            logger.warning(f"💸 [COST] Dry run falló ({variant or 'sql'}): {e}")
+            return None
+        duration = time.time() - t_start
+
+        with self._lock:
+            self._estimates[key] = {"bytes": total_bytes, "at": now}
+            self._estimates.move_to_end(key)
+            while len(self._estimates) > self.MAX_ENTRIES:
+                self._estimates.popitem(last=False)
+
+        log_perf("bq_dry_run", duration, {"sql_hash": key[:12], "variant": variant, "bytes": total_bytes, "cache_hit": False})
+        return total_bytes
+
+    def is_over_budget(self, estimated_bytes: Optional[int]) -> bool:
+        return estimated_bytes is not None and estimated_bytes > self.budget_bytes
+
+    def clear(self):
+        with self._lock:
+            self._estimates.clear()
+
+
+def get_query_cost_estimator() -> QueryCostEstimator:
+    return QueryCostEstimator()
@@ -0,0 +1,131 @@
+"""
+Estadísticas de jobs de BigQuery (bytes, slots, cache, cola, filas) por consulta.
+
+`BigQueryService` registra cada job ejecutado en el colector del contexto actual
+(`collect_query_stats`). `execute_semantic_query` abre un colector por llamada, adjunta
+el resultado a su telemetría (y por ende a cada bloque del reporte ejecutivo) y lo suma
+al agregado del proceso por builder y por métrica (`GET /admin/bq-stats`), para dirigir
+las optimizaciones SQL a lo que realmente consume slots.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+_current: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("bq_query_stats", default=None)
+
+STAT_FIELDS = ("bytes_processed", "bytes_billed", "slot_ms", "queue_ms", "exec_ms", "rows")
+
+
+def _int(value) -> Optional[int]:
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _elapsed_ms(start, end) -> Optional[int]:
+    if isinstance(start, datetime) and isinstance(end, datetime):
+        return int((end - start).total_seconds() * 1000)
+    return None
+
+
+def job_statistics(job, rows: Optional[int] = None) -> Dict[str, Any]:
+    """Estadísticas de un QueryJob terminado (None en los campos que el job no informa)."""
+    cache_hit = getattr(job, "cache_hit", None)
+    return {
+        "job_id": getattr(job, "job_id", None) if isinstance(getattr(job, "job_id", None), str) else None,
+        "bytes_processed": _int(getattr(job, "total_bytes_processed", None)),
+        "bytes_billed": _int(getattr(job, "total_bytes_billed", None)),
+        "slot_ms": _int(getattr(job, "slot_millis", None)),
+        "cache_hit": cache_hit if isinstance(cache_hit, bool) else None,
+        "queue_ms": _elapsed_ms(getattr(job, "created", None), getattr(job, "started", None)),
+        "exec_ms": _elapsed_ms(getattr(job, "started", None), getattr(job, "ended", None)),
+        "rows": _int(rows),
+    }
+
+
+def record_job(job, rows: Optional[int] = None):
+    """Registra el job en el colector activo (no-op fuera de `collect_query_stats`)."""
+    jobs = _current.get()
+    if jobs is not None:
+        jobs.append(job_statistics(job, rows))
+
+
+@contextmanager
+def collect_query_stats():
+    """`with collect_query_stats() as jobs:` — jobs de BigQuery ejecutados dentro del bloque."""
+    jobs: List[Dict[str, Any]] = []
+    token = _current.set(jobs)
+    try:
+        yield jobs
+    finally:
+        _current.reset(token)
+
+
+def summarize_jobs(jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totales de una lista de jobs (cache_hit: todos los jobs salieron del cache de BigQuery)."""
+    summary = {"jobs": len(jobs)}
+    for field in STAT_FIELDS:
+        summary[field] = sum(j[field] or 0 for j in jobs)
+    summary["cache_hit"] = bool(jobs) and all(j["cache_hit"] for j in jobs)
+    return summary
+
+
+class QueryStatsAggregator:
+    """Totales del proceso por builder y por métrica (una consulta suma a cada métrica que pidió)."""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(QueryStatsAggregator, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance._by_builder = {}
+            cls._instance._by_metric = {}
+        return cls._instance
+
+    @staticmethod
+    def _add(bucket: Dict[str, Any], summary: Dict[str, Any]):
+        bucket["queries"] = bucket.get("queries", 0) + 1
+        bucket["jobs"] = bucket.get("jobs", 0) + summary["jobs"]
+        bucket["cache_hits"] = bucket.get("cache_hits", 0) + int(summary["cache_hit"])
+        for field in STAT_FIELDS:
+            bucket[field] = bucket.get(field, 0) + summary[field]
+
+    def record(self, builder: str, metrics: List[str], jobs: List[Dict[str, Any]]):
+        if not jobs:
+            return
+        summary = summarize_jobs(jobs)
+        with self._lock:
+            self._add(self._by_builder.setdefault(builder, {}), summary)
+            for metric in dict.fromkeys(metrics):
+                self._add(self._by_metric.setdefault(metric, {}), summary)
+
+    @staticmethod
+    def _ranked(buckets: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        ranked = {}
+        for name, bucket in sorted(buckets.items(), key=lambda item: item[1]["slot_ms"], reverse=True):
+            queries = bucket["queries"]
+            ranked[name] = {
+                **bucket,
+                "avg_slot_ms": round(bucket["slot_ms"] / queries, 1),
+                "avg_bytes_processed": round(bucket["bytes_processed"] / queries),
+                "avg_queue_ms": round(bucket["queue_ms"] / queries, 1),
+                "cache_hit_rate": round(bucket["cache_hits"] / queries, 3),
+            }
+        return ranked
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Agregados ordenados por slot_ms total (lo más caro primero)."""
+        with self._lock:
+            by_builder = {k: dict(v) for k, v in self._by_builder.items()}
+            by_metric = {k: dict(v) for k, v in self._by_metric.items()}
+        return {"by_builder": self._ranked(by_builder), "by_metric": self._ranked(by_metric)}
+
+    def clear(self):
+        with self._lock:
+            self._by_builder.clear()
+            self._by_metric.clear()
+
+
+def get_query_stats_aggregator() -> QueryStatsAggregator:
+    return QueryStatsAggregator()
@@ -0,0 +1,204 @@
+import re
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import firestore
+
+from app.core.config.config import get_settings
+from app.services.bigquery import get_bq_service
+from app.services.data_freshness import get_data_freshness_service
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+CUBE_SOURCE = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
+
+
+class ReportCacheWarmer:
+    """
+    Pre-generates executive reports right after each data refresh, so the first
+    request of the morning is a memo hit (report_snapshots + ai_insights_cache).
+
+    - Detects the latest `MAX(periodo)` in the turnover table (data freshness metadata).
+    - One lease document per period (`cache_warmer_runs/{YYYYMM}`, created atomically):
+      only one worker/process warms a given period. The lease has a deadline (renewed as
+      targets finish): a run that crashed leaves a stale lease that the next tick takes over.
+    - A period is COMPLETED only when every target succeeded; FAILED/PARTIAL runs are
+      retried on the next tick (already memoized reports are cheap hits).
+    - Targets: month, quarter and year-to-date for Global + every uo2 division.
+    - Bounded concurrency: each report already fans out 7 BigQuery blocks.
+    """
+
+    DEFAULT_CONCURRENCY = 2
+    # Deadline of an IN_PROGRESS lease without renewal (one report takes well under this)
+    LEASE_SECONDS = 30 * 60
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._db = None
+
+    @property
+    def runs(self):
+        if self._db is None:
+            self._db = firestore.Client(project=os.getenv("PROJECT_ID"))
+        return self._db.collection("cache_warmer_runs")
+
+    # --- DISCOVERY ---
+
+    def detect_latest_period(self) -> Optional[str]:
+        """Latest loaded period as 'YYYYMM' (None if the table is empty)."""
+        # Forced metadata refresh: a new load also invalidates the result caches
+        freshness = get_data_freshness_service()
+        if freshness.refresh(force=True):
+            latest = freshness.latest_periodo()
+            return latest.strftime("%Y%m") if latest else None
+
+        df = get_bq_service().execute_query(f"SELECT CAST(MAX(periodo) AS STRING) AS max_periodo FROM {CUBE_SOURCE}")
+        raw = df.iloc[0]["max_periodo"] if not df.empty else None
+        if raw is None:
+            return None
+        digits = re.sub(r"\D", "", str(raw))
+        return digits[:6] if len(digits) >= 6 else None
+
+    def list_divisions(self) -> List[str]:
+        df = get_bq_service().execute_query(f"SELECT DISTINCT uo2 FROM {CUBE_SOURCE} WHERE uo2 IS NOT NULL ORDER BY 1")
+        return df["uo2"].tolist()
+
+    @staticmethod
+    def build_targets(latest_period: str, divisions: List[str]) -> List[Tuple[str, Optional[str]]]:
+        """
+        (periodo_anomes, uo2_filter) pairs: month, quarter and YTD for Global + each division.
+        Only formats the report tool supports (YYYYMM, YYYYQ#, YYYY): the YTD is the YEAR
+        report, whose KPIs are year-to-date up to the latest loaded month.
+        """
+        year, month = int(latest_period[:4]), int(latest_period[4:6])
+        periods = [latest_period, f"{year}Q{(month - 1) // 3 + 1}"]
+        if month > 1:
+            periods.append(str(year))  # Year-to-date
+
+        scopes = [None] + list(divisions)
+        return [(p, scope) for scope in scopes for p in periods]
+
+    # --- LEASE ---
+
+    def _lease_deadline(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=self.LEASE_SECONDS)
+
+    def _acquire(self, period: str, force: bool) -> bool:
+        doc_ref = self.runs.document(period)
+        payload = {
+            "period": period,
+            "status": "IN_PROGRESS",
+            "started_at": firestore.SERVER_TIMESTAMP,
+            "lease_expires_at": self._lease_deadline(),
+        }
+        if force:
+            doc_ref.set(payload)
+            return True
+        try:
+            doc_ref.create(payload)
+            return True
+        except AlreadyExists:
+            pass
+
+        # El lease existe: se toma solo si la corrida anterior no completó y no está viva
+        @firestore.transactional
+        def _take_over(transaction) -> bool:
+            current = doc_ref.get(transaction=transaction).to_dict() or {}
+            status = current.get("status")
+            if status == "COMPLETED":
+                return False
+            expires_at = current.get("lease_expires_at")
+            if status == "IN_PROGRESS" and expires_at and expires_at > datetime.now(timezone.utc):
+                return False
+            transaction.set(doc_ref, {**payload, "attempts": current.get("attempts", 1) + 1, "previous_status": status})
+            return True
+
+        taken = _take_over(self._db.transaction())
+        if taken:
+            logger.info(f"🔥 [WARMER] Retomando lease de {period} (corrida previa fallida, parcial o caída).")
+        return taken
+
+    def _renew(self, period: str):
+        self.runs.document(period).update({"lease_expires_at": self._lease_deadline()})
+
+    def _release(self, period: str, summary: Dict[str, Any]):
+        self.runs.document(period).update({
+            "status": summary["status"].upper(),
+            "completed_at": firestore.SERVER_TIMESTAMP,
+            "lease_expires_at": None,
+            "summary": summary
+        })
+
+    # --- EXECUTION ---
+
+    async def warm(self, period: Optional[str] = None, force: bool = False, include_divisions: bool = True) -> Dict[str, Any]:
+        """Warm every target for `period` (default: latest loaded). Returns a summary dict."""
+        period = period or await asyncio.to_thread(self.detect_latest_period)
+        if not period:
+            logger.warning("🔥 [WARMER] No se pudo detectar el último periodo.")
+            return {"status": "skipped", "reason": "no_period"}
+
+        if not await asyncio.to_thread(self._acquire, period, force):
+            logger.info(f"🔥 [WARMER] Periodo {period} ya precalentado (o en curso). Skip.")
+            return {"status": "skipped", "reason": "already_warmed", "period": period}
+
+        try:
+            summary = await self._warm_targets(period, include_divisions)
+        except Exception as e:
+            # No dejar el lease IN_PROGRESS hasta que venza: el próximo tick reintenta
+            await asyncio.to_thread(self._release, period, {"status": "failed", "period": period, "error": str(e)})
+            raise
+        await asyncio.to_thread(self._release, period, summary)
+        logger.info(f"🔥 [WARMER] Fin: {summary}")
+        return summary
+
+    async def _warm_targets(self, period: str, include_divisions: bool) -> Dict[str, Any]:
+        # Import diferido: el orquestador arrastra el stack de tools del agente
+        from app.ai.tools.executive_report_orchestrator import generate_executive_report
+
+        divisions = await asyncio.to_thread(self.list_divisions) if include_divisions else []
+        targets = self.build_targets(period, divisions)
+        logger.info(f"🔥 [WARMER] Precalentando {len(targets)} reportes para {period} (concurrencia={self.concurrency})")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _warm_one(target_period: str, scope: Optional[str]) -> bool:
+            async with semaphore:
+                result = await generate_executive_report(target_period, uo2_filter=scope)
+                meta = result.get("metadata", {})
+                # Un reporte armado con datos stale (circuito abierto) no quedó precalentado
+                ok = (result.get("response_type") != "error" and not meta.get("failed_blocks")
+                      and not meta.get("stale_blocks") and not meta.get("stale_narratives"))
+                logger.info(f"🔥 [WARMER] {target_period} | {scope or 'Global'} -> {'OK' if ok else 'ERROR'}")
+                try:
+                    await asyncio.to_thread(self._renew, period)
+                except Exception as e:
+                    logger.warning(f"🔥 [WARMER] No se pudo renovar el lease de {period}: {e}")
+                return ok
+
+        outcomes = await asyncio.gather(*[_warm_one(p, s) for p, s in targets], return_exceptions=True)
+        succeeded = sum(1 for o in outcomes if o is True)
+        failed = len(targets) - succeeded
+        # Solo COMPLETED si todo salió bien: FAILED/PARTIAL se reintentan en el próximo tick
+        status = "completed" if failed == 0 else "failed" if succeeded == 0 else "partial"
+        return {"status": status, "period": period, "targets": len(targets), "succeeded": succeeded, "failed": failed}
+
+    async def run_forever(self, interval_seconds: int):
+        """In-process scheduler: polls for a new MAX(periodo) every `interval_seconds`."""
+        while True:
+            try:
+                await self.warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"🔥 [WARMER] Error en ciclo de precalentamiento: {e}", exc_info=True)
+            await asyncio.sleep(interval_seconds)
+
+
+def get_report_cache_warmer(concurrency: int = ReportCacheWarmer.DEFAULT_CONCURRENCY) -> ReportCacheWarmer:
+    return ReportCacheWarmer(concurrency=concurrency)
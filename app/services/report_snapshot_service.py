@@ -1,40 +1,261 @@
 import os
+import json
+import time
 import uuid
+import queue
+import hashlib
 import logging
+import threading
 from datetime import datetime
-from typing import Dict, Any, List, Union
+from typing import Dict, Any, List, Optional, Union
 from google.cloud import firestore
+from google.api_core import exceptions as gexceptions
 
 logger = logging.getLogger(__name__)
 
+
+# Errores de Firestore que vale la pena reintentar (el resto es permanente para ese batch)
+_TRANSIENT_ERRORS = (
+    gexceptions.ServiceUnavailable,
+    gexceptions.DeadlineExceeded,
+    gexceptions.InternalServerError,
+    gexceptions.Aborted,
+    gexceptions.ResourceExhausted,
+)
+
+
+def _doc_key(doc_ref) -> str:
+    return getattr(doc_ref, "path", None) or str(doc_ref)
+
+
+def _op_size(op) -> int:
+    """Tamaño aproximado (bytes) de una escritura en el request de commit."""
+    _, doc_ref, data = op
+    return len(_doc_key(doc_ref)) + len(json.dumps(data, default=str).encode("utf-8"))
+
+
+class _SnapshotWriteBehind:
+    """
+    Write-behind queue for snapshot writes.
+    A single daemon thread drains the queue in FIFO order and groups pending
+    operations into Firestore WriteBatches, so callers (async orchestrator) never wait on I/O.
+
+    Batches mix writes from different reports, so a failing write must not drop the rest:
+    transient errors are retried with backoff, and a batch that still fails is split per
+    document (report / memo-index entry) and then per op, isolating the bad write.
+    """
+
+    # Firestore limit is 500 writes per batch
+    MAX_BATCH_SIZE = 450
+    # Firestore limit is 10 MiB per commit request: leave headroom for field paths/encoding
+    MAX_BATCH_BYTES = 8 * 1024 * 1024
+    # Short wait to coalesce writes that arrive together (e.g. parallel blocks finishing)
+    LINGER_SECONDS = 0.05
+    # Backoff between attempts for transient commit failures
+    RETRY_BACKOFF_SECONDS = (0.2, 1.0, 3.0)
+
+    def __init__(self, db):
+        self._db = db
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, op: str, doc_ref, data: Dict[str, Any]):
+        """Enqueue a 'set' or 'update' and return immediately."""
+        self._ensure_started()
+        self._queue.put((op, doc_ref, data))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            ops = [self._queue.get()]
+            time.sleep(self.LINGER_SECONDS)
+            while len(ops) < self.MAX_BATCH_SIZE:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                for chunk in self._chunks(ops):
+                    self._write(chunk)
+            except Exception as e:
+                logger.error(f"Snapshot batch write failed ({len(ops)} ops): {e}")
+            finally:
+                for _ in ops:
+                    self._queue.task_done()
+
+    def _chunks(self, ops: List[tuple]) -> List[List[tuple]]:
+        """Parte los ops (en orden) en batches que respetan el límite de bytes del request."""
+        chunks, current, size = [], [], 0
+        for op in ops:
+            op_size = _op_size(op)
+            if current and size + op_size > self.MAX_BATCH_BYTES:
+                chunks.append(current)
+                current, size = [], 0
+            current.append(op)
+            size += op_size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _commit(self, ops: List[tuple]):
+        """Commit con reintentos para errores transitorios; propaga el error final."""
+        for attempt in range(len(self.RETRY_BACKOFF_SECONDS) + 1):
+            try:
+                batch = self._db.batch()
+                for op, doc_ref, data in ops:
+                    if op == "set":
+                        batch.set(doc_ref, data)
+                    else:
+                        batch.update(doc_ref, data)
+                batch.commit()
+                return
+            except _TRANSIENT_ERRORS as e:
+                if attempt == len(self.RETRY_BACKOFF_SECONDS):
+                    raise
+                delay = self.RETRY_BACKOFF_SECONDS[attempt]
+                logger.warning(f"Snapshot batch commit transient failure ({len(ops)} ops), retrying in {delay}s: {e}")
+                time.sleep(delay)
+
+    def _write(self, ops: List[tuple]):
+        """Commit de un batch; si falla, aísla la escritura culpable (por documento, luego por op)."""
+        try:
+            self._commit(ops)
+            return
+        except Exception as e:
+            if len(ops) == 1:
+                _, doc_ref, _ = ops[0]
+                logger.error(f"Snapshot write dropped for {_doc_key(doc_ref)}: {e}")
+                return
+            logger.warning(f"Snapshot batch commit failed ({len(ops)} ops), splitting: {e}")
+
+        by_doc: Dict[str, List[tuple]] = {}
+        for op in ops:
+            by_doc.setdefault(_doc_key(op[1]), []).append(op)
+        groups = list(by_doc.values())
+        if len(groups) == 1:
+            # Un solo documento: cada op por separado (en orden)
+            groups = [[op] for op in ops]
+        for group in groups:
+            self._write(group)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Block until every queued write is committed (or timeout). Returns True if drained."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                logger.warning(f"Snapshot flush timed out with {self._queue.unfinished_tasks} pending writes")
+                return False
+            time.sleep(0.05)
+        return True
+
+
 class ReportSnapshotService:
     """
     Handles persistence of partial and complete report data in Firestore.
     Collection: report_snapshots
+    Memoization index: report_snapshot_index (doc id = deterministic report key)
+
+    Writes are fire-and-forget (write-behind queue + batched commits); reads are synchronous.
     """
-    def __init__(self):
-        self.project_id = os.getenv("PROJECT_ID")
-        self.db = firestore.Client(project=self.project_id)
-        self.collection = self.db.collection("report_snapshots")
+    _instance = None
 
-    def create_snapshot(self, period: str, scope: str) -> str:
-        """Creates a new report entry and returns its ID."""
+    # Bump when block specs / narrative prompts change, to invalidate memoized reports
+    REPORT_KEY_VERSION = 1
+    # Memoized snapshots older than this are recomputed even if the data version matches
+    MEMO_TTL_DAYS = 30
+
+    def __new__(cls):
+        if cls._instance is None:
+            instance = super(ReportSnapshotService, cls).__new__(cls)
+            instance.project_id = os.getenv("PROJECT_ID")
+            instance.db = firestore.Client(project=instance.project_id)
+            instance.collection = instance.db.collection("report_snapshots")
+            instance.index = instance.db.collection("report_snapshot_index")
+            instance._writer = _SnapshotWriteBehind(instance.db)
+            cls._instance = instance
+        return cls._instance
+
+    @classmethod
+    def build_report_key(cls, period: str, scope: str, sections: List[str], data_version: str) -> str:
+        """Deterministic key: same period, scope, sections and data version -> same report."""
+        raw = json.dumps({
+            "period": period,
+            "scope": scope,
+            "sections": sorted(sections),
+            "data_version": data_version,
+            "v": cls.REPORT_KEY_VERSION
+        }, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def create_snapshot(self, period: str, scope: str, report_key: Optional[str] = None) -> str:
+        """Creates a new report entry (queued) and returns its ID immediately."""
         report_id = str(uuid.uuid4())
-        doc_ref = self.collection.document(report_id)
-        doc_ref.set({
+        self._writer.submit("set", self.collection.document(report_id), {
             "report_id": report_id,
+            "report_key": report_key,
             "period": period,
             "scope": scope,
             "created_at": firestore.SERVER_TIMESTAMP,
             "status": "GATHERING_DATA",
-            "blocks": []
+            "blocks": {}
         })
         return report_id
 
+    def save_block(self, report_id: str, key: str, result: Dict[str, Any]):
+        """Writes a single block result as soon as it completes (nested field update, queued)."""
+        self._writer.submit("update", self.collection.document(report_id), {
+            f"blocks.{key}": result,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        })
+
+    def update_status(self, report_id: str, status: str):
+        """Updates only the status of a report (queued)."""
+        self._writer.submit("update", self.collection.document(report_id), {
+            "status": status,
+            "updated_at": firestore.SERVER_TIMESTAMP
+        })
+
+    def find_completed_snapshot(self, report_key: str) -> Optional[Dict[str, Any]]:
+        """Returns a prior COMPLETED snapshot for this key if it is still fresh, else None."""
+        try:
+            index_doc = self.index.document(report_key).get()
+            if not index_doc.exists:
+                return None
+
+            snapshot = self.get_snapshot(index_doc.to_dict().get("report_id"))
+            if snapshot.get("status") != "COMPLETED":
+                return None
+
+            completed_at = snapshot.get("completed_at")
+            if completed_at:
+                age = datetime.now(completed_at.tzinfo) - completed_at
+                if age.days > self.MEMO_TTL_DAYS:
+                    logger.info(f"Report memo expired for key {report_key[:8]}... (age: {age.days}d)")
+                    return None
+            return snapshot
+        except Exception as e:
+            logger.warning(f"Report memo lookup failed: {e}")
+            return None
+
+    def register_snapshot(self, report_key: str, report_id: str):
+        """Points the report key to a COMPLETED snapshot so later requests reuse it (queued after narratives)."""
+        self._writer.submit("set", self.index.document(report_key), {
+            "report_id": report_id,
+            "indexed_at": firestore.SERVER_TIMESTAMP
+        })
+
     def update_snapshot(self, report_id: str, blocks: Union[List[Dict], Dict[str, Any]], status: str = "DATA_GATHERED"):
-        """Updates blocks and status of a report. Accepts list or dict of block results."""
-        doc_ref = self.collection.document(report_id)
-        doc_ref.update({
+        """Updates blocks and status of a report. Accepts list or dict of block results (queued)."""
+        self._writer.submit("update", self.collection.document(report_id), {
             "blocks": blocks,
             "status": status,
             "updated_at": firestore.SERVER_TIMESTAMP
@@ -42,16 +263,32 @@ class ReportSnapshotService:
 
     def get_snapshot(self, report_id: str) -> Dict[str, Any]:
         """Retrieves the full snapshot data."""
+        if not report_id:
+            return {}
         doc = self.collection.document(report_id).get()
         if doc.exists:
             return doc.to_dict()
         return {}
 
     def save_narratives(self, report_id: str, narratives: Dict[str, str]):
-        """Saves generated AI narratives to the snapshot."""
-        doc_ref = self.collection.document(report_id)
-        doc_ref.update({
+        """Saves generated AI narratives to the snapshot (queued)."""
+        self._writer.submit("update", self.collection.document(report_id), {
             "narratives": narratives,
             "status": "COMPLETED",
             "completed_at": firestore.SERVER_TIMESTAMP
         })
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Waits for pending snapshot writes to be committed."""
+        return self._writer.flush(timeout)
+
+
+def get_report_snapshot_service() -> ReportSnapshotService:
+    return ReportSnapshotService()
+
+
+def flush_snapshot_writes(timeout: float = 10.0) -> bool:
+    """Shutdown hook: drain pending writes. No-op if the service was never used (no Firestore client created)."""
+    if ReportSnapshotService._instance is None:
+        return True
+    return ReportSnapshotService._instance.flush(timeout)
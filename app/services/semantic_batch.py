@@ -0,0 +1,139 @@
+import json
+import time
+import asyncio
+import hashlib
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+from app.core.config.config import get_settings
+from app.core.utils.perf_logger import log_perf
+from app.schemas.analytics import SemanticRequest
+from app.services.query_generator import select_builder_name
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Builders con CTE / ventanas primero: los jobs largos arrancan antes (menor tiempo total del lote)
+BUILDER_PRIORITY = {"ytd_optimized": 0, "comparison_cte": 0, "comparison": 1, "ytd_ratio": 2, "simple": 3}
+
+# Pool compartido por todos los lotes del proceso: es el presupuesto de concurrencia de BigQuery
+_executor = ThreadPoolExecutor(max_workers=settings.SEMANTIC_BATCH_MAX_CONCURRENCY, thread_name_prefix="semantic-batch")
+
+
+class SemanticBatchService:
+    """
+    Ejecución de varias SemanticRequest en un solo round-trip (POST /semantic/batch).
+
+    - Planificación: cada request se normaliza y se genera su SQL (los errores de validación
+      quedan como error del ítem, sin afectar al resto).
+    - Deduplicación: requests con la misma SQL, intent y metadata de visualización se
+      ejecutan una sola vez y el resultado se reparte.
+    - Agrupación por builder: los grupos más pesados (CTE) se encolan primero.
+    - Ejecución concurrente acotada por un pool compartido (SEMANTIC_BATCH_MAX_CONCURRENCY).
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SemanticBatchService, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def plan_item(item: SemanticRequest) -> Dict[str, Any]:
+        """
+        Plan del ítem (normalización + SQL, se ejecuta sin re-planificar), clave de
+        deduplicación y builder. Lanza excepción si la request no es válida
+        (métrica/dimensión inexistente, etc.).
+        """
+        # Import diferido: universal_analyst importa el stack de tools del agente
+        from app.ai.tools.universal_analyst import plan_semantic_query
+
+        planned = plan_semantic_query(item.intent, item.cube_query.model_dump(), item.metadata.model_dump())
+        query_params = planned["query_params"]
+
+        key = hashlib.sha256(json.dumps({
+            "intent": item.intent,
+            "sql": " ".join(planned["sql"].split()),
+            "metadata": planned["req"].metadata.model_dump(),
+        }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+        return {
+            "key": key,
+            "builder": select_builder_name(query_params["metrics"], query_params.get("comparison_groups")),
+            "planned": planned,
+        }
+
+    @classmethod
+    def _plan_all(cls, items: List[SemanticRequest]) -> List[Any]:
+        """Plan por ítem (o la excepción de validación, que queda como error del ítem)."""
+        plans = []
+        for item in items:
+            try:
+                plans.append(cls.plan_item(item))
+            except Exception as e:
+                logger.warning(f"📦 [BATCH] Request {item.operation_id} inválida: {e}")
+                plans.append(e)
+        return plans
+
+    @staticmethod
+    def run_item(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ejecuta el plan de `plan_item`. Lanza excepción si retornó el paquete de error
+        (fallo de BigQuery o de runtime): el ítem se reporta con status "error".
+        """
+        from app.ai.tools.universal_analyst import execute_planned_semantic_query, is_error_package
+        package = execute_planned_semantic_query(plan["planned"])
+        if is_error_package(package):
+            raise RuntimeError(package["summary"])
+        return package
+
+    async def execute(self, items: List[SemanticRequest]) -> List[Dict[str, Any]]:
+        """
+        Resultados en el mismo orden que `items`:
+        `{"operation_id", "status": "ok", "package"}` o `{"operation_id", "status": "error", "error"}`.
+        """
+        t_start = time.time()
+        loop = asyncio.get_running_loop()
+
+        plans = await loop.run_in_executor(_executor, self._plan_all, items)
+        unique: Dict[str, Dict[str, Any]] = {}
+        for plan in plans:
+            if not isinstance(plan, Exception):
+                unique.setdefault(plan["key"], plan)
+
+        ordered = sorted(unique.values(), key=lambda p: BUILDER_PRIORITY.get(p["builder"], len(BUILDER_PRIORITY)))
+        # run_in_executor no copia el contexto: el usuario del request (dueño de los cursores) debe llegar al ítem
+        futures = {
+            p["key"]: loop.run_in_executor(_executor, contextvars.copy_context().run, self.run_item, p)
+            for p in ordered
+        }
+        outcomes = dict(zip(futures.keys(), await asyncio.gather(*futures.values(), return_exceptions=True)))
+
+        results = []
+        for item, plan in zip(items, plans):
+            outcome = plan if isinstance(plan, Exception) else outcomes[plan["key"]]
+            if isinstance(outcome, Exception):
+                results.append({"operation_id": item.operation_id, "status": "error", "error": str(outcome)})
+            else:
+                # Copia por ítem: los duplicados comparten el resultado de una sola ejecución
+                results.append({"operation_id": item.operation_id, "status": "ok", "package": dict(outcome)})
+
+        groups: Dict[str, int] = {}
+        for p in ordered:
+            groups[p["builder"]] = groups.get(p["builder"], 0) + 1
+        duration = time.time() - t_start
+        log_perf("semantic_batch", duration, {
+            "items": len(items),
+            "unique_queries": len(ordered),
+            "errors": sum(1 for r in results if r["status"] == "error"),
+            "builders": groups,
+        })
+        logger.info(f"📦 [BATCH] {len(items)} requests -> {len(ordered)} consultas únicas {groups} en {duration:.2f}s")
+        return results
+
+
+def get_semantic_batch_service() -> SemanticBatchService:
+    return SemanticBatchService()
@@ -0,0 +1,188 @@
+"""
+Session Compaction (rolling summary)
+
+Las conversaciones largas hacen crecer sin límite el documento de sesión en Firestore
+y el prompt (el triaje re-envía eventos crudos y ADK reproduce el historial completo).
+
+Este módulo pliega los turnos antiguos en un resumen estructurado guardado en
+`session.state["conversation_summary"]` y conserva solo los últimos turnos crudos:
+
+- slots: último estado resuelto del triaje (periodo, estructura, formato).
+- previous_queries: consultas semánticas ejecutadas (intent, métricas, dimensiones, filtros).
+- key_numbers: cifras clave devueltas (KPIs y último valor de cada serie).
+- topics: mensajes previos del usuario (truncados).
+
+Se aplica con histéresis: solo se compacta cuando los turnos crudos superan
+`COMPACT_AFTER_TURNS` (o los eventos superan `MAX_RAW_EVENTS`, el límite de carga
+de la sesión), dejando `KEEP_RAW_TURNS`.
+"""
+
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_STATE_KEY = "conversation_summary"
+
+# Turnos (mensaje de usuario + respuesta/tools) que se conservan crudos
+KEEP_RAW_TURNS = 3
+COMPACT_AFTER_TURNS = 6
+# Límite de eventos crudos cargados por sesión (los que excedan se pliegan, no se pierden)
+MAX_RAW_EVENTS = 20
+
+MAX_PREVIOUS_QUERIES = 8
+MAX_KEY_NUMBERS = 8
+MAX_VALUES_PER_RESULT = 6
+MAX_TOPICS = 10
+TOPIC_CHARS = 160
+
+SEMANTIC_TOOL = "execute_semantic_query"
+
+
+def _as_dict(obj: Any) -> Any:
+    """Eventos/partes ADK (pydantic) o dicts serializados -> dict."""
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(exclude_none=True)
+    return obj
+
+
+def _parts(event: Any) -> List[Dict[str, Any]]:
+    ev = _as_dict(event)
+    if not isinstance(ev, dict):
+        return []
+    content = _as_dict(ev.get("content"))
+    if not isinstance(content, dict):
+        return []
+    if "parts" not in content and "text" in content:
+        return [{"text": content["text"]}]
+    return [p for p in (_as_dict(p) for p in content.get("parts") or []) if isinstance(p, dict)]
+
+
+def _is_user_message(event: Any) -> bool:
+    """Inicio de turno: mensaje de texto del usuario (las respuestas de tools no cuentan)."""
+    ev = _as_dict(event)
+    author = (ev.get("author") or ev.get("role")) if isinstance(ev, dict) else None
+    return author == "user" and any(p.get("text") for p in _parts(ev))
+
+
+def _turn_starts(events: List[Any]) -> List[int]:
+    return [i for i, ev in enumerate(events) if _is_user_message(ev)]
+
+
+def _key_numbers(package: Dict[str, Any]) -> Dict[str, Any]:
+    """KPIs y último valor de cada serie de un VisualDataPackage."""
+    values = {}
+    for block in package.get("content") or []:
+        if not isinstance(block, dict):
+            continue
+        if block.get("type") == "KPI_ROW":
+            for item in block.get("payload") or []:
+                values[item.get("label")] = item.get("value")
+        elif block.get("type") == "CHART":
+            payload = block.get("payload") or {}
+            labels = payload.get("labels") or []
+            for ds in payload.get("datasets") or []:
+                data = [v for v in ds.get("data") or [] if v is not None]
+                if data:
+                    suffix = f" ({labels[-1]})" if labels else ""
+                    values[f"{ds.get('label')}{suffix}"] = data[-1]
+        if len(values) >= MAX_VALUES_PER_RESULT:
+            break
+    return dict(list(values.items())[:MAX_VALUES_PER_RESULT])
+
+
+def fold_events(events: List[Any], summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Pliega `events` (en orden) sobre un resumen existente."""
+    summary = {
+        "turns_compacted": 0,
+        "slots": {},
+        "previous_queries": [],
+        "key_numbers": [],
+        "topics": [],
+        **(summary or {}),
+    }
+    queries, numbers, topics = list(summary["previous_queries"]), list(summary["key_numbers"]), list(summary["topics"])
+
+    for event in events:
+        user_turn = _is_user_message(event)
+        for part in _parts(event):
+            if user_turn and part.get("text"):
+                text = " ".join(part["text"].split())
+                topics.append(text[:TOPIC_CHARS] + ("…" if len(text) > TOPIC_CHARS else ""))
+
+            call = _as_dict(part.get("function_call"))
+            if isinstance(call, dict) and call.get("name"):
+                args = call.get("args") or {}
+                if call["name"] == SEMANTIC_TOOL:
+                    cube = args.get("cube_query") or {}
+                    queries.append({
+                        "intent": args.get("intent"),
+                        "metrics": cube.get("metrics"),
+                        "dimensions": cube.get("dimensions"),
+                        "filters": cube.get("filters"),
+                        "title": (args.get("metadata") or {}).get("title_suggestion"),
+                    })
+                else:
+                    queries.append({"tool": call["name"], "args": args})
+
+            response = _as_dict(part.get("function_response"))
+            if isinstance(response, dict) and response.get("name") == SEMANTIC_TOOL:
+                package = response.get("response") or {}
+                values = _key_numbers(package) if isinstance(package, dict) else {}
+                if values:
+                    title = str(package.get("summary") or "").split("\n")[0][:TOPIC_CHARS]
+                    numbers.append({"title": title, "values": values})
+
+    summary["previous_queries"] = queries[-MAX_PREVIOUS_QUERIES:]
+    summary["key_numbers"] = numbers[-MAX_KEY_NUMBERS:]
+    summary["topics"] = topics[-MAX_TOPICS:]
+    return summary
+
+
+def compact_history(
+    events: List[Any],
+    state: Dict[str, Any],
+    keep_turns: int = KEEP_RAW_TURNS,
+    threshold: int = COMPACT_AFTER_TURNS,
+    max_events: int = MAX_RAW_EVENTS
+) -> List[Any]:
+    """
+    Si hay más de `threshold` turnos crudos (o más de `max_events` eventos), pliega los
+    antiguos en `state[SUMMARY_STATE_KEY]` (muta `state`) y retorna solo los eventos de
+    los últimos `keep_turns` turnos.
+    """
+    starts = _turn_starts(events)
+    if len(starts) <= keep_turns or (len(starts) <= threshold and len(events) <= max_events):
+        return events
+
+    cut = starts[-keep_turns]
+    summary = fold_events(events[:cut], state.get(SUMMARY_STATE_KEY))
+    summary["turns_compacted"] += len(starts) - keep_turns
+    summary["slots"] = dict(state.get("triage_slots") or {})
+    state[SUMMARY_STATE_KEY] = summary
+
+    logger.info(f"🗜️ [COMPACTION] {cut} eventos plegados ({summary['turns_compacted']} turnos en resumen), "
+                f"{len(events) - cut} crudos")
+    return events[cut:]
+
+
+def render_summary(summary: Any) -> str:
+    """Bloque de texto compacto para los prompts (triaje y agente). Vacío si no hay resumen."""
+    if not isinstance(summary, dict) or not summary.get("turns_compacted"):
+        return ""
+
+    lines = [f"\n\n### RESUMEN DE LA CONVERSACIÓN PREVIA ({summary['turns_compacted']} turnos compactados):"]
+    if summary.get("slots"):
+        lines.append(f"- Slots resueltos: {summary['slots']}")
+    if summary.get("topics"):
+        lines.append("- Preguntas previas del usuario: " + " | ".join(summary["topics"]))
+    for q in summary.get("previous_queries") or []:
+        if "tool" in q:
+            lines.append(f"- Consulta previa: {q['tool']} {q.get('args')}")
+        else:
+            lines.append(f"- Consulta previa: {q.get('intent')} metrics={q.get('metrics')} "
+                         f"dims={q.get('dimensions')} filters={q.get('filters')} ({q.get('title')})")
+    for n in summary.get("key_numbers") or []:
+        values = ", ".join(f"{k}={v}" for k, v in n["values"].items())
+        lines.append(f"- Cifras: {n.get('title')}: {values}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,188 @@
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from app.services.bigquery import get_bq_service
+from app.services.circuit_breaker import get_circuit_breaker
+from app.services.query_generator import build_analytical_query
+from app.services.query_stats import record_job
+from app.services.trend_partition_cache import get_trend_partition_cache
+
+logger = logging.getLogger(__name__)
+
+_YEAR_RE = re.compile(r"\b(20\d{2})\b")
+_TREND_RE = re.compile(r"\b(evolucion|tendencia|mes a mes|mensual|historico|curva)\b")
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes (evolución -> evolucion)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def guess_semantic_query(message: str, divisions: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Adivina localmente (sin LLM) la consulta más probable para patrones frecuentes.
+    Conservador a propósito: si hay ambigüedad retorna None y no se especula.
+
+    Patrones soportados:
+    - "evolución/tendencia de (la) rotación [voluntaria|involuntaria] [división X] 2025"
+      -> TREND tasa_rotacion_mensual* por mes.
+    """
+    text = _normalize(message)
+    years = _YEAR_RE.findall(text)
+    if "rotacion" not in text or len(set(years)) != 1:
+        return None
+    if not _TREND_RE.search(text):
+        return None
+    # Comparativas, listados o cortes adicionales -> el agente decidirá dimensiones extra
+    if re.search(r"\b(vs|versus|compar\w*|por|lista\w*|tabla|detalle)\b", text):
+        return None
+
+    if "involuntaria" in text:
+        metric = "tasa_rotacion_mensual_involuntaria"
+    elif "voluntaria" in text:
+        metric = "tasa_rotacion_mensual_voluntaria"
+    else:
+        metric = "tasa_rotacion_mensual"
+
+    filters = [{"dimension": "anio", "value": int(years[0])}]
+
+    matched = [d for d in (divisions or []) if re.search(rf"\b{re.escape(_normalize(d).replace('division ', ''))}\b", text)]
+    if len(matched) > 1:
+        return None
+    if matched:
+        filters.append({"dimension": "uo2", "value": matched[0]})
+
+    return {
+        "intent": "TREND",
+        "cube_query": {"metrics": [metric], "dimensions": ["mes"], "filters": filters},
+        "metadata": {"requested_viz": "LINE_CHART"}
+    }
+
+
+def _sql_key(sql: str) -> str:
+    return hashlib.sha256(" ".join(sql.split()).encode("utf-8")).hexdigest()
+
+
+class SpeculativeQueryExecutor:
+    """
+    Ejecución especulativa de BigQuery solapada con los turnos del LLM.
+
+    - El router llama `speculate()` al recibir el mensaje: si la consulta es adivinable,
+      se genera la SQL canónica y el job arranca de inmediato.
+    - `execute_semantic_query` llama `consume(sql)`: si la SQL generada por el agente es
+      idéntica, reutiliza el job en vuelo (o ya terminado) en lugar de lanzar otro.
+    - Al terminar el request, `discard(owner)` cancela los jobs no consumidos.
+    """
+    _instance = None
+
+    # Entradas huérfanas (request abortado sin discard) se descartan tras este tiempo
+    TTL_SECONDS = 120
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SpeculativeQueryExecutor, cls).__new__(cls)
+            cls._instance._entries = {}
+            cls._instance._lock = threading.Lock()
+            cls._instance._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bq-speculative")
+        return cls._instance
+
+    def speculate(self, message: str, owner: str, divisions: Optional[List[str]] = None) -> Optional[str]:
+        """Lanza la consulta probable para `message`. Retorna la key de la entrada o None."""
+        guess = guess_semantic_query(message, divisions)
+        if not guess:
+            return None
+
+        try:
+            # Import diferido: universal_analyst importa el stack de tools del agente
+            from app.ai.tools.universal_analyst import _prepare_semantic_query
+            prepared = _prepare_semantic_query(guess["intent"], guess["cube_query"], guess["metadata"])
+            sql = build_analytical_query(**prepared["query_params"])
+            # Si el cache de tendencias ya tiene los meses cerrados, la consulta real es mínima
+            if get_trend_partition_cache().covers(prepared["query_params"]):
+                return None
+        except Exception as e:
+            logger.info(f"🔮 [SPECULATIVE] No se pudo construir SQL especulativa: {e}")
+            return None
+
+        key = _sql_key(sql)
+        with self._lock:
+            self._evict_expired()
+            if key in self._entries:
+                return key
+
+        # jobs.insert fuera del lock (llamada de red)
+        job = get_bq_service().start_query(sql)
+        entry = {
+            "job": job,
+            "future": self._pool.submit(job.to_dataframe),
+            "owner": owner,
+            "created": time.monotonic()
+        }
+        with self._lock:
+            duplicate = self._entries.get(key)
+            if duplicate is None:
+                self._entries[key] = entry
+        if duplicate is not None:
+            self._cancel(entry)
+            return key
+
+        logger.info(f"🔮 [SPECULATIVE] Job lanzado ({guess['cube_query']['metrics']} / {guess['cube_query']['filters']})")
+        return key
+
+    def consume(self, sql: str):
+        """DataFrame del job especulativo si la SQL coincide; None si no hay (o falló)."""
+        with self._lock:
+            entry = self._entries.pop(_sql_key(sql), None)
+        if not entry:
+            return None
+
+        try:
+            # El resultado cuenta para el breaker de BigQuery (lanzar el job no prueba nada):
+            # timeouts/5xx del job especulativo son fallos y no cierran un circuito half-open
+            with get_circuit_breaker("bigquery").guard():
+                df = entry["future"].result()
+        except Exception as e:
+            logger.warning(f"🔮 [SPECULATIVE] Job especulativo falló, se ejecuta normal: {e}")
+            return None
+
+        # El job corrió en el pool especulativo: sus estadísticas se registran en quien lo consume
+        record_job(entry["job"], rows=len(df))
+        saved = time.monotonic() - entry["created"]
+        logger.info(f"🔮 [SPECULATIVE] HIT: resultado reutilizado (job iniciado hace {saved:.2f}s)")
+        return df
+
+    def discard(self, owner: str):
+        """Cancela y elimina las entradas no consumidas de un request."""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e["owner"] == owner]
+            entries = [self._entries.pop(k) for k in keys]
+        for entry in entries:
+            self._cancel(entry)
+        if entries:
+            logger.info(f"🔮 [SPECULATIVE] MISS: {len(entries)} job(s) descartado(s)")
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [k for k, e in self._entries.items() if now - e["created"] > self.TTL_SECONDS]
+        for k in expired:
+            self._cancel(self._entries.pop(k))
+
+    @staticmethod
+    def _cancel(entry: Dict[str, Any]):
+        entry["future"].cancel()
+        try:
+            if not entry["job"].done():
+                entry["job"].cancel()
+        except Exception:
+            pass
+
+
+def get_speculative_executor() -> SpeculativeQueryExecutor:
+    return SpeculativeQueryExecutor()
@@ -0,0 +1,302 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
+from app.core.config.config import get_settings
+from app.services.bigquery import get_bq_service
+from app.services.data_freshness import get_data_freshness_service
+from app.services.cte_builders import (
+    MONTHLY_SNAPSHOT_MEASURES, build_dimension_filter_clauses, headcount_base_months, headcount_base_column
+)
+from app.services.partition_pruning import month_index, periodo_range_predicate
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+CUBE_SOURCE = f"`{settings.PROJECT_ID}.{settings.BQ_DATASET}.{settings.BQ_TABLE_TURNOVER}`"
+
+TEMPORAL_DIMS = ["periodo", "anio", "mes", "month", "year"]
+BASE_MEASURES = ["hc_final", "ceses", "ceses_voluntarios", "ceses_involuntarios"]
+
+# Columnas que headcount_base deriva de los agregados mensuales (y que se recalculan localmente)
+DERIVED_COLUMNS = set(BASE_MEASURES) | {
+    "hc_inicial", "headcount_promedio_mensual", "hc_promedio_acumulado",
+    "ceses_acumulado", "ceses_voluntarios_acumulado", "ceses_involuntarios_acumulado",
+    "tasa_rotacion_mensual", "tasa_rotacion_mensual_voluntaria", "tasa_rotacion_mensual_involuntaria",
+    "tasa_rotacion_anual", "tasa_rotacion_anual_voluntaria", "tasa_rotacion_anual_involuntaria",
+}
+
+_GROUP_COL = "_grupo"
+
+
+def _safe_pct(num: pd.Series, den: pd.Series) -> pd.Series:
+    """SAFE_DIVIDE(num, den) * 100 (NULL si el denominador es 0)."""
+    return num / den.where(den != 0) * 100
+
+
+class TrendPartitionCache:
+    """
+    Cache incremental por mes para las series de headcount_base (TREND mensual).
+
+    Las series de rotación/headcount se derivan de 4 agregados mensuales
+    (hc_final, ceses, ceses voluntarios/involuntarios). Se cachean esos agregados por
+    partición `(dimensión de agrupación, filtros, mes)`:
+
+    - Meses cerrados: se leen de memoria mientras su partición no cambie (versión de la
+      metadata de frescura) y dentro de un TTL de seguridad ante recargas históricas.
+    - Meses abiertos (mes actual y anterior) o faltantes: se consultan en BigQuery con
+      un rango de `periodo` acotado (partition pruning).
+    - LAG, promedios y acumulados YTD y las tasas se recalculan en pandas, replicando
+      los pasos 2-5 de `headcount_base_stages`.
+    """
+    _instance = None
+
+    # Meses cuyo dato aún puede cambiar (carga del mes en curso y del mes anterior)
+    OPEN_MONTHS = 2
+    # Meses cerrados se vuelven a consultar tras este tiempo (correcciones de datos)
+    CLOSED_MONTH_TTL_SECONDS = 24 * 3600
+    # Series distintas (agrupación + filtros) retenidas en memoria (LRU)
+    MAX_SERIES = 256
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TrendPartitionCache, cls).__new__(cls)
+            cls._instance._series = OrderedDict()
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    # --- PLANNING ---
+
+    @staticmethod
+    def plan(query_params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Retorna el plan de la serie si la SQL que generaría `build_analytical_query`
+        es la serie mensual de headcount_base; None si no es cacheable.
+        """
+        metrics = query_params.get("metrics") or []
+        dimensions = query_params.get("dimensions") or []
+        filters = query_params.get("filters") or {}
+
+        if query_params.get("comparison_groups") or query_params.get("adhoc_groups"):
+            return None
+        # El dispatcher solo usa la serie YTD si alguna métrica requiere la CTE y se pidió mes/periodo
+        if not any(METRICS_REGISTRY.get(m, {}).get("requires_cte") or
+                   METRICS_REGISTRY.get(m, {}).get("complexity") == "window_function" for m in metrics):
+            return None
+        if "mes" not in dimensions and "periodo" not in dimensions:
+            return None
+
+        columns = {}
+        for m in metrics:
+            if m not in METRICS_REGISTRY:
+                return None
+            # Misma columna que lee la serie YTD (`headcount_base_column`)
+            col = headcount_base_column(m)
+            if col not in DERIVED_COLUMNS:
+                return None
+            columns[m] = col
+
+        # Trimestre como dimensión: la serie lo proyecta sin particionar las ventanas por él
+        if any(d in dimensions for d in ["trimestre", "q"]):
+            return None
+        group_dims = [d for d in dimensions if d not in TEMPORAL_DIMS]
+        if len(group_dims) > 1 or any(d not in DIMENSIONS_REGISTRY for d in group_dims):
+            return None
+        group_dim = group_dims[0] if group_dims else None
+        group_col = DIMENSIONS_REGISTRY[group_dim]["sql"] if group_dim else None
+
+        # Solo 'anio' como filtro temporal (define el rango Dic(año-1)..Dic(año))
+        if any(k in filters for k in ["periodo", "mes", "month", "year", "trimestre", "q"]) or "anio" not in filters:
+            return None
+        raw_years = filters["anio"] if isinstance(filters["anio"], list) else [filters["anio"]]
+        try:
+            years = sorted({int(y) for y in raw_years})
+        except (TypeError, ValueError):
+            return None
+        if not years:
+            return None
+
+        partition_filters = {
+            k: sorted(v, key=str) if isinstance(v, list) else v
+            for k, v in filters.items() if k != "anio"
+        }
+        key = hashlib.sha256(json.dumps({
+            "group_col": group_col,
+            "filters": partition_filters
+        }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+        return {
+            "key": key,
+            "group_dim": group_dim,
+            "group_col": group_col,
+            "filters": partition_filters,
+            "years": years,
+            "months": headcount_base_months(years),
+            "dimensions": dimensions,
+            "columns": columns,
+            "limit": query_params.get("limit")
+        }
+
+    def _open_from(self) -> int:
+        today = date.today()
+        return month_index(today.year, today.month) - (self.OPEN_MONTHS - 1)
+
+    def _cached_months(self, plan: Dict[str, Any]) -> Dict[int, pd.DataFrame]:
+        """Meses cerrados vigentes en cache para la serie del plan."""
+        now = time.monotonic()
+        open_from = self._open_from()
+        with self._lock:
+            series = self._series.get(plan["key"])
+            if series is None:
+                return {}
+            self._series.move_to_end(plan["key"])
+            candidates = {
+                idx: entry for idx, entry in series.items()
+                if idx in plan["months"] and idx < open_from and now - entry["fetched_at"] < self.CLOSED_MONTH_TTL_SECONDS
+            }
+        # Partición recargada desde que se cacheó el mes -> se vuelve a consultar.
+        # Sin versión (metadata no disponible) no hay señal de invalidación: no se sirve.
+        freshness = get_data_freshness_service()
+        return {
+            idx: entry["rows"] for idx, entry in candidates.items()
+            if entry["version"] is not None and entry["version"] == freshness.month_version(idx)
+        }
+
+    def covers(self, query_params: Dict[str, Any]) -> bool:
+        """True si todos los meses cerrados de la serie ya están en cache."""
+        plan = self.plan(query_params)
+        if not plan:
+            return False
+        open_from = self._open_from()
+        closed = [m for m in plan["months"] if m < open_from]
+        return len(self._cached_months(plan)) == len(closed)
+
+    # --- EXECUTION ---
+
+    def _build_monthly_sql(self, plan: Dict[str, Any], months: List[int]) -> str:
+        """Agregados mensuales (Paso 1 de headcount_base) solo para `months`."""
+        where_clauses = ["segmento != 'PRACTICANTE'", periodo_range_predicate(months)]
+        where_clauses.extend(build_dimension_filter_clauses(plan["filters"]))
+
+        group_select = f"{plan['group_col']} AS {_GROUP_COL}," if plan["group_col"] else ""
+        group_by = f", {_GROUP_COL}" if plan["group_col"] else ""
+
+        sql = f"""
+SELECT
+    periodo,
+    EXTRACT(YEAR FROM periodo) AS anio,
+    EXTRACT(MONTH FROM periodo) AS mes,
+    {group_select}
+    {MONTHLY_SNAPSHOT_MEASURES}
+FROM {CUBE_SOURCE}
+WHERE {" AND ".join(where_clauses)}
+GROUP BY periodo, anio, mes{group_by}
+"""
+        return sql.strip()
+
+    def execute(self, query_params: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Serie completa para `query_params` (mismas columnas que la SQL de la serie YTD).
+        Retorna None si la consulta no es cacheable o si falla (el caller ejecuta la SQL completa).
+        """
+        plan = self.plan(query_params)
+        if not plan:
+            return None
+
+        try:
+            cached = self._cached_months(plan)
+            missing = [m for m in plan["months"] if m not in cached]
+
+            fetched = {}
+            if missing:
+                # Versión de cada partición leída antes de consultar (una recarga posterior invalida)
+                freshness = get_data_freshness_service()
+                versions = {idx: freshness.month_version(idx) for idx in missing}
+                df = get_bq_service().execute_query(self._build_monthly_sql(plan, missing))
+                month_idx = df["anio"].astype(int) * 12 + df["mes"].astype(int) - 1 if not df.empty else pd.Series(dtype=int)
+                for idx in missing:
+                    fetched[idx] = df[month_idx == idx] if not df.empty else df
+                self._store(plan["key"], fetched, versions)
+
+            logger.info(
+                f"🧊 [TREND CACHE] {len(cached)}/{len(plan['months'])} meses desde cache, "
+                f"{len(missing)} consultados en BigQuery"
+            )
+            frames = [cached.get(m, fetched.get(m)) for m in plan["months"]]
+            return self._assemble(plan, [f for f in frames if f is not None and not f.empty])
+        except Exception as e:
+            logger.warning(f"🧊 [TREND CACHE] Fallback a consulta completa: {e}")
+            return None
+
+    def _store(self, key: str, fetched: Dict[int, pd.DataFrame], versions: Dict[int, Optional[str]]):
+        """
+        Guarda solo meses cerrados (incluye meses vacíos: también son un resultado) cuya
+        versión se conoce: sin versión no habría cómo invalidarlos ante una recarga.
+        """
+        open_from = self._open_from()
+        now = time.monotonic()
+        with self._lock:
+            series = self._series.setdefault(key, {})
+            self._series.move_to_end(key)
+            for idx, rows in fetched.items():
+                if idx < open_from and versions.get(idx) is not None:
+                    series[idx] = {"rows": rows, "fetched_at": now, "version": versions[idx]}
+            while len(self._series) > self.MAX_SERIES:
+                self._series.popitem(last=False)
+
+    @staticmethod
+    def _assemble(plan: Dict[str, Any], frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """Pasos 2-5 de headcount_base en pandas + SELECT/WHERE/ORDER de la serie."""
+        out_columns = list(plan["dimensions"]) + list(plan["columns"].keys())
+        if not frames:
+            return pd.DataFrame(columns=out_columns)
+
+        grp = [_GROUP_COL] if plan["group_col"] else []
+        base = pd.concat(frames, ignore_index=True).sort_values(grp + ["periodo"], kind="stable", ignore_index=True)
+
+        # Paso 2-3: HC inicial = HC final del mes anterior (LAG por partición), fallback al propio
+        lag = base.groupby(grp, sort=False, dropna=False)["hc_final"].shift(1) if grp else base["hc_final"].shift(1)
+        base["hc_inicial"] = lag.fillna(base["hc_final"])
+        base["headcount_promedio_mensual"] = (base["hc_inicial"] + base["hc_final"]) / 2
+
+        # Paso 4: acumulados YTD por (anio, grupo) ordenados por mes
+        base = base.sort_values(["anio"] + grp + ["mes"], kind="stable", ignore_index=True)
+        ytd = base.groupby(["anio"] + grp, sort=False, dropna=False)
+        base["hc_promedio_acumulado"] = ytd["hc_final"].cumsum() / (ytd.cumcount() + 1)
+        for col in ["ceses", "ceses_voluntarios", "ceses_involuntarios"]:
+            base[f"{col}_acumulado"] = ytd[col].cumsum()
+
+        # Paso 5: tasas
+        for suffix, col in [("", "ceses"), ("_voluntaria", "ceses_voluntarios"), ("_involuntaria", "ceses_involuntarios")]:
+            base[f"tasa_rotacion_mensual{suffix}"] = _safe_pct(base[col], base["hc_inicial"])
+            base[f"tasa_rotacion_anual{suffix}"] = _safe_pct(base[f"{col}_acumulado"], base["hc_promedio_acumulado"])
+
+        # SELECT final: WHERE anio IN (...) ORDER BY anio, mes LIMIT n
+        base = base[base["anio"].astype(int).isin(plan["years"])]
+        base = base.sort_values(["anio", "mes"], kind="stable", ignore_index=True)
+
+        result = pd.DataFrame(index=base.index)
+        for dim in plan["dimensions"]:
+            result[dim] = base[_GROUP_COL] if dim == plan["group_dim"] else base[dim]
+        for metric, col in plan["columns"].items():
+            result[metric] = base[col]
+
+        if plan["limit"]:
+            result = result.head(plan["limit"])
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def get_trend_partition_cache() -> TrendPartitionCache:
+    return TrendPartitionCache()
@@ -0,0 +1,22 @@
+# Configuración de gunicorn para Cloud Run (ver Dockerfile).
+# El master precarga el estado inmutable (registry, prompts, catálogo, librerías) y los
+# workers lo comparten copy-on-write: ver app/core/preload.py.
+import os
+
+from app.core.preload import preload_shared_state, reset_after_fork
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 300
+
+
+def on_starting(server):
+    # El GC del master queda desactivado: gunicorn llama `when_ready` antes de hacer fork de
+    # los workers, y los workers que se re-crean después (crash, timeout) también deben
+    # heredar un heap que el collector no tocó. El master solo corre el loop del arbiter.
+    preload_shared_state()
+
+
+def post_fork(server, worker):
+    reset_after_fork()
@@ -0,0 +1,31 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.report_cache_warmer import get_report_cache_warmer, ReportCacheWarmer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalienta reportes ejecutivos para el último periodo cargado.")
+    parser.add_argument("--period", help="Periodo YYYYMM (default: MAX(periodo) de la tabla de rotación)")
+    parser.add_argument("--force", action="store_true", help="Re-generar aunque el periodo ya esté precalentado")
+    parser.add_argument("--concurrency", type=int, default=ReportCacheWarmer.DEFAULT_CONCURRENCY, help="Reportes en paralelo")
+    parser.add_argument("--global-only", action="store_true", help="Solo scope Global (sin divisiones uo2)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    warmer = get_report_cache_warmer(args.concurrency)
+    summary = asyncio.run(warmer.warm(period=args.period, force=args.force, include_divisions=not args.global_only))
+
+    print(f"🔥 Resultado: {json.dumps(summary, ensure_ascii=False)}")
+    sys.exit(0 if summary.get("status") in ("completed", "skipped") and not summary.get("failed") else 1)
+
+
+if __name__ == "__main__":
+    main()
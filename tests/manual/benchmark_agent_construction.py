@@ -0,0 +1,110 @@
+"""
+Benchmark: Construcción del Agente HR + Runner por request
+
+Compara el camino legacy de `AgentRouter._route` (dos `get_hr_agent` por request:
+modelo Gemini nuevo, concatenación del prompt de varios KB y un `Runner` nuevo) contra
+el Runner prearmado por perfil, donde solo se resuelve la instrucción con el estado
+del triaje (InstructionProvider).
+
+Cada `Gemini` nuevo crea su propio cliente GenAI (HTTP, SSL, credenciales) en el primer
+turno: se materializa `api_client` en ambos caminos. Se usa modo API key con una clave
+ficticia para no depender de credenciales ni de red.
+
+Verifica además que la instrucción resultante sea idéntica a la legacy.
+No llama al LLM ni a BigQuery.
+
+Uso:
+    python tests/manual/benchmark_agent_construction.py [--iterations 200]
+"""
+import os
+import sys
+import time
+import argparse
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+# Cliente GenAI sin red ni ADC (solo se mide su construcción)
+os.environ["GOOGLE_GENAI_USE_VERTEXAI"] = "false"
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-dummy-key")
+
+from google.adk import Agent, Runner
+
+from app.ai.agents.hr_agent import (
+    HR_PROMPT_SEMANTIC, get_vertex_model, get_hr_agent, triage_state
+)
+from app.ai.tools.universal_analyst import execute_semantic_query
+from app.ai.tools.executive_report_orchestrator import generate_executive_report
+
+TRIAGE_SLOTS = {"period": "2025", "structure": "DIVISION TALENTO", "format": "LINE_CHART", "period_valid": True}
+
+
+# --- LEGACY REFERENCE (get_hr_agent previo al cache por perfil) ---
+
+def legacy_get_hr_agent(profile: str = "EJECUTIVO", context_state: dict = None):
+    final_instruction = HR_PROMPT_SEMANTIC
+    if context_state:
+        context_str = "\n\n### ESTADO DETERMINADO POR TRIAJE (Prioridad Alta):\n"
+        for k, v in context_state.items():
+            context_str += f"- {k.upper()}: {v}\n"
+        context_str += "\nSI EL FORMATO ES 'TABLE', DEBES USAR INTENT='LISTING' Y REQUESTED_VIZ='TABLE'.\n"
+        final_instruction = context_str + HR_PROMPT_SEMANTIC
+
+    return Agent(
+        name="HR_Semantic_Agent",
+        instruction=final_instruction,
+        model=get_vertex_model(),
+        tools=[execute_semantic_query, generate_executive_report]
+    )
+
+
+def legacy_request(session_service):
+    legacy_get_hr_agent(profile="EJECUTIVO")  # resultado descartado (como en el router)
+    agent = legacy_get_hr_agent(profile="EJECUTIVO", context_state=TRIAGE_SLOTS)
+    Runner(app_name="PeopleAnalyticsApp", agent=agent, session_service=session_service)
+    agent.canonical_model.api_client  # primer turno: cliente GenAI del modelo nuevo
+    return agent.instruction
+
+
+def cached_request(runners, session_service):
+    runner = runners.get("EJECUTIVO")
+    if runner is None:
+        runner = runners["EJECUTIVO"] = Runner(
+            app_name="PeopleAnalyticsApp", agent=get_hr_agent("EJECUTIVO"), session_service=session_service
+        )
+    runner.agent.canonical_model.api_client  # cacheado en el modelo compartido
+    with triage_state(TRIAGE_SLOTS):
+        return runner.agent.instruction(MagicMock())
+
+
+def _bench(fn, iterations):
+    fn()  # warm-up (imports, primer armado)
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - t0) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    session_service = MagicMock()
+    runners = {}
+
+    legacy_instruction = legacy_request(session_service)
+    cached_instruction = cached_request(runners, session_service)
+    assert cached_instruction == legacy_instruction, "La instrucción inyectada difiere de la legacy"
+    print(f"✅ Instrucción idéntica ({len(cached_instruction):,} chars)")
+
+    legacy_ms = _bench(lambda: legacy_request(session_service), args.iterations)
+    cached_ms = _bench(lambda: cached_request(runners, session_service), args.iterations)
+
+    print(f"🏗️  Legacy (2 agentes + Gemini + Runner por request): {legacy_ms:.3f} ms/request")
+    print(f"♻️  Runner prearmado + InstructionProvider:           {cached_ms:.3f} ms/request")
+    print(f"⚡ Overhead eliminado: {legacy_ms - cached_ms:.3f} ms/request ({legacy_ms / max(cached_ms, 1e-9):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Benchmark: Motor de Balanceo de Series (Zero-Fill + Multi-Series)
+
+Compara la implementación legacy (bucles por fila y por grupo × label) contra el
+motor vectorizado de `universal_analyst` sobre entradas de alta cardinalidad
+(ej: COMPARISON por uo5 × mes a lo largo de varios años).
+
+Verifica además que el payload serializado sea idéntico byte a byte.
+
+Uso:
+    python tests/manual/benchmark_chart_balancing.py [--groups 400] [--years 2022 2023 2024 2025]
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import contextlib
+import io
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.schemas.analytics import SemanticRequest
+from app.schemas.payloads import ChartBlock, ChartPayload, Dataset, ChartMetadata, MetricFormat
+from app.core.analytics.registry import METRICS_REGISTRY, DIMENSIONS_REGISTRY
+from app.ai.tools.universal_analyst import (
+    _ensure_dataframe_completeness, _format_chart_block, _sanitize_payload
+)
+
+# --- LEGACY REFERENCE (copia literal previa a la vectorización) ---
+
+def legacy_ensure_dataframe_completeness(df: pd.DataFrame, req: SemanticRequest) -> pd.DataFrame:
+    """
+    Middleware de Completitud: Garantiza que la estructura de datos
+    refleje fielmente la intención de comparación del usuario, incluso si
+    la base de datos no retorna filas para ciertos periodos/grupos.
+    
+    Estrategia: 'Zero-Filling' basado en Filtros Explícitos.
+    Si el filtro es anio=[2024, 2025] y SQL solo trae 2025, inyectamos 2024=0.
+    """
+    if not req.cube_query.dimensions:
+        return df
+
+    # 1. Identificar Eje Principal (X-Axis)
+    x_dim = req.cube_query.dimensions[0] 
+    
+    # 2. Verificar filtros y Completeness
+    if req.cube_query.filters:
+        # Verificar si hay una intención explícita de rango/lista en ese eje
+        filter_vals = None
+        for f in req.cube_query.filters:
+            if f.dimension == x_dim:
+                filter_vals = f.value
+                break
+        
+        # Si no es una lista, no hay "comparación explícita" que rellenar
+        if isinstance(filter_vals, list):
+            # 3. Calcular Delta (Lo que esperamos vs Lo que llegó)
+            expected_keys = set(str(v) for v in filter_vals)
+            
+            if df.empty:
+                actual_keys = set()
+                # Si está vacío, necesitamos inicializar el DF con las columnas correctas
+                columns = req.cube_query.dimensions + req.cube_query.metrics
+                df = pd.DataFrame(columns=columns)
+            else:
+                actual_keys = set(df[x_dim].astype(str).unique())
+                
+            missing_keys = expected_keys - actual_keys
+            
+            if missing_keys:
+                pass  # print(f"🧱 [MIDDLEWARE] Data Completeness: Injecting missing keys for {x_dim}: {missing_keys}")
+                
+                # 4. Inyectar Filas Faltantes (Zero-Filling)
+                new_rows = []
+                for mis in missing_keys:
+                    # Intentar mantener el tipo de dato original si es posible
+                    val = int(mis) if str(mis).isdigit() else mis
+                    
+                    row = {x_dim: val}
+                    
+                    # Rellenar métricas con NaN (= "no data", not "zero")
+                    # NaN → None in JSON → Chart.js breaks line (no point drawn)
+                    for m in req.cube_query.metrics:
+                        row[m] = float('nan')
+                        
+                    # Otras dimensiones: "N/A" o Contextual
+                    new_rows.append(row)
+                
+                df_fill = pd.DataFrame(new_rows)
+                df = pd.concat([df, df_fill], ignore_index=True)
+    
+    # 5. Ordenamiento (Crucial para series temporales)
+    # Usar metadata del registro si está disponible
+    x_meta = DIMENSIONS_REGISTRY.get(x_dim, {})
+    if x_meta.get("type") == "temporal" or x_meta.get("sorting") == "numeric":
+        # Ordenar numérica o temporalmente
+        try:
+            df = df.sort_values(by=x_dim)
+        except:
+            pass
+            
+    return df
+
+def legacy_format_chart_block(df: pd.DataFrame, req: SemanticRequest) -> ChartBlock:
+    """Transforma un DF en estructura Chart.js."""
+    
+    # 1. Definir Ejes
+    dimensions_present = req.cube_query.dimensions.copy() if req.cube_query.dimensions else []
+    
+    # Inyectar 'comparison_group' como dimension si existe en el df
+    if "comparison_group" in df.columns and "comparison_group" not in dimensions_present:
+        dimensions_present.append("comparison_group")
+
+    if dimensions_present:
+        x_dim = dimensions_present[0]
+    else:
+        x_dim = "index"
+        if "index" not in df.columns:
+            df = df.copy()
+            df["index"] = ["Total"] * len(df) if not df.empty else []
+
+    x_meta = DIMENSIONS_REGISTRY.get(x_dim, {})
+    group_dim = dimensions_present[1] if len(dimensions_present) > 1 else None
+    
+    labels = []
+    datasets = []
+    consumed_as_informative = set() # Track metrics used as tooltips to avoid redundancy
+
+    # Helper para extraer formato
+    def get_format(m_key: str):
+        m_def = METRICS_REGISTRY.get(m_key, {})
+        if "format" in m_def and isinstance(m_def["format"], dict):
+            return MetricFormat(**m_def["format"])
+        return None
+
+    # Helper para construir related_datasets
+    def get_related(m_key: str, dataframe: pd.DataFrame, filter_col=None, filter_val=None):
+        m_def = METRICS_REGISTRY.get(m_key, {})
+        info_keys = m_def.get("informative_metrics", [])
+        related = []
+        for i_key in info_keys:
+            if i_key in dataframe.columns:
+                i_def = METRICS_REGISTRY.get(i_key, {})
+                
+                # Si estamos en modo agrupado, el dataframe ya es un subset
+                i_data = dataframe[i_key].tolist()
+                
+                related.append(Dataset(
+                    label=i_def.get("label", i_key),
+                    data=i_data,
+                    format=get_format(i_key)
+                ))
+                consumed_as_informative.add(i_key)
+        return related if related else None
+
+    # 2. Generar Datasets
+    if group_dim:
+        # MODO A: AGRUPADO (Multi-Series por una Dimensión, solo 1ra métrica)
+        raw_labels = df[x_dim].astype(str).unique().tolist()
+        
+        if x_meta.get("label_mapping"):
+            mapping = x_meta["label_mapping"]
+            labels = [mapping.get(str(lbl), lbl) for lbl in raw_labels]
+        else:
+            labels = ["Sin Especificar" if lbl == "None" or lbl == "nan" else lbl for lbl in raw_labels]
+            
+        raw_groups = df[group_dim].unique().tolist()
+        group_meta = DIMENSIONS_REGISTRY.get(group_dim, {})
+        
+        # Sort groups logically
+        try:
+            raw_groups.sort(key=lambda x: float(x) if str(x).replace('.','',1).isdigit() else str(x))
+        except:
+            raw_groups.sort(key=str)
+        
+        metric_key = req.cube_query.metrics[0] if req.cube_query.metrics else df.columns[0]
+        
+        for g_val in raw_groups:
+            # Subset para este grupo
+            subset = df[df[group_dim] == g_val].copy()
+            
+            # Asegurar alineación con labels del eje X
+            data_points = []
+            for lbl in raw_labels:
+                match = subset[subset[x_dim].astype(str) == lbl]
+                data_points.append(match.iloc[0][metric_key] if not match.empty else None)
+            
+            ds_label = str(g_val)
+            if group_meta.get("label_mapping"):
+                ds_label = group_meta["label_mapping"].get(str(g_val), str(g_val))
+            
+            # En modo agrupado, related_datasets se aplica a la misma métrica pero filtrada por grupo
+            # Rebalanceamos el subset para que coincida con raw_labels para las métricas informativas
+            balanced_subset = []
+            for lbl in raw_labels:
+                match = subset[subset[x_dim].astype(str) == lbl]
+                if not match.empty:
+                    balanced_subset.append(match.iloc[0])
+                else:
+                    # Fill with NaN for missing data points (not zero)
+                    row = {col: float('nan') for col in subset.columns}
+                    row[x_dim] = lbl
+                    balanced_subset.append(pd.Series(row))
+            
+            df_balanced = pd.DataFrame(balanced_subset)
+            
+            datasets.append(Dataset(
+                label=ds_label,
+                data=data_points,
+                format=get_format(metric_key),
+                related_datasets=get_related(metric_key, df_balanced)
+            ))
+            
+    else:
+        # MODO B: MULTI-MÉTRICA (Múltiples métricas como series independientes)
+        raw_labels = df[x_dim].astype(str).tolist() if not df.empty else []
+        labels = [x_meta.get("label_mapping", {}).get(str(lbl), lbl) for lbl in raw_labels]
+        if not x_meta.get("label_mapping"):
+            labels = ["Sin Especificar" if lbl == "None" or lbl == "nan" else lbl for lbl in labels]
+
+        # Identificar métricas a procesar (Solicitadas + Inyectadas)
+        processed_metrics = []
+        for m_key in req.cube_query.metrics:
+            if m_key in df.columns:
+                processed_metrics.append(m_key)
+        for col in df.columns:
+            if col in METRICS_REGISTRY and col not in processed_metrics and col not in req.cube_query.dimensions:
+                processed_metrics.append(col)
+
+        for m_key in processed_metrics:
+            datasets.append(Dataset(
+                label=METRICS_REGISTRY.get(m_key, {}).get("label", m_key),
+                data=df[m_key].tolist(),
+                format=get_format(m_key),
+                related_datasets=get_related(m_key, df)
+            ))
+
+    # 3. Heuristic: Decluttering (Scale & Focus Management)
+    # Si hay Ratios (Tasa), movemos los Counts a tooltips globales solo si no fueron vinculados ya.
+    has_ratio = any(ds.format and ds.format.unit_type in ('percentage', 'ratio') for ds in datasets)
+    
+    final_datasets = []
+    tooltip_datasets = []
+    
+    if has_ratio:
+        for ds in datasets:
+            # Encontrar el key de la métrica original por su label para saber si fue consumida
+            # Nota: Esto es un poco frágil pero efectivo dada la estructura actual.
+            m_key = next((k for k, v in METRICS_REGISTRY.items() if v.get("label") == ds.label), ds.label)
+            
+            if ds.format and ds.format.unit_type in ('percentage', 'ratio'):
+                final_datasets.append(ds)
+            elif m_key not in consumed_as_informative:
+                tooltip_datasets.append(ds)
+        
+        if final_datasets:
+            datasets = final_datasets
+
+    # Metadata
+    metric_label = METRICS_REGISTRY.get(req.cube_query.metrics[0], {}).get("label", "Valor") if req.cube_query.metrics else "Valor"
+    meta = ChartMetadata(
+        title=req.metadata.title_suggestion or "Análisis de Datos",
+        y_axis_label=metric_label,
+        show_legend=True
+    )
+
+    return ChartBlock(
+        subtype="BAR" if req.metadata.requested_viz == "BAR_CHART" else "LINE",
+        payload=ChartPayload(labels=labels, datasets=datasets, tooltip_datasets=tooltip_datasets),
+        metadata=meta
+    )
+
+
+# --- HARNESS ---
+
+def build_comparison_frame(n_groups: int, years: list, seed: int = 7) -> pd.DataFrame:
+    """Genera un resultado tipo BigQuery (uo5 × mes × anio) con huecos aleatorios."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for g in range(n_groups):
+        for y in years:
+            for m in range(1, 13):
+                if rng.random() < 0.15:
+                    continue  # Combinación sin datos (hueco a balancear)
+                rows.append({
+                    "uo5": f"CANAL {g:04d}",
+                    "mes": m,
+                    "anio": y,
+                    "tasa_rotacion_mensual": float(rng.random() * 10),
+                    "ceses_totales": int(rng.integers(0, 50)),
+                    "headcount_inicial": int(rng.integers(50, 500)),
+                })
+    df = pd.DataFrame(rows)
+    # Años completos ausentes (zero-fill por filtro explícito)
+    return df[df["anio"] != years[0]].reset_index(drop=True)
+
+
+def build_request(dimensions: list, years: list) -> SemanticRequest:
+    return SemanticRequest(
+        intent="COMPARISON",
+        cube_query={
+            "metrics": ["tasa_rotacion_mensual"],
+            "dimensions": dimensions,
+            "filters": [{"dimension": "anio", "value": years}],
+        },
+        metadata={"requested_viz": "LINE_CHART", "title_suggestion": "Benchmark"},
+    )
+
+
+def render(complete_fn, chart_fn, df: pd.DataFrame, req: SemanticRequest) -> str:
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_full = complete_fn(df, req)
+        block = chart_fn(df_full, req)
+    return json.dumps(_sanitize_payload(block.model_dump()), ensure_ascii=False)
+
+
+def timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, nargs="+", default=[50, 200, 400])
+    parser.add_argument("--years", type=int, nargs="+", default=[2022, 2023, 2024, 2025])
+    args = parser.parse_args()
+
+    scenarios = [
+        ("anio × uo5 (series por canal)", ["anio", "uo5"]),
+        ("uo5 × mes (series por mes)", ["uo5", "mes"]),
+        ("mes × anio (series por año)", ["mes", "anio"]),
+    ]
+
+    print(f"{'Escenario':<32} {'Grupos':>7} {'Filas':>7} {'Legacy (s)':>11} {'Vector (s)':>11} {'Speedup':>8}  Payload")
+    print("-" * 95)
+    for title, dims in scenarios:
+        for n_groups in args.groups:
+            df = build_comparison_frame(n_groups, args.years)
+            req_legacy = build_request(dims, args.years)
+            req_new = build_request(dims, args.years)
+
+            legacy_json, t_legacy = timed(render, legacy_ensure_dataframe_completeness, legacy_format_chart_block, df, req_legacy, repeat=1)
+            new_json, t_new = timed(render, _ensure_dataframe_completeness, _format_chart_block, df, req_new)
+
+            identical = "IDENTICO" if legacy_json == new_json else "DIFERENTE"
+            print(f"{title:<32} {n_groups:>7} {len(df):>7} {t_legacy:>11.3f} {t_new:>11.3f} {t_legacy / max(t_new, 1e-9):>7.1f}x  {identical}")
+            if legacy_json != new_json:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Entrypoint ASGI del load test: `app.main:app` real con los fakes de fakes.py instalados.
+
+Uso (lo lanza run_loadtest.py):
+    gunicorn fake_app:app -w 4 -k uvicorn.workers.UvicornWorker
+    uvicorn fake_app:app --workers 2
+
+Cada worker mide el lag de su event loop (sleep de 50 ms vs tiempo real) y escribe cada
+segundo sus contadores acumulados en $LOADTEST_STATS_DIR/worker-<pid>.json:
+CPU del proceso, requests atendidos e histograma de lag. El driver diferencia dos
+lecturas para obtener los valores de la ventana medida.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import bisect
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+
+from fakes import LAG_BUCKETS_MS, install_fakes  # noqa: E402
+
+install_fakes()
+
+from app.main import app  # noqa: E402
+
+LAG_INTERVAL = 0.05
+
+_stats = {"requests": 0, "lag_histogram": [0] * (len(LAG_BUCKETS_MS) + 1), "lag_max_ms": 0.0}
+
+
+def _write_stats():
+    stats_dir = os.getenv("LOADTEST_STATS_DIR")
+    if not stats_dir:
+        return
+    path = os.path.join(stats_dir, f"worker-{os.getpid()}.json")
+    payload = {"pid": os.getpid(), "cpu_s": time.process_time(), "wall": time.time(), **_stats}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(path + ".tmp", path)
+
+
+async def _monitor_loop_lag():
+    last_write = time.monotonic()
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag_ms = max(0.0, (time.perf_counter() - t0 - LAG_INTERVAL) * 1000)
+        _stats["lag_histogram"][bisect.bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+        _stats["lag_max_ms"] = max(_stats["lag_max_ms"], lag_ms)
+        if time.monotonic() - last_write >= 1.0:
+            _write_stats()
+            last_write = time.monotonic()
+
+
+@app.middleware("http")
+async def _count_requests(request, call_next):
+    _stats["requests"] += 1
+    return await call_next(request)
+
+
+_app_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def _lifespan(application):
+    monitor = asyncio.create_task(_monitor_loop_lag())
+    async with _app_lifespan(application) as state:
+        yield state
+    monitor.cancel()
+    _write_stats()
+
+
+app.router.lifespan_context = _lifespan
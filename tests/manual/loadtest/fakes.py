@@ -0,0 +1,472 @@
+"""
+Fakes en proceso para el load test offline (sin GCP, red ni credenciales).
+
+Se reemplazan los clientes de bajo nivel, no los servicios: el código de la app
+(BigQueryService, FirestoreService, circuit breakers, hedging, caches, serialización)
+corre tal cual.
+
+- google.cloud.bigquery.Client -> FakeBigQueryClient (DataFrames sintéticos según las
+  columnas de salida de la SQL generada)
+- google.cloud.firestore.Client / AsyncClient -> documentos en memoria (por proceso)
+- google.genai.Client -> modelo guionado: el triaje responde PROCEED, el agente llama a
+  `execute_semantic_query` (o a `generate_executive_report` si se pide un reporte) y
+  luego cierra con texto; las narrativas del reporte devuelven JSON.
+
+Latencia (lognormal por mediana/p95) y tasa de errores por dependencia, vía la variable
+LOADTEST_PROFILE (JSON) que se fusiona sobre DEFAULT_PROFILE, p.ej.:
+    {"genai": {"median_ms": 2000, "p95_ms": 6000, "error_rate": 0.02}}
+
+`install_fakes()` debe ejecutarse ANTES de importar la app (router_logic y ADK importan
+`google.genai.Client` por nombre).
+"""
+import os
+import re
+import copy
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import itertools
+import threading
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+from google.api_core import exceptions as api_exceptions
+from google.genai import errors as genai_errors, types
+
+DEFAULT_PROFILE = {
+    "bigquery": {"median_ms": 800, "p95_ms": 2500, "error_rate": 0.0},
+    "bigquery_metadata": {"median_ms": 120, "p95_ms": 300, "error_rate": 0.0},  # dry runs, get_table, list_rows
+    "firestore": {"median_ms": 25, "p95_ms": 80, "error_rate": 0.0},
+    "genai": {"median_ms": 1200, "p95_ms": 4000, "error_rate": 0.0},
+}
+
+# Límites superiores (ms) del histograma de lag del event loop; el último bucket es "> 1000 ms"
+LAG_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class LatencyModel:
+    """Latencia lognormal definida por mediana y p95 (ms) + probabilidad de error."""
+
+    def __init__(self, median_ms: float, p95_ms: float = None, error_rate: float = 0.0):
+        self.median_ms = median_ms
+        self.p95_ms = p95_ms or median_ms
+        self.error_rate = error_rate
+        self._sigma = math.log(self.p95_ms / median_ms) / 1.645 if self.p95_ms > median_ms > 0 else 0.0
+
+    def sample(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_ms / 1000), self._sigma)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+    def wait(self, error_factory):
+        time.sleep(self.sample())
+        if self.fails():
+            raise error_factory()
+
+    async def await_(self, error_factory):
+        await asyncio.sleep(self.sample())
+        if self.fails():
+            raise error_factory()
+
+
+def load_profile(raw: str = None) -> dict:
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    for dep, overrides in json.loads(raw or os.getenv("LOADTEST_PROFILE") or "{}").items():
+        profile.setdefault(dep, {}).update(overrides)
+    return {dep: LatencyModel(**cfg) for dep, cfg in profile.items()}
+
+
+PROFILE = load_profile()
+
+
+def _unavailable(dep: str):
+    return lambda: api_exceptions.ServiceUnavailable(f"[loadtest] {dep} no disponible (error inyectado)")
+
+
+# --- BIGQUERY ---
+
+_DIVISIONS = [f"DIVISION {name}" for name in ("TALENTO", "COMERCIAL", "FINANZAS", "OPERACIONES", "TECNOLOGIA", "LEGAL")]
+_PARTITION_RE = re.compile(r"INFORMATION_SCHEMA\.PARTITIONS", re.I)
+_TOKEN_RE = re.compile(r"\(|\)|\bSELECT\b|\bFROM\b", re.I)
+
+
+def _split_top_level(text: str):
+    depth, start = 0, 0
+    for i, ch in enumerate(text):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            yield text[start:i]
+            start = i + 1
+    yield text[start:]
+
+
+def output_columns(sql: str) -> list:
+    """Columnas de salida del SELECT más externo (alias o identificador final)."""
+    sql = re.sub(r"--[^\n]*", "", sql)
+    depth, select_end, from_start = 0, None, None
+    for m in _TOKEN_RE.finditer(sql):
+        token = m.group(0).upper()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0 and token == "SELECT":
+            select_end, from_start = m.end(), None
+        elif depth == 0 and token == "FROM" and select_end is not None and from_start is None:
+            from_start = m.start()
+    if select_end is None:
+        return []
+
+    columns = []
+    for item in _split_top_level(sql[select_end:from_start]):
+        item = item.strip()
+        alias = re.search(r"\bAS\s+`?(\w+)`?\s*$", item, re.I) or re.search(r"(\w+)`?\s*$", item)
+        if item and item != "*" and alias:
+            columns.append(alias.group(1))
+    return columns
+
+
+def _dimension_values(col: str) -> list:
+    if col == "mes":
+        return list(range(1, 13))
+    if col == "anio":
+        return [2025]
+    if col == "trimestre":
+        return [1, 2, 3, 4]
+    if col == "periodo":
+        return [date(2025, m, 1) for m in range(1, 13)]
+    if col == "uo2":
+        return _DIVISIONS
+    return [f"{col.upper()} {i}" for i in range(1, 7)]
+
+
+def _metric_value(col: str, rnd: random.Random):
+    if "tasa" in col or "porcentaje" in col or "pct" in col:
+        return round(rnd.uniform(0.5, 3.5), 2)
+    if "ceses" in col or col == "total":
+        return rnd.randint(5, 120)
+    if "headcount" in col or col.startswith("hc"):
+        return rnd.randint(800, 5000)
+    return round(rnd.uniform(0, 100), 2)
+
+
+def synthesize_dataframe(sql: str) -> pd.DataFrame:
+    """DataFrame plausible para la SQL: dimensiones del registry como categorías, el resto numérico."""
+    if _PARTITION_RE.search(sql):
+        return pd.DataFrame([
+            {"partition_id": f"{y}{m:02d}01", "total_rows": 10_000,
+             "last_modified_time": datetime(y, m, 28, tzinfo=timezone.utc)}
+            for y in (2024, 2025) for m in range(1, 13)
+        ])
+
+    from app.core.analytics.registry import DIMENSIONS_REGISTRY, METRICS_REGISTRY
+
+    columns = output_columns(sql)
+    dims = [c for c in columns if (c in DIMENSIONS_REGISTRY or c in ("anio", "mes", "periodo", "trimestre"))
+            and c not in METRICS_REGISTRY]
+    rnd = random.Random(hashlib.md5(sql.encode("utf-8")).hexdigest())
+
+    if len(dims) <= 2:
+        combos = list(itertools.product(*[_dimension_values(d) for d in dims]))[:200]
+    else:  # listados: muchas columnas descriptivas
+        combos = [tuple(_dimension_values(d)[i % len(_dimension_values(d))] for d in dims) for i in range(50)]
+
+    rows = []
+    for combo in combos:
+        row = dict(zip(dims, combo))
+        for col in columns:
+            if col not in row:
+                row[col] = _metric_value(col, rnd)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=columns or None)
+
+
+class _FakeRows:
+    def __init__(self, df: pd.DataFrame, page_size: int = None, total_rows: int = None):
+        self._df = df
+        self._page_size = page_size or max(len(df), 1)
+        self.total_rows = len(df) if total_rows is None else total_rows
+
+    def to_dataframe(self, *args, **kwargs):
+        return self._df.copy()
+
+    def to_dataframe_iterable(self, *args, **kwargs):
+        for start in range(0, len(self._df), self._page_size):
+            yield self._df.iloc[start:start + self._page_size].reset_index(drop=True)
+
+
+class FakeQueryJob:
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.job_id = f"loadtest_{uuid.uuid4().hex[:12]}"
+        self.total_bytes_processed = 50 * 2**20
+        self.total_bytes_billed = 50 * 2**20
+        self.cache_hit = False
+        self.slot_millis = None
+        self.created = datetime.now(timezone.utc)
+        self.started = self.ended = None
+        self.destination = SimpleNamespace(project="loadtest", dataset_id="_anon", table_id=f"anon{self.job_id}")
+        self._df = None
+        self._lock = threading.Lock()
+
+    def _run(self) -> pd.DataFrame:
+        with self._lock:
+            if self._df is None:
+                self.started = datetime.now(timezone.utc)
+                PROFILE["bigquery"].wait(_unavailable("bigquery"))
+                self._df = synthesize_dataframe(self.sql)
+                self.ended = datetime.now(timezone.utc)
+                self.slot_millis = int((self.ended - self.started).total_seconds() * 1000)
+            return self._df
+
+    def to_dataframe(self, *args, **kwargs):
+        return self._run().copy()
+
+    def result(self, max_results=None, page_size=None, **kwargs):
+        df = self._run()
+        return _FakeRows(df.head(max_results) if max_results else df, page_size, total_rows=len(df))
+
+    def cancel(self):
+        return True
+
+    def done(self):
+        return self._df is not None
+
+
+class FakeBigQueryClient:
+    def __init__(self, *args, **kwargs):
+        self.project = kwargs.get("project", "loadtest")
+
+    def query(self, query: str, job_config=None, **kwargs):
+        if job_config is not None and getattr(job_config, "dry_run", False):
+            PROFILE["bigquery_metadata"].wait(_unavailable("bigquery"))
+        return FakeQueryJob(query)
+
+    def get_table(self, table_id):
+        PROFILE["bigquery_metadata"].wait(_unavailable("bigquery"))
+        return SimpleNamespace(modified=datetime(2025, 12, 28, tzinfo=timezone.utc), num_rows=240_000)
+
+    def list_rows(self, table_id, start_index=0, max_results=None, **kwargs):
+        PROFILE["bigquery_metadata"].wait(_unavailable("bigquery"))
+        rows = [{"nombre": f"Colaborador {i}", "uo2": _DIVISIONS[i % len(_DIVISIONS)]}
+                for i in range(start_index, start_index + (max_results or 50))]
+        return _FakeRows(pd.DataFrame(rows))
+
+
+# --- FIRESTORE ---
+
+_store = {}
+_store_lock = threading.Lock()
+
+
+def _resolve(value):
+    """Sentinels (SERVER_TIMESTAMP, etc.) -> valor concreto, como lo haría el servidor."""
+    if isinstance(value, dict):
+        return {k: _resolve(v) for k, v in value.items()}
+    if type(value).__name__ == "Sentinel":
+        return datetime.now(timezone.utc)
+    return value
+
+
+class _FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return self._data
+
+
+class _FakeDocument:
+    def __init__(self, key):
+        self._key = key
+
+    def _read(self):
+        with _store_lock:
+            return _FakeSnapshot(_store.get(self._key))
+
+    def _write(self, data, merge=False, must_exist=False):
+        with _store_lock:
+            current = _store.get(self._key)
+            if must_exist and current is None:
+                raise api_exceptions.NotFound(f"[loadtest] documento inexistente: {self._key}")
+            data = _resolve(copy.deepcopy(data))
+            _store[self._key] = {**current, **data} if (merge or must_exist) and current else data
+
+    def get(self, *args, **kwargs):
+        PROFILE["firestore"].wait(_unavailable("firestore"))
+        return self._read()
+
+    def set(self, data, merge=False):
+        PROFILE["firestore"].wait(_unavailable("firestore"))
+        self._write(data, merge=merge)
+
+    def update(self, data):
+        PROFILE["firestore"].wait(_unavailable("firestore"))
+        self._write(data, must_exist=True)
+
+
+class _FakeAsyncDocument(_FakeDocument):
+    async def get(self, *args, **kwargs):
+        await PROFILE["firestore"].await_(_unavailable("firestore"))
+        return self._read()
+
+    async def set(self, data, merge=False):
+        await PROFILE["firestore"].await_(_unavailable("firestore"))
+        self._write(data, merge=merge)
+
+    async def update(self, data):
+        await PROFILE["firestore"].await_(_unavailable("firestore"))
+        self._write(data, must_exist=True)
+
+
+class _FakeBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._ops.append(lambda: doc_ref._write(data, merge=merge))
+
+    def update(self, doc_ref, data):
+        self._ops.append(lambda: doc_ref._write(data, must_exist=True))
+
+    def commit(self):
+        PROFILE["firestore"].wait(_unavailable("firestore"))
+        for op in self._ops:
+            op()
+
+
+class _FakeCollection:
+    def __init__(self, database, name, document_cls):
+        self._prefix = (database, name)
+        self._document_cls = document_cls
+
+    def document(self, doc_id=None):
+        return self._document_cls(self._prefix + (doc_id or uuid.uuid4().hex,))
+
+
+class FakeFirestoreClient:
+    _document_cls = _FakeDocument
+
+    def __init__(self, *args, database="(default)", **kwargs):
+        self._database = database
+
+    def collection(self, name):
+        return _FakeCollection(self._database, name, self._document_cls)
+
+    def batch(self):
+        return _FakeBatch()
+
+
+class FakeAsyncFirestoreClient(FakeFirestoreClient):
+    _document_cls = _FakeAsyncDocument
+
+
+# --- GENAI ---
+
+# Consultas que el "agente" planifica (rotan por mensaje)
+SEMANTIC_CALLS = [
+    {"intent": "SNAPSHOT", "cube_query": {"metrics": ["ceses_totales"], "dimensions": ["uo2"],
+                                          "filters": [{"dimension": "anio", "value": 2025}]},
+     "metadata": {"requested_viz": "BAR_CHART", "title_suggestion": "Ceses por división 2025"}},
+    {"intent": "TREND", "cube_query": {"metrics": ["tasa_rotacion_mensual"], "dimensions": ["mes"],
+                                       "filters": [{"dimension": "anio", "value": 2025}]},
+     "metadata": {"requested_viz": "LINE_CHART", "title_suggestion": "Rotación mensual 2025"}},
+    {"intent": "SNAPSHOT", "cube_query": {"metrics": ["ceses_voluntarios", "ceses_involuntarios"], "dimensions": [],
+                                          "filters": [{"dimension": "anio", "value": 2025}]},
+     "metadata": {"requested_viz": "KPI_ROW", "title_suggestion": "Ceses 2025"}},
+]
+
+NARRATIVES = {
+    "critical_insight": "La rotación voluntaria concentra la mayor parte de los ceses del periodo.",
+    "segmentation": "FFVV rota más que administrativos.",
+    "voluntary_trend": "La rotación voluntaria se mantiene estable.",
+    "talent_leakage": "Sin fuga critica",
+    "strategic_conclusion": "Salud organizacional estable con foco en retención comercial.",
+    "recommendations": ["Revisar compensación en FFVV", "Planes de carrera para HiPo"],
+}
+
+
+def _genai_unavailable():
+    return genai_errors.ServerError(503, {"error": {"code": 503, "status": "UNAVAILABLE",
+                                                    "message": "[loadtest] genai no disponible (error inyectado)"}})
+
+
+def _response(part: types.Part) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[part]),
+                                    finish_reason=types.FinishReason.STOP)],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=1200, candidates_token_count=60),
+    )
+
+
+def _last_user_text(contents) -> str:
+    for content in reversed(contents or []):
+        for part in getattr(content, "parts", None) or []:
+            if getattr(content, "role", "user") == "user" and getattr(part, "text", None):
+                return part.text
+    return ""
+
+
+class _FakeModels:
+    """Llamadas síncronas: triaje (con la tool local de slots) y narrativas del reporte."""
+
+    def generate_content(self, model=None, contents=None, config=None, **kwargs):
+        PROFILE["genai"].wait(_genai_unavailable)
+        tools = [t for t in (getattr(config, "tools", None) or []) if callable(t)]
+        if tools:
+            # Equivalente a la función automática del SDK: el triaje llena slots y procede
+            tools[0](period="2025", structure=_DIVISIONS[0], format="TABLE")
+            return _response(types.Part(text="PROCEED"))
+        if getattr(config, "response_mime_type", None) == "application/json":
+            return _response(types.Part(text=json.dumps(NARRATIVES, ensure_ascii=False)))
+        return _response(types.Part(text=NARRATIVES["critical_insight"]))
+
+
+class _FakeAsyncModels:
+    """Turnos del agente ADK: tool call y, tras la respuesta de la tool, el cierre en texto."""
+
+    async def generate_content(self, model=None, contents=None, config=None, **kwargs):
+        await PROFILE["genai"].await_(_genai_unavailable)
+        last = (contents or [None])[-1]
+        if last is not None and any(getattr(p, "function_response", None) for p in last.parts or []):
+            return _response(types.Part(text="Listo, aquí tienes el análisis."))
+
+        text = _last_user_text(contents)
+        if "reporte" in text.lower():
+            call = types.FunctionCall(name="generate_executive_report", args={"periodo_anomes": "2025"})
+        else:
+            args = SEMANTIC_CALLS[int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16) % len(SEMANTIC_CALLS)]
+            call = types.FunctionCall(name="execute_semantic_query", args=copy.deepcopy(args))
+        return _response(types.Part(function_call=call))
+
+
+class FakeGenAIClient:
+    def __init__(self, *args, vertexai=None, **kwargs):
+        self.vertexai = bool(vertexai)
+        self.models = _FakeModels()
+        self.aio = SimpleNamespace(models=_FakeAsyncModels())
+
+
+def install_fakes():
+    """Reemplaza los clientes de GCP/GenAI. Llamar antes de importar `app`."""
+    import google.genai
+    from google.cloud import bigquery, firestore
+
+    os.environ["GOOGLE_GENAI_USE_VERTEXAI"] = "false"
+    os.environ.setdefault("GOOGLE_API_KEY", "loadtest-dummy-key")
+    bigquery.Client = FakeBigQueryClient
+    firestore.Client = FakeFirestoreClient
+    firestore.AsyncClient = FakeAsyncFirestoreClient
+    google.genai.Client = FakeGenAIClient
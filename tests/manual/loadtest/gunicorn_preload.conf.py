@@ -0,0 +1,15 @@
+# Hooks de preload de gunicorn.conf.py (raíz del repo) con los fakes del load test instalados
+# antes de que el master importe nada. bind/workers/worker_class los pasa el driver por CLI.
+from fakes import install_fakes
+
+install_fakes()
+
+from app.core.preload import preload_shared_state, reset_after_fork  # noqa: E402
+
+
+def on_starting(server):
+    preload_shared_state()
+
+
+def post_fork(server, worker):
+    reset_after_fork()
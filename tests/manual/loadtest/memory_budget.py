@@ -0,0 +1,115 @@
+"""
+Presupuesto de memoria por worker: gunicorn con y sin preload del estado inmutable.
+
+Levanta `fake_app` (fakes de fakes.py, sin GCP) bajo gunicorn en cada modo, calienta los
+workers con algunas requests (agente, runner y caches se construyen lazy) y lee
+/proc/<pid>/smaps_rollup del master y de cada worker:
+
+- RSS: memoria residente (cuenta completas las páginas compartidas: sobreestima).
+- PSS: RSS con las páginas compartidas prorrateadas entre los procesos que las usan.
+- USS: páginas privadas del proceso = lo que cuesta realmente un worker adicional.
+
+Con eso estima cuántos workers caben en una instancia de Cloud Run de `--budget-mb`:
+base compartida (PSS total - USS de los workers) + USS medio por worker adicional.
+
+Uso (solo Linux):
+    python tests/manual/loadtest/memory_budget.py --workers 4 --budget-mb 2048 --warmup-requests 20
+"""
+import os
+import sys
+import json
+import glob
+import asyncio
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from run_loadtest import start_server, wait_ready, stop_server, run_load  # noqa: E402
+
+MODES = {"sin preload": "gunicorn", "con preload": "gunicorn+preload"}
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid: int) -> dict:
+    """Campos de /proc/<pid>/smaps_rollup en MB (+ USS = privado limpio + sucio)."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in SMAPS_FIELDS:
+                values[key] = int(rest.split()[0]) / 1024
+    values["Uss"] = values["Private_Clean"] + values["Private_Dirty"]
+    return {k: round(v, 1) for k, v in values.items()}
+
+
+def measure(mode: str, workers: int, warmup_requests: int, budget_mb: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="membudget-") as run_dir:
+        proc, base_url, stats_dir, _ = start_server(f"{MODES[mode]}:{workers}", run_dir, "{}")
+        try:
+            wait_ready(proc, base_url, stats_dir, workers)
+            if warmup_requests:
+                # Sin latencias inyectadas: solo interesa que cada worker construya su estado lazy
+                asyncio.run(run_load(base_url, stats_dir, concurrency=workers * 2, warmup=0,
+                                     duration=max(2.0, warmup_requests / 10), mix={"chat": 0.8, "report": 0.2}))
+            worker_pids = sorted(int(os.path.basename(p)[7:-5]) for p in glob.glob(os.path.join(stats_dir, "worker-*.json")))
+            worker_mem = {pid: read_memory(pid) for pid in worker_pids}
+            master_mem = read_memory(proc.pid)
+        finally:
+            stop_server(proc)
+
+    n = len(worker_mem)
+    mean = lambda field: round(sum(m[field] for m in worker_mem.values()) / max(n, 1), 1)  # noqa: E731
+    total_pss = master_mem["Pss"] + sum(m["Pss"] for m in worker_mem.values())
+    shared_base = total_pss - sum(m["Uss"] for m in worker_mem.values())
+    fits = int((budget_mb - shared_base) // mean("Uss")) if mean("Uss") else None
+    return {
+        "mode": mode,
+        "master": master_mem,
+        "workers": worker_mem,
+        "worker_mean_rss_mb": mean("Rss"),
+        "worker_mean_pss_mb": mean("Pss"),
+        "worker_mean_uss_mb": mean("Uss"),
+        "total_pss_mb": round(total_pss, 1),
+        "shared_base_mb": round(shared_base, 1),
+        "workers_within_budget": fits,
+    }
+
+
+def print_result(result: dict, budget_mb: float):
+    print(f"\n=== {result['mode']} ===")
+    print(f"  master   RSS {result['master']['Rss']:>7.1f} MB | PSS {result['master']['Pss']:>7.1f} MB | USS {result['master']['Uss']:>7.1f} MB")
+    for pid, mem in result["workers"].items():
+        print(f"  w{pid:<7} RSS {mem['Rss']:>7.1f} MB | PSS {mem['Pss']:>7.1f} MB | USS {mem['Uss']:>7.1f} MB")
+    print(f"  Total PSS {result['total_pss_mb']} MB | base compartida {result['shared_base_mb']} MB | "
+          f"USS medio por worker {result['worker_mean_uss_mb']} MB")
+    print(f"  Workers que caben en {budget_mb:.0f} MB: {result['workers_within_budget']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--budget-mb", type=float, default=2048, help="Memoria de la instancia de Cloud Run")
+    parser.add_argument("--warmup-requests", type=int, default=20, help="0 = medir recién arrancado")
+    parser.add_argument("--out", help="Archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        parser.error("Requiere Linux (/proc/<pid>/smaps_rollup)")
+
+    results = []
+    for mode in MODES:
+        print(f"🧪 Midiendo gunicorn {mode} ({args.workers} workers)...", flush=True)
+        result = measure(mode, args.workers, args.warmup_requests, args.budget_mb)
+        print_result(result, args.budget_mb)
+        results.append(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"budget_mb": args.budget_mb, "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
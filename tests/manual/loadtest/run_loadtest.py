@@ -0,0 +1,326 @@
+"""
+Load test offline de la API (sin GCP): capacidad real de `app.main:app` por worker.
+
+Levanta la app real vía fake_app.py (BigQuery, Firestore y GenAI falsos con latencia y
+errores inyectables, ver fakes.py) bajo uvicorn o gunicorn, y la carga con usuarios
+virtuales en lazo cerrado que mezclan:
+- token:  POST /token
+- chat:   POST /chat con una consulta (triaje + agente + execute_semantic_query)
+- report: POST /chat pidiendo el reporte ejecutivo (generate_executive_report + narrativas)
+
+Por cada combinación servidor × concurrencia reporta RPS, p50/p95/p99 por escenario,
+errores, lag del event loop (histograma de los workers) y CPU por worker (% de un core
+en la ventana medida), para dimensionar instancias de Cloud Run con datos.
+
+Uso:
+    python tests/manual/loadtest/run_loadtest.py \\
+        --servers uvicorn:1,gunicorn:2,gunicorn:4 --concurrency 16,64 --duration 30 \\
+        --profile '{"genai": {"median_ms": 1500, "p95_ms": 5000, "error_rate": 0.01}}' \\
+        --out loadtest.json
+
+Servidores: <runner>[+<loop>][+preload]:<workers>, runner uvicorn|gunicorn y loop
+auto|asyncio|uvloop (gunicorn+asyncio usa UvicornH11Worker). gunicorn+preload usa los hooks
+de preload de gunicorn.conf.py (ver gunicorn_preload.conf.py). El servidor corre en un directorio temporal:
+sus logs y .agent/logs/performance.jsonl quedan ahí, no en el repo.
+"""
+import os
+import sys
+import json
+import time
+import glob
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.abspath(os.path.join(HERE, "..", "..", ".."))
+PRELOAD_CONFIG = os.path.join(HERE, "gunicorn_preload.conf.py")
+sys.path.insert(0, HERE)
+
+from fakes import LAG_BUCKETS_MS  # noqa: E402
+
+SERVER_ENV = {
+    "PROJECT_ID": "loadtest-project",
+    "BQ_DATASET": "loadtest",
+    "BQ_TABLE_TURNOVER": "fact_hr_rotation",
+    "GCS_BUCKET_DOCS": "loadtest-docs",
+    "GCS_BUCKET_LANDING": "loadtest-landing",
+    "ENV": "development",
+    "LOG_LEVEL": "WARNING",
+    "CACHE_WARMER_ENABLED": "false",
+}
+
+CHAT_MESSAGES = [
+    "Ceses por división en 2025",
+    "Evolución mensual de la rotación 2025",
+    "Ceses voluntarios e involuntarios de 2025",
+    "¿Cuántos ceses hubo en la división comercial este año?",
+]
+REPORT_MESSAGE = "Genera el reporte ejecutivo 2025"
+USER = {"username": "analista", "password": "123"}
+
+
+# --- SERVER ---
+
+def parse_server(spec: str):
+    """'<runner>[+<opción>...]:<workers>' -> (runner, loop, preload, workers)."""
+    runner_options, workers = spec.split(":")
+    runner, *options = runner_options.split("+")
+    preload = "preload" in options
+    loops = [o for o in options if o != "preload"]
+    loop = loops[0] if loops else "auto"
+    if runner not in ("uvicorn", "gunicorn") or len(loops) > 1 or loop not in ("auto", "asyncio", "uvloop") \
+            or (preload and runner != "gunicorn"):
+        raise ValueError(f"Servidor inválido: {spec}")
+    return runner, loop, preload, int(workers)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(spec: str, run_dir: str, profile: str):
+    runner, loop, preload, workers = parse_server(spec)
+    port = _free_port()
+    if runner == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "fake_app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--no-access-log", "--log-level", "warning"]
+        if loop != "auto":
+            cmd += ["--loop", loop]
+    else:
+        worker_class = "uvicorn.workers.UvicornH11Worker" if loop == "asyncio" else "uvicorn.workers.UvicornWorker"
+        cmd = [sys.executable, "-m", "gunicorn", "fake_app:app", "-w", str(workers), "-k", worker_class,
+               "--bind", f"127.0.0.1:{port}", "--timeout", "300", "--log-level", "warning"]
+        if preload:
+            cmd += ["-c", PRELOAD_CONFIG]
+
+    stats_dir = os.path.join(run_dir, "stats")
+    os.makedirs(stats_dir, exist_ok=True)
+    env = {**os.environ, **SERVER_ENV, "LOADTEST_STATS_DIR": stats_dir, "LOADTEST_PROFILE": profile,
+           "PYTHONPATH": os.pathsep.join([HERE, REPO_ROOT])}
+    log = open(os.path.join(run_dir, "server.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc, f"http://127.0.0.1:{port}", stats_dir, workers
+
+
+def wait_ready(proc, base_url: str, stats_dir: str, workers: int, timeout: float = 180.0):
+    """Espera /health y a que todos los workers hayan arrancado (cada uno escribe su archivo de stats)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proc.returncode}); ver server.log")
+        try:
+            healthy = httpx.get(f"{base_url}/health", timeout=2).status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+        if healthy and len(glob.glob(os.path.join(stats_dir, "worker-*.json"))) >= workers:
+            return
+        time.sleep(0.5)
+    raise TimeoutError("El servidor no quedó listo a tiempo")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# --- WORKER STATS ---
+
+def read_worker_stats(stats_dir: str) -> dict:
+    stats = {}
+    for path in glob.glob(os.path.join(stats_dir, "worker-*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            stats[data["pid"]] = data
+        except (OSError, ValueError):
+            continue
+    return stats
+
+
+def _histogram_percentile(histogram, pct: float):
+    total = sum(histogram)
+    if not total:
+        return 0.0
+    target, cumulative = total * pct / 100, 0
+    for i, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= target:
+            return LAG_BUCKETS_MS[i] if i < len(LAG_BUCKETS_MS) else f">{LAG_BUCKETS_MS[-1]}"
+    return f">{LAG_BUCKETS_MS[-1]}"
+
+
+def diff_worker_stats(before: dict, after: dict) -> dict:
+    workers = []
+    merged = [0] * (len(LAG_BUCKETS_MS) + 1)
+    for pid, end in after.items():
+        start = before.get(pid, {"cpu_s": 0.0, "wall": end["wall"], "requests": 0, "lag_histogram": [0] * len(merged)})
+        wall = max(end["wall"] - start["wall"], 1e-9)
+        histogram = [e - s for e, s in zip(end["lag_histogram"], start["lag_histogram"])]
+        merged = [m + h for m, h in zip(merged, histogram)]
+        workers.append({
+            "pid": pid,
+            "cpu_pct": round((end["cpu_s"] - start["cpu_s"]) / wall * 100, 1),
+            "requests": end["requests"] - start["requests"],
+            "lag_p99_ms": _histogram_percentile(histogram, 99),
+        })
+    return {
+        "workers": sorted(workers, key=lambda w: w["pid"]),
+        "lag_p50_ms": _histogram_percentile(merged, 50),
+        "lag_p99_ms": _histogram_percentile(merged, 99),
+        "lag_max_ms": round(max((w.get("lag_max_ms", 0.0) for w in after.values()), default=0.0), 1),
+    }
+
+
+# --- LOAD ---
+
+async def _token(client, token, vu, n):
+    return await client.post("/token", data=USER)
+
+
+async def _chat(client, token, vu, n):
+    message = CHAT_MESSAGES[(vu + n) % len(CHAT_MESSAGES)]
+    return await client.post("/chat", json={"message": message, "session_id": f"loadtest-{vu}"},
+                             headers={"Authorization": f"Bearer {token}"})
+
+
+async def _report(client, token, vu, n):
+    return await client.post("/chat", json={"message": REPORT_MESSAGE, "session_id": f"loadtest-report-{vu}"},
+                             headers={"Authorization": f"Bearer {token}"})
+
+
+SCENARIOS = {"token": _token, "chat": _chat, "report": _report}
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_load(base_url: str, stats_dir: str, concurrency: int, warmup: float, duration: float, mix: dict):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        token = (await client.post("/token", data=USER)).json()["access_token"]
+        t_measure = time.monotonic() + warmup
+        t_end = t_measure + duration
+        samples = []
+        names, weights = list(mix), list(mix.values())
+
+        async def virtual_user(vu: int):
+            rnd = random.Random(vu)
+            n = 0
+            while time.monotonic() < t_end:
+                scenario = rnd.choices(names, weights)[0]
+                t0 = time.monotonic()
+                try:
+                    ok = (await SCENARIOS[scenario](client, token, vu, n)).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                t1 = time.monotonic()
+                # Se cuentan las respuestas completadas dentro de la ventana medida
+                if t_measure <= t1 <= t_end:
+                    samples.append((scenario, t1 - t0, ok))
+                n += 1
+
+        async def snapshot_at(t: float):
+            await asyncio.sleep(max(0.0, t - time.monotonic()))
+            return read_worker_stats(stats_dir)
+
+        # Los workers escriben sus stats cada segundo: la ventana de CPU/lag tiene ±1 s de error
+        before_task = asyncio.create_task(snapshot_at(t_measure))
+        after_task = asyncio.create_task(snapshot_at(t_end))
+        await asyncio.gather(*[virtual_user(vu) for vu in range(concurrency)])
+        before, after = await before_task, await after_task
+
+    by_scenario = defaultdict(list)
+    for scenario, latency, ok in samples:
+        by_scenario[scenario].append((latency, ok))
+
+    def summary(entries):
+        latencies = [lat for lat, _ in entries]
+        return {
+            "requests": len(entries),
+            "errors": sum(1 for _, ok in entries if not ok),
+            "rps": round(len(entries) / duration, 2),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        }
+
+    return {
+        "total": summary([(lat, ok) for _, lat, ok in samples]),
+        "scenarios": {name: summary(entries) for name, entries in sorted(by_scenario.items())},
+        "runtime": diff_worker_stats(before, after),
+    }
+
+
+def print_result(server: str, concurrency: int, result: dict):
+    total, runtime = result["total"], result["runtime"]
+    cpu = [w["cpu_pct"] for w in runtime["workers"]]
+    print(f"\n=== {server} | concurrencia {concurrency} ===")
+    print(f"  TOTAL   {total['rps']:>8.2f} rps | p50 {total['p50_ms']:>8.1f} ms | p95 {total['p95_ms']:>8.1f} ms "
+          f"| p99 {total['p99_ms']:>8.1f} ms | errores {total['errors']}/{total['requests']}")
+    for name, s in result["scenarios"].items():
+        print(f"  {name:<7} {s['rps']:>8.2f} rps | p50 {s['p50_ms']:>8.1f} ms | p95 {s['p95_ms']:>8.1f} ms "
+              f"| p99 {s['p99_ms']:>8.1f} ms | errores {s['errors']}/{s['requests']}")
+    print(f"  Event loop lag: p50 ≤{runtime['lag_p50_ms']} ms | p99 ≤{runtime['lag_p99_ms']} ms | máx {runtime['lag_max_ms']} ms (histórico)")
+    print(f"  CPU por worker (% de un core): {cpu} | media {sum(cpu) / max(len(cpu), 1):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default="uvicorn:1,gunicorn:2,gunicorn:4")
+    parser.add_argument("--concurrency", default="16,64")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos medidos por combinación")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Segundos de carga descartados al inicio")
+    parser.add_argument("--mix", default="chat=0.7,report=0.2,token=0.1", help="Pesos de escenarios")
+    parser.add_argument("--profile", default="{}", help="Latencia/errores por dependencia (JSON, ver fakes.py)")
+    parser.add_argument("--out", help="Archivo JSON con los resultados")
+    args = parser.parse_args()
+
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {unknown}")
+    json.loads(args.profile)  # validar antes de levantar servidores
+
+    results = []
+    for server in args.servers.split(","):
+        with tempfile.TemporaryDirectory(prefix="loadtest-") as run_dir:
+            proc, base_url, stats_dir, workers = start_server(server, run_dir, args.profile)
+            try:
+                print(f"🚀 {server}: arrancando {workers} worker(s)...", flush=True)
+                wait_ready(proc, base_url, stats_dir, workers)
+                for concurrency in (int(c) for c in args.concurrency.split(",")):
+                    result = asyncio.run(run_load(base_url, stats_dir, concurrency, args.warmup, args.duration, mix))
+                    print_result(server, concurrency, result)
+                    results.append({"server": server, "workers": workers, "concurrency": concurrency, **result})
+            except Exception:
+                with open(os.path.join(run_dir, "server.log"), encoding="utf-8", errors="replace") as f:
+                    print(f.read()[-4000:], file=sys.stderr)
+                raise
+            finally:
+                stop_server(proc)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"profile": json.loads(args.profile), "mix": mix, "duration": args.duration,
+                       "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
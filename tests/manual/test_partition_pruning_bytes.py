@@ -0,0 +1,68 @@
+"""
+Regresión de bytes escaneados: Partition Pruning
+
+Compara (vía dry run, sin costo) los bytes que procesaría BigQuery con los filtros
+temporales reescritos a rangos literales de `periodo` contra la forma legacy
+(`anio = 2025`, `EXTRACT(... FROM periodo)`, `periodo = (SELECT MAX(...))`).
+
+Requiere credenciales de GCP (ADC) y la tabla real; se omite si no hay.
+
+Uso:
+    python -m pytest tests/manual/test_partition_pruning_bytes.py -v -s
+"""
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app.services.bigquery import get_bq_service
+from app.services.query_generator import build_analytical_query
+
+
+def _has_credentials() -> bool:
+    try:
+        import google.auth
+        google.auth.default()
+        return True
+    except Exception:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not _has_credentials(), reason="Requiere credenciales de BigQuery (dry run)")
+
+SCENARIOS = {
+    "año": {"metrics": ["ceses_totales"], "dimensions": ["uo2"], "filters": {"anio": 2025}},
+    "trimestre": {"metrics": ["ceses_totales"], "dimensions": ["mes"], "filters": {"anio": 2025, "trimestre": 1}},
+    "mes": {"metrics": ["personal_activo_total"], "dimensions": ["uo2"], "filters": {"anio": 2025, "mes": 3}},
+    "max_periodo": {"metrics": ["personal_activo_total"], "dimensions": ["uo2"], "filters": {"periodo": "MAX"}},
+    "comparacion": {
+        "metrics": ["ceses_totales"], "dimensions": ["mes"],
+        "comparison_groups": [
+            {"label": "2024 Q1", "filters": {"anio": 2024, "trimestre": 1}},
+            {"label": "2025 Q1", "filters": {"anio": 2025, "trimestre": 1}},
+        ],
+    },
+}
+
+
+def _legacy_sql(params):
+    """SQL sin reescritura temporal (comportamiento previo)."""
+    with patch("app.services.query_builders.utils.rewrite_temporal_filters", lambda f, c: ([], f)), \
+         patch("app.services.query_generator.pruning_predicate", lambda f: None):
+        return build_analytical_query(**params)
+
+
+@pytest.mark.parametrize("name", list(SCENARIOS))
+def test_pruned_query_scans_fewer_bytes(name):
+    params = SCENARIOS[name]
+    bq = get_bq_service()
+
+    legacy_bytes = bq.dry_run(_legacy_sql(params))
+    pruned_bytes = bq.dry_run(build_analytical_query(**params))
+
+    print(f"\n✂️ {name}: legacy={legacy_bytes:,} B | pruned={pruned_bytes:,} B "
+          f"({(1 - pruned_bytes / max(legacy_bytes, 1)) * 100:.1f}% menos)")
+    assert pruned_bytes < legacy_bytes
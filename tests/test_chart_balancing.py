@@ -0,0 +1,61 @@
+import pandas as pd
+from app.schemas.analytics import SemanticRequest
+from app.ai.tools.universal_analyst import (
+    _ensure_dataframe_completeness, _format_chart_block, _build_series_grid
+)
+
+
+def _request(dimensions, years):
+    return SemanticRequest(
+        intent="COMPARISON",
+        cube_query={
+            "metrics": ["tasa_rotacion_mensual"],
+            "dimensions": dimensions,
+            "filters": [{"dimension": "anio", "value": years}],
+        },
+        metadata={"requested_viz": "BAR_CHART"},
+    )
+
+
+def test_zero_fill_adds_missing_filter_values():
+    """Years requested in the filter but absent in the result are appended as empty rows."""
+    df = pd.DataFrame([{"anio": 2024, "tasa_rotacion_mensual": 1.5}])
+    req = _request(["anio"], [2023, 2024, 2025])
+
+    out = _ensure_dataframe_completeness(df, req)
+
+    assert out["anio"].tolist() == [2023, 2024, 2025]
+    assert pd.isna(out.loc[out["anio"] == 2023, "tasa_rotacion_mensual"]).all()
+
+
+def test_series_grid_first_match_wins_and_missing_is_negative():
+    """Grid keeps the first row per (label, group) and -1 for absent combinations."""
+    df = pd.DataFrame([
+        {"anio": 2024, "uo5": "A", "v": 1.0},
+        {"anio": 2024, "uo5": "A", "v": 9.0},  # Duplicate: ignored
+        {"anio": 2025, "uo5": "B", "v": 2.0},
+    ])
+
+    labels, group_index, grid = _build_series_grid(df, "anio", "uo5")
+
+    assert labels == ["2024", "2025"]
+    assert grid[group_index["A"]].tolist() == [0, -1]
+    assert grid[group_index["B"]].tolist() == [-1, 2]
+
+
+def test_multi_series_balancing_aligns_series():
+    """Every series has one point per label, with None where the group has no data."""
+    df = pd.DataFrame([
+        {"anio": 2024, "uo5": "A", "tasa_rotacion_mensual": 1.0},
+        {"anio": 2025, "uo5": "A", "tasa_rotacion_mensual": 2.0},
+        {"anio": 2025, "uo5": "B", "tasa_rotacion_mensual": 3.0},
+        {"anio": 2024, "uo5": None, "tasa_rotacion_mensual": 4.0},
+    ])
+    req = _request(["anio", "uo5"], [2024, 2025])
+
+    block = _format_chart_block(_ensure_dataframe_completeness(df, req), req)
+    series = {ds.label: ds.data for ds in block.payload.datasets}
+
+    assert block.payload.labels == ["2024", "2025"]
+    assert series["A"] == [1.0, 2.0]
+    assert series["B"] == [None, 3.0]
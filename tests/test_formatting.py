@@ -51,3 +51,38 @@ def test_format_empty_dataframe():
     df = pd.DataFrame()
     formatted = format_dataframe_for_export(df)
     assert formatted == []
+
+def test_encode_table_columnar_dictionary_encodes_repeated_strings():
+    """Low-cardinality string columns are dictionary-encoded; others are plain columns."""
+    from app.core.utils.formatting import encode_table_columnar
+
+    rows = [
+        {"nombre": "Ana", "uo2": "FINANZAS", "edad": 30},
+        {"nombre": "Luis", "uo2": "FINANZAS", "edad": 41},
+        {"nombre": "Eva", "uo2": None, "edad": None},
+        {"nombre": "Juan", "uo2": "FINANZAS", "edad": 25},
+    ]
+
+    payload = encode_table_columnar(["nombre", "uo2", "edad"], rows)
+
+    assert payload["row_count"] == 4
+    assert payload["columns"][0] == ["Ana", "Luis", "Eva", "Juan"]
+    assert payload["dictionaries"] == {"uo2": ["FINANZAS"]}
+    assert payload["columns"][1] == [0, 0, None, 0]
+    assert payload["columns"][2] == [30, 41, None, 25]
+
+
+def test_apply_table_format_only_touches_tables():
+    from app.core.utils.formatting import apply_table_format
+
+    content = [
+        {"type": "text", "payload": "hola"},
+        {"type": "TABLE", "payload": {"headers": ["a"], "rows": [{"a": 1}]}},
+    ]
+
+    assert apply_table_format(content, "rows") is content
+    encoded = apply_table_format(content, "columnar")
+    assert encoded[0] == content[0]
+    assert encoded[1]["payload"]["columns"] == [[1]]
+    # El contenido original no se muta
+    assert "rows" in content[1]["payload"]
@@ -22,7 +22,7 @@ def test_build_query_basic():
     assert "SELECT" in query
     assert "uo2 AS uo2" in query
     assert "SAFE_DIVIDE" in query  # Tasa de rotación usa safe_divide
-    assert "anio = 2025" in query or "anio = '2025'" in query
+    assert "periodo BETWEEN DATE('2025-01-01') AND DATE('2025-12-31')" in query  # Partition pruning
     # Regla de Oro (Security Filter)
     assert "segmento != 'PRACTICANTE'" in query
 
@@ -161,5 +161,6 @@ def test_smart_listing_limits():
         )
         
         # Verificar que se inyectó limit=50 por default para listados
-        args, kwargs = mock_build.call_args
+        # (la primera llamada; las variantes de LIMIT del listado también salen del builder)
+        args, kwargs = mock_build.call_args_list[0]
         assert kwargs.get("limit") == 50
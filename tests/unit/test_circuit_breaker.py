@@ -0,0 +1,77 @@
+import time
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+from google.api_core.exceptions import BadRequest, ServiceUnavailable
+
+from app.ai.tools import universal_analyst
+from app.services.bigquery import get_bq_service
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breaker, CLOSED, OPEN
+
+
+def _fail(breaker, error):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+def test_breaker_opens_fails_fast_and_recovers_via_probe():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_seconds=0.05)
+
+    # Errores de la request (4xx) no cuentan como caída
+    _fail(breaker, BadRequest("SQL inválida"))
+    _fail(breaker, BadRequest("SQL inválida"))
+    assert breaker.state == CLOSED
+
+    _fail(breaker, ServiceUnavailable("backend down"))
+    _fail(breaker, TimeoutError())
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # Half-open: una sola llamada de prueba; las concurrentes siguen fallando rápido
+    time.sleep(0.06)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["rejected_calls"] == 2
+
+
+@pytest.fixture
+def bq_client(mocker):
+    mocker.patch.object(universal_analyst.settings, "QUERY_COST_CONTROL_ENABLED", False)
+    universal_analyst._last_good_packages.clear()
+    client = MagicMock()
+    mocker.patch.object(get_bq_service(), "_client", client)
+    yield client
+    get_circuit_breaker("bigquery").record_success()
+
+
+def test_bigquery_outage_serves_last_good_package_marked_stale(bq_client):
+    query = dict(
+        intent="SNAPSHOT",
+        cube_query={"metrics": ["ceses_totales"], "dimensions": [],
+                    "filters": [{"dimension": "anio", "value": 2025}]},
+    )
+    bq_client.query.return_value.to_dataframe.return_value = pd.DataFrame([{"ceses_totales": 42}])
+    fresh = universal_analyst.execute_semantic_query(**query)
+    assert "stale" not in fresh
+
+    bq_client.query.side_effect = ServiceUnavailable("backend down")
+    threshold = get_circuit_breaker("bigquery").failure_threshold
+    for _ in range(threshold + 3):
+        stale = universal_analyst.execute_semantic_query(**query)
+        assert stale["stale"] is True and stale["content"] == fresh["content"]
+        assert "Datos en caché" in stale["summary"]
+
+    # Con el circuito abierto ya no se llama a BigQuery
+    assert bq_client.query.call_count == 1 + threshold
+    assert get_circuit_breaker("bigquery").state == OPEN
+
+    # Consulta sin resultado previo: error inmediato, sin tocar BigQuery
+    other = universal_analyst.execute_semantic_query(**{**query, "intent": "TREND"})
+    assert other["content"] == [] and "abierto" in other["summary"]
+    assert bq_client.query.call_count == 1 + threshold
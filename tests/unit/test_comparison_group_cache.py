@@ -0,0 +1,124 @@
+import re
+
+import pandas as pd
+import pytest
+
+from app.services.comparison_group_cache import ComparisonGroupCache, get_comparison_group_cache
+
+# (anio, trimestre) -> ceses por mes del trimestre
+CESES = {(2024, 1): [5, 6, 7], (2025, 1): [8, 9, 10], (2026, 1): [11, 12, 13]}
+
+
+def _query(*years):
+    return {
+        "metrics": ["ceses_totales"],
+        "dimensions": ["mes"],
+        "filters": {},
+        "comparison_groups": [{"label": f"Q1 {y}", "filters": {"anio": y, "trimestre": 1}} for y in years],
+        "limit": 5000,
+    }
+
+
+class _FakeBQ:
+    """Una parte del UNION ALL por grupo: responde según los filtros de su CASE WHEN."""
+
+    def __init__(self):
+        self.calls = []
+
+    def execute_query(self, sql):
+        parts = sql.split("\nUNION ALL\n")
+        self.calls.append(len(parts))
+        rows = []
+        for part in parts:
+            anio, trimestre, label = re.search(r"WHEN .*= (\d{4}) AND .*= (\d) THEN '([^']+)'", part).groups()
+            for i, ceses in enumerate(CESES[(int(anio), int(trimestre))]):
+                rows.append({"comparison_group": label, "mes": i + 1, "ceses_totales": ceses})
+        return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def cache(mocker):
+    cache = get_comparison_group_cache()
+    cache.clear()
+    fake = _FakeBQ()
+    mocker.patch("app.services.comparison_group_cache.get_bq_service", return_value=fake)
+    freshness = mocker.patch("app.services.comparison_group_cache.get_data_freshness_service").return_value
+    freshness.data_version.return_value = "v1"
+    yield cache, fake, freshness
+    cache.clear()
+
+
+def test_plan_only_decomposes_disjoint_groups_over_same_dimensions():
+    plan = ComparisonGroupCache.plan
+    assert plan(_query(2024, 2025)) is not None
+    overlapping = _query(2024, 2025)
+    overlapping["comparison_groups"][1]["filters"] = {"anio": [2024, 2025], "trimestre": 1}
+    assert plan(overlapping) is None
+    mixed = _query(2024, 2025)
+    mixed["comparison_groups"][1]["filters"] = {"anio": 2025}
+    assert plan(mixed) is None
+    assert plan({**_query(2024), "comparison_groups": _query(2024)["comparison_groups"]}) is None
+
+
+def test_plan_decomposes_window_metrics_only_across_years():
+    rates = {"metrics": ["tasa_rotacion_mensual", "tasa_rotacion_anual"]}
+    assert ComparisonGroupCache.plan({**_query(2024, 2025), **rates}) is not None
+
+    # Mismo año: el LAG/YTD de Q2 ve los meses de Q1 en el scan fusionado
+    same_year = _query(2025, 2025)
+    same_year["comparison_groups"][1] = {"label": "Q2 2025", "filters": {"anio": 2025, "trimestre": 2}}
+    assert ComparisonGroupCache.plan({**same_year, **rates}) is None
+
+
+def _normalized(sql):
+    """SQL sin el rango temporal del scan ni las condiciones por grupo (CASE WHEN / WHERE del cuerpo)."""
+    sql = re.sub(r"\(?periodo BETWEEN DATE\('[\d-]+'\) AND DATE\('[\d-]+'\)(?: OR periodo BETWEEN [^)]+\)[^)]*\))*\)?", "<scan>", sql)
+    sql = re.sub(r"\n\s+WHEN [^\n]+", "", sql)
+    return re.sub(r"\nWHERE \(anio[^\n]+", "", sql)
+
+
+def _scan_ranges(sql):
+    return set(re.findall(r"periodo BETWEEN DATE\('[\d-]+'\) AND DATE\('[\d-]+'\)", sql))
+
+
+def test_year_disjoint_group_sql_matches_the_merged_sql():
+    from app.services.query_generator import build_analytical_query
+
+    metrics, groups = ["tasa_rotacion_mensual", "tasa_rotacion_anual"], _query(2024, 2025)["comparison_groups"]
+    merged = build_analytical_query(metrics, ["mes"], comparison_groups=groups)
+
+    # Acumulados YTD por año: el mes previo (Diciembre) de un grupo no entra en la partición del otro
+    assert "OVER (PARTITION BY anio" in merged
+    for group in groups:
+        single = build_analytical_query(metrics, ["mes"], comparison_groups=[group])
+        # Mismas etapas y ventanas; el scan del grupo (con sus meses de LAG/YTD) está dentro del fusionado
+        assert _normalized(single) == _normalized(merged)
+        assert _scan_ranges(single) <= _scan_ranges(merged)
+    assert set.union(*(_scan_ranges(build_analytical_query(metrics, ["mes"], comparison_groups=[g])) for g in groups)) == _scan_ranges(merged)
+
+
+def test_sliding_comparison_only_queries_missing_group(cache):
+    cache, fake, _ = cache
+
+    first = cache.execute(_query(2024, 2025))
+    assert fake.calls == [2]
+    assert first.columns.tolist() == ["comparison_group", "mes", "ceses_totales"]
+    # ORDER BY mes, comparison_group (como la SQL de comparación)
+    assert first["comparison_group"].tolist()[:2] == ["Q1 2024", "Q1 2025"]
+    assert first["ceses_totales"].tolist() == [5, 8, 6, 9, 7, 10]
+
+    second = cache.execute(_query(2025, 2026))
+    assert fake.calls == [2, 1]  # Q1 2025 sale de cache
+    assert second["comparison_group"].tolist() == ["Q1 2025", "Q1 2026"] * 3
+    assert second["ceses_totales"].tolist() == [8, 11, 9, 12, 10, 13]
+
+
+def test_new_data_version_invalidates_cached_groups(cache):
+    cache, fake, freshness = cache
+    cache.execute(_query(2024, 2025))
+    cache.execute(_query(2024, 2025))
+    assert fake.calls == [2]
+
+    freshness.data_version.return_value = "v2"
+    cache.execute(_query(2024, 2025))
+    assert fake.calls == [2, 2]
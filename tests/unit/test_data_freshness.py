@@ -0,0 +1,89 @@
+from datetime import date
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+
+from app.services.data_freshness import get_data_freshness_service
+from app.services.partition_pruning import month_index
+
+PARTITIONS = pd.DataFrame([
+    {"partition_id": "202411", "total_rows": 90, "last_modified_time": pd.Timestamp("2024-12-02T05:00:00Z")},
+    {"partition_id": "202412", "total_rows": 100, "last_modified_time": pd.Timestamp("2025-01-02T05:00:00Z")},
+    {"partition_id": "202501", "total_rows": 110, "last_modified_time": pd.Timestamp("2025-02-02T05:00:00Z")},
+    {"partition_id": "202502", "total_rows": 120, "last_modified_time": pd.Timestamp("2025-03-02T05:00:00Z")},
+    {"partition_id": "__NULL__", "total_rows": 3, "last_modified_time": pd.Timestamp("2025-03-02T05:00:00Z")},
+])
+
+
+@pytest.fixture
+def freshness(mocker):
+    svc = get_data_freshness_service()
+    svc.clear()
+    bq = MagicMock()
+    bq.get_table_metadata.return_value = {"modified": "2025-03-02T05:00:00+00:00", "num_rows": 423}
+    bq.execute_query.return_value = PARTITIONS
+    mocker.patch("app.services.data_freshness.get_bq_service", return_value=bq)
+    yield svc, bq
+    svc.clear()
+
+
+def test_period_stats_come_from_partition_metadata(freshness):
+    svc, bq = freshness
+
+    assert svc.latest_periodo() == date(2025, 2, 1)
+    assert svc.latest_periodo(2024) == date(2024, 12, 1)
+    assert svc.earliest_periodo() == date(2024, 11, 1)
+    assert svc.available_years() == [2025, 2024]
+    assert svc.year_row_count(2024) == 190
+    assert svc.year_row_count(2023) == 0
+    assert svc.data_version() == "2025-03-02T05:00:00+00:00"
+
+    # Todo lo anterior salió de una sola lectura de metadata
+    bq.get_table_metadata.assert_called_once()
+    assert bq.execute_query.call_count == 1
+    assert "INFORMATION_SCHEMA.PARTITIONS" in bq.execute_query.call_args.args[0]
+
+
+def test_unchanged_table_skips_stats_and_new_load_notifies(freshness):
+    svc, bq = freshness
+    listener = MagicMock()
+    svc.subscribe(listener)
+
+    svc.refresh(force=True)
+    svc.refresh(force=True)
+    assert bq.execute_query.call_count == 1
+    listener.assert_not_called()
+
+    bq.get_table_metadata.return_value = {"modified": "2025-04-02T05:00:00+00:00", "num_rows": 553}
+    bq.execute_query.return_value = pd.concat([PARTITIONS, pd.DataFrame([
+        {"partition_id": "202503", "total_rows": 130, "last_modified_time": pd.Timestamp("2025-04-02T05:00:00Z")},
+    ])])
+    svc.refresh(force=True)
+
+    listener.assert_called_once_with("2025-04-02T05:00:00+00:00")
+    assert svc.latest_periodo() == date(2025, 3, 1)
+    assert svc.month_version(month_index(2025, 1)) == pd.Timestamp("2025-02-02T05:00:00Z").isoformat()
+
+
+def test_unpartitioned_table_falls_back_to_aggregate(freshness):
+    svc, bq = freshness
+    aggregate = pd.DataFrame([
+        {"mes": date(2025, 1, 1), "min_periodo": date(2025, 1, 1), "max_periodo": date(2025, 1, 1), "filas": 50},
+    ])
+    bq.execute_query.side_effect = [pd.DataFrame([{"partition_id": "__UNPARTITIONED__", "total_rows": 50,
+                                                   "last_modified_time": None}]), aggregate]
+
+    assert svc.latest_periodo(2025) == date(2025, 1, 1)
+    # Sin versión por partición: la versión de la tabla invalida ante cualquier recarga
+    assert svc.month_version(month_index(2025, 1)) == svc.data_version()
+    assert "GROUP BY 1" in bq.execute_query.call_args.args[0]
+
+
+def test_metadata_failure_keeps_callers_on_fallback(freshness):
+    svc, bq = freshness
+    bq.get_table_metadata.return_value = None
+
+    assert svc.latest_periodo() is None
+    assert svc.year_row_count(2025) is None
+    assert svc.snapshot() == {"available": False}
@@ -0,0 +1,95 @@
+import io
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from app.services.export_service import get_export_service, settings
+
+
+class _FakeBQ:
+    def __init__(self, pages):
+        self.pages = pages
+        self.sql = None
+
+    def query_pages(self, sql, page_size=10_000):
+        self.sql = sql
+        return sum(len(p) for p in self.pages), iter(self.pages)
+
+
+PAGES = [
+    pd.DataFrame([{"dni": "12345678", "nombre": "Ana", "fecha_cese": "2025-01-31"}]),
+    pd.DataFrame([{"dni": "87654321", "nombre": "José", "fecha_cese": "2025-02-28"}]),
+]
+
+
+def test_build_sql_uses_export_limit():
+    """Export SQL comes from the same generator, but with the export cap (+1 to detect truncation)."""
+    sql = get_export_service().build_sql(
+        "LISTING",
+        {"metrics": [], "dimensions": ["uo2"], "filters": [{"dimension": "anio", "value": 2025}]},
+    )
+    assert f"LIMIT {settings.EXPORT_MAX_ROWS + 1}" in sql
+
+
+def test_iter_csv_streams_masked_chunks(mocker):
+    fake = _FakeBQ(PAGES)
+    mocker.patch("app.services.export_service.get_bq_service", return_value=fake)
+
+    pages, truncated = get_export_service().run("SELECT 1")
+    chunks = list(get_export_service().iter_csv(pages))
+
+    assert truncated is False
+
+    assert len(chunks) == 2  # Un chunk por página de BigQuery
+    text = b"".join(chunks).decode("utf-8-sig")
+    lines = text.strip().splitlines()
+    assert lines[0] == "dni,nombre,fecha_cese"
+    assert len(lines) == 3
+    assert "12345678" not in text  # Masking aplicado por chunk
+    assert "José" in text
+
+
+def test_iter_xlsx_writes_all_pages(mocker):
+    mocker.patch("app.services.export_service.get_bq_service", return_value=_FakeBQ(PAGES))
+
+    pages, _ = get_export_service().run("SELECT 1")
+    data = b"".join(get_export_service().iter_xlsx(pages))
+
+    ws = load_workbook(io.BytesIO(data)).active
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0] == ("dni", "nombre", "fecha_cese")
+    assert [r[1] for r in rows[1:]] == ["Ana", "José"]
+
+
+def test_result_over_the_cap_is_cut_and_flagged(mocker):
+    mocker.patch.object(settings, "EXPORT_MAX_ROWS", 1)
+    mocker.patch("app.services.export_service.get_bq_service", return_value=_FakeBQ(PAGES))
+
+    pages, truncated = get_export_service().run("SELECT 1")
+    lines = b"".join(get_export_service().iter_csv(pages)).decode("utf-8-sig").strip().splitlines()
+
+    assert truncated is True
+    assert len(lines) == 2  # header + EXPORT_MAX_ROWS filas, sin la fila extra
+
+
+def test_export_endpoint_marks_truncated_files(mocker):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    import app.api.routes as routes
+    from app.core.auth.security import get_current_user
+    from app.schemas.chat import TokenData
+
+    app = FastAPI()
+    app.include_router(routes.api_router)
+    app.dependency_overrides[get_current_user] = lambda: TokenData(username="tester", profile="ANALISTA")
+    mocker.patch.object(settings, "EXPORT_MAX_ROWS", 1)
+    mocker.patch("app.services.export_service.get_bq_service", return_value=_FakeBQ(PAGES))
+
+    response = TestClient(app).post("/export", json={
+        "cube_query": {"metrics": [], "dimensions": ["uo2"], "filters": [{"dimension": "anio", "value": 2025}]},
+    })
+
+    assert response.status_code == 200
+    assert response.headers["X-Export-Truncated"] == "true"
+    assert response.headers["X-Export-Max-Rows"] == "1"
@@ -0,0 +1,28 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from app.ai.agents.hr_agent import HR_PROMPT_SEMANTIC, get_hr_agent, triage_state
+
+
+def test_agent_is_built_once_per_profile():
+    assert get_hr_agent("EJECUTIVO") is get_hr_agent("EJECUTIVO")
+    assert get_hr_agent("EJECUTIVO").canonical_model is get_hr_agent("EJECUTIVO").canonical_model
+    assert get_hr_agent("ANALISTA") is not get_hr_agent("EJECUTIVO")
+
+
+def test_triage_state_is_injected_per_request():
+    agent = get_hr_agent("EJECUTIVO")
+
+    async def _instruction(state):
+        with triage_state(state):
+            await asyncio.sleep(0)  # intercalar requests concurrentes
+            return agent.instruction(MagicMock())
+
+    async def _both():
+        return await asyncio.gather(_instruction({"period": "2024"}), _instruction({"format": "TABLE"}))
+
+    first, second = asyncio.run(_both())
+    assert "- PERIOD: 2024" in first and "- FORMAT:" not in first
+    assert "- FORMAT: TABLE" in second and "- PERIOD:" not in second
+    # Fuera de una request: solo el prompt base
+    assert agent.instruction(MagicMock()) == HR_PROMPT_SEMANTIC
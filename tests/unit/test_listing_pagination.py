@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from app.core.auth.security import create_listing_cursor, decode_listing_cursor
+from app.ai.tools.universal_analyst import fetch_listing_page
+
+
+class _FakeBQ:
+    def __init__(self):
+        self.calls = []
+
+    def read_table_page(self, table_id, start_index, page_size):
+        self.calls.append((table_id, start_index, page_size))
+        return pd.DataFrame([{"nombre": f"P{i}"} for i in range(start_index, min(start_index + page_size, 120))])
+
+
+def test_fetch_listing_page_reads_destination_table(mocker):
+    fake = _FakeBQ()
+    mocker.patch("app.ai.tools.universal_analyst.get_bq_service", return_value=fake)
+
+    pkg = fetch_listing_page(create_listing_cursor("proj.ds._anon", 50, 50, 120, "ana"), "ana")
+
+    assert fake.calls == [("proj.ds._anon", 50, 50)]
+    table = pkg["content"][0]
+    assert table["payload"]["rows"][0] == {"nombre": "P50"}
+    assert table["pagination"]["offset"] == 50
+    assert decode_listing_cursor(table["pagination"]["next_cursor"], "ana")["off"] == 100
+
+
+def test_fetch_listing_last_page_has_no_next_cursor(mocker):
+    mocker.patch("app.ai.tools.universal_analyst.get_bq_service", return_value=_FakeBQ())
+
+    pkg = fetch_listing_page(create_listing_cursor("proj.ds._anon", 100, 50, 120, "ana"), "ana")
+
+    table = pkg["content"][0]
+    assert len(table["payload"]["rows"]) == 20
+    assert table["pagination"]["next_cursor"] is None
+    assert "101–120 de 120" in pkg["summary"]
+
+
+def test_cursor_of_another_user_is_rejected(mocker):
+    fake = _FakeBQ()
+    mocker.patch("app.ai.tools.universal_analyst.get_bq_service", return_value=fake)
+
+    with pytest.raises(ValueError):
+        fetch_listing_page(create_listing_cursor("proj.ds._anon", 50, 50, 120, "ana"), "luis")
+    assert fake.calls == []
+
+
+def test_listing_sql_limit_comes_from_the_builder(mocker):
+    import contextvars
+    from app.ai.tools import universal_analyst
+    from app.core.auth.security import bind_listing_owner
+
+    mocker.patch.object(universal_analyst.settings, "QUERY_COST_CONTROL_ENABLED", False)
+    bq = mocker.patch.object(universal_analyst, "get_bq_service").return_value
+    bq.execute_query.return_value = pd.DataFrame({"total": [500]})
+    bq.execute_query_first_page.return_value = (pd.DataFrame([{"nombre": "P0"}] * 50), "proj.ds._anon")
+
+    def run():
+        bind_listing_owner("ana")
+        return universal_analyst.execute_semantic_query(
+            "LISTING", {"metrics": [], "dimensions": ["nombre"], "filters": [{"dimension": "anio", "value": 2025}]},
+            {"requested_viz": "TABLE"}, limit=50,
+        )
+
+    pkg = contextvars.copy_context().run(run)
+
+    sql = bq.execute_query_first_page.call_args[0][0]
+    assert sql.rstrip().endswith("LIMIT 500") and "LIMIT 50\n" not in sql
+    cursor = pkg["content"][0]["pagination"]["next_cursor"]
+    assert decode_listing_cursor(cursor, "ana")["off"] == 50
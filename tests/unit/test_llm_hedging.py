@@ -0,0 +1,83 @@
+import time
+import itertools
+
+import pytest
+
+import app.services.llm_hedging as llm_hedging
+from app.services.llm_hedging import get_llm_hedger
+
+
+@pytest.fixture
+def hedger(mocker):
+    mocker.patch.object(llm_hedging, "log_perf")
+    mocker.patch.object(llm_hedging.settings, "LLM_HEDGE_ENABLED", True)
+    mocker.patch.object(llm_hedging.settings, "LLM_HEDGE_INITIAL_DELAY_SECONDS", 0.05)
+    hedger = get_llm_hedger()
+    hedger.clear()
+    yield hedger
+    hedger.clear()
+
+
+def _first_call_slow(delay=1.0):
+    """El primer intento se cuelga; los siguientes responden al instante."""
+    counter = itertools.count()
+
+    def call():
+        attempt = next(counter)
+        if attempt == 0:
+            time.sleep(delay)
+        return f"attempt-{attempt}"
+    return call
+
+
+def test_slow_call_is_hedged_and_first_answer_wins(hedger):
+    t0 = time.perf_counter()
+    assert hedger.call("triage", _first_call_slow()) == "attempt-1"
+    assert time.perf_counter() - t0 < 0.5
+
+    stats = hedger.stats()["triage"]
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1 and stats["hedge_win_rate"] == 1.0
+    llm_hedging.log_perf.assert_called_once()
+    assert llm_hedging.log_perf.call_args.args[2]["winner"] == "hedge"
+
+
+def test_fast_call_is_not_hedged(hedger):
+    assert hedger.call("triage", lambda: "ok") == "ok"
+    assert hedger.stats()["triage"] == {
+        "calls": 1, "hedged": 0, "hedge_wins": 0, "skipped": {}, "errors": 0,
+        "hedge_win_rate": 0.0, "hedge_delay_s": 0.05,
+    }
+
+
+def test_quota_error_suspends_hedging(hedger):
+    def exhausted():
+        raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+    with pytest.raises(RuntimeError):
+        hedger.call("report_insight", exhausted)
+
+    # En cooldown de cuota: la llamada lenta se espera sin duplicar
+    assert hedger.call("report_insight", _first_call_slow(0.2)) == "attempt-0"
+    stats = hedger.stats()["report_insight"]
+    assert stats["hedged"] == 0 and stats["errors"] == 1
+    assert stats["skipped"] == {"quota_cooldown": 1}
+
+
+def test_primaries_never_queue_behind_the_hedge_capacity(hedger, mocker):
+    from concurrent.futures import ThreadPoolExecutor
+
+    mocker.patch.object(llm_hedging.settings, "LLM_MAX_CONCURRENT_CALLS", 1)
+
+    def slow():
+        time.sleep(0.3)
+        return "ok"
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as callers:
+        results = list(callers.map(lambda _: hedger.call("triage", slow), range(4)))
+
+    # Las 4 primarias corren a la vez aunque el cupo sea 1; sin cupo libre no hay hedges
+    assert results == ["ok"] * 4
+    assert time.perf_counter() - t0 < 0.6
+    stats = hedger.stats()["triage"]
+    assert stats["hedged"] == 0 and stats["skipped"] == {"no_capacity": 4}
@@ -0,0 +1,64 @@
+from app.services.cte_builders import build_headcount_base_cte
+from app.services.partition_pruning import rewrite_temporal_filters, pruning_predicate
+from app.services.query_builders.utils import build_where_clauses
+from app.services.query_generator import build_analytical_query
+
+CUBE = "`p.d.t`"
+
+
+def test_year_quarter_month_become_literal_ranges():
+    clauses, remaining = rewrite_temporal_filters({"anio": 2025, "trimestre": 2, "uo2": "X"}, CUBE)
+    assert clauses == ["periodo BETWEEN DATE('2025-04-01') AND DATE('2025-06-30')"]
+    assert remaining == {"uo2": "X"}
+
+    clauses, _ = rewrite_temporal_filters({"anio": [2023, 2025], "mes": [1, 2, 12]}, CUBE)
+    assert clauses == ["(periodo BETWEEN DATE('2023-01-01') AND DATE('2023-02-28') OR "
+                       "periodo BETWEEN DATE('2023-12-01') AND DATE('2023-12-31') OR "
+                       "periodo BETWEEN DATE('2025-01-01') AND DATE('2025-02-28') OR "
+                       "periodo BETWEEN DATE('2025-12-01') AND DATE('2025-12-31'))"]
+
+    clauses, remaining = rewrite_temporal_filters({"periodo": "202503"}, CUBE)
+    assert clauses == ["periodo BETWEEN DATE('2025-03-01') AND DATE('2025-03-31')"]
+    assert remaining == {}
+
+
+def test_unbounded_filters_are_left_untouched():
+    # Sin año no hay rango finito: el mes se filtra de forma normal
+    assert rewrite_temporal_filters({"mes": 3}, CUBE) == ([], {"mes": 3})
+    assert pruning_predicate({"uo2": "X"}) is None
+
+
+def test_max_period_is_resolved_to_literal(mocker):
+    from datetime import date
+    resolver = mocker.patch("app.services.partition_pruning.resolve_latest_periodo", return_value=date(2025, 9, 1))
+
+    clauses = build_where_clauses({"periodo": "MAX", "anio": 2025, "uo2": "X"}, CUBE)
+
+    resolver.assert_called_once_with(2025)
+    assert "periodo = DATE('2025-09-01')" in clauses
+    assert not any("SELECT MAX" in c or c.startswith("anio") for c in clauses)
+
+
+def test_max_period_falls_back_to_subquery(mocker):
+    mocker.patch("app.services.partition_pruning.resolve_latest_periodo", return_value=None)
+    clauses = build_where_clauses({"periodo": "MAX"}, CUBE)
+    assert f"periodo = (SELECT MAX(periodo) FROM {CUBE})" in clauses
+
+
+def test_cte_skips_unrequested_years():
+    cte = build_headcount_base_cte(["mes"], {"anio": [2023, 2025]})
+    assert ("(periodo BETWEEN DATE('2022-12-01') AND DATE('2023-12-31') OR "
+            "periodo BETWEEN DATE('2024-12-01') AND DATE('2025-12-31'))") in cte
+
+
+def test_comparison_groups_get_top_level_range():
+    sql = build_analytical_query(
+        metrics=["ceses_totales"],
+        dimensions=["mes"],
+        comparison_groups=[
+            {"label": "2024 Q1", "filters": {"anio": 2024, "trimestre": 1}},
+            {"label": "2025 Q1", "filters": {"anio": 2025, "trimestre": 1}},
+        ],
+    )
+    assert ") AND (periodo BETWEEN DATE('2024-01-01') AND DATE('2024-03-31') OR " \
+           "periodo BETWEEN DATE('2025-01-01') AND DATE('2025-03-31'))" in sql
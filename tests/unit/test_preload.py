@@ -0,0 +1,19 @@
+import gc
+from unittest.mock import MagicMock
+
+from app.core.preload import reset_after_fork
+from app.services.bigquery import get_bq_service
+from app.services.firestore import get_firestore_service
+
+
+def test_post_fork_drops_clients_inherited_from_master(mocker):
+    bq, fs = get_bq_service(), get_firestore_service()
+    mocker.patch.object(bq, "_client", MagicMock())
+    mocker.patch.object(fs, "_client", MagicMock())
+    gc.disable()  # estado del master tras preload_shared_state
+
+    reset_after_fork()
+
+    # Cada worker abre sus propias conexiones de forma lazy y vuelve a recolectar basura
+    assert bq._client is None and fs._client is None
+    assert gc.isenabled()
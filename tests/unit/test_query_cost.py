@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.query_cost import get_query_cost_estimator, suggest_narrowing
+
+
+@pytest.fixture
+def estimator(mocker):
+    est = get_query_cost_estimator()
+    est.clear()
+    perf = mocker.patch("app.services.query_cost.log_perf")
+    yield est, perf
+    est.clear()
+
+
+def test_estimates_are_cached_and_exported(estimator):
+    est, perf = estimator
+    bq = MagicMock()
+    bq.dry_run.return_value = 1234
+
+    assert est.estimate("SELECT 1", bq=bq) == 1234
+    assert est.estimate("SELECT   1", bq=bq) == 1234  # misma SQL normalizada
+
+    bq.dry_run.assert_called_once()
+    assert [c.args[2]["cache_hit"] for c in perf.call_args_list] == [False, True]
+    assert perf.call_args_list[0].args[2]["bytes"] == 1234
+
+
+def test_dry_run_failure_does_not_block(estimator):
+    est, _ = estimator
+    bq = MagicMock()
+    bq.dry_run.side_effect = RuntimeError("network")
+
+    estimated = est.estimate("SQL_A", variant="simple", bq=bq)
+    assert estimated is None
+    assert not est.is_over_budget(estimated)
+
+
+def test_budget_and_suggestions(estimator):
+    est, _ = estimator
+    assert est.is_over_budget(est.budget_bytes + 1)
+    assert not est.is_over_budget(est.budget_bytes)
+
+    tips = suggest_narrowing({"anio": [2023, 2024, 2025]}, ["mes"], "TREND")
+    assert tips == ["Consulta un solo año a la vez (pediste 3)", "Filtra por una división específica"]
+    assert suggest_narrowing({}, ["nombre"], "LISTING")[0] == "Filtra por un año o periodo específico"
+
+
+def test_dry_run_only_when_query_goes_to_bigquery(mocker):
+    import pandas as pd
+    from app.ai.tools import universal_analyst
+
+    mocker.patch.object(universal_analyst.settings, "QUERY_COST_CONTROL_ENABLED", True)
+    mocker.patch.object(universal_analyst.settings, "TREND_CACHE_ENABLED", False)
+    mocker.patch.object(universal_analyst.settings, "COMPARISON_GROUP_CACHE_ENABLED", False)
+    bq = mocker.patch.object(universal_analyst, "get_bq_service").return_value
+    speculative = mocker.patch.object(universal_analyst, "get_speculative_executor").return_value
+    estimator = mocker.patch.object(universal_analyst, "get_query_cost_estimator").return_value
+    estimator.budget_bytes = 100
+    estimator.is_over_budget.side_effect = lambda b: b is not None and b > 100
+    cube_query = {"metrics": ["ceses_totales"], "dimensions": ["uo2"], "filters": [{"dimension": "anio", "value": 2025}]}
+
+    # Servida por la ejecución especulativa: sin dry run
+    speculative.consume.return_value = pd.DataFrame({"uo2": ["A"], "ceses_totales": [3]})
+    universal_analyst.execute_semantic_query("SNAPSHOT", cube_query)
+    estimator.estimate.assert_not_called()
+
+    # Va a BigQuery y supera el presupuesto: se rechaza antes de ejecutar
+    speculative.consume.return_value = None
+    estimator.estimate.return_value = 10_000
+    result = universal_analyst.execute_semantic_query("SNAPSHOT", cube_query)
+    estimator.estimate.assert_called_once()
+    bq.execute_query.assert_not_called()
+    assert result["telemetry"]["bq_rejected"] is True
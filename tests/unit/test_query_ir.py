@@ -0,0 +1,97 @@
+from app.services.query_builders.emitter import emit, emit_union
+from app.services.query_builders.ir import Query, Select, Column
+from app.services.query_builders.optimizer import optimize, merge_union
+from app.services.query_generator import build_analytical_query, plan_analytical_query
+from app.services.trend_partition_cache import TrendPartitionCache
+
+
+def test_monthly_rate_prunes_ytd_windows_and_unused_measures():
+    sql = build_analytical_query(["tasa_rotacion_mensual"], ["mes"], {"anio": 2025})
+
+    assert "LAG(hc_final)" in sql
+    assert "OVER (PARTITION BY anio" not in sql  # acumulados YTD podados
+    assert "ceses_voluntarios" not in sql and "ceses_involuntarios" not in sql
+    assert "FinalMetrics" not in sql  # etapa sin cálculo propio colapsada
+
+
+def test_month_filter_is_pushed_down_to_the_scan():
+    # Tasa mensual: el mes pedido + el anterior (LAG)
+    sql = build_analytical_query(["tasa_rotacion_mensual"], ["mes"], {"anio": 2025, "mes": 6})
+    assert "periodo BETWEEN DATE('2025-05-01') AND DATE('2025-06-30')" in sql
+    assert "WHERE periodo BETWEEN DATE('2025-06-01') AND DATE('2025-06-30')" in sql
+
+    # Tasa anual (YTD): enero..mes, sin el Diciembre previo
+    sql = build_analytical_query(["tasa_rotacion_anual"], ["mes"], {"anio": 2025, "mes": 6})
+    assert "periodo BETWEEN DATE('2025-01-01') AND DATE('2025-06-30')" in sql
+    assert "2024-12-01" not in sql
+
+
+def _scan(sql):
+    """Definición del CTE que lee la tabla (MonthlySnapshots)."""
+    return sql.split("MonthlySnapshots AS (", 1)[1].split("\n),", 1)[0]
+
+
+def test_quarter_filter_stays_out_of_the_windowed_scan():
+    # LAG de Abril necesita Marzo; el YTD de Q2 necesita Q1
+    sql = build_analytical_query(["tasa_rotacion_mensual"], ["mes"], {"anio": 2025, "trimestre": 2})
+    assert "EXTRACT(QUARTER" not in _scan(sql)
+    assert "periodo BETWEEN DATE('2025-03-01') AND DATE('2025-06-30')" in _scan(sql)
+    assert "WHERE periodo BETWEEN DATE('2025-04-01') AND DATE('2025-06-30')" in sql
+
+    sql = build_analytical_query(["tasa_rotacion_anual"], ["mes"], {"anio": 2025, "q": 2})
+    assert "EXTRACT(QUARTER" not in _scan(sql)
+    assert "periodo BETWEEN DATE('2025-01-01') AND DATE('2025-06-30')" in _scan(sql)
+
+    # Sin año no hay rango: el trimestre se filtra sobre headcount_base, no en el scan
+    sql = build_analytical_query(["tasa_rotacion_mensual"], ["mes"], {"trimestre": 2})
+    assert "EXTRACT(QUARTER" not in _scan(sql)
+    assert "WHERE EXTRACT(QUARTER FROM periodo) = 2" in sql
+
+    # Comparación por trimestre: las ventanas no se particionan por trimestre
+    sql = build_analytical_query(["tasa_rotacion_mensual"], ["mes"], comparison_groups=[
+        {"label": "Q1 24", "filters": {"anio": 2024, "trimestre": 1}},
+        {"label": "Q1 25", "filters": {"anio": 2025, "trimestre": 1}},
+    ])
+    assert "EXTRACT(QUARTER FROM periodo) IN" not in _scan(sql)
+    assert "PARTITION BY trimestre" not in sql
+    assert "periodo BETWEEN DATE('2024-12-01') AND DATE('2025-03-31')" in _scan(sql)
+
+
+def test_series_without_month_filter_keeps_previous_december():
+    sql = build_analytical_query(["tasa_rotacion_mensual"], ["mes"], {"anio": 2025})
+    assert "periodo BETWEEN DATE('2024-12-01') AND DATE('2025-12-31')" in sql
+
+
+def test_comparison_cte_scans_only_group_months():
+    sql = build_analytical_query(["tasa_rotacion_mensual"], [], comparison_groups=[
+        {"label": "Mar 24", "filters": {"anio": 2024, "mes": 3}},
+        {"label": "Mar 25", "filters": {"anio": 2025, "mes": 3}},
+    ])
+    assert ("(periodo BETWEEN DATE('2024-02-01') AND DATE('2024-03-31') OR "
+            "periodo BETWEEN DATE('2025-02-01') AND DATE('2025-03-31'))") in sql
+
+
+def test_unknown_expressions_are_kept():
+    query = Query(
+        ctes={"t": Select(columns=[Column("a", "x"), Column("b", "y")], source="src")},
+        body=Select(columns=[Column("c", "a + b")], source="t"),  # uses desconocido
+    )
+    assert optimize(query).ctes["t"].column_names() == ["a", "b"]
+
+
+def test_identical_ctes_are_emitted_once():
+    query = optimize(plan_analytical_query(["tasa_rotacion_mensual"], ["mes"], {"anio": 2025}))
+    ctes, bodies = merge_union([query, query])
+
+    assert list(ctes) == list(query.ctes)
+    sql = emit_union(ctes, bodies)
+    assert sql.count("MonthlySnapshots AS (") == 1
+    assert sql.count("\nUNION ALL\n") == 1
+    assert emit(query).startswith("WITH MonthlySnapshots AS (")
+
+
+def test_trend_cache_skips_quarter_filters():
+    query = {"metrics": ["tasa_rotacion_mensual"], "dimensions": ["mes"], "filters": {"anio": 2025}}
+    assert TrendPartitionCache.plan(query) is not None
+    assert TrendPartitionCache.plan({**query, "filters": {"anio": 2025, "trimestre": 2}}) is None
+    assert TrendPartitionCache.plan({**query, "dimensions": ["mes", "trimestre"]}) is None
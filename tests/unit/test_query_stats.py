@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from app.services.query_stats import collect_query_stats, get_query_stats_aggregator, job_statistics, record_job
+
+T0 = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _job(slot_millis=1200, cache_hit=False, bytes_processed=10 * 2**20):
+    return SimpleNamespace(
+        job_id="job_1", total_bytes_processed=bytes_processed, total_bytes_billed=bytes_processed,
+        slot_millis=slot_millis, cache_hit=cache_hit,
+        created=T0, started=T0 + timedelta(milliseconds=250), ended=T0 + timedelta(milliseconds=900),
+    )
+
+
+@pytest.fixture
+def aggregator():
+    aggregator = get_query_stats_aggregator()
+    aggregator.clear()
+    yield aggregator
+    aggregator.clear()
+
+
+def test_job_statistics_reads_queue_and_execution_time():
+    stats = job_statistics(_job(), rows=12)
+    assert stats == {
+        "job_id": "job_1", "bytes_processed": 10 * 2**20, "bytes_billed": 10 * 2**20, "slot_ms": 1200,
+        "cache_hit": False, "queue_ms": 250, "exec_ms": 650, "rows": 12,
+    }
+    # Jobs sin estadísticas (mocks, jobs cancelados): campos en None
+    assert job_statistics(SimpleNamespace())["slot_ms"] is None
+
+
+def test_record_job_is_noop_outside_collector():
+    record_job(_job())
+    with collect_query_stats() as jobs:
+        record_job(_job(), rows=3)
+        with collect_query_stats() as inner:
+            record_job(_job(), rows=1)
+    assert [j["rows"] for j in jobs] == [3]
+    assert [j["rows"] for j in inner] == [1]
+
+
+def test_execute_semantic_query_attaches_stats_and_aggregates(mocker, aggregator):
+    from app.ai.tools import universal_analyst
+
+    def fake_execute(intent, cube_query, metadata, limit, comparison_groups):
+        record_job(_job(slot_millis=800), rows=5)
+        record_job(_job(slot_millis=400, cache_hit=True), rows=1)
+        return {"response_type": "visual_package", "content": [], "telemetry": {"bq_builder_variant": "ytd_ratio"}}
+
+    mocker.patch.object(universal_analyst, "_execute_semantic_query", side_effect=fake_execute)
+    mocker.patch.object(universal_analyst, "log_perf")
+
+    result = universal_analyst.execute_semantic_query("SNAPSHOT", {"metrics": ["tasa_rotacion", "ceses_totales"]})
+    stats = result["telemetry"]["bq_stats"]
+    assert (stats["jobs"], stats["slot_ms"], stats["rows"], stats["cache_hit"]) == (2, 1200, 6, False)
+    assert len(stats["by_job"]) == 2
+    assert result["telemetry"]["bq_builder_variant"] == "ytd_ratio"
+
+    snapshot = aggregator.snapshot()
+    assert snapshot["by_builder"]["ytd_ratio"]["queries"] == 1
+    assert snapshot["by_builder"]["ytd_ratio"]["slot_ms"] == 1200
+    assert set(snapshot["by_metric"]) == {"tasa_rotacion", "ceses_totales"}
+
+
+def test_snapshot_ranks_builders_by_slot_ms(aggregator):
+    aggregator.record("simple", ["ceses_totales"], [job_statistics(_job(slot_millis=100), rows=1)])
+    aggregator.record("comparison_cte", ["tasa_rotacion"], [job_statistics(_job(slot_millis=9000), rows=1)])
+    aggregator.record("comparison_cte", ["tasa_rotacion"], [job_statistics(_job(slot_millis=1000, cache_hit=True), rows=1)])
+
+    by_builder = aggregator.snapshot()["by_builder"]
+    assert list(by_builder) == ["comparison_cte", "simple"]
+    assert by_builder["comparison_cte"]["avg_slot_ms"] == 5000
+    assert by_builder["comparison_cte"]["cache_hit_rate"] == 0.5
+
+
+def test_bq_service_records_executed_jobs(mocker):
+    from app.services.bigquery import BigQueryService
+
+    service = BigQueryService()
+    job = _job()
+    job.to_dataframe = lambda: pd.DataFrame({"x": [1, 2, 3]})
+    mocker.patch.object(BigQueryService, "client", new_callable=mocker.PropertyMock).return_value.query.return_value = job
+
+    with collect_query_stats() as jobs:
+        service.execute_query("SELECT 1")
+    assert jobs[0]["rows"] == 3 and jobs[0]["slot_ms"] == 1200
@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from google.api_core.exceptions import AlreadyExists
+
+import app.ai.tools.executive_report_orchestrator as orchestrator
+from app.services.report_cache_warmer import ReportCacheWarmer
+
+
+def test_build_targets_month_quarter_ytd_per_scope():
+    targets = ReportCacheWarmer.build_targets("202511", ["DIVISION FINANZAS"])
+
+    assert targets == [
+        ("202511", None), ("2025Q4", None), ("2025", None),
+        ("202511", "DIVISION FINANZAS"), ("2025Q4", "DIVISION FINANZAS"), ("2025", "DIVISION FINANZAS"),
+    ]
+    # Enero: el YTD coincide con el mes
+    assert ReportCacheWarmer.build_targets("202601", []) == [("202601", None), ("2026Q1", None)]
+
+
+@pytest.mark.parametrize("latest", ["202511", "202601", "202603"])
+def test_build_targets_are_supported_by_the_report_tool(latest):
+    # Sin mock de generate_executive_report: cada periodo debe poder armar sus bloques
+    for period, scope in ReportCacheWarmer.build_targets(latest, ["DIVISION FINANZAS"]):
+        parsed = orchestrator.parse_period(period)
+        blocks = orchestrator._build_report_blocks(parsed, orchestrator.get_previous_period(period), scope)
+        assert blocks["headline_current"]["cube_query"]["filters"]
+
+
+def test_warm_respects_lease_and_concurrency(mocker):
+    warmer = ReportCacheWarmer(concurrency=2)
+    mocker.patch.object(warmer, "_acquire", side_effect=[True, False])
+    release = mocker.patch.object(warmer, "_release")
+    mocker.patch.object(warmer, "_renew")
+    mocker.patch.object(warmer, "list_divisions", return_value=["DIVISION FINANZAS", "DIVISION TALENTO"])
+
+    in_flight = {"now": 0, "max": 0}
+
+    async def fake_report(periodo_anomes, uo2_filter=None, sections=None):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return {"response_type": "visual_package", "metadata": {"failed_blocks": []}}
+
+    mocker.patch.object(orchestrator, "generate_executive_report", side_effect=fake_report)
+
+    summary = asyncio.run(warmer.warm(period="202511"))
+    assert summary["targets"] == 9 and summary["succeeded"] == 9
+    assert in_flight["max"] <= 2
+    release.assert_called_once()
+
+    # Segunda corrida: el lease ya existe -> skip
+    assert asyncio.run(warmer.warm(period="202511"))["reason"] == "already_warmed"
+
+
+def test_failed_targets_are_not_marked_completed(mocker):
+    warmer = ReportCacheWarmer(concurrency=2)
+    mocker.patch.object(warmer, "_acquire", return_value=True)
+    release = mocker.patch.object(warmer, "_release")
+    mocker.patch.object(warmer, "_renew")
+
+    async def flaky_report(periodo_anomes, uo2_filter=None, sections=None):
+        if uo2_filter:
+            raise RuntimeError("BigQuery unavailable")
+        return {"response_type": "visual_package", "metadata": {}}
+
+    mocker.patch.object(orchestrator, "generate_executive_report", side_effect=flaky_report)
+    mocker.patch.object(warmer, "list_divisions", return_value=["DIVISION FINANZAS"])
+    assert asyncio.run(warmer.warm(period="202511"))["status"] == "partial"
+    assert release.call_args[0][1]["status"] == "partial"
+
+    mocker.patch.object(warmer, "list_divisions", side_effect=RuntimeError("BigQuery unavailable"))
+    with pytest.raises(RuntimeError):
+        asyncio.run(warmer.warm(period="202511"))
+    assert release.call_args[0][1]["status"] == "failed"
+
+
+class _FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+
+    def to_dict(self):
+        return self._data
+
+
+class _FakeDoc:
+    def __init__(self, data):
+        self.data = data
+
+    def create(self, payload):
+        raise AlreadyExists("exists")
+
+    def get(self, transaction=None):
+        return _FakeSnapshot(self.data)
+
+
+class _FakeTransaction:
+    """`firestore.transactional` se parchea: la función corre directo sobre este fake."""
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def set(self, ref, payload):
+        self.doc.data = payload
+
+
+@pytest.mark.parametrize("existing, taken", [
+    ({"status": "COMPLETED"}, False),
+    ({"status": "IN_PROGRESS", "lease_expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)}, False),
+    ({"status": "IN_PROGRESS", "lease_expires_at": datetime.now(timezone.utc) - timedelta(minutes=5)}, True),
+    ({"status": "IN_PROGRESS"}, True),
+    ({"status": "PARTIAL"}, True),
+    ({"status": "FAILED", "attempts": 2}, True),
+])
+def test_acquire_takes_over_stale_or_unfinished_leases(mocker, existing, taken):
+    doc = _FakeDoc(dict(existing))
+    warmer = ReportCacheWarmer()
+    warmer._db = mocker.Mock()
+    warmer._db.collection.return_value.document.return_value = doc
+    warmer._db.transaction.return_value = _FakeTransaction(doc)
+    mocker.patch("app.services.report_cache_warmer.firestore.transactional", side_effect=lambda fn: fn)
+
+    assert warmer._acquire("202511", force=False) is taken
+    if taken:
+        assert doc.data["status"] == "IN_PROGRESS" and doc.data["lease_expires_at"] > datetime.now(timezone.utc)
+        assert doc.data["attempts"] == existing.get("attempts", 1) + 1
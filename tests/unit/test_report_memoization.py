@@ -0,0 +1,74 @@
+import asyncio
+from unittest.mock import MagicMock
+
+from app.services.report_snapshot_service import ReportSnapshotService
+import app.ai.tools.executive_report_orchestrator as orchestrator
+
+
+def test_report_key_is_deterministic_and_data_versioned():
+    key = ReportSnapshotService.build_report_key("202511", "Global", ["trend", "talent"], "2025-12-01T00:00:00")
+    same = ReportSnapshotService.build_report_key("202511", "Global", ["talent", "trend"], "2025-12-01T00:00:00")
+    newer_data = ReportSnapshotService.build_report_key("202511", "Global", ["talent", "trend"], "2025-12-02T00:00:00")
+
+    assert key == same
+    assert key != newer_data
+
+
+def _patch_services(mocker, cached=None):
+    snapshot_svc = MagicMock()
+    snapshot_svc.build_report_key.side_effect = ReportSnapshotService.build_report_key
+    snapshot_svc.find_completed_snapshot.return_value = cached
+    snapshot_svc.create_snapshot.return_value = "new-report"
+    mocker.patch.object(orchestrator, "get_report_snapshot_service", return_value=snapshot_svc)
+
+    freshness = MagicMock()
+    freshness.data_version.return_value = "2025-12-01T00:00:00"
+    mocker.patch.object(orchestrator, "get_data_freshness_service", return_value=freshness)
+
+    execute = mocker.patch.object(orchestrator, "execute_semantic_query", return_value={
+        "response_type": "visual_package", "content": [{"type": "text", "payload": "ok"}]
+    })
+    insights = MagicMock()
+    insights.generate_report_narratives.return_value = {"critical_insight": "Fresh"}
+    mocker.patch.object(orchestrator, "ReportInsightGenerator", return_value=insights)
+    return snapshot_svc, execute
+
+
+def test_completed_snapshot_is_reused_without_recomputing(mocker):
+    cached = {
+        "report_id": "old-report",
+        "status": "COMPLETED",
+        "blocks": {"trend": {"content": [{"type": "text", "payload": "cached-trend"}]}},
+        "narratives": {"critical_insight": "Cached insight"},
+    }
+    snapshot_svc, execute = _patch_services(mocker, cached=cached)
+
+    result = asyncio.run(orchestrator.generate_executive_report("202511", sections=["trend"]))
+
+    execute.assert_not_called()
+    snapshot_svc.create_snapshot.assert_not_called()
+    assert result["metadata"]["report_id"] == "old-report"
+    payloads = [b["payload"] for b in result["content"]]
+    assert "Cached insight" in payloads and "cached-trend" in payloads
+
+
+def test_fresh_report_is_registered_for_reuse(mocker):
+    snapshot_svc, execute = _patch_services(mocker, cached=None)
+
+    result = asyncio.run(orchestrator.generate_executive_report("202511", sections=["trend"]))
+
+    assert execute.call_count == 1
+    assert result["metadata"]["report_id"] == "new-report"
+    key = snapshot_svc.create_snapshot.call_args.kwargs["report_key"]
+    snapshot_svc.register_snapshot.assert_called_once_with(key, "new-report")
+
+
+def test_blocks_are_persisted_as_they_complete(mocker):
+    snapshot_svc, _ = _patch_services(mocker, cached=None)
+
+    asyncio.run(orchestrator.generate_executive_report("202511", sections=["trend", "talent"]))
+
+    saved = {c.args[1] for c in snapshot_svc.save_block.call_args_list}
+    assert saved == {"trend", "talent"}
+    snapshot_svc.update_status.assert_called_once_with("new-report", "DATA_GATHERED")
+    snapshot_svc.update_snapshot.assert_not_called()
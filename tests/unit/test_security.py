@@ -60,3 +60,23 @@ def test_clean_sensitive_data_regex():
     input_text_2 = "CE 00123456789 activo."
     expected_2 = "CE XX.XXX.XXX activo."
     assert clean_sensitive_data(input_text_2) == expected_2
+
+def test_listing_cursor_roundtrip_and_tamper():
+    """El cursor de paginación es firmado: no puede redirigirse a otra tabla."""
+    from app.core.auth.security import create_listing_cursor, decode_listing_cursor
+
+    cursor = create_listing_cursor("proj.ds._anon_table", 50, 50, 120, "ana")
+    state = decode_listing_cursor(cursor, "ana")
+    assert (state["tbl"], state["off"], state["ps"], state["tot"]) == ("proj.ds._anon_table", 50, 50, 120)
+
+    # Solo el usuario que ejecutó la consulta puede paginar
+    with pytest.raises(ValueError):
+        decode_listing_cursor(cursor, "luis")
+
+    forged = jwt.encode({"typ": "listing_cursor", "usr": "ana", "tbl": "proj.hr.salaries"}, "otra-clave", algorithm="HS256")
+    with pytest.raises(ValueError):
+        decode_listing_cursor(forged, "ana")
+
+    # Un access token no es un cursor válido
+    with pytest.raises(ValueError):
+        decode_listing_cursor(create_access_token({"sub": "admin"}), "admin")
@@ -0,0 +1,89 @@
+import asyncio
+
+import pandas as pd
+
+from app.schemas.analytics import SemanticRequest
+from app.services.semantic_batch import get_semantic_batch_service
+
+
+def _request(op_id, metrics, dimensions, year=2025, viz="SMART_AUTO"):
+    return SemanticRequest(
+        operation_id=op_id,
+        intent="SNAPSHOT",
+        cube_query={"metrics": metrics, "dimensions": dimensions,
+                    "filters": [{"dimension": "anio", "value": year}]},
+        metadata={"requested_viz": viz},
+    )
+
+
+def test_batch_dedupes_orders_and_isolates_errors(mocker):
+    mocker.patch("app.services.semantic_batch.log_perf")
+    execute = mocker.patch(
+        "app.ai.tools.universal_analyst.execute_planned_semantic_query",
+        side_effect=lambda planned: {
+            "response_type": "visual_package", "summary": planned["req"].cube_query.metrics[0], "content": []
+        },
+    )
+    items = [
+        _request("a", ["ceses_totales"], ["uo2"]),
+        _request("b", ["metrica_inexistente"], ["uo2"]),
+        _request("c", ["personal_activo_total"], ["uo2"]),
+        _request("d", ["ceses_totales"], ["uo2"]),  # duplicado de "a"
+    ]
+
+    results = asyncio.run(get_semantic_batch_service().execute(items))
+
+    assert [r["operation_id"] for r in results] == ["a", "b", "c", "d"]
+    assert [r["status"] for r in results] == ["ok", "error", "ok", "ok"]
+    assert "metrica_inexistente" in results[1]["error"]
+    assert results[0]["package"]["summary"] == results[3]["package"]["summary"] == "ceses_totales"
+    assert results[0]["package"] is not results[3]["package"]
+    assert execute.call_count == 2
+
+
+def test_different_visualization_is_not_deduped(mocker):
+    mocker.patch("app.services.semantic_batch.log_perf")
+    execute = mocker.patch("app.ai.tools.universal_analyst.execute_planned_semantic_query",
+                           return_value={"response_type": "visual_package", "content": []})
+
+    items = [_request("a", ["ceses_totales"], ["uo2"], viz="BAR_CHART"),
+             _request("b", ["ceses_totales"], ["uo2"], viz="PIE_CHART")]
+    asyncio.run(get_semantic_batch_service().execute(items))
+
+    assert execute.call_count == 2
+
+
+def test_execution_failure_is_reported_as_error(mocker):
+    log_perf = mocker.patch("app.services.semantic_batch.log_perf")
+    # La ejecución no lanza: retorna el paquete de error
+    mocker.patch("app.ai.tools.universal_analyst.execute_planned_semantic_query", side_effect=[
+        {"response_type": "visual_package", "summary": "⚠️ Error procesando consulta: 503 BigQuery", "content": []},
+        {"response_type": "visual_package", "summary": "ok", "content": []},
+    ])
+
+    items = [_request("a", ["ceses_totales"], ["uo2"]), _request("b", ["ceses_totales"], ["uo2"], year=2024)]
+    results = asyncio.run(get_semantic_batch_service().execute(items))
+
+    statuses = {r["operation_id"]: r["status"] for r in results}
+    assert sorted(statuses.values()) == ["error", "ok"]
+    failed = next(r for r in results if r["status"] == "error")
+    assert "503 BigQuery" in failed["error"] and "package" not in failed
+    assert log_perf.call_args[0][2]["errors"] == 1
+
+
+def test_planned_sql_is_executed_without_replanning(mocker):
+    from app.ai.tools import universal_analyst
+
+    mocker.patch("app.services.semantic_batch.log_perf")
+    prepare = mocker.spy(universal_analyst, "_prepare_semantic_query")
+    build = mocker.spy(universal_analyst, "build_analytical_query")
+    bq = mocker.patch.object(universal_analyst, "get_bq_service").return_value
+    bq.execute_query.return_value = pd.DataFrame({"uo2": ["A"], "ceses_totales": [3]})
+    mocker.patch.object(universal_analyst.settings, "QUERY_COST_CONTROL_ENABLED", False)
+    mocker.patch.object(universal_analyst, "get_speculative_executor").return_value.consume.return_value = None
+
+    results = asyncio.run(get_semantic_batch_service().execute([_request("a", ["ceses_totales"], ["uo2"])]))
+
+    assert results[0]["status"] == "ok"
+    assert prepare.call_count == 1 and build.call_count == 1
+    assert bq.execute_query.call_args[0][0] == build.spy_return
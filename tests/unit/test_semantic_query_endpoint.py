@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.routes as routes
+from app.core.auth.security import get_current_user
+from app.schemas.chat import TokenData
+
+BODY = {
+    "intent": "SNAPSHOT",
+    "cube_query": {"metrics": ["ceses_totales"], "dimensions": ["uo2"],
+                   "filters": [{"dimension": "anio", "value": 2025}]},
+    "metadata": {"requested_viz": "TABLE"},
+}
+
+
+@pytest.fixture
+def client(mocker):
+    app = FastAPI()
+    app.include_router(routes.api_router)
+    app.dependency_overrides[get_current_user] = lambda: TokenData(username="tester", profile="ANALISTA")
+
+    freshness = MagicMock()
+    freshness.data_version.return_value = "2025-12-01T00:00:00"
+    mocker.patch.object(routes, "get_data_freshness_service", return_value=freshness)
+    execute = mocker.patch.object(routes, "execute_planned_semantic_query", return_value={
+        "response_type": "visual_package", "summary": "ok",
+        "content": [{"type": "text", "payload": "Ceses por división"}],
+    })
+    return TestClient(app), execute, freshness
+
+
+def test_query_runs_without_llm_and_revalidates_with_etag(client):
+    client, execute, freshness = client
+
+    first = client.post("/semantic/query", json=BODY)
+    assert first.status_code == 200
+    assert first.json()["summary"] == "ok"
+    etag = first.headers["ETag"]
+
+    # Misma consulta (otro operation_id) y mismos datos -> 304 sin ejecutar
+    second = client.post("/semantic/query", json={**BODY, "operation_id": "x"}, headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert execute.call_count == 1
+
+    # Nueva carga de datos -> el ETag anterior deja de valer
+    freshness.data_version.return_value = "2026-01-01T00:00:00"
+    third = client.post("/semantic/query", json=BODY, headers={"If-None-Match": etag})
+    assert third.status_code == 200
+    assert third.headers["ETag"] != etag
+
+
+def test_invalid_request_is_rejected_before_execution(client):
+    client, execute, _ = client
+
+    bad_metric = {**BODY, "cube_query": {**BODY["cube_query"], "metrics": ["metrica_inexistente"]}}
+    assert client.post("/semantic/query", json=bad_metric).status_code == 400
+    assert client.post("/semantic/query", json={**BODY, "intent": "CHAT"}).status_code == 422
+    execute.assert_not_called()
+
+
+def test_table_format_comes_from_the_body(client, mocker):
+    client, execute, _ = client
+    table = {"type": "table", "payload": {"headers": ["uo2"], "rows": [{"uo2": "A"}]}}
+    execute.return_value = {"response_type": "visual_package", "summary": "ok", "content": [table]}
+    apply = mocker.spy(routes, "apply_table_format")
+
+    rows = client.post("/semantic/query", json=BODY)
+    columnar = client.post("/semantic/query", json={**BODY, "table_format": "columnar"})
+
+    assert [c.args[1] for c in apply.call_args_list] == ["rows", "columnar"]
+    assert rows.headers["ETag"] != columnar.headers["ETag"]
@@ -0,0 +1,44 @@
+import json
+import math
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app.core.utils.serialization import dumps, to_json_safe, FastJSONResponse
+
+
+def test_nan_and_inf_are_serialized_as_null():
+    payload = {"data": [1.0, float("nan"), float("inf"), -math.inf, None]}
+    assert json.loads(dumps(payload)) == {"data": [1.0, None, None, None, None]}
+
+
+def test_numpy_and_pandas_scalars():
+    payload = {
+        "count": np.int64(3),
+        "rate": np.float64("nan"),
+        "day": pd.Timestamp("2025-01-31"),
+        "missing": pd.NA,
+    }
+    assert to_json_safe(payload) == {
+        "count": 3, "rate": None, "day": "2025-01-31T00:00:00", "missing": None
+    }
+
+
+def test_to_json_safe_matches_recursive_sanitizer():
+    """Same output as the previous recursive NaN walk for plain payloads."""
+    payload = {
+        "response_type": "visual_package",
+        "content": [{"type": "chart", "payload": {"labels": ["2024"], "datasets": [{"data": [float("nan"), 2.5, 3]}]}}],
+    }
+    assert to_json_safe(payload) == {
+        "response_type": "visual_package",
+        "content": [{"type": "chart", "payload": {"labels": ["2024"], "datasets": [{"data": [None, 2.5, 3]}]}}],
+    }
+
+
+def test_fast_json_response_renders_datetime_like_fastapi():
+    ts = datetime(2026, 1, 2, 3, 4, 5, 678)
+    response = FastJSONResponse({"timestamp": ts, "value": float("nan")})
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"timestamp": ts.isoformat(), "value": None}
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.api.routes as routes
+from app.main import app
+from app.core.auth.security import get_current_user
+from app.core.utils.sampling_profiler import get_sampling_profiler
+from app.core.utils.server_timing import record_timing
+from app.schemas.chat import TokenData
+
+BODY = {
+    "intent": "SNAPSHOT",
+    "cube_query": {"metrics": ["ceses_totales"], "dimensions": [],
+                   "filters": [{"dimension": "anio", "value": 2025}]},
+}
+
+
+def _fake_query(*args, **kwargs):
+    # Corre en el threadpool (run_in_threadpool): el colector del request debe seguir visible
+    record_timing("sq_bq_exec", 0.2)
+    record_timing("sq_bq_exec", 0.1)
+    time.sleep(0.05)
+    return {"response_type": "visual_package", "summary": "ok", "content": []}
+
+
+@pytest.fixture
+def client(mocker):
+    profile = {"value": "ANALISTA"}
+    app.dependency_overrides[get_current_user] = lambda: TokenData(username="tester", profile=profile["value"])
+    mocker.patch.object(routes, "get_data_freshness_service").return_value.data_version.return_value = None
+    mocker.patch.object(routes, "execute_planned_semantic_query", side_effect=_fake_query)
+    get_sampling_profiler().clear()
+    yield TestClient(app), profile
+    app.dependency_overrides.clear()
+    get_sampling_profiler().clear()
+
+
+def test_response_carries_server_timing_for_measured_stages(client):
+    client, _ = client
+    response = client.post("/semantic/query", json=BODY)
+
+    assert response.status_code == 200
+    metrics = {m.split(";")[0]: m for m in response.headers["Server-Timing"].split(", ")}
+    assert metrics["sq_bq_exec"] == 'sq_bq_exec;dur=300.0;desc="x2"'
+    assert float(metrics["app"].split("dur=")[1]) >= 50
+
+
+def test_profiler_is_admin_only_and_captures_next_requests(client):
+    client, profile = client
+    assert client.post("/admin/profiler", json={"requests": 1}).status_code == 403
+
+    profile["value"] = "ADMIN"
+    assert client.post("/admin/profiler", json={"requests": 1}).json()["armed_requests"] == 1
+    client.post("/semantic/query", json=BODY)
+    client.post("/semantic/query", json=BODY)  # ya no está armado
+
+    result = client.get("/admin/profiler").json()
+    assert result["armed_requests"] == 0
+    assert [p["request"] for p in result["profiles"]] == ["POST /semantic/query"]
+    captured = result["profiles"][0]
+    assert captured["samples"] > 0
+    assert any("_fake_query" in line for line in captured["folded"])
@@ -0,0 +1,79 @@
+from unittest.mock import AsyncMock
+
+import pytest
+from google.adk.events.event import Event
+
+from app.services.adk_firestore_connector import FirestoreADKSessionService
+from app.services.session_compaction import (
+    SUMMARY_STATE_KEY, KEEP_RAW_TURNS, COMPACT_AFTER_TURNS, compact_history, render_summary
+)
+
+
+def _turn(i):
+    """Un turno completo: pregunta, llamada a la tool, respuesta con KPI y texto final."""
+    return [
+        {"author": "user", "content": {"parts": [{"text": f"Ceses de la división {i}"}]}},
+        {"author": "HR_Semantic_Agent", "content": {"role": "model", "parts": [{"function_call": {
+            "name": "execute_semantic_query",
+            "args": {"intent": "SNAPSHOT", "cube_query": {"metrics": ["ceses_totales"], "dimensions": [],
+                                                          "filters": [{"dimension": "anio", "value": 2025}]},
+                     "metadata": {"title_suggestion": f"Ceses {i}"}}}}]}},
+        {"author": "HR_Semantic_Agent", "content": {"role": "user", "parts": [{"function_response": {
+            "name": "execute_semantic_query",
+            "response": {"summary": f"Ceses {i}", "content": [
+                {"type": "KPI_ROW", "payload": [{"label": "Ceses Totales", "value": 100 + i}]}]}}}]}},
+        {"author": "HR_Semantic_Agent", "content": {"role": "model", "parts": [{"text": f"Hubo {100 + i} ceses."}]}},
+    ]
+
+
+def _history(turns):
+    return [ev for i in range(turns) for ev in _turn(i)]
+
+
+def test_old_turns_fold_into_structured_summary():
+    state = {"triage_slots": {"period": "2025", "format": "KPI_ROW"}}
+    kept = compact_history(_history(COMPACT_AFTER_TURNS + 1), state)
+
+    assert len(kept) == KEEP_RAW_TURNS * 4
+    assert kept[0]["content"]["parts"][0]["text"] == f"Ceses de la división {COMPACT_AFTER_TURNS + 1 - KEEP_RAW_TURNS}"
+
+    summary = state[SUMMARY_STATE_KEY]
+    assert summary["turns_compacted"] == COMPACT_AFTER_TURNS + 1 - KEEP_RAW_TURNS
+    assert summary["slots"] == {"period": "2025", "format": "KPI_ROW"}
+    assert summary["previous_queries"][0]["metrics"] == ["ceses_totales"]
+    assert summary["key_numbers"][-1] == {"title": "Ceses 3", "values": {"Ceses Totales": 103}}
+    assert "Ceses de la división 0" in render_summary(summary)
+
+    # Por debajo de ambos umbrales no se toca nada
+    assert compact_history(_history(5), {}) == _history(5)
+    # Turnos con muchos eventos: se pliegan antes de que el límite de carga los descarte
+    state = {}
+    assert len(compact_history(_history(6), state)) == KEEP_RAW_TURNS * 4
+    assert state[SUMMARY_STATE_KEY]["turns_compacted"] == 3
+
+
+@pytest.mark.asyncio
+async def test_persisted_session_stays_flat(mocker):
+    store = {}
+    firestore = mocker.patch("app.services.adk_firestore_connector.get_firestore_service").return_value
+    firestore.save_session = AsyncMock(side_effect=lambda sid, data: store.update({sid: data}))
+    firestore.get_session = AsyncMock(side_effect=lambda sid: store.get(sid))
+
+    service = FirestoreADKSessionService()
+    await service.create_session(app_name="app", user_id="u1", session_id="s1")
+
+    sizes = []
+    for i in range(40):
+        session = await service.get_session(app_name="app", user_id="u1", session_id="s1")
+        loaded = len(session.events)
+        for ev in _turn(i):
+            await service.append_event(session, Event(**ev))
+        # La sesión en memoria (en uso por el Runner) no se recorta al persistir
+        assert len(session.events) == loaded + 4
+        sizes.append(len(store["s1"]["history"]))
+
+    assert max(sizes) <= 20
+    summary = store["s1"]["state"][SUMMARY_STATE_KEY]
+    raw_turns = len(store["s1"]["history"]) // 4
+    assert summary["turns_compacted"] + raw_turns == 40
+    assert summary["key_numbers"][-1]["values"] == {"Ceses Totales": 100 + 40 - raw_turns - 1}
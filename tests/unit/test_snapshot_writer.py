@@ -0,0 +1,111 @@
+from app.services.report_snapshot_service import _SnapshotWriteBehind
+
+
+class _FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data):
+        self.ops.append(("set", ref, data))
+
+    def update(self, ref, data):
+        self.ops.append(("update", ref, data))
+
+    def commit(self):
+        self.db.committed.append(self.ops)
+
+
+class _FakeDB:
+    def __init__(self):
+        self.committed = []
+
+    def batch(self):
+        return _FakeBatch(self)
+
+
+def test_writes_are_batched_in_order_and_flushed():
+    db = _FakeDB()
+    writer = _SnapshotWriteBehind(db)
+
+    writer.submit("set", "doc", {"status": "GATHERING_DATA"})
+    for i in range(5):
+        writer.submit("update", "doc", {f"blocks.b{i}": i})
+
+    assert writer.flush(timeout=5)
+    ops = [op for batch in db.committed for op in batch]
+    assert [o[0] for o in ops] == ["set"] + ["update"] * 5
+    assert ops[-1][2] == {"blocks.b4": 4}
+    # Writes submitted together are coalesced into fewer commits
+    assert len(db.committed) < 6
+
+
+def test_failed_commit_does_not_block_flush():
+    class _BrokenDB(_FakeDB):
+        def batch(self):
+            batch = _FakeBatch(self)
+            batch.commit = lambda: (_ for _ in ()).throw(RuntimeError("unavailable"))
+            return batch
+
+    writer = _SnapshotWriteBehind(_BrokenDB())
+    writer.submit("set", "doc", {"a": 1})
+    assert writer.flush(timeout=5)
+
+
+def test_bad_write_does_not_drop_other_reports():
+    class _PoisonDB(_FakeDB):
+        def batch(self):
+            batch = _FakeBatch(self)
+
+            def commit():
+                if any(ref == "bad" for _, ref, _ in batch.ops):
+                    raise ValueError("invalid payload")
+                self.committed.append(batch.ops)
+            batch.commit = commit
+            return batch
+
+    db = _PoisonDB()
+    writer = _SnapshotWriteBehind(db)
+    writer.submit("set", "r1", {"status": "GATHERING_DATA"})
+    writer.submit("update", "bad", {"blocks.x": 1})
+    writer.submit("update", "r1", {"blocks.b": 2})
+    writer.submit("set", "index", {"report_id": "r1"})
+
+    assert writer.flush(timeout=5)
+    ops = [op for batch in db.committed for op in batch]
+    assert [(o[0], o[1]) for o in ops] == [("set", "r1"), ("update", "r1"), ("set", "index")]
+
+
+def test_transient_failures_are_retried(mocker):
+    from google.api_core import exceptions
+
+    class _FlakyDB(_FakeDB):
+        failures = 2
+
+        def batch(self):
+            batch = _FakeBatch(self)
+            original = batch.commit
+
+            def commit():
+                if self.failures:
+                    self.failures -= 1
+                    raise exceptions.ServiceUnavailable("try again")
+                original()
+            batch.commit = commit
+            return batch
+
+    mocker.patch.object(_SnapshotWriteBehind, "RETRY_BACKOFF_SECONDS", (0.01, 0.01, 0.01))
+    db = _FlakyDB()
+    writer = _SnapshotWriteBehind(db)
+    writer.submit("set", "doc", {"a": 1})
+    assert writer.flush(timeout=5)
+    assert db.committed == [[("set", "doc", {"a": 1})]]
+
+
+def test_batches_are_capped_by_payload_bytes(mocker):
+    mocker.patch.object(_SnapshotWriteBehind, "MAX_BATCH_BYTES", 1000)
+    writer = _SnapshotWriteBehind(_FakeDB())
+    ops = [("update", f"doc{i}", {"blocks.t": "x" * 400}) for i in range(5)]
+    chunks = writer._chunks(ops)
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert [op for c in chunks for op in c] == ops
@@ -0,0 +1,106 @@
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+
+from app.services.speculative_query import guess_semantic_query, get_speculative_executor
+
+DIVISIONS = ["DIVISION FINANZAS", "DIVISION TALENTO"]
+
+
+def test_guess_trend_with_division_and_year():
+    guess = guess_semantic_query("Evolución de la rotación voluntaria de Finanzas 2025", DIVISIONS)
+
+    assert guess["intent"] == "TREND"
+    assert guess["cube_query"] == {
+        "metrics": ["tasa_rotacion_mensual_voluntaria"],
+        "dimensions": ["mes"],
+        "filters": [{"dimension": "anio", "value": 2025}, {"dimension": "uo2", "value": "DIVISION FINANZAS"}],
+    }
+
+
+def test_guess_is_conservative():
+    assert guess_semantic_query("Evolución de rotación 2024 vs 2025", DIVISIONS) is None
+    assert guess_semantic_query("Listado de cesados 2025", DIVISIONS) is None
+    assert guess_semantic_query("Evolución de la rotación por segmento 2025", DIVISIONS) is None
+    assert guess_semantic_query("Evolución de rotación de Finanzas y Talento 2025", DIVISIONS) is None
+
+
+def _fake_job(df):
+    job = MagicMock()
+    job.to_dataframe.return_value = df
+    job.done.return_value = False
+    return job
+
+
+def test_matching_sql_consumes_speculative_result(mocker):
+    df = pd.DataFrame([{"mes": 1, "tasa_rotacion_mensual": 1.2}])
+    bq = MagicMock()
+    bq.start_query.return_value = _fake_job(df)
+    mocker.patch("app.services.speculative_query.get_bq_service", return_value=bq)
+    mocker.patch("app.services.speculative_query.build_analytical_query", return_value="SELECT  1\n FROM t")
+
+    executor = get_speculative_executor()
+    assert executor.speculate("Evolución de rotación 2025", owner="req-1")
+
+    # Misma SQL (whitespace distinto) -> HIT, sin segundo job
+    assert executor.consume("SELECT 1 FROM t") is df
+    assert executor.consume("SELECT 1 FROM t") is None
+    assert bq.start_query.call_count == 1
+
+
+def test_unconsumed_speculation_is_cancelled(mocker):
+    job = _fake_job(pd.DataFrame())
+    bq = MagicMock()
+    bq.start_query.return_value = job
+    mocker.patch("app.services.speculative_query.get_bq_service", return_value=bq)
+    mocker.patch("app.services.speculative_query.build_analytical_query", return_value="SELECT 2")
+
+    executor = get_speculative_executor()
+    executor.speculate("Tendencia de rotación 2024", owner="req-2")
+    executor.discard("req-2")
+
+    assert executor.consume("SELECT 2") is None
+    job.cancel.assert_called_once()
+
+
+def test_speculative_result_counts_for_the_bigquery_breaker(mocker):
+    from google.api_core.exceptions import ServiceUnavailable
+    from app.services.circuit_breaker import get_circuit_breaker
+
+    breaker = get_circuit_breaker("bigquery")
+    breaker.record_success()
+    record_failure = mocker.spy(breaker, "record_failure")
+    job = _fake_job(None)
+    job.to_dataframe.side_effect = ServiceUnavailable("backend down")
+    bq = MagicMock()
+    bq.start_query.return_value = job
+    mocker.patch("app.services.speculative_query.get_bq_service", return_value=bq)
+    mocker.patch("app.services.speculative_query.build_analytical_query", return_value="SELECT 3")
+
+    executor = get_speculative_executor()
+    executor.speculate("Evolución de rotación 2023", owner="req-3")
+
+    # El 503 al leer el job especulativo es un fallo de BigQuery (no un éxito por haberlo lanzado)
+    assert executor.consume("SELECT 3") is None
+    assert isinstance(record_failure.call_args[0][0], ServiceUnavailable)
+    breaker.record_success()
+
+
+def test_start_query_does_not_probe_or_count_submission_as_success(mocker):
+    from app.services.bigquery import BigQueryService
+    from app.services.circuit_breaker import CircuitOpenError, get_circuit_breaker
+
+    breaker = get_circuit_breaker("bigquery")
+    breaker.record_success()
+    record_success = mocker.spy(breaker, "record_success")
+    client = mocker.patch.object(BigQueryService, "client", new_callable=mocker.PropertyMock).return_value
+
+    BigQueryService().start_query("SELECT 1")
+    record_success.assert_not_called()
+
+    # Circuito no cerrado: la especulación no se lanza (no ocupa la llamada de prueba)
+    mocker.patch.object(type(breaker), "state", new_callable=mocker.PropertyMock, return_value="half_open")
+    with pytest.raises(CircuitOpenError):
+        BigQueryService().start_query("SELECT 1")
+    assert client.query.call_count == 1
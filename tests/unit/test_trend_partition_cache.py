@@ -0,0 +1,119 @@
+import re
+
+import pandas as pd
+import pytest
+
+from app.services.partition_pruning import month_index as _month_index
+from app.services.trend_partition_cache import TrendPartitionCache, get_trend_partition_cache
+
+# (anio, mes) -> (hc_final, ceses, ceses_voluntarios, ceses_involuntarios)
+MONTHLY = {
+    (2024, 12): (100, 5, 3, 2),
+    (2025, 1): (110, 10, 6, 4),
+    (2025, 2): (120, 11, 5, 6),
+    (2025, 3): (100, 0, 0, 0),
+}
+
+QUERY = {
+    "metrics": ["tasa_rotacion_mensual", "tasa_rotacion_anual"],
+    "dimensions": ["mes"],
+    "filters": {"anio": 2025},
+    "limit": 5000,
+}
+
+
+class _FakeBQ:
+    """Responde a la SQL mensual con las filas de MONTHLY dentro de los rangos BETWEEN."""
+
+    def __init__(self):
+        self.calls = []
+
+    def execute_query(self, sql):
+        ranges = re.findall(r"DATE\('(\d{4})-(\d{2})-01'\) AND DATE\('(\d{4})-(\d{2})-\d{2}'\)", sql)
+        self.calls.append(ranges)
+        rows = []
+        for (y, m), (hc, ceses, vol, inv) in MONTHLY.items():
+            idx = _month_index(y, m)
+            if any(_month_index(int(y1), int(m1)) <= idx <= _month_index(int(y2), int(m2)) for y1, m1, y2, m2 in ranges):
+                rows.append({"periodo": pd.Timestamp(y, m, 1), "anio": y, "mes": m, "hc_final": hc,
+                             "ceses": ceses, "ceses_voluntarios": vol, "ceses_involuntarios": inv})
+        return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def cache(mocker):
+    cache = get_trend_partition_cache()
+    cache.clear()
+    fake = _FakeBQ()
+    mocker.patch("app.services.trend_partition_cache.get_bq_service", return_value=fake)
+    freshness = mocker.patch("app.services.trend_partition_cache.get_data_freshness_service").return_value
+    freshness.month_version.return_value = "v1"
+    # "Hoy" = marzo 2025: febrero y marzo son meses abiertos
+    mocker.patch.object(TrendPartitionCache, "_open_from", return_value=_month_index(2025, 2))
+    yield cache, fake
+    cache.clear()
+
+
+def test_plan_rejects_non_series_queries():
+    plan = TrendPartitionCache.plan
+    assert plan({**QUERY, "dimensions": ["uo2"]}) is None  # sin mes -> snapshot
+    assert plan({**QUERY, "filters": {"anio": 2025, "mes": 3}}) is None
+    assert plan({**QUERY, "comparison_groups": [{"label": "a"}]}) is None
+    assert plan({**QUERY, "metrics": ["ceses_totales"]}) is None  # no usa headcount_base
+    assert plan({**QUERY, "dimensions": ["mes", "uo2", "segmento"]}) is None
+
+
+def test_series_is_rebuilt_locally(cache):
+    cache, _ = cache
+    df = cache.execute(QUERY)
+
+    assert list(df.columns) == ["mes", "tasa_rotacion_mensual", "tasa_rotacion_anual"]
+    assert df["mes"].tolist() == [1, 2, 3]
+    # Mensual: ceses / HC final del mes anterior (LAG cruza Dic del año previo)
+    assert df["tasa_rotacion_mensual"].round(4).tolist() == [10.0, 10.0, 0.0]
+    # Anual: ceses acumulados / promedio simple de HC finales YTD
+    assert df["tasa_rotacion_anual"].round(4).tolist() == [
+        round(10 / 110 * 100, 4), round(21 / 115 * 100, 4), round(21 / 110 * 100, 4)
+    ]
+
+
+def test_repeated_request_only_queries_open_months(cache):
+    cache, fake = cache
+    first = cache.execute(QUERY)
+    second = cache.execute(QUERY)
+
+    assert len(fake.calls) == 2
+    assert fake.calls[0] == [("2024", "12", "2025", "12")]
+    assert fake.calls[1] == [("2025", "02", "2025", "12")]
+    pd.testing.assert_frame_equal(first, second)
+    assert cache.covers(QUERY)
+
+
+def test_reloaded_partition_is_refetched(cache, mocker):
+    cache, fake = cache
+    cache.execute(QUERY)
+
+    # Recarga de enero: solo ese mes cerrado vuelve a BigQuery
+    from app.services import trend_partition_cache as module
+    jan = _month_index(2025, 1)
+    module.get_data_freshness_service.return_value.month_version.side_effect = lambda idx: "v2" if idx == jan else "v1"
+    cache.execute(QUERY)
+
+    assert fake.calls[1] == [("2025", "01", "2025", "12")]
+
+
+def test_bigquery_error_falls_back_to_full_query(cache, mocker):
+    cache, fake = cache
+    mocker.patch.object(fake, "execute_query", side_effect=RuntimeError("boom"))
+    assert cache.execute(QUERY) is None
+
+
+def test_unknown_month_version_is_never_cached(cache):
+    cache, fake = cache
+    from app.services import trend_partition_cache as module
+    module.get_data_freshness_service.return_value.month_version.return_value = None
+    cache.execute(QUERY)
+    cache.execute(QUERY)
+
+    # Sin versión no hay cómo invalidar ante una recarga: todo vuelve a BigQuery
+    assert fake.calls[1] == fake.calls[0]